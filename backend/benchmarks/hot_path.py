@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the point update hot path, against the real lib60870 build.
+
+Runs add_ioa, update_ioa, update_ioa_from_server dispatch, a station
+interrogation (GI_h building and sending the ASDUs to a local master), a
+general counter interrogation read (CI_h) and one poll_ioa_values iteration
+at each point count, and writes the results as
+JSON so runs on different commits can be compared:
+
+    python -m benchmarks.hot_path --output results/$(git rev-parse --short HEAD).json
+    python -m benchmarks.hot_path --compare results/baseline.json
+
+With --compare the run fails when a case is slower than the baseline by more
+than --threshold.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Keep log output out of the measurements, main.py reads this when imported
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+# Same simulated values on every run, so results compare between releases
+os.environ.setdefault('SIMULATION_SEED', '104')
+
+from lib.lib60870 import *
+from lib.libiec60870server import IEC60870_5_104_server
+from lib import metrics
+from lib.station import add_counter_point
+from data_models import CircuitBreakerItem, CounterItem, TelemetryItem, TeleSignalItem
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+CASES = ('add_ioa', 'update_ioa', 'update_ioa_from_server', 'gi', 'ci', 'poll_iteration')
+
+# update_ioa_from_server scans every breaker, cap the calls per run at large sizes
+MAX_DISPATCH_CALLS = 2000
+
+main_server_started = False
+
+
+def callback(ioa, ioa_object, server, is_select=None):
+    return server.update_ioa_from_server(ioa, ioa_object['data']) if not is_select else True
+
+
+def new_server(port, circuit_breakers=None):
+    return IEC60870_5_104_server('127.0.0.1', port, circuit_breakers=circuit_breakers)
+
+
+@contextmanager
+def running_server(port, circuit_breakers=None):
+    """A started server, the slave only has its event queue once it runs."""
+    server = new_server(port, circuit_breakers)
+    if server.start() != 0:
+        raise RuntimeError(f"could not start the server on port {port}")
+    try:
+        yield server
+    finally:
+        server.stop()
+
+
+def add_points(server, size):
+    for ioa in range(1, size + 1):
+        server.add_ioa(ioa, MeasuredValueScaled, 0, None, True)
+
+
+def add_breakers(server, circuit_breakers, count):
+    """Breakers laid out like the UI creates them, 8 IOAs each."""
+    for i in range(count):
+        base = 100000 + i * 10
+        item = CircuitBreakerItem(
+            id=f"cb{i}", name=f"BENCH_CB_{i}",
+            ioa_cb_status=base, ioa_cb_status_close=base + 1, ioa_cb_status_dp=base + 2,
+            ioa_control_open=base + 3, ioa_control_close=base + 4, ioa_control_dp=base + 5,
+            ioa_local_remote_sp=base + 6, ioa_local_remote_dp=base + 7,
+            is_sbo=False, has_double_point=True, is_dp_mode=True,
+        )
+        circuit_breakers[item.id] = item
+        server.add_ioa(item.ioa_cb_status, SinglePointInformation, 0, callback, True)
+        server.add_ioa(item.ioa_cb_status_close, SinglePointInformation, 0, callback, True)
+        server.add_ioa(item.ioa_control_open, SingleCommand, 0, callback, True)
+        server.add_ioa(item.ioa_control_close, SingleCommand, 0, callback, True)
+        server.add_ioa(item.ioa_cb_status_dp, DoublePointInformation, 0, callback, True)
+        server.add_ioa(item.ioa_control_dp, DoubleCommand, 0, callback, True)
+        server.add_ioa(item.ioa_local_remote_sp, SinglePointInformation, 0, callback, True)
+        server.add_ioa(item.ioa_local_remote_dp, DoublePointInformation, 0, callback, True)
+
+
+def bench_add_ioa(size, repeat, port):
+    def run():
+        add_points(new_server(port), size)
+        return size
+    return measure(run, repeat)
+
+
+def bench_update_ioa(size, repeat, port):
+    with running_server(port) as server:
+        add_points(server, size)
+        rounds = iter(range(1, repeat + 1))
+
+        def run():
+            # A new value every round, unchanged values return before building an ASDU
+            value = next(rounds)
+            for ioa in range(1, size + 1):
+                server.update_ioa(ioa, value)
+            return size
+        return measure(run, repeat)
+
+
+def bench_update_ioa_from_server(size, repeat, port):
+    circuit_breakers = {}
+    with running_server(port, circuit_breakers) as server:
+        count = max(size // 8, 1)
+        add_breakers(server, circuit_breakers, count)
+        # Spread the calls over the whole table, the dispatch cost depends on the breaker's position
+        step = max(count // MAX_DISPATCH_CALLS, 1)
+        targets = [item.ioa_control_dp for item in list(circuit_breakers.values())[::step]]
+        rounds = iter(range(repeat))
+
+        def run():
+            state = 1 if next(rounds) % 2 == 0 else 2
+            for ioa in targets:
+                server.update_ioa_from_server(ioa, state)
+            # Run the breaker operations the calls scheduled, they reschedule their completion once
+            for step in (1, 2):
+                server.timer_wheel.advance(time.monotonic() + step)
+            return len(targets)
+        return measure(run, repeat)
+
+
+class GIMaster:
+    """Local master that times a station or counter interrogation until its ACT_TERM."""
+
+    def __init__(self, port):
+        self.done = threading.Event()
+        self.started = threading.Event()
+        self.asdus = 0
+        self.objects = 0
+        self.connection = CS104_Connection_create('127.0.0.1', port)
+        self.asduHandler = CS101_ASDUReceivedHandler(self.asdu_received)
+        self.connectionHandler = CS104_ConnectionHandler(self.connection_event)
+        CS104_Connection_setASDUReceivedHandler(self.connection, self.asduHandler, None)
+        CS104_Connection_setConnectionHandler(self.connection, self.connectionHandler, None)
+
+    def connection_event(self, param, connection, event):
+        if event == CS104_CONNECTION_STARTDT_CON_RECEIVED:
+            self.started.set()
+
+    def asdu_received(self, param, address, asdu):
+        if CS101_ASDU_getCOT(asdu) in (CS101_COT_INTERROGATED_BY_STATION, CS101_COT_REQUESTED_BY_GENERAL_COUNTER):
+            self.asdus += 1
+            self.objects += CS101_ASDU_getNumberOfElements(asdu)
+        elif CS101_ASDU_getTypeID(asdu) in (C_IC_NA_1, C_CI_NA_1) and CS101_ASDU_getCOT(asdu) == CS101_COT_ACTIVATION_TERMINATION:
+            self.done.set()
+        return True
+
+    def connect(self):
+        if not CS104_Connection_connect(self.connection):
+            return False
+        CS104_Connection_sendStartDT(self.connection)
+        return self.started.wait(5)
+
+    def interrogate(self, ca, timeout):
+        self.done.clear()
+        self.asdus = self.objects = 0
+        CS104_Connection_sendInterrogationCommand(self.connection, CS101_COT_ACTIVATION, ca, IEC60870_QOI_STATION)
+        return self.done.wait(timeout)
+
+    def interrogate_counters(self, ca, timeout):
+        self.done.clear()
+        self.asdus = self.objects = 0
+        CS104_Connection_sendCounterInterrogationCommand(self.connection, CS101_COT_ACTIVATION, ca, IEC60870_QCC_RQT_GENERAL | IEC60870_QCC_FRZ_READ)
+        return self.done.wait(timeout)
+
+    def close(self):
+        CS104_Connection_destroy(self.connection)
+
+
+def bench_gi(size, repeat, port, timeout=60):
+    with running_server(port) as server:
+        # GI sends measured values and single points in separate ASDUs
+        for ioa in range(1, size + 1):
+            server.add_ioa(ioa, SinglePointInformation if ioa % 4 == 0 else MeasuredValueScaled, 0, None, True)
+        master = GIMaster(port)
+        try:
+            if not master.connect():
+                raise RuntimeError(f"could not connect to the server on port {port}")
+            extra = {'timeouts': 0}
+
+            def run():
+                gi_sum = metrics.GI_DURATION.totals()[1]
+                if not master.interrogate(1, timeout):
+                    extra['timeouts'] += 1
+                # Time spent building and queueing the ASDUs, without the transfer
+                extra['server_gi_s'] = round(metrics.GI_DURATION.totals()[1] - gi_sum, 6)
+                extra['asdus'] = master.asdus
+                extra['objects'] = master.objects
+                return 1
+            result = measure(run, repeat)
+            result.update(extra)
+            return result
+        finally:
+            master.close()
+
+
+def bench_ci(size, repeat, port, timeout=60):
+    with running_server(port) as server:
+        # Plain and timestamped counters are sent in separate ASDUs
+        for ioa in range(1, size + 1):
+            add_counter_point(server, CounterItem(id=f"c{ioa}", name=f"BENCH_C_{ioa}", ioa=ioa, value=ioa, has_timestamp=ioa % 4 == 0))
+        master = GIMaster(port)
+        try:
+            if not master.connect():
+                raise RuntimeError(f"could not connect to the server on port {port}")
+            extra = {'timeouts': 0}
+
+            def run():
+                if not master.interrogate_counters(1, timeout):
+                    extra['timeouts'] += 1
+                extra['asdus'] = master.asdus
+                extra['objects'] = master.objects
+                return 1
+            result = measure(run, repeat)
+            result.update(extra)
+            return result
+        finally:
+            master.close()
+
+
+def bench_poll_iteration(size, repeat, port):
+    import main
+    global main_server_started
+    if not main_server_started:
+        # main.IEC_SERVER listens on IEC_104_SERVER_PORT from .env
+        if main.IEC_SERVER.start() != 0:
+            raise RuntimeError("could not start main.IEC_SERVER")
+        main_server_started = True
+
+    for collection in (main.telesignals, main.telemetries, main.circuit_breakers, main.tap_changers, main.counters):
+        collection.clear()
+    for ioa in list(main.IEC_SERVER.ioa_list):
+        del main.IEC_SERVER.ioa_list[ioa]
+    # Every item due on every iteration: the worst case for one pass
+    for i in range(size):
+        ioa = i + 1
+        if i % 5 == 0:
+            item = TeleSignalItem(id=f"ts{i}", name=f"BENCH_TS_{i}", ioa=ioa, interval=0)
+            main.telesignals[item.id] = item
+            main.IEC_SERVER.add_ioa(ioa, SinglePointInformation, 0, None, True)
+        else:
+            item = TelemetryItem(id=f"tm{i}", name=f"BENCH_TM_{i}", ioa=ioa, unit="A", value=0, scale_factor=0.1, min_value=0, max_value=500, interval=0)
+            main.telemetries[item.id] = item
+            main.IEC_SERVER.add_ioa(ioa, MeasuredValueScaled, 0, None, True)
+    state = main.new_poll_state()
+
+    async def poll_and_flush():
+        await main.poll_ioa_values_once(state)
+        await main.broadcaster.flush()
+
+    def run():
+        asyncio.run(poll_and_flush())
+        return size
+    return measure(run, repeat)
+
+
+def measure(run, repeat):
+    times = []
+    ops = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        ops = run()
+        times.append(time.perf_counter() - started)
+    best = min(times)
+    return {
+        'ops': ops,
+        'best_s': round(best, 6),
+        'mean_s': round(sum(times) / len(times), 6),
+        'per_op_us': round(best / max(ops, 1) * 1e6, 3),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path, threshold):
+    with open(baseline_path) as f:
+        baseline = {(r['case'], r['points']): r for r in json.load(f)['results']}
+    regressions = []
+    print(f"\nCompared to {baseline_path}:")
+    for result in results:
+        base = baseline.get((result['case'], result['points']))
+        if base is None or not base['best_s']:
+            continue
+        ratio = result['best_s'] / base['best_s']
+        flag = ' REGRESSION' if ratio > threshold else ''
+        print(f"  {result['case']:<24} {result['points']:>7} points  {ratio:6.2f}x{flag}")
+        if flag:
+            regressions.append(result)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)), help="comma separated point counts")
+    parser.add_argument('--cases', default=','.join(CASES), help="comma separated cases to run")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--port', type=int, default=2410, help="first port for the benchmark servers, one per case and size")
+    parser.add_argument('--gi-timeout', type=float, default=60, help="seconds to wait for a station or counter interrogation")
+    parser.add_argument('--output', default='benchmark-results.json')
+    parser.add_argument('--compare', help="baseline results JSON to compare against")
+    parser.add_argument('--threshold', type=float, default=1.2, help="slowdown ratio that counts as a regression")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    cases = [case.strip() for case in args.cases.split(',')]
+    runners = {
+        'add_ioa': bench_add_ioa,
+        'update_ioa': bench_update_ioa,
+        'update_ioa_from_server': bench_update_ioa_from_server,
+        'gi': lambda size, repeat, port: bench_gi(size, repeat, port, args.gi_timeout),
+        'ci': lambda size, repeat, port: bench_ci(size, repeat, port, args.gi_timeout),
+        'poll_iteration': bench_poll_iteration,
+    }
+
+    results = []
+    # Every server gets its own port, a stopped slave may hold its port for a while
+    port = args.port
+    for case in cases:
+        for size in sizes:
+            result = runners[case](size, args.repeat, port)
+            port += 1
+            result = {'case': case, 'points': size, **result}
+            results.append(result)
+            print(f"{case:<24} {size:>7} points  best {result['best_s'] * 1000:10.2f} ms  {result['per_op_us']:10.3f} us/op")
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    output_dir = os.path.dirname(args.output)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if main_server_started:
+        import main
+        main.IEC_SERVER.stop()
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
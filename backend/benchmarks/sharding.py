@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Shard scaling benchmark, against the real lib60870 build.
+
+Runs --stations stations of --points auto mode telemetries each through a
+ShardCoordinator, once for every worker count, with the workers polling
+as fast as they can (tick 0) and every telemetry due on every poll. The
+point changes per second reaching the coordinator show how throughput
+scales with the worker processes:
+
+    python -m benchmarks.sharding --stations 100 --points 200 --workers 1,2,4,8 --seconds 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+# Keep log output out of the measurements
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+from lib.sharding import ShardCoordinator, farm_specs
+
+
+def station_config(points):
+    return {
+        'telemetries': [
+            {
+                'id': f'bench-{i}',
+                'name': f'Bench {i}',
+                'ioa': 1000 + i,
+                'unit': 'A',
+                'value': 0,
+                'min_value': 0,
+                'max_value': 1000,
+                'scale_factor': 1,
+                'interval': 0,
+                'auto_mode': True,
+            }
+            for i in range(points)
+        ],
+    }
+
+
+async def measure(workers, stations, points, seconds, base_port, startup_timeout=60):
+    specs = farm_specs(station_config(points), range(base_port, base_port + stations))
+    coordinator = ShardCoordinator(workers, specs, '127.0.0.1', seed=104, tick=0)
+    coordinator.start()
+    try:
+        deadline = time.monotonic() + startup_timeout
+        while len(coordinator.stations) < stations:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"only {len(coordinator.stations)} of {stations} stations came up")
+            await asyncio.sleep(0.1)
+        # Let every worker settle into its loop before measuring
+        await asyncio.sleep(1.0)
+        changes_before = sum(station.changes for station in coordinator.stations.values())
+        started = time.monotonic()
+        await asyncio.sleep(seconds)
+        elapsed = time.monotonic() - started
+        changes = sum(station.changes for station in coordinator.stations.values()) - changes_before
+    finally:
+        coordinator.stop()
+    return {'workers': len(coordinator.assignments), 'point_changes_per_s': round(changes / elapsed)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stations', type=int, default=100)
+    parser.add_argument('--points', type=int, default=200, help="auto mode telemetries per station")
+    parser.add_argument('--workers', default=f'1,2,{os.cpu_count()}', help="comma separated worker counts to measure in turn")
+    parser.add_argument('--seconds', type=float, default=10, help="measurement window per worker count")
+    parser.add_argument('--base-port', type=int, default=24040, help="port of the first station")
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = []
+    for workers in (int(count) for count in args.workers.split(',')):
+        try:
+            result = asyncio.run(measure(workers, args.stations, args.points, args.seconds, args.base_port))
+        except RuntimeError as e:
+            print(f"{workers} workers: {e}", file=sys.stderr)
+            sys.exit(1)
+        results.append(result)
+        baseline = results[0]['point_changes_per_s'] / results[0]['workers']
+        speedup = result['point_changes_per_s'] / baseline if baseline else 0
+        print(f"{result['workers']:>3} workers  {result['point_changes_per_s']:>10} point changes/s  {speedup:.2f}x one worker")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'stations': args.stations, 'points': args.points, 'results': results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Socket.IO fan-out benchmark with simulated dashboards.
+
+Serves main.socket_app from a child process with --points auto mode
+telemetries, connects N python-socketio clients to it and measures, while
+poll_ioa_values runs:
+
+  - end-to-end latency from the first update_ioa feeding a 'telemetries'
+    broadcast to its receipt by each client
+  - server CPU and Socket.IO bytes/s, read from the server's /metrics
+  - how many of the items in each full-list broadcast actually changed, and
+    what an incremental scheme sending only those would have cost
+
+    python -m benchmarks.socketio_fanout --points 10000 --clients 1,10,50 --seconds 20
+    python -m benchmarks.socketio_fanout --points 10000 --serializer msgpack --columnar-min-items 1000
+
+The clients need the asyncio client extra: pip install "python-socketio[asyncio_client]".
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+import urllib.request
+
+import numpy as np
+import socketio
+
+# First telemetry in every broadcast, its value carries the update time
+PROBE_ID = 'fanout-probe'
+
+
+def rows_of(data):
+    """The items of a collection payload, whether a list or columnar."""
+    if isinstance(data, list):
+        return data
+    return [dict(zip(data['fields'], values)) for values in zip(*data['columns'])]
+
+
+def stamp(data, at):
+    """A copy of a telemetries payload with the probe's value set to `at`, None without the probe."""
+    if isinstance(data, list):
+        if data and data[0].get('id') == PROBE_ID:
+            return [dict(data[0], value=at)] + data[1:]
+        return None
+    if isinstance(data, dict) and data.get('columns'):
+        fields = data['fields']
+        if data['columns'][fields.index('id')][0] == PROBE_ID:
+            columns = list(data['columns'])
+            value = fields.index('value')
+            columns[value] = [at] + columns[value][1:]
+            return dict(data, columns=columns)
+    return None
+
+
+def serve(port, iec_port, points, interval, serializer, columnar_min_items):
+    """Child process: the backend with a probe stamped into every telemetries broadcast."""
+    os.environ.update({
+        'FASTAPI_HOST': '127.0.0.1',
+        'FASTAPI_PORT': str(port),
+        'IEC_104_SERVER_HOST': '127.0.0.1',
+        'IEC_104_SERVER_PORT': str(iec_port),
+        'SOCKETIO_SERIALIZER': serializer,
+        'SOCKETIO_COLUMNAR_MIN_ITEMS': str(columnar_min_items),
+    })
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ.setdefault('SIMULATION_SEED', '104')
+    import uvicorn
+    import main
+    from data_models import TelemetryItem
+    from lib.lib60870 import MeasuredValueScaled
+
+    main.telemetries[PROBE_ID] = TelemetryItem(
+        id=PROBE_ID, name='PROBE', ioa=0, unit='s', value=0, scale_factor=1, min_value=0, max_value=0, auto_mode=False,
+    )
+    for i in range(points):
+        ioa = 1000 + i
+        main.telemetries[f"tm{i}"] = TelemetryItem(
+            id=f"tm{i}", name=f"FANOUT_TM_{i}", ioa=ioa, unit="A", value=0,
+            scale_factor=0.1, min_value=0, max_value=500, interval=interval,
+        )
+        main.IEC_SERVER.add_ioa(ioa, MeasuredValueScaled, 0, None, True)
+
+    # Stamp the broadcast with the time of the first update_ioa it carries
+    first_update = {'at': None}
+    update_ioa = main.IEC_SERVER.update_ioa
+    emit = main.sio.emit
+
+    def stamped_update_ioa(ioa, data):
+        if first_update['at'] is None:
+            first_update['at'] = time.time()
+        return update_ioa(ioa, data)
+
+    async def stamped_emit(event, data=None, *args, **kwargs):
+        if event == 'telemetries':
+            # The payload is the collection's cached one, stamp a copy
+            stamped = stamp(data, first_update['at'] or 0)
+            if stamped is not None:
+                data = stamped
+                first_update['at'] = None
+        return await emit(event, data, *args, **kwargs)
+
+    main.IEC_SERVER.update_ioa = stamped_update_ioa
+    main.sio.emit = stamped_emit
+
+    uvicorn.run(main.socket_app, host='127.0.0.1', port=port, log_level='warning')
+
+
+class Dashboard:
+    """One simulated browser subscribed to the telemetries broadcast."""
+
+    def __init__(self, url, track_changes, serializer):
+        self.url = url
+        self.track_changes = track_changes
+        self.client = socketio.AsyncClient(reconnection=False, serializer='msgpack' if serializer == 'msgpack' else 'default')
+        self.client.on('telemetries', self.telemetries)
+        self.measuring_since = None
+        self.latencies = []
+        self.messages = 0
+        self.items = 0
+        self.changed = 0
+        self.full_bytes = 0
+        self.incremental_bytes = 0
+        self.previous = {}
+
+    async def connect(self):
+        await self.client.connect(self.url, transports=['websocket'])
+
+    async def disconnect(self):
+        await self.client.disconnect()
+
+    def start(self, since):
+        self.measuring_since = since
+        self.latencies = []
+        self.messages = self.items = self.changed = self.full_bytes = self.incremental_bytes = 0
+
+    async def telemetries(self, data):
+        received = time.time()
+        if self.measuring_since is None:
+            return
+        rows = rows_of(data)
+        if not rows or rows[0].get('id') != PROBE_ID:
+            return
+        stamped = rows[0]['value']
+        if stamped < self.measuring_since:
+            return
+        self.latencies.append(received - stamped)
+        self.messages += 1
+        if self.track_changes:
+            items = rows[1:]
+            changed = [item for item in items if self.previous.get(item['id']) != item['value']]
+            self.previous = {item['id']: item['value'] for item in items}
+            size = len(json.dumps(data))
+            self.items += len(items)
+            self.changed += len(changed)
+            self.full_bytes += size
+            self.incremental_bytes += len(json.dumps(changed))
+
+
+def read_metrics(base_url):
+    """Sample values of the server's /metrics, keyed by the full series name."""
+    with urllib.request.urlopen(f"{base_url}/metrics", timeout=10) as response:
+        text = response.read().decode()
+    values = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            name, _, value = line.rpartition(' ')
+            values[name] = float(value)
+    return values
+
+
+def wait_until_up(base_url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"{base_url}/", timeout=2):
+                return True
+        except OSError:
+            time.sleep(0.25)
+    return False
+
+
+def summary(samples):
+    if not samples:
+        return None
+    ms = np.asarray(samples) * 1000.0
+    return {
+        'count': len(samples),
+        'p50_ms': round(float(np.percentile(ms, 50)), 3),
+        'p99_ms': round(float(np.percentile(ms, 99)), 3),
+        'max_ms': round(float(ms.max()), 3),
+    }
+
+
+async def measure(base_url, clients, seconds, serializer):
+    dashboards = [Dashboard(base_url, track_changes=(i == 0), serializer=serializer) for i in range(clients)]
+    await asyncio.gather(*(dashboard.connect() for dashboard in dashboards))
+    try:
+        # Let the initial full sync to every new client pass
+        await asyncio.sleep(2)
+        before = read_metrics(base_url)
+        started = time.time()
+        for dashboard in dashboards:
+            dashboard.start(started)
+        await asyncio.sleep(seconds)
+        after = read_metrics(base_url)
+        elapsed = time.time() - started
+    finally:
+        await asyncio.gather(*(dashboard.disconnect() for dashboard in dashboards), return_exceptions=True)
+
+    def delta(name):
+        return after.get(name, 0.0) - before.get(name, 0.0)
+
+    sample = dashboards[0]
+    latencies = [latency for dashboard in dashboards for latency in dashboard.latencies]
+    return {
+        'clients': clients,
+        'seconds': round(elapsed, 3),
+        'latency': summary(latencies),
+        'server_cpu_percent': round(delta('process_cpu_seconds_total') / elapsed * 100, 1),
+        'telemetries_emits_per_s': round(delta('socketio_emits_total{event="telemetries"}') / elapsed, 2),
+        'telemetries_bytes_per_s': round(delta('socketio_emit_bytes_total{event="telemetries"}') / elapsed, 1),
+        'messages_per_client': sample.messages,
+        'items_per_message': round(sample.items / sample.messages, 1) if sample.messages else None,
+        'changed_items_per_message': round(sample.changed / sample.messages, 1) if sample.messages else None,
+        'full_list_bytes_per_message': round(sample.full_bytes / sample.messages) if sample.messages else None,
+        'incremental_bytes_per_message': round(sample.incremental_bytes / sample.messages) if sample.messages else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--points', type=int, default=1000, help="auto mode telemetries on the server")
+    parser.add_argument('--interval', type=int, default=1, help="auto update interval of the telemetries in seconds")
+    parser.add_argument('--clients', default='1,10,50', help="comma separated client counts to measure in turn")
+    parser.add_argument('--seconds', type=float, default=10, help="measurement window per client count")
+    parser.add_argument('--port', type=int, default=6106)
+    parser.add_argument('--iec-port', type=int, default=2504)
+    parser.add_argument('--serializer', choices=('json', 'msgpack'), default='json', help="Socket.IO serializer of server and clients")
+    parser.add_argument('--columnar-min-items', type=int, default=0, help="send collections of at least this many items columnar, 0 disables")
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    server = multiprocessing.get_context('spawn').Process(target=serve, args=(args.port, args.iec_port, args.points, args.interval, args.serializer, args.columnar_min_items), daemon=True)
+    server.start()
+    try:
+        if not wait_until_up(base_url):
+            print(f"Server did not come up on {base_url}", file=sys.stderr)
+            sys.exit(1)
+        results = []
+        for clients in (int(count) for count in args.clients.split(',')):
+            result = asyncio.run(measure(base_url, clients, args.seconds, args.serializer))
+            results.append(result)
+            latency = result['latency'] or {}
+            print(f"{clients:>4} clients  latency p50 {latency.get('p50_ms')} ms p99 {latency.get('p99_ms')} ms  "
+                  f"server CPU {result['server_cpu_percent']}%  {result['telemetries_bytes_per_s'] / 1024:.0f} KiB/s")
+            print(f"      per broadcast: {result['changed_items_per_message']} of {result['items_per_message']} items changed, "
+                  f"full list {result['full_list_bytes_per_message']} B vs changed items only {result['incremental_bytes_per_message']} B")
+    finally:
+        server.terminate()
+        server.join()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'points': args.points,
+                'interval': args.interval,
+                'serializer': args.serializer,
+                'columnar_min_items': args.columnar_min_items,
+                'results': results,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
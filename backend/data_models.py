@@ -1,7 +1,19 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, PrivateAttr
+from typing import Any, List, Optional
 
-class CircuitBreakerItem(BaseModel):
+class TrackedModel(BaseModel):
+    """Item that tells the lib.collection.Collection holding it when a field is assigned."""
+    _collection: Any = PrivateAttr(default=None)
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        if name[0] != '_':
+            # Read the private directly, the _collection attribute lookup is several times slower
+            collection = self.__pydantic_private__['_collection']
+            if collection is not None:
+                collection.touch()
+
+class CircuitBreakerItem(TrackedModel):
     id: str
     name: str
     
@@ -15,6 +27,10 @@ class CircuitBreakerItem(BaseModel):
     ioa_local_remote_dp: int  # Local/Remote Double
     
     is_sbo: bool
+    sbo_timeout: float = 10.0  # Seconds a select stays armed before it expires
+    
+    travel_time: float = 0.0  # Seconds spent in the intermediate position while operating
+    failure_probability: float = 0.0  # Chance (0..1) that an operation leaves the breaker in place
     
     has_double_point: bool
     
@@ -33,7 +49,7 @@ class CircuitBreakerItem(BaseModel):
     control_close: int = 0
     control_dp: int = 0
     
-class TeleSignalItem(BaseModel):
+class TeleSignalItem(TrackedModel):
     id: str
     name: str
     ioa: int
@@ -41,7 +57,7 @@ class TeleSignalItem(BaseModel):
     interval: int = 2
     auto_mode: bool = True
 
-class TelemetryItem(BaseModel):
+class TelemetryItem(TrackedModel):
     id: str
     name: str
     ioa: int
@@ -52,8 +68,15 @@ class TelemetryItem(BaseModel):
     max_value: float
     interval: int = 2
     auto_mode: bool = True
+
+    # Coupling, see lib/dependencies.py: 0 unless all these breakers are closed
+    breaker_ids: List[str] = []
+    # and offset by tap_step per position of this tap changer above tap_neutral
+    tap_changer_id: Optional[str] = None
+    tap_step: float = 0.0
+    tap_neutral: int = 0
     
-class TapChangerItem(BaseModel):
+class TapChangerItem(TrackedModel):
     id: str
     name: str
     ioa_value: int
@@ -65,11 +88,12 @@ class TapChangerItem(BaseModel):
     ioa_high_limit: int
     ioa_low_limit: int
     
-    ioa_status_raise_lower: int  # 1: lower, 2: raise, 0: neutral
+    ioa_status_raise_lower: int  # 1: raise, 2: lower, 0: neutral
     ioa_command_raise_lower: int
     
     interval: int = 1
     auto_mode: int = 2  # 1: manual, 2: auto
+    operating_time: float = 0.0  # Seconds one tap step takes, ioa_status_raise_lower shows the direction meanwhile
     ioa_status_auto_manual: int
     ioa_command_auto_manual: int
     
@@ -77,10 +101,23 @@ class TapChangerItem(BaseModel):
     ioa_local_remote: int    
 
 
+class CounterItem(TrackedModel):
+    id: str
+    name: str
+    ioa: int
+    telemetry_id: Optional[str] = None  # Telemetry integrated into this counter
+    value: int = 0
+    scale_factor: float = 1.0  # Telemetry unit-hours per count
+    group: int = 0  # Counter interrogation group 1-4, 0: general request only
+    has_timestamp: bool = False  # M_IT_TB_1 instead of M_IT_NA_1
+    interval: int = 2
+
+
     # Export all classes
     __all__ = [
       'CircuitBreakerItem',
       'TeleSignalItem',
       'TelemetryItem',
-      'TapChangerItem'
+      'TapChangerItem',
+      'CounterItem'
     ]
\ No newline at end of file
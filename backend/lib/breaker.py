@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+import logging
+import threading
+from .lib60870 import *
+
+logger = logging.getLogger(__name__)
+
+# Double point positions, 00 is the intermediate state while the breaker travels
+POSITION_INTERMEDIATE = IEC60870_DOUBLE_POINT_INTERMEDIATE
+POSITION_OPEN = IEC60870_DOUBLE_POINT_OFF
+POSITION_CLOSED = IEC60870_DOUBLE_POINT_ON
+
+
+class CommandOrigin:
+    """
+    The master connection and command a breaker operation has to answer with ACT_TERM.
+
+    `connection_id` is the serial the server gave the connection when it
+    opened, not its pointer, which lib60870 reuses for later connections.
+    """
+    __slots__ = ('connection', 'connection_id', 'type_id', 'ca', 'ioa', 'state')
+
+    def __init__(self, connection, connection_id, type_id, ca, ioa, state):
+        self.connection = connection
+        self.connection_id = connection_id
+        self.type_id = type_id
+        self.ca = ca
+        self.ioa = ioa
+        self.state = state
+
+
+class Operation:
+    __slots__ = ('cb', 'position', 'previous', 'origin', 'timer')
+
+    def __init__(self, cb, position, previous, origin):
+        self.cb = cb
+        self.position = position
+        self.previous = previous
+        self.origin = origin
+        self.timer = None
+
+
+class BreakerOperations:
+    """
+    Simulated breaker travel for control commands.
+
+    An operation reports the intermediate double point state for the
+    breaker's travel_time, then either the commanded position or, with
+    failure_probability, the previous position again, and finally ACT_TERM
+    to the commanding connection. Every step runs from the shared timer
+    wheel on the event loop, so the lib60870 thread only schedules work.
+    """
+
+    def __init__(self, server, timer_wheel):
+        self.server = server
+        self.timer_wheel = timer_wheel
+        self._operations = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._operations)
+
+    def operate(self, cb, position, origin=None):
+        """Start moving `cb` to `position` (POSITION_OPEN or POSITION_CLOSED)."""
+        previous = self.position_of(cb)
+        operation = Operation(cb, position, previous, origin)
+        with self._lock:
+            superseded = self._operations.get(cb.id)
+            self._operations[cb.id] = operation
+        if superseded is not None:
+            if superseded.timer is not None:
+                superseded.timer.cancel()
+            # Keep the position the superseded operation started from
+            operation.previous = superseded.previous
+            self.send_act_term(superseded.origin, negative=True)
+        operation.timer = self.timer_wheel.call_later(0, self._begin, operation)
+        return 0
+
+    def forget_connection(self, connection_id):
+        """Drop the origins of a closed connection, its operations finish without an ACT_TERM."""
+        with self._lock:
+            operations = [operation for operation in self._operations.values()
+                          if operation.origin is not None and operation.origin.connection_id == connection_id]
+            for operation in operations:
+                operation.origin = None
+        return len(operations)
+
+    def position_of(self, cb):
+        ioa_list = self.server.ioa_list
+        if cb.is_dp_mode and cb.ioa_cb_status_dp in ioa_list:
+            return ioa_list[cb.ioa_cb_status_dp]['data']
+        status_open = ioa_list.get(cb.ioa_cb_status, {}).get('data', 0)
+        status_close = ioa_list.get(cb.ioa_cb_status_close, {}).get('data', 0)
+        return (2 if status_close else 0) | (1 if status_open else 0)
+
+    def apply_position(self, cb, position):
+        self.server.update_ioa(cb.ioa_cb_status, 1 if position & POSITION_OPEN else 0)
+        self.server.update_ioa(cb.ioa_cb_status_close, 1 if position & POSITION_CLOSED else 0)
+        if cb.is_dp_mode and cb.ioa_cb_status_dp:
+            self.server.update_ioa(cb.ioa_cb_status_dp, position)
+
+    def _begin(self, operation):
+        travel_time = getattr(operation.cb, 'travel_time', 0) or 0
+        if travel_time > 0:
+            self.apply_position(operation.cb, POSITION_INTERMEDIATE)
+        operation.timer = self.timer_wheel.call_later(travel_time, self._complete, operation)
+
+    def _complete(self, operation):
+        cb = operation.cb
+        with self._lock:
+            if self._operations.get(cb.id) is not operation:
+                return
+            del self._operations[cb.id]
+
+        failed = self.server.random.stream('circuit_breaker', cb.ioa_cb_status).random() < (getattr(cb, 'failure_probability', 0) or 0)
+        if failed:
+            logger.info("Circuit breaker %s failed to operate, staying at position %s", cb.name, operation.previous)
+            self.apply_position(cb, operation.previous)
+        else:
+            self.apply_position(cb, operation.position)
+        self.send_act_term(operation.origin, negative=failed)
+
+    def send_act_term(self, origin, negative=False):
+        if origin is None:
+            return
+        with self.server.connections_lock:
+            # The connection may have closed while the breaker was travelling
+            if origin.connection_id not in self.server.open_connections:
+                return
+            alParams = IMasterConnection_getApplicationLayerParameters(origin.connection)
+            newAsdu = CS101_ASDU_create(alParams, False, CS101_COT_ACTIVATION_TERMINATION, 0, origin.ca, False, negative)
+            if origin.type_id == C_SC_NA_1:
+                io = cast(SingleCommand_create(None, origin.ioa, bool(origin.state), False, 0), InformationObject)
+            else:
+                io = cast(DoubleCommand_create(None, origin.ioa, origin.state, False, 0), InformationObject)
+            CS101_ASDU_addInformationObject(newAsdu, io)
+            InformationObject_destroy(io)
+            IMasterConnection_sendASDU(origin.connection, newAsdu)
+            CS101_ASDU_destroy(newAsdu)
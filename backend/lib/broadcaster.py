@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FRAME_RATE = 10.0  # flushes per second
+
+
+class Broadcaster:
+    """
+    Coalesces collection broadcasts to the Socket.IO clients.
+
+    Handlers mark a collection dirty instead of emitting it; once per frame
+    every dirty collection is emitted once, with its cached payload. However
+    fast the simulation changes items, each collection goes out at most
+    `frame_rate` times per second.
+    """
+
+    def __init__(self, sio, collections, frame_rate=DEFAULT_FRAME_RATE, clock=time.monotonic):
+        self.sio = sio
+        self.collections = collections  # event name -> Collection
+        self.frame_rate = frame_rate
+        self.clock = clock
+        self._dirty = set()
+
+    def mark(self, event):
+        """Broadcast the collection of `event` with the next frame."""
+        self._dirty.add(event)
+
+    async def flush(self):
+        """Emit every dirty collection once. Returns the number emitted."""
+        if not self._dirty:
+            return 0
+        dirty, self._dirty = self._dirty, set()
+        # Emit in the collections' order, not the set's, so clients see a stable sequence
+        for event, collection in self.collections.items():
+            if event in dirty:
+                await self.sio.emit(event, collection.payload())
+        return len(dirty)
+
+    async def run(self):
+        """Flush at the frame rate until cancelled."""
+        interval = 1.0 / self.frame_rate
+        logger.info("Starting broadcaster (%g frames/s)", self.frame_rate)
+        next_frame = self.clock() + interval
+        while True:
+            await asyncio.sleep(max(next_frame - self.clock(), 0))
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("Error in broadcaster flush: %s", e)
+            next_frame += interval
+            now = self.clock()
+            if next_frame < now:
+                # Skip the frames a slow flush overran instead of flushing back to back
+                next_frame = now + interval
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+import collections
+import ipaddress
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+from ctypes import c_void_p, cast, create_string_buffer, string_at
+
+from .lib60870 import IMasterConnection_getPeerAddress
+from .metrics import CAPTURE_APDUS, CAPTURE_DROPPED
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024  # per file
+DEFAULT_MAX_FILES = 4
+DEFAULT_MAX_PENDING = 100000          # APDUs waiting for the writer before new ones are dropped
+WRITE_INTERVAL = 0.05
+
+LINKTYPE_RAW = 101  # the packet starts with its IPv4 header
+SHB_MAGIC = 0x1A2B3C4D
+TCP_PSH_ACK = 0x18
+
+
+class ApduCapture:
+    """
+    Writes every APDU the slave sends or receives to a ring of pcapng files.
+
+    raw_message is registered as the slave's raw message handler and runs on
+    the lib60870 connection threads. It only copies the APDU and appends it
+    to a deque, which is atomic and needs no lock; when `max_pending` APDUs
+    are waiting, new ones are dropped and counted instead of blocking the
+    connection. A writer thread drains the deque every WRITE_INTERVAL.
+
+    Each APDU is wrapped in synthetic IPv4/TCP headers between the peer and
+    the server address, with per-direction sequence numbers, so Wireshark
+    dissects it as IEC 60870-5-104 (use Decode As for ports other than
+    2404). Files are `<stem>.<n><ext>` for n in 0..max_files-1; when one
+    reaches `max_bytes` the next is started, overwriting the oldest.
+    """
+
+    def __init__(self, path, local_address, local_port, max_bytes=DEFAULT_MAX_BYTES, max_files=DEFAULT_MAX_FILES, max_pending=DEFAULT_MAX_PENDING):
+        self.path = path
+        self.local_ip = ip_bytes(local_address if local_address not in (None, '', '0.0.0.0') else '127.0.0.1')
+        self.local_port = local_port
+        self.max_bytes = max_bytes
+        self.max_files = max(int(max_files), 1)
+        self.max_pending = max_pending
+        self._pending = collections.deque()
+        self._peers = {}      # connection id -> (ip bytes, port)
+        self._sequences = {}  # (connection id, sent) -> next TCP sequence number
+        self._file = None
+        self._file_index = -1
+        self._file_bytes = 0
+        self._ident = 0
+        self._running = False
+        self._thread = None
+
+    def raw_message(self, param, connection, msg, msg_size, sent):
+        """CS104_SlaveRawMessageHandler, on a lib60870 thread."""
+        if len(self._pending) >= self.max_pending:
+            CAPTURE_DROPPED.inc()
+            return
+        connection_id = cast(connection, c_void_p).value
+        peer = self._peers.get(connection_id)
+        if peer is None:
+            peer = self._peers[connection_id] = peer_address(connection)
+        self._pending.append((time.time_ns(), connection_id, peer, bool(sent), string_at(msg, msg_size)))
+
+    def forget(self, connection_id):
+        """Drop the cached peer and sequence numbers of a closed connection, its id may be reused."""
+        self._peers.pop(connection_id, None)
+        # APDUs of the connection may still be pending, the writer drops the sequence numbers after them
+        self._pending.append((None, connection_id, None, None, None))
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="apdu-capture", daemon=True)
+        self._thread.start()
+        logger.info("Capturing APDUs to %s (%s files of %s bytes)", self.path, self.max_files, self.max_bytes)
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while self._running:
+            time.sleep(WRITE_INTERVAL)
+            self._drain()
+        self._drain()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _drain(self):
+        pending = self._pending
+        count = 0
+        while True:
+            try:
+                record = pending.popleft()
+            except IndexError:
+                break
+            if record[0] is None:
+                self._forget_sequences(record[1])
+                continue
+            self._write(*record)
+            count += 1
+        if count:
+            self._file.flush()
+            CAPTURE_APDUS.inc(amount=count)
+
+    def _forget_sequences(self, connection_id):
+        self._sequences.pop((connection_id, True), None)
+        self._sequences.pop((connection_id, False), None)
+
+    def _write(self, timestamp_ns, connection_id, peer, sent, apdu):
+        peer_ip, peer_port = peer
+        key = (connection_id, sent)
+        seq = self._sequences.get(key, 1)
+        self._sequences[key] = (seq + len(apdu)) & 0xFFFFFFFF
+        ack = self._sequences.get((connection_id, not sent), 1)
+        if sent:
+            packet = self._ip_tcp(self.local_ip, peer_ip, self.local_port, peer_port, seq, ack, apdu)
+        else:
+            packet = self._ip_tcp(peer_ip, self.local_ip, peer_port, self.local_port, seq, ack, apdu)
+
+        padding = -len(packet) % 4
+        length = 32 + len(packet) + padding
+        block = struct.pack('<IIIIIII', 6, length, 0, timestamp_ns >> 32, timestamp_ns & 0xFFFFFFFF, len(packet), len(packet))
+        block += packet + b'\0' * padding + struct.pack('<I', length)
+
+        if self._file is None or self._file_bytes + len(block) > self.max_bytes:
+            self._rotate()
+        self._file.write(block)
+        self._file_bytes += len(block)
+
+    def _ip_tcp(self, src_ip, dst_ip, src_port, dst_port, seq, ack, payload):
+        self._ident = (self._ident + 1) & 0xFFFF
+        header = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 40 + len(payload), self._ident, 0x4000, 64, socket.IPPROTO_TCP, 0, src_ip, dst_ip)
+        header = header[:10] + struct.pack('!H', ip_checksum(header)) + header[12:]
+        tcp = struct.pack('!HHIIBBHHH', src_port, dst_port, seq, ack, 5 << 4, TCP_PSH_ACK, 0xFFFF, 0, 0)
+        return header + tcp + payload
+
+    def _rotate(self):
+        if self._file is not None:
+            self._file.close()
+        self._file_index = (self._file_index + 1) % self.max_files
+        stem, ext = os.path.splitext(self.path)
+        self._file = open(f"{stem}.{self._file_index}{ext or '.pcapng'}", 'wb')
+        header = section_header() + interface_description()
+        self._file.write(header)
+        self._file_bytes = len(header)
+
+
+def section_header():
+    return struct.pack('<IIIHHqI', 0x0A0D0D0A, 28, SHB_MAGIC, 1, 0, -1, 28)
+
+
+def interface_description():
+    # if_tsresol = 9: timestamps are in nanoseconds
+    options = struct.pack('<HHB3x', 9, 1, 9) + struct.pack('<HH', 0, 0)
+    length = 20 + len(options)
+    return struct.pack('<IIHHI', 1, length, LINKTYPE_RAW, 0, 0) + options + struct.pack('<I', length)
+
+
+def ip_checksum(header):
+    total = sum(struct.unpack(f'!{len(header) // 2}H', header))
+    total = (total & 0xFFFF) + (total >> 16)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def ip_bytes(address):
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return bytes(4)
+    # The synthetic headers are IPv4, other peers show up as 0.0.0.0
+    return ip.packed if ip.version == 4 else bytes(4)
+
+
+def peer_address(connection):
+    """(IPv4 bytes, port) of a master connection's peer."""
+    buffer = create_string_buffer(64)
+    IMasterConnection_getPeerAddress(connection, buffer, len(buffer))
+    host, _, port = buffer.value.decode(errors='replace').rpartition(':')
+    try:
+        port = int(port)
+    except ValueError:
+        port = 0
+    return ip_bytes(host.strip('[]')), port
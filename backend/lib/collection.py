@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+from collections.abc import MutableMapping
+
+
+class Collection(MutableMapping):
+    """
+    Id to item map of one frontend collection with a cached payload.
+
+    Every mutation bumps `version`: adding, removing or reordering items,
+    and assigning a field of an item the collection holds (the items call
+    touch, see data_models.TrackedModel). The items are dumped once per
+    version, so the clients connecting in a burst and the emits of one tick
+    share a single payload instead of each re-running model_dump over the
+    whole collection.
+
+    From `columnar_min_items` items on (0 disables it), payload() is sent
+    columnar: {"fields": [name, ...], "columns": [[value, ...], ...]}, one
+    column per field, so the field names go over the wire once instead of
+    once per item.
+    """
+
+    def __init__(self, name, items=None, columnar_min_items=0):
+        self.name = name
+        self.columnar_min_items = columnar_min_items
+        self.version = 0
+        self._items = {}
+        self._rows = None
+        self._rows_version = -1
+        self._columns = None
+        self._columns_version = -1
+        if items:
+            self.update(items)
+
+    def touch(self):
+        """Mark the collection changed, dropping the cached payload."""
+        self.version += 1
+
+    def __getitem__(self, item_id):
+        return self._items[item_id]
+
+    def __contains__(self, item_id):
+        return item_id in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __setitem__(self, item_id, item):
+        previous = self._items.get(item_id)
+        if previous is not None and previous is not item:
+            previous._collection = None
+        item._collection = self
+        self._items[item_id] = item
+        self.version += 1
+
+    def __delitem__(self, item_id):
+        item = self._items.pop(item_id)
+        item._collection = None
+        self.version += 1
+
+    def keys(self):
+        return self._items.keys()
+
+    def items(self):
+        return self._items.items()
+
+    def values(self):
+        return self._items.values()
+
+    def clear(self):
+        for item in self._items.values():
+            item._collection = None
+        self._items.clear()
+        self.version += 1
+
+    def reorder(self, item_ids):
+        """Keep only the listed items, in the listed order."""
+        ordered = {item_id: self._items[item_id] for item_id in item_ids if item_id in self._items}
+        for item_id, item in self._items.items():
+            if item_id not in ordered:
+                item._collection = None
+        self._items = ordered
+        self.version += 1
+
+    def rows(self):
+        """
+        The items as a list of model_dump dicts, rebuilt only when the
+        collection changed since the last call. Shared between callers:
+        copy it before modifying it.
+        """
+        version = self.version
+        if self._rows_version != version:
+            # Tag with the version read before dumping, so a change made while dumping forces a rebuild
+            self._rows = [item.model_dump() for item in self._items.values()]
+            self._rows_version = version
+        return self._rows
+
+    def columns(self):
+        """The items in the columnar layout, cached like rows()."""
+        version = self.version
+        if self._columns_version != version:
+            rows = self.rows()
+            fields = list(rows[0]) if rows else []
+            self._columns = {
+                "fields": fields,
+                "columns": [list(column) for column in zip(*(row.values() for row in rows))] if rows else [],
+            }
+            self._columns_version = version
+        return self._columns
+
+    def payload(self):
+        """The collection as sent to the Socket.IO clients: columns() when large enough, else rows()."""
+        if self.columnar_min_items and len(self._items) >= self.columnar_min_items:
+            return self.columns()
+        return self.rows()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+import logging
+
+from .breaker import POSITION_CLOSED
+from .lib60870 import MeasuredValueShort
+
+logger = logging.getLogger(__name__)
+
+
+class Links:
+    """What one telemetry depends on: breakers in series and an optional tap changer."""
+    __slots__ = ('breakers', 'tap_changer')
+
+    def __init__(self, breakers, tap_changer):
+        self.breakers = breakers
+        self.tap_changer = tap_changer
+
+
+class DependencyGraph:
+    """
+    Telemetries coupled to breaker and tap changer state.
+
+    A telemetry with `breaker_ids` reads 0 unless every listed breaker is
+    closed, like the current of a feeder behind them. One with a
+    `tap_changer_id` is offset by `tap_step` per tap position above
+    `tap_neutral`, like a regulated voltage. The simulated or manual value
+    of the telemetry is kept as its base, and the coupling is applied on
+    top of it.
+
+    The graph is indexed by the status IOAs of the breakers and the value
+    IOA of the tap changers. The IEC server calls on_change for every point
+    change, and only the telemetries behind a changed source IOA are
+    recomputed. Call rebuild after items or their links change.
+    """
+
+    def __init__(self, server, telemetries, circuit_breakers, tap_changers, mark):
+        self.server = server
+        self.telemetries = telemetries
+        self.circuit_breakers = circuit_breakers
+        self.tap_changers = tap_changers
+        self.mark = mark               # called with 'telemetries' when one changed
+        self._links = {}               # telemetry id -> Links
+        self._by_ioa = {}              # source IOA -> [telemetry id, ...]
+        self._base = {}                # telemetry id -> value before coupling
+
+    def __len__(self):
+        return len(self._links)
+
+    def rebuild(self):
+        """Re-index the links of every telemetry and bring the coupled ones up to date."""
+        links = {}
+        by_ioa = {}
+        for item_id, item in self.telemetries.items():
+            breakers = [self.circuit_breakers[cb_id] for cb_id in item.breaker_ids if cb_id in self.circuit_breakers]
+            tap_changer = self.tap_changers.get(item.tap_changer_id) if item.tap_changer_id else None
+            if not breakers and tap_changer is None:
+                continue
+            links[item_id] = Links(breakers, tap_changer)
+            sources = []
+            for cb in breakers:
+                sources += [cb.ioa_cb_status, cb.ioa_cb_status_close]
+                if cb.is_dp_mode and cb.ioa_cb_status_dp:
+                    sources.append(cb.ioa_cb_status_dp)
+            if tap_changer is not None:
+                sources.append(tap_changer.ioa_value)
+            for ioa in set(sources):
+                by_ioa.setdefault(ioa, []).append(item_id)
+        # Keep the bases of telemetries that stay coupled, a forced 0 must not become the base
+        self._base = {item_id: self._base.get(item_id, self.telemetries[item_id].value) for item_id in links}
+        self._links = links
+        self._by_ioa = by_ioa
+        for item_id in links:
+            self._recompute(item_id)
+        logger.debug("Dependency graph: %s coupled telemetries on %s source IOAs", len(links), len(by_ioa))
+
+    def apply(self, item, base):
+        """
+        The value of telemetry `item` for a new simulated or manual value
+        `base`, which is kept for later recomputation.
+        """
+        if item.id not in self._links:
+            return base
+        self._base[item.id] = base
+        return self._effective(item, base)
+
+    def base(self, item):
+        """The value of telemetry `item` before coupling."""
+        return self._base.get(item.id, item.value)
+
+    def on_change(self, ioa):
+        """Called by the IEC server when the value of `ioa` changed."""
+        dependents = self._by_ioa.get(ioa)
+        if dependents is None:
+            return
+        for item_id in dependents:
+            self._recompute(item_id)
+
+    def _effective(self, item, base):
+        links = self._links[item.id]
+        position_of = self.server.breaker_operations.position_of
+        for cb in links.breakers:
+            if position_of(cb) != POSITION_CLOSED:
+                return 0.0
+        if links.tap_changer is not None:
+            position = self.server.ioa_list.get(links.tap_changer.ioa_value, {}).get('data', links.tap_changer.value)
+            base += item.tap_step * (position - item.tap_neutral)
+        # Steps of a decimal tap_step add up to float noise
+        return round(base, 6)
+
+    def _recompute(self, item_id):
+        item = self.telemetries.get(item_id)
+        if item is None:
+            return
+        value = self._effective(item, self._base[item_id])
+        if value == item.value:
+            return
+        item.value = value
+        point = self.server.ioa_list.get(item.ioa)
+        if point is not None:
+            self.server.update_ioa(item.ioa, value if point['type'] == MeasuredValueShort else int(round(value / item.scale_factor)))
+        self.mark('telemetries')
@@ -2,26 +2,76 @@
 import asyncio
 import datetime
 from .lib60870 import *
+from .breaker import BreakerOperations, CommandOrigin, POSITION_OPEN, POSITION_CLOSED
+from .counters import CounterIntegrator, GROUP_GENERAL
+from .metrics import ASDUS_ENQUEUED, ASDU_HANDLER_DURATION, COMMANDS, COMMAND_CALLBACK_DURATION, GI_DURATION
+from .point_table import PointTable
+from .rng import StationRandom
+from .sbo import SelectBeforeOperate
+from .tap_changer import TapChangerOperations, RAISE, LOWER
+from .timer_wheel import TimerWheel
 import time
+import threading
+import itertools
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Quality descriptor flags that can be simulated per point
+QUALITY_FLAGS = {
+    'overflow': IEC60870_QUALITY_OVERFLOW,
+    'blocked': IEC60870_QUALITY_BLOCKED,
+    'substituted': IEC60870_QUALITY_SUBSTITUTED,
+    'non_topical': IEC60870_QUALITY_NON_TOPICAL,
+    'invalid': IEC60870_QUALITY_INVALID,
+}
+
+# Single and double point indications have no overflow bit (SIQ/DIQ)
+POINT_QUALITY_MASK = IEC60870_QUALITY_BLOCKED | IEC60870_QUALITY_SUBSTITUTED | IEC60870_QUALITY_NON_TOPICAL | IEC60870_QUALITY_INVALID
+
+# Monitoring types that carry a quality descriptor
+QUALITY_TYPES = (SinglePointInformation, DoublePointInformation, MeasuredValueScaled, MeasuredValueNormalized, MeasuredValueShort, MeasuredValueShortWithCP56Time2a, IntegratedTotals)
+
+# Types update_ioa reports spontaneously
+SPONTANEOUS_TYPES = (MeasuredValueScaled, SinglePointInformation, DoublePointInformation, MeasuredValueShort)
+
+# Types information_object can build, the points a C_RD is answered for
+READABLE_TYPES = (MeasuredValueScaled, SinglePointInformation, DoublePointInformation, DoubleCommand, MeasuredValueNormalized, MeasuredValueShort)
+
+# Metric label names, resolved through lib60870 once per type ID / COT
+_type_names = {}
+_cot_names = {}
+
+def type_name(type_id):
+    name = _type_names.get(type_id)
+    if name is None:
+        name = _type_names[type_id] = (TypeID_toString(type_id) or b'').decode() or str(type_id)
+    return name
+
+def cot_name(cot):
+    name = _cot_names.get(cot)
+    if name is None:
+        name = _cot_names[cot] = (CS101_CauseOfTransmission_toString(cot) or b'').decode() or str(cot)
+    return name
+
 class IEC60870_5_104_server:
-    def __init__(self, host, port, ioa_list=None, socketio_server=None, circuit_breakers=None, telesignals=None, telemetries=None, tap_changers=None):
+    def __init__(self, host, port, ioa_list=None, socketio_server=None, circuit_breakers=None, telesignals=None, telemetries=None, tap_changers=None, counters=None, server_mode=CS104_MODE_SINGLE_REDUNDANCY_GROUP, capture=None, seed=None, common_address=1):
         self.clockSyncHandler = CS101_ClockSynchronizationHandler(self.clock)
         self.interrogationHandler = CS101_InterrogationHandler(self.GI_h)
+        self.counterInterrogationHandler = CS101_CounterInterrogationHandler(self.CI_h)
         self.asduHandler = CS101_ASDUHandler(self.ASDU_h)
         self.connectionRequestHandler = CS104_ConnectionRequestHandler(self.connection_request)
         self.connectionEventHandler = CS104_ConnectionEventHandler(self.connection_event)
         self.readEventHandler = CS101_ReadHandler(self.read)
         self.socketio = socketio_server
+        # Common address (CA) of the ASDUs this station sends
+        self.common_address = common_address
 
         self.slave = CS104_Slave_create(100, 100)
         CS104_Slave_setLocalAddress(self.slave, host)
         CS104_Slave_setLocalPort(self.slave, port)
-        #   /* Set mode to a single redundancy group
-        CS104_Slave_setServerMode(self.slave, CS104_MODE_SINGLE_REDUNDANCY_GROUP)
+        #   /* Set mode to a single redundancy group (only one active master), or one group per connection
+        CS104_Slave_setServerMode(self.slave, server_mode)
 
         #/* get the connection parameters - we need them to create correct ASDUs */
         self.alParams = CS104_Slave_getAppLayerParameters(self.slave)
@@ -32,6 +82,9 @@ class IEC60870_5_104_server:
         #/* set the callback handler for the interrogation command */
         CS104_Slave_setInterrogationHandler(self.slave, self.interrogationHandler, None)
 
+        #/* set the callback handler for the counter interrogation command */
+        CS104_Slave_setCounterInterrogationHandler(self.slave, self.counterInterrogationHandler, None)
+
         #/* set handler for other message types */
         CS104_Slave_setASDUHandler(self.slave, self.asduHandler, None)
 
@@ -43,16 +96,58 @@ class IEC60870_5_104_server:
 
         CS104_Slave_setReadHandler(self.slave, self.readEventHandler, None)
 
-        self.ioa_list = ioa_list if ioa_list is not None else {}
+        # Optional raw APDU capture, see capture.ApduCapture
+        self.capture = capture
+        if capture is not None:
+            self.rawMessageHandler = CS104_SlaveRawMessageHandler(capture.raw_message)
+            CS104_Slave_setRawMessageHandler(self.slave, self.rawMessageHandler, None)
+
+        self.ioa_list = ioa_list if isinstance(ioa_list, PointTable) else PointTable(ioa_list)
         
         # Store references to circuit_breakers, telesignals, and telemetries
         self.circuit_breakers = circuit_breakers
         self.telesignals = telesignals
         self.telemetries = telemetries
         self.tap_changers = tap_changers
+        self.counters = counters
+
+        # Per-point random streams of the simulation, reproducible with the same seed
+        self.random = StationRandom(seed)
+
+        # Integrated totals state, reported through counter interrogation
+        self.counter_integrator = CounterIntegrator()
+
+        # Shared timer wheel for select timeouts and other simulation timers
+        self.timer_wheel = TimerWheel()
+        self.sbo = SelectBeforeOperate(self.timer_wheel)
+        self.breaker_operations = BreakerOperations(self, self.timer_wheel)
+        self.tap_changer_operations = TapChangerOperations(self, self.timer_wheel)
+
+        # Connections that can still receive ACT_TERM, guarded against concurrent close.
+        # lib60870 reuses the memory of a closed connection, so each one gets a serial when it opens
+        self.open_connections = set()
+        self.connection_serials = {}
+        self.connection_serial = itertools.count(1)
+        self.connections_lock = threading.Lock()
+        # Command being executed by the current lib60870 thread, read by update_ioa_from_server
+        self.command_origin = threading.local()
+        # Optional sink fed every point change with record(ioa, value) and record_quality(ioa, quality):
+        # a recording.ScenarioRecorder, or the delta buffer of a station running in a shard worker
+        self.recorder = None
+        # Optional dependencies.DependencyGraph, told about every point change
+        self.dependencies = None
+        # Optional shared_points.SharedPointTable, publishing every point change to other processes
+        self.shared_points = None
     
     def start(self):
         logger.info("Starting 104 server")
+        try:
+            # Commands received on lib60870 threads are applied on this loop
+            self.ioa_list.bind(asyncio.get_running_loop())
+        except RuntimeError:
+            logger.warning("No running event loop, commands are applied on the lib60870 threads")
+        if self.capture is not None:
+            self.capture.start()
         CS104_Slave_start(self.slave)
 
         if CS104_Slave_isRunning(self.slave) == False:
@@ -62,29 +157,58 @@ class IEC60870_5_104_server:
     def stop(self):
         CS104_Slave_stop(self.slave)
         CS104_Slave_destroy(self.slave)
+        if self.capture is not None:
+            self.capture.stop()
     
     def connection_request(self, param, address):
-        logger.info(f"New connection request from {address}")
+        logger.info("New connection request from %s", address)
         return True
 
     def connection_event(self, param, connection, event):
-        logger.info(f"Connection event {event} for {connection}")
+        logger.info("Connection event %s for %s", event, connection)
         if (event == CS104_CON_EVENT_CONNECTION_OPENED):
-            logger.info(f"Connection opened {connection}")
+            logger.info("Connection opened %s", connection)
+            with self.connections_lock:
+                serial = next(self.connection_serial)
+                self.connection_serials[cast(connection, c_void_p).value] = serial
+                self.open_connections.add(serial)
         elif (event == CS104_CON_EVENT_CONNECTION_CLOSED):
-            logger.info(f"Connection closed {connection}")
+            logger.info("Connection closed %s", connection)
+            with self.connections_lock:
+                serial = self.connection_serials.pop(cast(connection, c_void_p).value, None)
+                self.open_connections.discard(serial)
+            if serial is not None:
+                self.sbo.cancel_owner(serial)
+                # Operations still run to their end, without an ACT_TERM to the closed connection
+                self.breaker_operations.forget_connection(serial)
+                self.tap_changer_operations.forget_connection(serial)
+            if self.capture is not None:
+                self.capture.forget(cast(connection, c_void_p).value)
         elif (event == CS104_CON_EVENT_ACTIVATED):
-            logger.info(f"Connection activated {connection}")
+            logger.info("Connection activated %s", connection)
         elif (event == CS104_CON_EVENT_DEACTIVATED):
-            logger.info(f"Connection deactivated {connection}")
+            logger.info("Connection deactivated %s", connection)
         
+    def connection_id(self, connection):
+        """Serial of an open connection, None once it has closed."""
+        return self.connection_serials.get(cast(connection, c_void_p).value)
+
+    def sbo_permits(self, ioa, ioa_object, state, is_select, connection):
+        """Run a command through the SBO state machine if the IOA requires select-before-operate."""
+        if not ioa_object.get('sbo', False):
+            return True
+        owner = self.connection_id(connection)
+        if is_select:
+            return self.sbo.select(ioa, state, ioa_object.get('sbo_timeout'), owner)
+        return self.sbo.execute(ioa, state, owner)
+
     def printCP56Time2a(self, time):
-        logger.info("%02i:%02i:%02i %02i/%02i/%04i" % ( CP56Time2a_getHour(time),
+        logger.info("%02i:%02i:%02i %02i/%02i/%04i", CP56Time2a_getHour(time),
                         CP56Time2a_getMinute(time),
                         CP56Time2a_getSecond(time),
                         CP56Time2a_getDayOfMonth(time),
                         CP56Time2a_getMonth(time),
-                        CP56Time2a_getYear(time) + 2000) )
+                        CP56Time2a_getYear(time) + 2000)
 
     def clock(self, param, con, asdu, newTime):
         logger.info("Process time sync command with time")
@@ -96,9 +220,12 @@ class IEC60870_5_104_server:
         return True
 
     def GI_h(self, param, connection, asdu, qoi):
-        logger.info(f"Received interrogation for group {qoi}")
+        logger.info("Received interrogation for group %s", qoi)
 
         if (qoi == 20): #{ /* only handle station interrogation */
+            # Iterate one consistent snapshot, the UI may add or remove points meanwhile
+            points = self.ioa_list.snapshot()
+            started = time.perf_counter()
             try:
                 alParams = IMasterConnection_getApplicationLayerParameters(connection)
                 IMasterConnection_sendACT_CON(connection, asdu, False)
@@ -106,119 +233,119 @@ class IEC60870_5_104_server:
                 #* The CS101 specification only allows information objects without timestamp in GI responses */
                 # measuredvalue
                 type = MeasuredValueScaled
-                newAsdu = CS101_ASDU_create(alParams, False, CS101_COT_INTERROGATED_BY_STATION, 0, 1, False, False)
+                newAsdu = CS101_ASDU_create(alParams, False, CS101_COT_INTERROGATED_BY_STATION, 0, self.common_address, False, False)
                 io = None
-                for ioa in self.ioa_list:
-                    if self.ioa_list[ioa]['type'] == type:
+                for ioa, point in points.items():
+                    if point['type'] == type:
                         if io == None:
-                            io = cast( MeasuredValueScaled_create(None,ioa, self.ioa_list[ioa]['data'], IEC60870_QUALITY_GOOD), InformationObject) #
+                            io = cast( MeasuredValueScaled_create(None,ioa, point['data'], self.point_quality(point)), InformationObject) #
                             CS101_ASDU_addInformationObject(newAsdu, io)
                         else:
-                            CS101_ASDU_addInformationObject(newAsdu, cast( MeasuredValueScaled_create(cast(io,MeasuredValueScaled),ioa,self.ioa_list[ioa]['data'],IEC60870_QUALITY_GOOD), InformationObject) )
+                            CS101_ASDU_addInformationObject(newAsdu, cast( MeasuredValueScaled_create(cast(io,MeasuredValueScaled),ioa,point['data'],self.point_quality(point)), InformationObject) )
                 if io != None:
                     InformationObject_destroy(io)
                     IMasterConnection_sendASDU(connection, newAsdu)
                 CS101_ASDU_destroy(newAsdu)
             except Exception as E:
-                logger.info(f"Error {E}")
+                logger.info("Error %s", E)
                 
             try:
                 #singlepoint
                 type = SinglePointInformation
-                newAsdu = CS101_ASDU_create(alParams, False, CS101_COT_INTERROGATED_BY_STATION, 0, 1, False, False)
+                newAsdu = CS101_ASDU_create(alParams, False, CS101_COT_INTERROGATED_BY_STATION, 0, self.common_address, False, False)
                 io = None
-                for ioa in self.ioa_list:
-                    if self.ioa_list[ioa]['type'] == type:
+                for ioa, point in points.items():
+                    if point['type'] == type:
                         if io == None:
-                            io = cast( SinglePointInformation_create(None, ioa, self.ioa_list[ioa]['data'], IEC60870_QUALITY_GOOD), InformationObject)
+                            io = cast( SinglePointInformation_create(None, ioa, point['data'], self.point_quality(point)), InformationObject)
                             CS101_ASDU_addInformationObject(newAsdu, io)
                         else:
-                            CS101_ASDU_addInformationObject(newAsdu, cast( SinglePointInformation_create(cast(io,SinglePointInformation), ioa,self.ioa_list[ioa]['data'],IEC60870_QUALITY_GOOD), InformationObject) )
+                            CS101_ASDU_addInformationObject(newAsdu, cast( SinglePointInformation_create(cast(io,SinglePointInformation), ioa,point['data'],self.point_quality(point)), InformationObject) )
                 if io != None:
                     InformationObject_destroy(io)
                     IMasterConnection_sendASDU(connection, newAsdu)
                 CS101_ASDU_destroy(newAsdu)
             except Exception as E:
-                logger.info(f"Error {E}")
+                logger.info("Error %s", E)
                 
             try:
                 type = DoublePointInformation
-                newAsdu = CS101_ASDU_create(alParams, False, CS101_COT_INTERROGATED_BY_STATION, 0, 1, False, False)
+                newAsdu = CS101_ASDU_create(alParams, False, CS101_COT_INTERROGATED_BY_STATION, 0, self.common_address, False, False)
                 io = None
-                for ioa in self.ioa_list:
-                    if self.ioa_list[ioa]['type'] == type:
+                for ioa, point in points.items():
+                    if point['type'] == type:
                         if io == None:
-                            io = cast( DoublePointInformation_create(None, ioa, self.ioa_list[ioa]['data'], IEC60870_QUALITY_GOOD), InformationObject)
+                            io = cast( DoublePointInformation_create(None, ioa, point['data'], self.point_quality(point)), InformationObject)
                             CS101_ASDU_addInformationObject(newAsdu, io)
                         else:
-                            CS101_ASDU_addInformationObject(newAsdu, cast( DoublePointInformation_create(cast(io,DoublePointInformation), ioa,self.ioa_list[ioa]['data'],IEC60870_QUALITY_GOOD), InformationObject) )
+                            CS101_ASDU_addInformationObject(newAsdu, cast( DoublePointInformation_create(cast(io,DoublePointInformation), ioa,point['data'],self.point_quality(point)), InformationObject) )
                 if io != None:
                     InformationObject_destroy(io)
                     IMasterConnection_sendASDU(connection, newAsdu)
                 CS101_ASDU_destroy(newAsdu)
             except Exception as E:
-                logger.info(f"Error {E}")
+                logger.info("Error %s", E)
                 
             try:
                 # Add DoubleCommand handling for tap changer command IOAs
                 type = DoubleCommand
-                newAsdu = CS101_ASDU_create(alParams, False, CS101_COT_INTERROGATED_BY_STATION, 0, 1, False, False)
+                newAsdu = CS101_ASDU_create(alParams, False, CS101_COT_INTERROGATED_BY_STATION, 0, self.common_address, False, False)
                 io = None
-                for ioa in self.ioa_list:
-                    if self.ioa_list[ioa]['type'] == type:
+                for ioa, point in points.items():
+                    if point['type'] == type:
                         if io == None:
-                            io = cast(DoubleCommand_create(None, ioa, self.ioa_list[ioa]['data'], False, 0), InformationObject)
+                            io = cast(DoubleCommand_create(None, ioa, point['data'], False, 0), InformationObject)
                             CS101_ASDU_addInformationObject(newAsdu, io)
                         else:
-                            CS101_ASDU_addInformationObject(newAsdu, cast(DoubleCommand_create(cast(io, DoubleCommand), ioa, self.ioa_list[ioa]['data'], False, 0), InformationObject))
+                            CS101_ASDU_addInformationObject(newAsdu, cast(DoubleCommand_create(cast(io, DoubleCommand), ioa, point['data'], False, 0), InformationObject))
                 if io != None:
                     InformationObject_destroy(io)
                     IMasterConnection_sendASDU(connection, newAsdu)
                 CS101_ASDU_destroy(newAsdu)
             except Exception as E:
-                logger.info(f"Error {E}")
+                logger.info("Error %s", E)
                 
             try:
                 type = MeasuredValueNormalized
-                newAsdu = CS101_ASDU_create(alParams, False, CS101_COT_INTERROGATED_BY_STATION, 0, 1, False, False)
+                newAsdu = CS101_ASDU_create(alParams, False, CS101_COT_INTERROGATED_BY_STATION, 0, self.common_address, False, False)
                 io = None
-                for ioa in self.ioa_list:
-                    if self.ioa_list[ioa]['type'] == type:
+                for ioa, point in points.items():
+                    if point['type'] == type:
                         if io == None:
-                            io = cast( MeasuredValueNormalized_create(None, ioa, self.ioa_list[ioa]['data'], IEC60870_QUALITY_GOOD), InformationObject)
+                            io = cast( MeasuredValueNormalized_create(None, ioa, point['data'], self.point_quality(point)), InformationObject)
                             CS101_ASDU_addInformationObject(newAsdu, io)
                         else:
-                            CS101_ASDU_addInformationObject(newAsdu, cast( MeasuredValueNormalized_create(cast(io,MeasuredValueNormalized), ioa,self.ioa_list[ioa]['data'],IEC60870_QUALITY_GOOD), InformationObject) )
+                            CS101_ASDU_addInformationObject(newAsdu, cast( MeasuredValueNormalized_create(cast(io,MeasuredValueNormalized), ioa,point['data'],self.point_quality(point)), InformationObject) )
                 if io != None:
                     InformationObject_destroy(io)
                     IMasterConnection_sendASDU(connection, newAsdu)
                 CS101_ASDU_destroy(newAsdu)
             except Exception as E:
-                logger.info(f"Error {E}")
+                logger.info("Error %s", E)
                 
             try:
                 type = MeasuredValueShort
-                newAsdu = CS101_ASDU_create(alParams, False, CS101_COT_INTERROGATED_BY_STATION, 0, 1, False, False)
+                newAsdu = CS101_ASDU_create(alParams, False, CS101_COT_INTERROGATED_BY_STATION, 0, self.common_address, False, False)
                 io = None
-                for ioa in self.ioa_list:
-                    if self.ioa_list[ioa]['type'] == type:
+                for ioa, point in points.items():
+                    if point['type'] == type:
                         if io == None:
-                            io = cast( MeasuredValueShort_create(None, ioa, self.ioa_list[ioa]['data'], IEC60870_QUALITY_GOOD), InformationObject)
+                            io = cast( MeasuredValueShort_create(None, ioa, point['data'], self.point_quality(point)), InformationObject)
                             CS101_ASDU_addInformationObject(newAsdu, io)
                         else:
-                            CS101_ASDU_addInformationObject(newAsdu, cast( MeasuredValueShort_create(cast(io,MeasuredValueShort), ioa,self.ioa_list[ioa]['data'],IEC60870_QUALITY_GOOD), InformationObject) )
+                            CS101_ASDU_addInformationObject(newAsdu, cast( MeasuredValueShort_create(cast(io,MeasuredValueShort), ioa,point['data'],self.point_quality(point)), InformationObject) )
                 if io != None:
                     InformationObject_destroy(io)
                     IMasterConnection_sendASDU(connection, newAsdu)
                 CS101_ASDU_destroy(newAsdu)
             except Exception as E:
-                logger.info(f"Error {E}")
+                logger.info("Error %s", E)
                 
             try:
                 
                 #MeasuredValueShortWithCP56Time2a
                 type = MeasuredValueShortWithCP56Time2a
-                newAsdu = CS101_ASDU_create(alParams, False, CS101_COT_INTERROGATED_BY_STATION, 0, 1, False, False)
+                newAsdu = CS101_ASDU_create(alParams, False, CS101_COT_INTERROGATED_BY_STATION, 0, self.common_address, False, False)
                 
                 # Dapatkan waktu saat ini
                 now = datetime.datetime.now()
@@ -242,13 +369,13 @@ class IEC60870_5_104_server:
                 logger.info("Year: %d, Month: %d, Day: %d, Hour: %d, Minute: %d, Second: %d, MS: %d", now.year, now.month, now.day, now.hour, now.minute, now.second, now.microsecond)
                 # timestamp.encodedValue = (1, 2, 3, 4, 5, 6, 7)
                 
-                for ioa in self.ioa_list:
-                    if self.ioa_list[ioa]['type'] == type:
+                for ioa, point in points.items():
+                    if point['type'] == type:
                         if io == None:
-                            io = cast( MeasuredValueShortWithCP56Time2a_create(None, ioa, self.ioa_list[ioa]['data'], IEC60870_QUALITY_GOOD, timestamp), InformationObject)
+                            io = cast( MeasuredValueShortWithCP56Time2a_create(None, ioa, point['data'], self.point_quality(point), timestamp), InformationObject)
                             CS101_ASDU_addInformationObject(newAsdu, io)
                         else:
-                            CS101_ASDU_addInformationObject(newAsdu, cast( MeasuredValueShortWithCP56Time2a_create(cast(io,MeasuredValueShortWithCP56Time2a), ioa, self.ioa_list[ioa]['data'],IEC60870_QUALITY_GOOD, timestamp), InformationObject) )
+                            CS101_ASDU_addInformationObject(newAsdu, cast( MeasuredValueShortWithCP56Time2a_create(cast(io,MeasuredValueShortWithCP56Time2a), ioa, point['data'],self.point_quality(point), timestamp), InformationObject) )
                 if io != None:
                     InformationObject_destroy(io)
                     IMasterConnection_sendASDU(connection, newAsdu)
@@ -256,30 +383,121 @@ class IEC60870_5_104_server:
 
                 IMasterConnection_sendACT_TERM(connection, asdu)
             except Exception as E:
-                logger.info(f"Error {E}")
+                logger.info("Error %s", E)
+            GI_DURATION.observe(time.perf_counter() - started)
         else:
             IMasterConnection_sendACT_CON(connection, asdu, True)
 
+    def send_packed(self, connection, cot, is_sequence, objects):
+        """
+        Send information objects packed into as few ASDUs as possible.
+
+        `objects` yields (ioa, create) pairs sorted by IOA, where create(ioa)
+        returns a new InformationObject or None to skip the IOA. A new ASDU is started whenever the
+        current one is full or, for sequence ASDUs, the next IOA is not
+        consecutive. With connection None the ASDUs go to the event queue.
+        """
+        alParams = IMasterConnection_getApplicationLayerParameters(connection) if connection else self.alParams
+        newAsdu = None
+        sent = 0
+        for ioa, create in objects:
+            io = create(ioa)
+            if io is None:
+                continue
+            if newAsdu is None or not CS101_ASDU_addInformationObject(newAsdu, io):
+                if newAsdu is not None:
+                    self.send_asdu(connection, newAsdu)
+                    CS101_ASDU_destroy(newAsdu)
+                    sent += 1
+                newAsdu = CS101_ASDU_create(alParams, is_sequence, cot, 0, self.common_address, False, False)
+                CS101_ASDU_addInformationObject(newAsdu, io)
+            InformationObject_destroy(io)
+        if newAsdu is not None:
+            self.send_asdu(connection, newAsdu)
+            CS101_ASDU_destroy(newAsdu)
+            sent += 1
+        return sent
+
+    def send_asdu(self, connection, asdu):
+        if connection:
+            IMasterConnection_sendASDU(connection, asdu)
+        else:
+            self.enqueue_asdu(asdu)
+
+    def enqueue_asdu(self, asdu):
+        #/* Add ASDU to slave event queue - don't release the ASDU afterwards!
+        CS104_Slave_enqueueASDU(self.slave, asdu)
+        ASDUS_ENQUEUED.inc(type_name(CS101_ASDU_getTypeID(asdu)))
+
+    def counter_objects(self, readings):
+        timestamp = struct_sCP56Time2a()
+        CP56Time2a_setFromMsTimestamp(timestamp, Hal_getTimeInMs())
+        for ioa, value, sequence, timestamped in readings:
+            bcr = struct_sBinaryCounterReading()
+            point = self.ioa_list.get(ioa)
+            invalid = point is not None and self.point_quality(point) & IEC60870_QUALITY_INVALID != 0
+            BinaryCounterReading_create(bcr, value, sequence, False, False, invalid)
+            if timestamped:
+                yield ioa, lambda ioa, bcr=bcr: cast(IntegratedTotalsWithCP56Time2a_create(None, ioa, bcr, timestamp), InformationObject)
+            else:
+                yield ioa, lambda ioa, bcr=bcr: cast(IntegratedTotals_create(None, ioa, bcr), InformationObject)
+
+    def CI_h(self, param, connection, asdu, qcc):
+        rqt = qcc & 0x3f
+        frz = qcc & 0xc0
+        logger.info("Received counter interrogation request %s freeze %s", rqt, frz)
+
+        if rqt < IEC60870_QCC_RQT_GROUP_1 or rqt > IEC60870_QCC_RQT_GENERAL:
+            IMasterConnection_sendACT_CON(connection, asdu, True)
+            return True
+
+        group = GROUP_GENERAL if rqt == IEC60870_QCC_RQT_GENERAL else rqt
+        IMasterConnection_sendACT_CON(connection, asdu, False)
+        try:
+            if frz == IEC60870_QCC_FRZ_READ:
+                cot = CS101_COT_REQUESTED_BY_GENERAL_COUNTER + (0 if group == GROUP_GENERAL else group)
+                # Timestamped and plain counters are different type IDs, so they never share an ASDU
+                readings = self.counter_integrator.read(group)
+                for timestamped in (False, True):
+                    self.send_packed(connection, cot, True, self.counter_objects(r for r in readings if r[3] == timestamped))
+            elif frz == IEC60870_QCC_FRZ_FREEZE_WITHOUT_RESET:
+                self.counter_integrator.freeze(group)
+            elif frz == IEC60870_QCC_FRZ_FREEZE_WITH_RESET:
+                self.counter_integrator.freeze(group, reset=True)
+            elif frz == IEC60870_QCC_FRZ_COUNTER_RESET:
+                self.counter_integrator.reset(group)
+        except Exception as E:
+            logger.info("Error %s", E)
+
+        IMasterConnection_sendACT_TERM(connection, asdu)
+        return True
+
     def ASDU_h(self, param, connection, asdu):
-        logger.info("ASDU received")
+        logger.debug("ASDU received")
+        started = time.perf_counter()
         cot = CS101_ASDU_getCOT(asdu)
         if cot == CS101_COT_ACTIVATION:
             io = CS101_ASDU_getElement(asdu, 0)
             ioa = InformationObject_getObjectAddress(io)
-            if not ioa in self.ioa_list:
+            ioa_object = self.ioa_list.get(ioa)
+            if ioa_object is None:
                 logger.info("could not find IOA")
                 CS101_ASDU_setCOT(asdu, CS101_COT_UNKNOWN_IOA)
             else:
-                ioa_object = self.ioa_list[ioa]
                 if (CS101_ASDU_getTypeID(asdu) == C_SC_NA_1):
-                    logger.info("Received single command")
+                    logger.debug("Received single command")
                     if ioa_object['type'] == SingleCommand:
                         sc = cast( io, SingleCommand)
+                        state = SingleCommand_getState(sc)
+                        is_select = SingleCommand_isSelect(sc)
                         
-                        logger.info(f"IOA: {InformationObject_getObjectAddress(io)} switch to {SingleCommand_getState(sc)}, select:{SingleCommand_isSelect(sc)}")
-                        ioa_object['data'] = SingleCommand_getState(sc)
-                        if self.ioa_list[ioa]['callback'] != None:
-                            self.ioa_list[ioa]['callback'](ioa,ioa_object, self, SingleCommand_isSelect(sc))
+                        logger.info("IOA: %s switch to %s, select:%s", InformationObject_getObjectAddress(io), state, is_select)
+                        if self.sbo_permits(ioa, ioa_object, state, is_select, connection):
+                            if not is_select:
+                                origin = CommandOrigin(connection, self.connection_id(connection), CS101_ASDU_getTypeID(asdu), CS101_ASDU_getCA(asdu), ioa, state)
+                                self.ioa_list.submit(self.execute_command, ioa, state, origin)
+                        else:
+                            CS101_ASDU_setNegative(asdu, True)
 
                         CS101_ASDU_setCOT(asdu, CS101_COT_ACTIVATION_CON)
                     else:
@@ -287,13 +505,18 @@ class IEC60870_5_104_server:
                         CS101_ASDU_setCOT(asdu, CS101_COT_UNKNOWN_TYPE_ID)
 
                 if (CS101_ASDU_getTypeID(asdu) == C_DC_NA_1):
-                    logger.info("Received double command")
+                    logger.debug("Received double command")
                     if ioa_object['type'] == DoubleCommand or ioa_object['type'] == DoubleCommandWithCP56Time2a:
                         sc = cast( io, DoubleCommand)
-                        logger.info(f"IOA: {InformationObject_getObjectAddress(io)} switch to {DoubleCommand_getState(sc)}, select:{DoubleCommand_isSelect(sc)}")
-                        ioa_object['data'] = DoubleCommand_getState(sc)
-                        if self.ioa_list[ioa]['callback'] != None:
-                            self.ioa_list[ioa]['callback'](ioa,ioa_object, self, DoubleCommand_isSelect(sc))
+                        state = DoubleCommand_getState(sc)
+                        is_select = DoubleCommand_isSelect(sc)
+                        logger.info("IOA: %s switch to %s, select:%s", InformationObject_getObjectAddress(io), state, is_select)
+                        if self.sbo_permits(ioa, ioa_object, state, is_select, connection):
+                            if not is_select:
+                                origin = CommandOrigin(connection, self.connection_id(connection), CS101_ASDU_getTypeID(asdu), CS101_ASDU_getCA(asdu), ioa, state)
+                                self.ioa_list.submit(self.execute_command, ioa, state, origin)
+                        else:
+                            CS101_ASDU_setNegative(asdu, True)
 
                         CS101_ASDU_setCOT(asdu, CS101_COT_ACTIVATION_CON)
                     else:
@@ -301,87 +524,220 @@ class IEC60870_5_104_server:
                         CS101_ASDU_setCOT(asdu, CS101_COT_UNKNOWN_TYPE_ID)
 
             InformationObject_destroy(io)
+        elif cot == CS101_COT_DEACTIVATION:
+            # Deactivation cancels a pending select
+            io = CS101_ASDU_getElement(asdu, 0)
+            ioa = InformationObject_getObjectAddress(io)
+            if not ioa in self.ioa_list:
+                CS101_ASDU_setCOT(asdu, CS101_COT_UNKNOWN_IOA)
+            else:
+                if not self.sbo.cancel(ioa, self.connection_id(connection)):
+                    CS101_ASDU_setNegative(asdu, True)
+                CS101_ASDU_setCOT(asdu, CS101_COT_DEACTIVATION_CON)
+            InformationObject_destroy(io)
         elif cot == CS101_COT_ACTIVATION_TERMINATION:
             logger.info("GI done")
         else:
-            logger.info("ASDU unknown: " + str(CS101_ASDU_getCOT(asdu)))
+            logger.info("ASDU unknown: %s", CS101_ASDU_getCOT(asdu))
             CS101_ASDU_setCOT(asdu, CS101_COT_UNKNOWN_COT)
 
+        # Count the command by the COT it is answered with
+        type_label = type_name(CS101_ASDU_getTypeID(asdu))
+        COMMANDS.inc(type_label, cot_name(CS101_ASDU_getCOT(asdu)), 'true' if CS101_ASDU_isNegative(asdu) else 'false')
         IMasterConnection_sendASDU(connection, asdu)
+        ASDU_HANDLER_DURATION.observe(time.perf_counter() - started, type_label)
 
         return True
     
+    def execute_command(self, ioa, state, origin=None):
+        """Apply an accepted command to its IOA, on the point table's writer thread."""
+        ioa_object = self.ioa_list.get(ioa)
+        if ioa_object is None:
+            logger.info("IOA %s was removed before its command could be applied", ioa)
+            return
+        ioa_object['data'] = state
+        if self.recorder is not None:
+            self.recorder.record(ioa, state)
+        if self.shared_points is not None:
+            self.shared_points.set(ioa, ioa_object)
+        if ioa_object['callback'] != None:
+            self.command_origin.value = origin
+            started = time.perf_counter()
+            try:
+                ioa_object['callback'](ioa, ioa_object, self, False)
+            finally:
+                self.command_origin.value = None
+                COMMAND_CALLBACK_DURATION.observe(time.perf_counter() - started)
+
     # IOAs Handlers
     def read(self, param, connection, asdu, ioa):
-        if ioa in self.ioa_list:
-            # update data
-            if self.ioa_list[ioa]['callback'] != None:
-                self.ioa_list[ioa]['callback'](ioa,self.ioa_list[ioa], self)
-
-            newAsdu = CS101_ASDU_create(self.alParams, False, CS101_COT_SPONTANEOUS, 0, 1, False, False)
-            if self.ioa_list[ioa]['type'] == MeasuredValueScaled:
-                io = cast(MeasuredValueScaled_create(None, ioa, self.ioa_list[ioa]['data'], IEC60870_QUALITY_GOOD),InformationObject)
-            elif self.ioa_list[ioa]['type'] == SinglePointInformation:
-                io = cast(SinglePointInformation_create(None, ioa, self.ioa_list[ioa]['data'], IEC60870_QUALITY_GOOD),InformationObject)
-            elif self.ioa_list[ioa]['type'] == DoublePointInformation:
-                io = cast(DoublePointInformation_create(None, ioa, self.ioa_list[ioa]['data'], IEC60870_QUALITY_GOOD),InformationObject)
-            elif self.ioa_list[ioa]['type'] == DoubleCommand:
-                io = cast(DoubleCommand_create(None, ioa, self.ioa_list[ioa]['data'], False, 0),InformationObject)
-            elif self.ioa_list[ioa]['type'] == MeasuredValueShort:
-                io = cast(MeasuredValueShort_create(None, ioa, self.ioa_list[ioa]['data'], IEC60870_QUALITY_GOOD),InformationObject)
-            else:
-                logger.error(f"Unsupported IOA type {self.ioa_list[ioa]['type']} for IOA {ioa}")
+        ioa_object = self.ioa_list.get(ioa)
+        if ioa_object is not None:
+            if ioa_object['type'] not in READABLE_TYPES:
+                logger.error("Unsupported IOA type %s for IOA %s", ioa_object['type'], ioa)
                 return False
-            
-            CS101_ASDU_addInformationObject(newAsdu, io)
-            InformationObject_destroy(io)
-            #/* Add ASDU to slave event queue - don't release the ASDU afterwards!
-            CS104_Slave_enqueueASDU(self.slave, newAsdu)
-            CS101_ASDU_destroy(newAsdu)  
+            # The refresh runs on the writer thread, the reply is built after it
+            self.ioa_list.submit(self.reply_read, ioa, ioa_object)
             return True
         return False
 
+    def reply_read(self, ioa, ioa_object):
+        """Refresh a point through its callback and send its value, the answer to a C_RD."""
+        # update data
+        if ioa_object['callback'] != None:
+            ioa_object['callback'](ioa, ioa_object, self)
+
+        io = self.information_object(ioa, ioa_object)
+        newAsdu = CS101_ASDU_create(self.alParams, False, CS101_COT_SPONTANEOUS, 0, self.common_address, False, False)
+        CS101_ASDU_addInformationObject(newAsdu, io)
+        InformationObject_destroy(io)
+        self.enqueue_asdu(newAsdu)
+        CS101_ASDU_destroy(newAsdu)
+
+    def quality(self, ioa):
+        """Quality descriptor of an IOA, masked to the bits its type can carry."""
+        return self.point_quality(self.ioa_list[ioa])
+
+    def point_quality(self, point):
+        quality = point.get('quality', IEC60870_QUALITY_GOOD)
+        if point['type'] == SinglePointInformation or point['type'] == DoublePointInformation:
+            return quality & POINT_QUALITY_MASK
+        return quality
+
+    def information_object(self, ioa, point=None):
+        """Create an InformationObject for the current value of an IOA, or None for unsupported types."""
+        if point is None:
+            point = self.ioa_list.get(ioa)
+            if point is None:
+                return None
+        type = point['type']
+        data = point['data']
+        if type == MeasuredValueScaled:
+            return cast(MeasuredValueScaled_create(None, ioa, data, self.point_quality(point)), InformationObject)
+        elif type == SinglePointInformation:
+            return cast(SinglePointInformation_create(None, ioa, data, self.point_quality(point)), InformationObject)
+        elif type == DoublePointInformation:
+            return cast(DoublePointInformation_create(None, ioa, data, self.point_quality(point)), InformationObject)
+        elif type == DoubleCommand:
+            return cast(DoubleCommand_create(None, ioa, data, False, 0), InformationObject)
+        elif type == MeasuredValueNormalized:
+            return cast(MeasuredValueNormalized_create(None, ioa, data, self.point_quality(point)), InformationObject)
+        elif type == MeasuredValueShort:
+            return cast(MeasuredValueShort_create(None, ioa, data, self.point_quality(point)), InformationObject)
+        return None
+
+    def set_quality(self, ioa_low, ioa_high, quality):
+        """
+        Set the quality descriptor of every point with an IOA in [ioa_low, ioa_high].
+
+        Changed points are reported in one spontaneous burst, packed into as
+        few ASDUs per type as possible, like a bay controller dropping out.
+        Returns the number of points that changed.
+        """
+        changed = {}
+        for ioa, entry in self.ioa_list.items():
+            if ioa_low <= ioa <= ioa_high and entry['type'] in QUALITY_TYPES and entry.get('quality') != quality:
+                entry['quality'] = quality
+                changed.setdefault(entry['type'], []).append(ioa)
+                if self.recorder is not None:
+                    self.recorder.record_quality(ioa, quality)
+                if self.shared_points is not None:
+                    self.shared_points.set(ioa, entry)
+
+        for type, ioas in changed.items():
+            if type == IntegratedTotals:
+                # Counters are only reported on counter interrogation
+                continue
+            ioas.sort()
+            self.send_packed(None, CS101_COT_SPONTANEOUS, False, ((ioa, self.information_object) for ioa in ioas if self.ioa_list.get(ioa, {}).get('event')))
+        return sum(len(ioas) for ioas in changed.values())
+
     def add_ioa(self, ioa, type = MeasuredValueScaled, data = 0, callback = None, event = False):
-        logger.info(f"Adding IOA {ioa} with type {type} and data {data}")
+        logger.info("Adding IOA %s with type %s and data %s", ioa, type, data)
         if not ioa in self.ioa_list:
-            self.ioa_list[int(ioa)] = { 'type': type, 'data': data, 'callback': callback, 'event': event }
+            self.ioa_list[int(ioa)] = { 'type': type, 'data': data, 'callback': callback, 'event': event, 'quality': IEC60870_QUALITY_GOOD }
             return 0
         else:
             return -1
 
     def update_ioa(self, ioa, data):
         value = int(float(data))
+        if ioa in self.ioa_list and self.ioa_list[ioa]['type'] == MeasuredValueShort:
+            # Short floats also change by less than 1
+            value = float(data)
         # logger.info(f"IOA List: {self.ioa_list}")
         if ioa in self.ioa_list and value != self.ioa_list[ioa]['data']: #check if value is different, else ignore
             self.ioa_list[ioa]['data'] = value
             if self.ioa_list[ioa]['event'] == True:
-                newAsdu = CS101_ASDU_create(self.alParams, False, CS101_COT_SPONTANEOUS, 0, 1, False, False)
+                newAsdu = CS101_ASDU_create(self.alParams, False, CS101_COT_SPONTANEOUS, 0, self.common_address, False, False)
                 if self.ioa_list[ioa]['type'] == MeasuredValueScaled:
                     self.ioa_list[ioa]['data'] = int(float(data))
-                    io = cast(MeasuredValueScaled_create(None, ioa, self.ioa_list[ioa]['data'], IEC60870_QUALITY_GOOD),InformationObject)
+                    io = cast(MeasuredValueScaled_create(None, ioa, self.ioa_list[ioa]['data'], self.quality(ioa)),InformationObject)
                 elif self.ioa_list[ioa]['type'] == SinglePointInformation:
                     self.ioa_list[ioa]['data'] = int(float(data))
-                    io = cast(SinglePointInformation_create(None, ioa, self.ioa_list[ioa]['data'], IEC60870_QUALITY_GOOD),InformationObject)
+                    io = cast(SinglePointInformation_create(None, ioa, self.ioa_list[ioa]['data'], self.quality(ioa)),InformationObject)
                 elif self.ioa_list[ioa]['type'] == DoublePointInformation:
-                    logger.info(f"Updating IOA {ioa} with data {data} of type {self.ioa_list[ioa]['type']} and value {value}")
+                    logger.debug("Updating IOA %s with data %s of type %s and value %s", ioa, data, self.ioa_list[ioa]['type'], value)
                     self.ioa_list[ioa]['data'] = int(float(data))
-                    io = cast(DoublePointInformation_create(None, ioa, self.ioa_list[ioa]['data'], IEC60870_QUALITY_GOOD),InformationObject)
+                    io = cast(DoublePointInformation_create(None, ioa, self.ioa_list[ioa]['data'], self.quality(ioa)),InformationObject)
                 elif self.ioa_list[ioa]['type'] == MeasuredValueShort:
                     self.ioa_list[ioa]['data'] = float(data)
-                    io = cast(MeasuredValueShort_create(None, ioa, self.ioa_list[ioa]['data'], IEC60870_QUALITY_GOOD),InformationObject)
+                    io = cast(MeasuredValueShort_create(None, ioa, self.ioa_list[ioa]['data'], self.quality(ioa)),InformationObject)
                 else:
                     return -1
 
                 CS101_ASDU_addInformationObject(newAsdu, io)
                 InformationObject_destroy(io)
-                #/* Add ASDU to slave event queue - don't release the ASDU afterwards!
-                CS104_Slave_enqueueASDU(self.slave, newAsdu)
+                self.enqueue_asdu(newAsdu)
                 CS101_ASDU_destroy(newAsdu)
 
+            if self.recorder is not None:
+                self.recorder.record(ioa, self.ioa_list[ioa]['data'])
+            if self.shared_points is not None:
+                self.shared_points.set(ioa, self.ioa_list[ioa])
+            if self.dependencies is not None:
+                self.dependencies.on_change(ioa)
+
         return 0
+
+    def update_ioas(self, updates):
+        """
+        Apply many (ioa, data) updates, like update_ioa for each in turn.
+
+        The spontaneous reports are packed into as few ASDUs per type as
+        possible instead of one ASDU per change. An IOA updated more than
+        once is reported with each value, in order. Returns the number of
+        points that changed.
+        """
+        changed = {}
+        count = 0
+        for ioa, data in updates:
+            point = self.ioa_list.get(ioa)
+            if point is None:
+                continue
+            value = float(data) if point['type'] == MeasuredValueShort else int(float(data))
+            if value == point['data']:
+                continue
+            point['data'] = value
+            count += 1
+            if self.recorder is not None:
+                self.recorder.record(ioa, point['data'])
+            if self.shared_points is not None:
+                self.shared_points.set(ioa, point)
+            if point['event'] == True and point['type'] in SPONTANEOUS_TYPES:
+                changed.setdefault(point['type'], []).append((ioa, point['data'], point))
+            if self.dependencies is not None:
+                self.dependencies.on_change(ioa)
+
+        for type, reports in changed.items():
+            self.send_packed(None, CS101_COT_SPONTANEOUS, False, (
+                (ioa, lambda ioa, data=data, point=point: self.information_object(ioa, dict(point, data=data)))
+                for ioa, data, point in reports
+            ))
+        return count
     
     def update_ioa_from_server(self, ioa, data):
-        logger.info(f"Called update ioa_from_server with ioa: {ioa} and data: {data}")
+        logger.debug("Called update ioa_from_server with ioa: %s and data: %s", ioa, data)
         value = None        
         if isinstance(data, bool):
             value = 1 if data else 0
@@ -389,68 +745,64 @@ class IEC60870_5_104_server:
             try:
                 value = int(float(data))
             except (ValueError, TypeError):
-                logger.error(f"Could not convert data {data} to integer for IOA {ioa}")
+                logger.error("Could not convert data %s to integer for IOA %s", data, ioa)
                 return -1
         
         self.ioa_list[ioa]['data'] = value
+        if self.recorder is not None:
+            self.recorder.record(ioa, value)
+        if self.shared_points is not None:
+            self.shared_points.set(ioa, self.ioa_list[ioa])
         
         # Handle the mapping between control and status IOAs
         # For circuit breakers, identify if this is a control IOA and update the corresponding status IOA
         if self.circuit_breakers:
+            origin = getattr(self.command_origin, 'value', None)
             for cb in self.circuit_breakers.values():
                 # Check if this is a control open command
                 if ioa == cb.ioa_control_open and value == 1:
-                    logger.info(f"Control open command received for IOA {ioa}, updating status IOAs")
-                    # Update the corresponding status IOAs
+                    logger.info("Control open command received for IOA %s, operating circuit breaker %s", ioa, cb.name)
                     self.update_ioa(cb.ioa_control_open, 1)  # Set control open to 1
-                    self.update_ioa(cb.ioa_cb_status, 1)  # Set status open to 1
-                    self.update_ioa(cb.ioa_cb_status_close, 0)  # Set status close to 0
-                    if cb.is_dp_mode and cb.ioa_cb_status_dp:
-                        self.update_ioa(cb.ioa_cb_status_dp, 1)  # Set double point status to 1 (open)
+                    self.breaker_operations.operate(cb, POSITION_OPEN, origin)
                     break
                 
                 # Check if this is a control close command
                 elif ioa == cb.ioa_control_close and value == 1:
-                    logger.info(f"Control close command received for IOA {ioa}, updating status IOAs")
-                    # Update the corresponding status IOAs
+                    logger.info("Control close command received for IOA %s, operating circuit breaker %s", ioa, cb.name)
                     self.update_ioa(cb.ioa_control_close, 1)
-                    self.update_ioa(cb.ioa_cb_status, 0)  # Set status open to 0
-                    self.update_ioa(cb.ioa_cb_status_close, 1)  # Set status close to 1
-                    if cb.is_dp_mode and cb.ioa_cb_status_dp:
-                        self.update_ioa(cb.ioa_cb_status_dp, 2)  # Set double point status to 2 (closed)
+                    self.breaker_operations.operate(cb, POSITION_CLOSED, origin)
                     break
                 
                 # Check if this is a double point control command
                 elif cb.is_dp_mode and cb.ioa_control_dp and ioa == cb.ioa_control_dp:
-                    logger.info(f"Double point control command received for IOA {ioa} with value {value}")
+                    logger.info("Double point control command received for IOA %s with value %s", ioa, value)
                     if value == 1:  # Open command in double point
                         self.update_ioa(cb.ioa_control_dp, 1)
-                        self.update_ioa(cb.ioa_cb_status, 1)
-                        self.update_ioa(cb.ioa_cb_status_close, 0)
-                        self.update_ioa(cb.ioa_cb_status_dp, 1)
+                        self.breaker_operations.operate(cb, POSITION_OPEN, origin)
                     elif value == 2:  # Close command in double point
                         self.update_ioa(cb.ioa_control_dp, 2)
-                        self.update_ioa(cb.ioa_cb_status, 0)
-                        self.update_ioa(cb.ioa_cb_status_close, 1)
-                        self.update_ioa(cb.ioa_cb_status_dp, 2)
+                        self.breaker_operations.operate(cb, POSITION_CLOSED, origin)
                     break
                 
-        elif self.tap_changers:
+        if self.tap_changers:
+            origin = getattr(self.command_origin, 'value', None)
             for tc in self.tap_changers.values():
                 if ioa == tc.ioa_local_remote:
                     if value == 1:
-                        logger.info(f"Tap changer {tc.name} set to local mode")
+                        logger.info("Tap changer %s set to local mode", tc.name)
                         self.update_ioa(tc.ioa_local_remote, 1)
                     elif value == 0:
-                        logger.info(f"Tap changer {tc.name} set to remote mode")
+                        logger.info("Tap changer %s set to remote mode", tc.name)
                         self.update_ioa(tc.ioa_local_remote, 0)
                 if ioa == tc.ioa_command_raise_lower:
-                    if value == 1:
-                        logger.info(f"Tap changer {tc.name} command to raise tap position")
-                        self.update_ioa(tc.ioa_command_raise_lower, 1)
-                    elif value == 2:
-                        logger.info(f"Tap changer {tc.name} command to lower tap position")
-                        self.update_ioa(tc.ioa_command_raise_lower, 2) 
+                    if value == RAISE:
+                        logger.info("Tap changer %s command to raise tap position", tc.name)
+                        self.update_ioa(tc.ioa_command_raise_lower, RAISE)
+                        self.tap_changer_operations.step(tc, RAISE, origin=origin)
+                    elif value == LOWER:
+                        logger.info("Tap changer %s command to lower tap position", tc.name)
+                        self.update_ioa(tc.ioa_command_raise_lower, LOWER)
+                        self.tap_changer_operations.step(tc, LOWER, origin=origin)
                     
         return 0
     
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+DEFAULT_LEVEL = 'INFO'
+DEFAULT_RATE_LIMIT = 20    # records per category per second, 0 disables
+DEFAULT_DEBUG_SAMPLE = 1   # pass one in N debug records per category
+MAX_CATEGORIES = 10000
+
+# Arguments of these types cannot change before the listener formats them
+_IMMUTABLE_ARGS = (str, int, float, bool, bytes, type(None))
+
+
+class HotPathFilter(logging.Filter):
+    """
+    Rate limit and sample log records per category.
+
+    The category is the record's `category` extra if it has one, else its
+    logger name and unformatted message, so every lazily formatted call site
+    is its own category. At most `rate_limit` records per category pass per
+    second; the first record of the next second that passes reports how many
+    were dropped. DEBUG records are additionally sampled one in
+    `debug_sample`.
+    """
+
+    def __init__(self, rate_limit=DEFAULT_RATE_LIMIT, debug_sample=DEFAULT_DEBUG_SAMPLE, clock=time.monotonic):
+        super().__init__()
+        self.rate_limit = rate_limit
+        self.debug_sample = max(int(debug_sample), 1)
+        self.clock = clock
+        self._categories = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if self.rate_limit <= 0 and self.debug_sample == 1:
+            return True
+        category = getattr(record, 'category', None) or (record.name, record.msg)
+        now = self.clock()
+        with self._lock:
+            state = self._categories.get(category)
+            if state is None:
+                if len(self._categories) >= MAX_CATEGORIES:
+                    # Call sites that still build their message eagerly make a new category per record
+                    self._categories.clear()
+                # [window start, passed in window, suppressed, debug records seen]
+                state = self._categories[category] = [now, 0, 0, 0]
+            if record.levelno <= logging.DEBUG and self.debug_sample > 1:
+                state[3] += 1
+                if (state[3] - 1) % self.debug_sample:
+                    return False
+            if self.rate_limit > 0:
+                if now - state[0] >= 1.0:
+                    state[0] = now
+                    state[1] = 0
+                if state[1] >= self.rate_limit:
+                    state[2] += 1
+                    return False
+                state[1] += 1
+            suppressed, state[2] = state[2], 0
+        if suppressed:
+            record.msg = f"{record.getMessage()} ({suppressed} similar messages suppressed)"
+            record.args = None
+        return True
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves formatting to the listener thread.
+
+    The stock prepare() formats every record on the logging thread. Records
+    whose arguments are all immutable are queued as they are, so the
+    lib60870 threads and the event loop only pay for the enqueue.
+    """
+
+    def prepare(self, record):
+        args = record.args
+        if record.exc_info or not (args is None or (isinstance(args, tuple) and all(isinstance(a, _IMMUTABLE_ARGS) for a in args))):
+            return super().prepare(record)
+        return record
+
+
+def setup_logging(level=None, rate_limit=None, debug_sample=None):
+    """
+    Route all logging through a queue drained by a listener thread.
+
+    Settings default to the LOG_LEVEL, LOG_RATE_LIMIT and LOG_DEBUG_SAMPLE
+    environment variables. Returns the started QueueListener; stop it on
+    shutdown to flush the queue.
+    """
+    level = (level or os.getenv('LOG_LEVEL') or DEFAULT_LEVEL).upper()
+    rate_limit = int(os.getenv('LOG_RATE_LIMIT', DEFAULT_RATE_LIMIT)) if rate_limit is None else rate_limit
+    debug_sample = int(os.getenv('LOG_DEBUG_SAMPLE', DEFAULT_DEBUG_SAMPLE)) if debug_sample is None else debug_sample
+
+    # LOG_FORMAT never shows these, skip collecting them for every record
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+    logging.logAsyncioTasks = False
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(HotPathFilter(rate_limit, debug_sample))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(getattr(logging, level, logging.INFO))
+
+    listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+import bisect
+import threading
+import time
+
+# Latency buckets in seconds, from sub-millisecond handler runs up to slow GIs
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metric:
+    """
+    Base for the counters and histograms behind GET /metrics.
+
+    Samples are keyed by the tuple of label values. An update is one dict
+    lookup and an add under a per-metric lock, so the instrumented paths on
+    the lib60870 threads and the event loop pay well under a microsecond.
+    """
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._samples = {}
+        self._lock = threading.Lock()
+        (REGISTRY if registry is None else registry).register(self)
+
+    def _labels(self, key):
+        if not self.labelnames:
+            return ''
+        pairs = ','.join(f'{name}="{escape(str(value))}"' for name, value in zip(self.labelnames, key))
+        return '{' + pairs + '}'
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            samples = {key: self._copy(value) for key, value in self._samples.items()}
+        for key in sorted(samples, key=lambda k: tuple(map(str, k))):
+            lines.extend(self._render_sample(key, samples[key]))
+        return lines
+
+    def _copy(self, value):
+        return value
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._samples[labels] = self._samples.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._samples.get(labels, 0)
+
+    def _render_sample(self, key, value):
+        yield f"{self.name}_total{self._labels(key)} {format_value(value)}"
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, *labels):
+        # Per-bucket counts, the cumulative le series is built at render time
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            sample = self._samples.get(labels)
+            if sample is None:
+                sample = self._samples[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            sample[0][index] += 1
+            sample[1] += value
+            sample[2] += 1
+
+    def totals(self, *labels):
+        """(count, sum) of the observations with these labels."""
+        sample = self._samples.get(labels)
+        return (sample[2], sample[1]) if sample else (0, 0.0)
+
+    def _copy(self, value):
+        return [list(value[0]), value[1], value[2]]
+
+    def _render_sample(self, key, value):
+        counts, total, count = value
+        labels = self._labels(key)
+        prefix = labels[:-1] + ',' if labels else '{'
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            yield f'{self.name}_bucket{prefix}le="{format_value(bound)}"}} {cumulative}'
+        yield f'{self.name}_bucket{prefix}le="+Inf"}} {count}'
+        yield f"{self.name}_sum{labels} {format_value(total)}"
+        yield f"{self.name}_count{labels} {count}"
+
+
+class Callback(Metric):
+    """
+    Values read from `function` when the metrics are rendered. Without
+    labelnames it returns a single value, with them a dict of label value
+    tuples to values.
+    """
+
+    def __init__(self, name, documentation, kind, function, labelnames=(), registry=None):
+        self.kind = kind
+        self.function = function
+        super().__init__(name, documentation, labelnames, registry)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        if not self.labelnames:
+            lines.append(f"{self.name} {format_value(float(self.function()))}")
+            return lines
+        samples = self.function()
+        for key in sorted(samples, key=lambda k: tuple(map(str, k))):
+            lines.append(f"{self.name}{self._labels(key)} {format_value(float(samples[key]))}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format (0.0.4)."""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# IEC 104 side
+ASDUS_ENQUEUED = Counter('iec104_asdus_enqueued', 'ASDUs put on the slave event queue', ('type',))
+GI_DURATION = Histogram('iec104_gi_duration_seconds', 'Time to answer a station interrogation, ACT_CON to ACT_TERM')
+COMMANDS = Counter('iec104_commands', 'Commands received from masters by type and the COT they were answered with', ('type', 'cot', 'negative'))
+ASDU_HANDLER_DURATION = Histogram('iec104_asdu_handler_seconds', 'Time spent in the ASDU handler callback', ('type',))
+COMMAND_CALLBACK_DURATION = Histogram('iec104_command_callback_seconds', 'Time spent in IOA callbacks applying accepted commands')
+CAPTURE_APDUS = Counter('iec104_capture_apdus', 'APDUs written to the raw capture')
+CAPTURE_DROPPED = Counter('iec104_capture_dropped_apdus', 'APDUs not captured because the writer fell behind')
+
+# Socket.IO side
+SOCKETIO_EMITS = Counter('socketio_emits', 'Socket.IO emit calls by event', ('event',))
+SOCKETIO_EMIT_BYTES = Counter('socketio_emit_bytes', 'Encoded Socket.IO packet bytes sent to clients by event', ('event',))
+SOCKETIO_SNAPSHOTS_REPLACED = Counter('socketio_snapshots_replaced', 'Queued collection snapshots replaced by a newer one before the client received them', ('event',))
+SOCKETIO_PACKETS_DROPPED = Counter('socketio_packets_dropped', 'Packets dropped because the client outbound queue was full', ('event',))
+SOCKETIO_SLOW_CLIENT_DISCONNECTS = Counter('socketio_slow_client_disconnects', 'Clients disconnected for lagging behind for too long')
+
+# Process
+PROCESS_CPU = Callback('process_cpu_seconds_total', 'Total user and system CPU time spent in seconds', 'counter', time.process_time)
+
+# Background tasks
+POLL_LOOP_LAG = Histogram('poll_loop_lag_seconds', 'How late the IOA polling loop woke up compared to its sleep interval')
+SCENARIO_REPLAY_LAG = Histogram('scenario_replay_lag_seconds', 'How late replayed point changes were applied compared to their schedule')
+
+# Shard workers
+SHARD_POINT_CHANGES = Counter('shard_point_changes', 'Point changes received from the stations of each shard worker', ('shard',))
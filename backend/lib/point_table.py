@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+import logging
+import threading
+from collections.abc import MutableMapping
+
+logger = logging.getLogger(__name__)
+
+
+class PointTable(MutableMapping):
+    """
+    IOA to point entry map shared by the lib60870 threads and the event loop.
+
+    Iteration always walks a snapshot: adding or removing a point drops the
+    cached snapshot and the next reader copies the table once, so a GI that
+    is running never sees the table change size under it. Readers on the
+    lib60870 threads never write; they hand state changes to submit, which
+    runs them on the event loop, the table's single writer. `version`
+    counts the points added and removed.
+    """
+
+    def __init__(self, points=None):
+        self._points = {}
+        self._snapshot = None
+        self.version = 0
+        self._lock = threading.Lock()
+        self._loop = None
+        self._writer_thread = None
+        if points:
+            self.update(points)
+
+    def bind(self, loop):
+        """Make `loop` the single writer. Must be called from the loop's thread."""
+        self._loop = loop
+        self._writer_thread = threading.get_ident()
+
+    def __getitem__(self, ioa):
+        return self._points[ioa]
+
+    def __contains__(self, ioa):
+        return ioa in self._points
+
+    def __len__(self):
+        return len(self._points)
+
+    def __iter__(self):
+        return iter(self.snapshot())
+
+    def __setitem__(self, ioa, point):
+        with self._lock:
+            self._points[ioa] = point
+            self._snapshot = None
+            self.version += 1
+
+    def __delitem__(self, ioa):
+        with self._lock:
+            del self._points[ioa]
+            self._snapshot = None
+            self.version += 1
+
+    def keys(self):
+        return self.snapshot().keys()
+
+    def items(self):
+        return self.snapshot().items()
+
+    def values(self):
+        return self.snapshot().values()
+
+    def snapshot(self):
+        """Point entries as of now, as a dict that is never modified afterwards."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._snapshot = dict(self._points)
+                snapshot = self._snapshot
+        return snapshot
+
+    def submit(self, fn, *args):
+        """Run `fn(*args)` on the writer thread, right away if already on it."""
+        if self._loop is None or threading.get_ident() == self._writer_thread:
+            fn(*args)
+            return
+        self._loop.call_soon_threadsafe(self._run, fn, args)
+
+    def _run(self, fn, args):
+        try:
+            fn(*args)
+        except Exception as e:
+            logger.error("Error applying point table command %s: %s", fn, e)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+import asyncio
+import collections
+import logging
+import struct
+import time
+
+from .metrics import SCENARIO_REPLAY_LAG
+
+logger = logging.getLogger(__name__)
+
+# File layout: HEADER, then one RECORD per point change
+MAGIC = b'IECSCN1\n'
+HEADER = struct.Struct('<8sQ')   # magic, wall clock start of the recording in ns
+RECORD = struct.Struct('<QId')   # ns since the start, IOA, value
+
+MAX_BATCH = 1000  # records applied per update_ioas call at max speed
+LAG_WINDOW = 10000  # latest wakeup lags kept for the p99 of a replay's status
+
+
+class ScenarioRecorder:
+    """
+    Logs every point value change, from update_ioa/update_ioas and from
+    commands, to a file.
+
+    Set as the IEC server's `recorder`. record runs on the event loop, the
+    point table's single writer, and only appends a fixed 20 byte record to
+    a buffered file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.records = 0
+        self._file = open(path, 'wb')
+        self._file.write(HEADER.pack(MAGIC, time.time_ns()))
+        self._started = time.monotonic_ns()
+
+    def record(self, ioa, value):
+        self._file.write(RECORD.pack(time.monotonic_ns() - self._started, ioa, value))
+        self.records += 1
+
+    def record_quality(self, ioa, quality):
+        """Quality changes are not part of a recording."""
+
+    def close(self):
+        self._file.close()
+        logger.info("Recorded %s point changes to %s", self.records, self.path)
+
+
+def read_scenario(path):
+    """(wall clock start in ns, [(offset ns, ioa, value), ...]) of a recording."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < HEADER.size:
+        raise ValueError(f"{path} is not a scenario recording")
+    magic, started = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a scenario recording")
+    body = memoryview(data)[HEADER.size:]
+    # A recording cut short by a crash may end in a partial record
+    body = body[:len(body) - len(body) % RECORD.size]
+    return started, list(RECORD.iter_unpack(body))
+
+
+class ScenarioReplayer:
+    """
+    Feeds a recording back through the IEC server's update_ioas.
+
+    Each record is due at its recorded offset divided by `speed`, measured
+    from the start of the replay on an absolute schedule, so a late wakeup
+    never pushes back the records after it. Every wakeup applies all
+    records that are due in one update_ioas call, which packs them into as
+    few spontaneous ASDUs as possible. With speed 0 the records are applied
+    as fast as possible, MAX_BATCH at a time. `on_applied`, if given, is
+    called with each batch of (ioa, value) after the server has it, to
+    bring the items the dashboards show up to date.
+
+    status() reports the p99 lag of the last LAG_WINDOW wakeups and the
+    maximum lag of the whole replay, so a long replay keeps a fixed amount
+    of lag history.
+    """
+
+    def __init__(self, server, path, speed=1.0, clock=time.monotonic, on_applied=None):
+        self.server = server
+        self.path = path
+        self.speed = speed
+        self.clock = clock
+        self.on_applied = on_applied
+        self.started_at = None
+        self.finished_at = None
+        self.applied = 0
+        self.total = 0
+        self.lags = collections.deque(maxlen=LAG_WINDOW)
+        self.max_lag = None
+
+    async def run(self):
+        _, records = read_scenario(self.path)
+        self.total = len(records)
+        logger.info("Replaying %s point changes from %s at %s", self.total, self.path, f"{self.speed:g}x" if self.speed else "max speed")
+        self.started_at = self.clock()
+        index = 0
+        while index < len(records):
+            if self.speed:
+                due = self.started_at + records[index][0] / 1e9 / self.speed
+                now = self.clock()
+                if due > now:
+                    await asyncio.sleep(due - now)
+                    now = self.clock()
+                lag = max(now - due, 0.0)
+                self.lags.append(lag)
+                if self.max_lag is None or lag > self.max_lag:
+                    self.max_lag = lag
+                SCENARIO_REPLAY_LAG.observe(lag)
+                # Everything that fell due while sleeping goes out with this batch
+                limit = (now - self.started_at) * self.speed * 1e9
+                end = index + 1
+                while end < len(records) and records[end][0] <= limit:
+                    end += 1
+            else:
+                end = min(index + MAX_BATCH, len(records))
+            batch = [(ioa, value) for _, ioa, value in records[index:end]]
+            self.server.update_ioas(batch)
+            if self.on_applied is not None:
+                self.on_applied(batch)
+            self.applied = end
+            index = end
+            if not self.speed:
+                await asyncio.sleep(0)
+        self.finished_at = self.clock()
+        logger.info("Replayed %s point changes from %s in %.3fs", self.applied, self.path, self.finished_at - self.started_at)
+        return self.status()
+
+    def status(self):
+        lags = sorted(self.lags)
+        return {
+            'path': self.path,
+            'speed': self.speed,
+            'applied': self.applied,
+            'total': self.total,
+            'elapsed': round((self.finished_at or self.clock()) - self.started_at, 6) if self.started_at is not None else None,
+            'lag_p99_ms': round(lags[int(len(lags) * 0.99)] * 1000, 3) if lags else None,
+            'lag_max_ms': round(self.max_lag * 1000, 3) if self.max_lag is not None else None,
+        }
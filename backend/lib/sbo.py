@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SELECT_TIMEOUT = 10.0
+
+
+class Selection:
+    __slots__ = ('state', 'owner', 'timer')
+
+    def __init__(self, state, owner, timer):
+        self.state = state
+        self.owner = owner
+        self.timer = timer
+
+
+class SelectBeforeOperate:
+    """
+    Select-before-operate state machine for command IOAs.
+
+    A select arms the IOA for the selecting connection until the select
+    timeout runs out. An execute is only accepted when it comes from the same
+    connection with the same state as the armed selection, and consumes it.
+    Timeouts live on the shared TimerWheel, so thousands of concurrent
+    selections cost one list entry each instead of one asyncio task each.
+    """
+
+    def __init__(self, timer_wheel, default_timeout=DEFAULT_SELECT_TIMEOUT):
+        self.timer_wheel = timer_wheel
+        self.default_timeout = default_timeout
+        self._selections = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._selections)
+
+    def is_selected(self, ioa):
+        return ioa in self._selections
+
+    def select(self, ioa, state, timeout=None, owner=None):
+        """Arm `ioa` for `state`. Returns False if another connection holds the selection."""
+        if timeout is None:
+            timeout = self.default_timeout
+        with self._lock:
+            current = self._selections.get(ioa)
+            if current is not None:
+                if current.owner != owner:
+                    logger.info("SBO select rejected for IOA %s: already selected by another connection", ioa)
+                    return False
+                # Re-select from the same connection restarts the timeout
+                current.timer.cancel()
+            selection = Selection(state, owner, None)
+            selection.timer = self.timer_wheel.call_later(timeout, self._expire, ioa, selection)
+            self._selections[ioa] = selection
+        logger.debug("SBO selected IOA %s state %s for %ss", ioa, state, timeout)
+        return True
+
+    def execute(self, ioa, state, owner=None):
+        """Consume the selection for `ioa`. Returns False if there is no matching select."""
+        with self._lock:
+            current = self._selections.get(ioa)
+            if current is None or current.owner != owner or current.state != state:
+                logger.info("SBO execute rejected for IOA %s: no valid selection for state %s", ioa, state)
+                return False
+            del self._selections[ioa]
+        current.timer.cancel()
+        return True
+
+    def cancel(self, ioa, owner=None):
+        """Drop the selection for `ioa` (deactivation). Returns False if nothing was selected."""
+        with self._lock:
+            current = self._selections.get(ioa)
+            if current is None or current.owner != owner:
+                return False
+            del self._selections[ioa]
+        current.timer.cancel()
+        return True
+
+    def cancel_owner(self, owner):
+        """Drop every selection held by `owner`, e.g. when its connection closes."""
+        with self._lock:
+            dropped = [ioa for ioa, selection in self._selections.items() if selection.owner == owner]
+            for ioa in dropped:
+                self._selections.pop(ioa).timer.cancel()
+        return len(dropped)
+
+    def _expire(self, ioa, selection):
+        with self._lock:
+            if self._selections.get(ioa) is not selection:
+                return
+            del self._selections[ioa]
+        logger.info("SBO selection for IOA %s timed out", ioa)
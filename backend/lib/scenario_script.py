@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+import json
+import logging
+import math
+
+from .breaker import POSITION_CLOSED, POSITION_OPEN
+from .libiec60870server import QUALITY_FLAGS
+from .lib60870 import MeasuredValueShort
+from .tap_changer import LOWER, RAISE
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RAMP_STEP = 1.0  # seconds between the values of a ramp
+
+BREAKER_ACTIONS = {'open': POSITION_OPEN, 'trip': POSITION_OPEN, 'close': POSITION_CLOSED}
+
+
+class ScriptError(ValueError):
+    """A scenario script that does not compile, with the offending action."""
+
+
+class Event:
+    """One compiled step of the timeline: run apply(*args) at `at` seconds if `condition` holds."""
+    __slots__ = ('at', 'apply', 'args', 'condition', 'index')
+
+    def __init__(self, at, apply, args, condition, index):
+        self.at = at
+        self.apply = apply
+        self.args = args
+        self.condition = condition
+        self.index = index
+
+
+def load_script(path):
+    """Read a scenario script, YAML when the file name says so, JSON otherwise."""
+    with open(path) as f:
+        if path.endswith(('.yaml', '.yml')):
+            import yaml
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+class ScenarioScript:
+    """
+    A declarative scenario compiled into a timeline.
+
+    The script is {"name": ..., "actions": [...]}, each action a dict with
+    `at` (seconds from the start), `action` and its arguments:
+
+      open / close / trip   breaker: name or id
+      set                   telemetry / telesignal: name or id, or ioa; value
+      ramp                  telemetry: name or id; to; over (s); step (s, default 1); from (default: current value)
+      tap                   tap_changer: name or id; direction: raise or lower; steps (default 1)
+      quality               ioa_start; ioa_end (default ioa_start); flags: [invalid, ...]
+
+    and an optional `when`: {telemetry / telesignal / ioa, above / below /
+    equals}, checked when the action is due; the action is skipped if it
+    does not hold. Names are resolved and ramps expanded into their steps
+    once, when compiling, so running the script only walks a sorted list.
+    """
+
+    def __init__(self, spec, server, collections, mark):
+        self.server = server
+        self.collections = collections  # kind -> Collection
+        self.mark = mark                 # called with the collection name of a changed item
+        if not isinstance(spec, dict) or not isinstance(spec.get('actions'), list):
+            raise ScriptError("A scenario script needs an 'actions' list")
+        self.name = spec.get('name', 'scenario')
+        events = []
+        for index, action in enumerate(spec['actions']):
+            try:
+                events.extend(self._compile(index, action))
+            except ScriptError:
+                raise
+            except (KeyError, TypeError, ValueError) as e:
+                raise ScriptError(f"Action {index}: {e!r}") from e
+        # sort is stable, actions due at the same time keep the script's order
+        events.sort(key=lambda event: event.at)
+        self.events = events
+        self.duration = events[-1].at if events else 0.0
+
+    def _compile(self, index, action):
+        at = float(action.get('at', 0))
+        if at < 0 or not math.isfinite(at):
+            raise ScriptError(f"Action {index}: 'at' must be a non-negative number of seconds")
+        kind = action.get('action')
+        condition = self._condition(index, action['when']) if 'when' in action else None
+
+        if kind in BREAKER_ACTIONS:
+            cb = self._item(index, 'circuit_breakers', action.get('breaker'))
+            return [Event(at, self._operate, (cb, BREAKER_ACTIONS[kind]), condition, index)]
+
+        if kind == 'set':
+            value = float(action['value'])
+            if 'telemetry' in action:
+                item = self._item(index, 'telemetries', action['telemetry'])
+                return [Event(at, self._set_telemetry, (item, value), condition, index)]
+            if 'telesignal' in action:
+                item = self._item(index, 'telesignals', action['telesignal'])
+                return [Event(at, self._set_telesignal, (item, int(value)), condition, index)]
+            ioa = int(action['ioa'])
+            return [Event(at, self.server.update_ioa, (ioa, value), condition, index)]
+
+        if kind == 'ramp':
+            item = self._item(index, 'telemetries', action.get('telemetry'))
+            over = float(action['over'])
+            step = float(action.get('step', DEFAULT_RAMP_STEP))
+            if over < 0 or step <= 0:
+                raise ScriptError(f"Action {index}: 'over' must be >= 0 and 'step' > 0")
+            steps = max(int(math.ceil(over / step)), 1)
+            # Shared by the steps, the start value is taken when the first one runs
+            ramp = {'from': float(action['from']) if 'from' in action else None, 'to': float(action['to'])}
+            # The first step decides on `when` for the whole ramp
+            return [
+                Event(at + min(i * step, over), self._ramp, (item, ramp, i / steps, i == 1), condition if i == 1 else None, index)
+                for i in range(1, steps + 1)
+            ]
+
+        if kind == 'tap':
+            item = self._item(index, 'tap_changers', action.get('tap_changer'))
+            direction = action.get('direction', 'raise')
+            if direction not in ('raise', 'lower'):
+                raise ScriptError(f"Action {index}: 'direction' must be raise or lower")
+            steps = int(action.get('steps', 1))
+            return [Event(at, self._tap, (item, RAISE if direction == 'raise' else LOWER, steps), condition, index)]
+
+        if kind == 'quality':
+            ioa_start = int(action['ioa_start'])
+            ioa_end = int(action.get('ioa_end', ioa_start))
+            quality = 0
+            for flag in action.get('flags', []):
+                if flag not in QUALITY_FLAGS:
+                    raise ScriptError(f"Action {index}: unknown quality flag {flag!r}")
+                quality |= QUALITY_FLAGS[flag]
+            return [Event(at, self.server.set_quality, (ioa_start, ioa_end, quality), condition, index)]
+
+        raise ScriptError(f"Action {index}: unknown action {kind!r}")
+
+    def _item(self, index, kind, key):
+        collection = self.collections[kind]
+        if key in collection:
+            return collection[key]
+        for item in collection.values():
+            if item.name == key:
+                return item
+        raise ScriptError(f"Action {index}: no {kind} item {key!r}")
+
+    def _condition(self, index, when):
+        if 'telemetry' in when:
+            item = self._item(index, 'telemetries', when['telemetry'])
+            read = lambda: item.value
+        elif 'telesignal' in when:
+            item = self._item(index, 'telesignals', when['telesignal'])
+            read = lambda: item.value
+        else:
+            ioa = int(when['ioa'])
+            read = lambda: self.server.ioa_list.get(ioa, {}).get('data')
+        if 'above' in when:
+            limit = float(when['above'])
+            return lambda: (value := read()) is not None and value > limit
+        if 'below' in when:
+            limit = float(when['below'])
+            return lambda: (value := read()) is not None and value < limit
+        if 'equals' in when:
+            expected = float(when['equals'])
+            return lambda: read() == expected
+        raise ScriptError(f"Action {index}: 'when' needs above, below or equals")
+
+    def _operate(self, cb, position):
+        self.server.breaker_operations.operate(cb, position)
+
+    def _set_telemetry(self, item, value):
+        dependencies = self.server.dependencies
+        if dependencies is not None:
+            # A coupled telemetry keeps the scripted value as its base, like a manual update
+            value = dependencies.apply(item, value)
+        item.value = value
+        point = self.server.ioa_list.get(item.ioa)
+        if point is not None:
+            # Scaled points carry the value in units of the scale factor, like the auto mode
+            self.server.update_ioa(item.ioa, value if point['type'] == MeasuredValueShort else int(round(value / item.scale_factor)))
+        self.mark('telemetries')
+
+    def _set_telesignal(self, item, value):
+        item.value = value
+        self.server.update_ioa(item.ioa, value)
+        self.mark('telesignals')
+
+    def _ramp(self, item, ramp, fraction, first):
+        if first:
+            ramp['started'] = True
+            if ramp['from'] is None:
+                dependencies = self.server.dependencies
+                ramp['from'] = item.value if dependencies is None else dependencies.base(item)
+        elif not ramp.get('started'):
+            return
+        self._set_telemetry(item, ramp['from'] + (ramp['to'] - ramp['from']) * fraction)
+
+    def _tap(self, item, direction, steps):
+        # Steps one position at a time within the limits; monitor_tap_changer_changes copies the position into the item
+        self.server.tap_changer_operations.step(item, direction, steps)
+
+
+class ScriptRun:
+    """
+    Runs a ScenarioScript on the shared timer wheel.
+
+    Only the next due time is ever scheduled: each wakeup runs every event
+    that is due and schedules the following one, so a script of thousands
+    of actions holds a single timer and costs nothing between its events.
+    Times are measured from the start of the run, a late wakeup does not
+    shift the events after it.
+    """
+
+    def __init__(self, script, timer_wheel):
+        self.script = script
+        self.timer_wheel = timer_wheel
+        self.started_at = None
+        self.position = 0
+        self.executed = 0
+        self.skipped = 0
+        self.errors = 0
+        self.max_lag = 0.0
+        self._timer = None
+
+    @property
+    def running(self):
+        return self._timer is not None
+
+    def start(self):
+        self.started_at = self.timer_wheel.clock()
+        logger.info("Running scenario script %s: %s events over %.1fs", self.script.name, len(self.script.events), self.script.duration)
+        self._schedule()
+
+    def stop(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+            logger.info("Stopped scenario script %s after %s of %s events", self.script.name, self.position, len(self.script.events))
+
+    def _schedule(self):
+        events = self.script.events
+        if self.position >= len(events):
+            self._timer = None
+            logger.info("Scenario script %s finished: %s events run, %s skipped, %s failed",
+                        self.script.name, self.executed, self.skipped, self.errors)
+            return
+        delay = self.started_at + events[self.position].at - self.timer_wheel.clock()
+        self._timer = self.timer_wheel.call_later(delay, self._fire)
+
+    def _fire(self):
+        events = self.script.events
+        elapsed = self.timer_wheel.clock() - self.started_at
+        self.max_lag = max(self.max_lag, elapsed - events[self.position].at)
+        while self.position < len(events) and events[self.position].at <= elapsed:
+            event = events[self.position]
+            self.position += 1
+            if event.condition is not None and not event.condition():
+                self.skipped += 1
+                continue
+            try:
+                event.apply(*event.args)
+                self.executed += 1
+            except Exception as e:
+                self.errors += 1
+                logger.error("Error in scenario script %s action %s: %s", self.script.name, event.index, e)
+        self._schedule()
+
+    def status(self):
+        return {
+            'name': self.script.name,
+            'running': self.running,
+            'events': len(self.script.events),
+            'position': self.position,
+            'executed': self.executed,
+            'skipped': self.skipped,
+            'errors': self.errors,
+            'duration': self.script.duration,
+            'max_lag_ms': round(self.max_lag * 1000, 3),
+        }
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+import asyncio
+import logging
+import multiprocessing
+import signal
+import struct
+import threading
+import time
+
+import numpy as np
+
+from .lib60870 import CS104_MODE_SINGLE_REDUNDANCY_GROUP
+from .logging_setup import setup_logging
+from .metrics import SHARD_POINT_CHANGES
+from .station import Station, StationTemplate
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TICK = 0.1  # seconds between the polls of a worker, and between its delta messages
+
+# A delta message is, per station with changes, DELTA_HEADER then that many DELTA_RECORDs
+DELTA_HEADER = struct.Struct('<HI')  # station CA, number of changed points
+DELTA_RECORD = np.dtype([('ioa', '<u4'), ('value', '<f8'), ('quality', 'u1')])
+
+
+def encode_deltas(stations):
+    """The changes of `stations` since the last call, or b'' when there are none."""
+    parts = []
+    for station in stations:
+        pending = station.deltas.take()
+        if pending:
+            parts.append(DELTA_HEADER.pack(station.ca, len(pending)))
+            parts.append(np.fromiter(pending, dtype=DELTA_RECORD, count=len(pending)).tobytes())
+    return b''.join(parts)
+
+
+def decode_deltas(payload):
+    """Yield (ca, records) for each station in a delta message, records a DELTA_RECORD array."""
+    offset = 0
+    while offset < len(payload):
+        ca, count = DELTA_HEADER.unpack_from(payload, offset)
+        offset += DELTA_HEADER.size
+        yield ca, np.frombuffer(payload, dtype=DELTA_RECORD, count=count, offset=offset)
+        offset += count * DELTA_RECORD.itemsize
+
+
+def parse_port_range(value):
+    """The ports of "2404-2603", or of a single "2404"."""
+    first, _, last = value.partition('-')
+    first = int(first)
+    last = int(last) if last else first
+    if not 0 < first <= last < 65536:
+        raise ValueError(f"Invalid port range {value!r}")
+    return range(first, last + 1)
+
+
+def farm_specs(template, ports, first_ca=2, ioa_offset=0):
+    """
+    (ca, port, config, ioa_offset) of a farm station on each port, all
+    built from the same `template` export: consecutive common addresses
+    from `first_ca`, and the IOAs of the n-th station moved up by n *
+    `ioa_offset`. The template object is shared by every spec, so it is
+    pickled and turned into a StationTemplate once per worker.
+    """
+    return [(first_ca + n, port, template, n * ioa_offset) for n, port in enumerate(ports)]
+
+
+def run_shard(index, specs, conn, host, seed=None, server_mode=CS104_MODE_SINGLE_REDUNDANCY_GROUP, tick=DEFAULT_TICK):
+    """
+    Entry point of a worker process: run the stations in `specs`, a list of
+    (ca, port, config, ioa_offset), until the coordinator says stop or goes away.
+    """
+    # Ctrl+C reaches the whole process group, the coordinator stops its workers itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    listener = setup_logging()
+    try:
+        asyncio.run(_serve_shard(index, specs, conn, host, seed, server_mode, tick))
+    finally:
+        listener.stop()
+
+
+async def _serve_shard(index, specs, conn, host, seed, server_mode, tick):
+    # Stations built from the same config share one template, see StationTemplate
+    templates = {}
+    for _, _, config, _ in specs:
+        if id(config) not in templates:
+            templates[id(config)] = StationTemplate(config)
+    # Each station draws from its own seed, derived from the farm seed and its CA
+    stations = {
+        ca: Station(ca, host, port, templates[id(config)], None if seed is None else [seed, ca], server_mode, ioa_offset)
+        for ca, port, config, ioa_offset in specs
+    }
+    timer_tasks = []
+    for station in stations.values():
+        if station.start() != 0:
+            logger.error("Shard %s: station %s could not listen on port %s", index, station.ca, station.port)
+        timer_tasks.append(asyncio.create_task(station.server.timer_wheel.run()))
+    conn.send(('ready', index, [(station.ca, station.port, station.points()) for station in stations.values()]))
+    logger.info("Shard %s running %s stations", index, len(stations))
+
+    try:
+        while True:
+            started = time.monotonic()
+            now = time.time()
+            for station in stations.values():
+                try:
+                    station.poll(now)
+                except Exception as e:
+                    logger.error("Shard %s: error polling station %s: %s", index, station.ca, e)
+            payload = encode_deltas(stations.values())
+            if payload:
+                conn.send(('deltas', payload))
+
+            while conn.poll():
+                message = conn.recv()
+                if message[0] == 'stop':
+                    return
+                if message[0] == 'set':
+                    _, ca, points = message
+                    station = stations.get(ca)
+                    if station is not None:
+                        station.set_points(points)
+
+            await asyncio.sleep(max(tick - (time.monotonic() - started), 0))
+    except (EOFError, BrokenPipeError, ConnectionResetError):
+        logger.warning("Shard %s lost its coordinator, stopping", index)
+    finally:
+        for task in timer_tasks:
+            task.cancel()
+        for station in stations.values():
+            station.stop()
+        logger.info("Shard %s stopped", index)
+
+
+class ShardedStation:
+    """The coordinator's copy of a station running in a worker: its points, kept current from the deltas."""
+
+    def __init__(self, ca, port, shard, points):
+        self.ca = ca
+        self.port = port
+        self.shard = shard
+        # ioa -> [type name, value, quality]
+        self.points = {ioa: [type_name, value, quality] for ioa, type_name, value, quality in points}
+        self.changes = 0
+
+    def point_json(self, ioa):
+        type_name, value, quality = self.points[ioa]
+        return {'ioa': ioa, 'type': type_name, 'value': value, 'quality': quality}
+
+    def apply(self, records):
+        points = self.points
+        for ioa, value, quality in records.tolist():
+            point = points.get(ioa)
+            if point is not None:
+                point[1] = value if point[0] == 'MeasuredValueShort' else int(value)
+                point[2] = quality
+        self.changes += len(records)
+
+
+class Shard:
+    __slots__ = ('index', 'process', 'conn', 'stations', 'messages', 'last_message', 'reader')
+
+    def __init__(self, index, process, conn, stations):
+        self.index = index
+        self.process = process
+        self.conn = conn
+        self.stations = stations   # CAs
+        self.messages = 0
+        self.last_message = None
+        self.reader = None         # thread receiving the worker's messages
+
+
+class ShardCoordinator:
+    """
+    Runs stations in worker processes, so a farm of stations is not limited
+    to the one core the GIL gives a single process.
+
+    The stations, (ca, port, config, ioa_offset) each (see farm_specs),
+    are dealt round robin over `workers` processes. A worker owns the IEC
+    servers (CS104_Slave) and the auto mode simulation of its stations and
+    sends the point changes of each tick, coalesced per IOA, over its pipe
+    as one packed binary message. The coordinator runs in the process that
+    hosts FastAPI and Socket.IO: a thread per worker receives its messages,
+    so a large one never blocks the event loop, and the loop applies them to
+    a copy of every station's points in `stations` for the REST API. Point
+    overrides are forwarded to the owning worker.
+    """
+
+    def __init__(self, workers, specs, host, seed=None, server_mode=CS104_MODE_SINGLE_REDUNDANCY_GROUP, tick=DEFAULT_TICK, context='spawn'):
+        self.host = host
+        self.seed = seed
+        self.server_mode = server_mode
+        self.tick = tick
+        self.context = multiprocessing.get_context(context)
+        workers = max(min(workers, len(specs)), 1)
+        self.assignments = [specs[index::workers] for index in range(workers)]
+        self.shards = []
+        self.stations = {}   # ca -> ShardedStation, once its worker is ready
+        self._owner = {}     # ca -> Shard
+        self._loop = None
+        self._stopping = False
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        for index, specs in enumerate(self.assignments):
+            parent, child = self.context.Pipe()
+            process = self.context.Process(
+                target=run_shard,
+                args=(index, specs, child, self.host, self.seed, self.server_mode, self.tick),
+                name=f'iec104-shard-{index}',
+                daemon=True,
+            )
+            process.start()
+            child.close()
+            shard = Shard(index, process, parent, [spec[0] for spec in specs])
+            self.shards.append(shard)
+            for ca in shard.stations:
+                self._owner[ca] = shard
+            shard.reader = threading.Thread(target=self._receive, args=(shard,), name=f'iec104-shard-{index}-reader', daemon=True)
+            shard.reader.start()
+        logger.info("Started %s shard workers for %s stations", len(self.shards), len(self._owner))
+
+    def _receive(self, shard):
+        """Reader thread of a shard: receive its messages and hand them to the event loop."""
+        while True:
+            try:
+                message = shard.conn.recv()
+            except (EOFError, OSError):
+                break
+            try:
+                self._loop.call_soon_threadsafe(self._handle, shard, message)
+            except RuntimeError:
+                # The loop is closed, nobody is left to apply the message
+                return
+        if not self._stopping:
+            logger.error("Shard %s (pid %s) exited, its stations %s are gone", shard.index, shard.process.pid, shard.stations)
+
+    def _handle(self, shard, message):
+        shard.messages += 1
+        shard.last_message = time.monotonic()
+        kind = message[0]
+        if kind == 'deltas':
+            changes = 0
+            for ca, records in decode_deltas(message[1]):
+                station = self.stations.get(ca)
+                if station is not None:
+                    station.apply(records)
+                    changes += len(records)
+            SHARD_POINT_CHANGES.inc(str(shard.index), amount=changes)
+        elif kind == 'ready':
+            for ca, port, points in message[2]:
+                self.stations[ca] = ShardedStation(ca, port, shard.index, points)
+            logger.info("Shard %s ready with stations %s", shard.index, shard.stations)
+
+    def set_points(self, ca, points):
+        """Send [(ioa, value), ...] overrides to the worker running station `ca`. Returns 0 or -1."""
+        shard = self._owner.get(ca)
+        if shard is None or not shard.process.is_alive():
+            return -1
+        shard.conn.send(('set', ca, points))
+        return 0
+
+    def status(self):
+        now = time.monotonic()
+        return [
+            {
+                'shard': shard.index,
+                'pid': shard.process.pid,
+                'alive': shard.process.is_alive(),
+                'stations': shard.stations,
+                'messages': shard.messages,
+                'last_message_age': round(now - shard.last_message, 3) if shard.last_message is not None else None,
+                'point_changes': sum(self.stations[ca].changes for ca in shard.stations if ca in self.stations),
+            }
+            for shard in self.shards
+        ]
+
+    def stop(self, timeout=5.0):
+        self._stopping = True
+        for shard in self.shards:
+            try:
+                shard.conn.send(('stop',))
+            except (BrokenPipeError, OSError):
+                pass
+        for shard in self.shards:
+            shard.process.join(timeout)
+            if shard.process.is_alive():
+                logger.warning("Shard %s did not stop in %ss, terminating it", shard.index, timeout)
+                shard.process.terminate()
+                shard.process.join()
+            # The worker is gone, its reader sees the end of the pipe
+            shard.reader.join(timeout)
+            shard.conn.close()
+        logger.info("Stopped %s shard workers", len(self.shards))
+        self.shards = []
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+import logging
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CAPACITY = 131072  # points, about 1.7 MB of shared memory
+
+# Segment layout: HEADER, then ioa u32[capacity], value f8[capacity], quality u8[capacity]
+MAGIC = b'IECPTS1\n'
+HEADER = struct.Struct('<8sQQII')  # magic, sequence, layout generation, capacity, count
+SEQUENCE_OFFSET = 8
+COUNT_OFFSET = 28
+
+# Segments created by a SharedPointTable of this process
+_created = set()
+
+
+def _arrays(buffer, capacity):
+    """(ioas, values, quality) views of a segment of `capacity` points."""
+    ioas_offset = HEADER.size
+    values_offset = ioas_offset + 4 * capacity
+    values_offset += -values_offset % 8
+    quality_offset = values_offset + 8 * capacity
+    return (
+        np.ndarray((capacity,), dtype='<u4', buffer=buffer, offset=ioas_offset),
+        np.ndarray((capacity,), dtype='<f8', buffer=buffer, offset=values_offset),
+        np.ndarray((capacity,), dtype='u1', buffer=buffer, offset=quality_offset),
+    )
+
+
+def _size(capacity):
+    values_offset = HEADER.size + 4 * capacity
+    values_offset += -values_offset % 8
+    return values_offset + 9 * capacity
+
+
+class SharedPointTable:
+    """
+    The current value and quality of every point, published in a named
+    shared memory segment for readers in other processes.
+
+    Points are kept sorted by IOA in fixed slots. Every write is guarded by
+    a seqlock: the sequence number is odd while a write is in progress and
+    bumped to the next even number when it is done, so a reader that sees
+    the same even number before and after copying knows its copy is
+    consistent. Value writes touch one slot; adding or removing points
+    rewrites the slots and bumps the layout generation. The IEC server
+    calls set for every changed point, and refresh picks up points that
+    were added or removed (see PointTable.version).
+    """
+
+    def __init__(self, name, points, capacity=DEFAULT_CAPACITY):
+        self.name = name
+        self.points = points            # the server's PointTable
+        self.capacity = capacity
+        self._shm = None
+        self._slots = {}                # ioa -> slot
+        self._layout_version = None
+        self._lock = threading.Lock()   # writes come from the event loop, or lib60870 threads when it is not bound
+
+    def open(self):
+        try:
+            self._shm = shared_memory.SharedMemory(name=self.name, create=True, size=_size(self.capacity))
+        except FileExistsError:
+            # Left behind by a run that did not shut down
+            stale = shared_memory.SharedMemory(name=self.name)
+            stale.close()
+            stale.unlink()
+            self._shm = shared_memory.SharedMemory(name=self.name, create=True, size=_size(self.capacity))
+        _created.add(self.name)
+        HEADER.pack_into(self._shm.buf, 0, MAGIC, 0, 0, self.capacity, 0)
+        self._sequence = np.ndarray((2,), dtype='<u8', buffer=self._shm.buf, offset=SEQUENCE_OFFSET)
+        self._count = np.ndarray((1,), dtype='<u4', buffer=self._shm.buf, offset=COUNT_OFFSET)
+        self._ioas, self._values, self._quality = _arrays(self._shm.buf, self.capacity)
+        self.refresh()
+        logger.info("Publishing point values in shared memory %s (%s points, %s bytes)", self.name, self.capacity, self._shm.size)
+
+    def close(self):
+        if self._shm is None:
+            return
+        # numpy views must go before the segment can be closed
+        self._sequence = self._count = self._ioas = self._values = self._quality = None
+        self._shm.close()
+        self._shm.unlink()
+        self._shm = None
+        _created.discard(self.name)
+
+    def set(self, ioa, point):
+        """Publish the value and quality of one changed point."""
+        if self._shm is None:
+            return
+        sequence = self._sequence
+        with self._lock:
+            # Looked up under the lock, a concurrent refresh may move the point to another slot
+            slot = self._slots.get(ioa)
+            if slot is None:
+                return
+            sequence[0] += 1
+            self._values[slot] = point['data']
+            self._quality[slot] = point.get('quality', 0)
+            sequence[0] += 1
+
+    def refresh(self):
+        """Re-publish every point if points were added or removed since the last call."""
+        if self._shm is None or self._layout_version == self.points.version:
+            return
+        self._layout_version = self.points.version
+        entries = sorted(self.points.items())
+        if len(entries) > self.capacity:
+            logger.error("Shared memory %s holds %s points, %s points are not published", self.name, self.capacity, len(entries) - self.capacity)
+            entries = entries[:self.capacity]
+        count = len(entries)
+        sequence = self._sequence
+        with self._lock:
+            sequence[0] += 1
+            self._ioas[:count] = [ioa for ioa, _ in entries]
+            self._values[:count] = [entry['data'] for _, entry in entries]
+            self._quality[:count] = [entry.get('quality', 0) for _, entry in entries]
+            self._count[0] = count
+            # Swapped with the layout it describes, set must never write a value to the slot of an old layout
+            self._slots = {ioa: slot for slot, (ioa, _) in enumerate(entries)}
+            sequence[1] += 1   # generation
+            sequence[0] += 1
+
+
+class PointSnapshot:
+    """A consistent copy of the shared point table: sorted `ioas` with their `values` and `quality`."""
+    __slots__ = ('ioas', 'values', 'quality', 'sequence', 'generation')
+
+    def __init__(self, ioas, values, quality, sequence, generation):
+        self.ioas = ioas
+        self.values = values
+        self.quality = quality
+        self.sequence = sequence
+        self.generation = generation
+
+    def __len__(self):
+        return len(self.ioas)
+
+    def value(self, ioa):
+        slot = int(np.searchsorted(self.ioas, ioa))
+        if slot == len(self.ioas) or self.ioas[slot] != ioa:
+            raise KeyError(ioa)
+        return self.values[slot]
+
+    def to_dict(self):
+        return dict(zip(self.ioas.tolist(), self.values.tolist()))
+
+
+class SharedPointReader:
+    """
+    Reads the point table a SharedPointTable publishes, from any process:
+
+        reader = SharedPointReader('iec104-points')
+        snapshot = reader.snapshot()
+        snapshot.value(1001), snapshot.to_dict()
+
+    The arrays are mapped straight from the segment, with nothing to
+    decode. snapshot copies each one in a single memcpy and retries while a
+    write is in progress, so it never returns a torn table. `sequence`
+    changes with every write, a cheap way to tell whether anything changed
+    since the last snapshot.
+    """
+
+    def __init__(self, name, retry_interval=0.0001, timeout=1.0):
+        try:
+            self._shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Before Python 3.13 an attaching process also registers the segment,
+            # and its resource tracker would unlink it when the reader exits
+            from multiprocessing import resource_tracker
+            self._shm = shared_memory.SharedMemory(name=name)
+            if name not in _created:
+                resource_tracker.unregister(self._shm._name, 'shared_memory')
+        magic, _, _, capacity, _ = HEADER.unpack_from(self._shm.buf)
+        if magic != MAGIC:
+            self._shm.close()
+            raise ValueError(f"{name} is not a shared point table")
+        self.name = name
+        self.capacity = capacity
+        self.retry_interval = retry_interval
+        self.timeout = timeout
+        self._sequence = np.ndarray((2,), dtype='<u8', buffer=self._shm.buf, offset=SEQUENCE_OFFSET)
+        self._count = np.ndarray((1,), dtype='<u4', buffer=self._shm.buf, offset=COUNT_OFFSET)
+        self._ioas, self._values, self._quality = _arrays(self._shm.buf, capacity)
+
+    @property
+    def sequence(self):
+        return int(self._sequence[0])
+
+    def snapshot(self):
+        """A consistent PointSnapshot. Raises TimeoutError if the writer never lets go for `timeout` seconds."""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            before = int(self._sequence[0])
+            if not before & 1:
+                generation = int(self._sequence[1])
+                count = int(self._count[0])
+                ioas = self._ioas[:count].copy()
+                values = self._values[:count].copy()
+                quality = self._quality[:count].copy()
+                if int(self._sequence[0]) == before:
+                    return PointSnapshot(ioas, values, quality, before, generation)
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Shared point table {self.name} stayed busy for {self.timeout}s")
+            time.sleep(self.retry_interval)
+
+    def close(self):
+        self._sequence = self._count = self._ioas = self._values = self._quality = None
+        self._shm.close()
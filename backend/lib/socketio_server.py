@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+import contextvars
+import logging
+import time
+
+import socketio
+from engineio import packet as eio_packet
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CLIENT_QUEUE = 100       # packets waiting for one client before more are dropped
+DEFAULT_SLOW_CLIENT_TIMEOUT = 30.0   # seconds a client may lag before it is disconnected
+
+# SOCKETIO_SERIALIZER -> python-socketio serializer, clients must use the same one
+SERIALIZERS = {'json': 'default', 'msgpack': 'msgpack'}
+
+# The per-recipient send tasks of an emit inherit this context, so they know which event they carry
+emitting_event = contextvars.ContextVar('emitting_event', default=None)
+
+
+def serializer_for(name):
+    """The python-socketio serializer for a SOCKETIO_SERIALIZER value, JSON unless it is msgpack."""
+    serializer = SERIALIZERS.get((name or 'json').lower())
+    if serializer is None:
+        logger.warning("Unknown Socket.IO serializer %r, using json", name)
+        return SERIALIZERS['json']
+    return serializer
+
+
+def wire_size(data):
+    """Bytes an Engine.IO message payload takes on the wire, text is sent as UTF-8."""
+    return len(data.encode()) if isinstance(data, str) else len(data)
+
+
+class OutboundPacket(eio_packet.Packet):
+    """Engine.IO message queued for one client, counted out when its transport encodes it."""
+
+    def __init__(self, outbox, data):
+        super().__init__(eio_packet.MESSAGE, data)
+        self.outbox = outbox
+        self.encoded = False
+
+    def encode(self, b64=False):
+        if not self.encoded:
+            self.encoded = True
+            self.outbox.outstanding -= 1
+        return super().encode(b64)
+
+
+class ClientOutbox:
+    """What one client has queued but not yet received."""
+
+    def __init__(self):
+        self.outstanding = 0
+        self.snapshots = {}  # event -> its latest queued OutboundPacket
+        self.lagging_since = None
+        self.disconnecting = False
+
+
+class MeteredAsyncServer(socketio.AsyncServer):
+    """
+    AsyncServer with per-client backpressure and emit metrics.
+
+    Every packet emitted to a client is tracked until the client's transport
+    encodes it, which is when it starts going out. Events in
+    `snapshot_events` carry a full collection state, so a new snapshot
+    replaces one still waiting for the same client instead of queuing
+    behind it (drop to latest). Other events are dropped once
+    `max_queue` packets are waiting. A client that keeps lagging, with
+    snapshots replaced or packets dropped, for `slow_client_timeout`
+    seconds is disconnected.
+    """
+
+    def __init__(self, *args, snapshot_events=(), max_queue=DEFAULT_MAX_CLIENT_QUEUE,
+                 slow_client_timeout=DEFAULT_SLOW_CLIENT_TIMEOUT, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.snapshot_events = frozenset(snapshot_events)
+        self.max_queue = max_queue
+        self.slow_client_timeout = slow_client_timeout
+        self._outboxes = {}  # eio_sid -> ClientOutbox
+
+    async def emit(self, event, *args, **kwargs):
+        metrics.SOCKETIO_EMITS.inc(event)
+        token = emitting_event.set(event)
+        try:
+            return await super().emit(event, *args, **kwargs)
+        finally:
+            emitting_event.reset(token)
+
+    async def _send_eio_packet(self, eio_sid, eio_pkt):
+        event = emitting_event.get()
+        if event is None or eio_pkt.packet_type != eio_packet.MESSAGE:
+            await super()._send_eio_packet(eio_sid, eio_pkt)
+            return
+
+        outbox = self._outboxes.get(eio_sid)
+        if outbox is None:
+            outbox = self._outboxes[eio_sid] = ClientOutbox()
+        snapshot = event in self.snapshot_events
+
+        if snapshot:
+            pending = outbox.snapshots.get(event)
+            if pending is not None and not pending.encoded:
+                # The client has not started receiving the previous snapshot, send this one in its place
+                metrics.SOCKETIO_EMIT_BYTES.inc(event, amount=wire_size(eio_pkt.data) - wire_size(pending.data))
+                metrics.SOCKETIO_SNAPSHOTS_REPLACED.inc(event)
+                pending.data = eio_pkt.data
+                await self._track_lag(eio_sid, outbox, True)
+                return
+        elif outbox.outstanding >= self.max_queue:
+            metrics.SOCKETIO_PACKETS_DROPPED.inc(event)
+            await self._track_lag(eio_sid, outbox, True)
+            return
+
+        pkt = OutboundPacket(outbox, eio_pkt.data)
+        outbox.outstanding += 1
+        if snapshot:
+            outbox.snapshots[event] = pkt
+        metrics.SOCKETIO_EMIT_BYTES.inc(event, amount=wire_size(eio_pkt.data))
+        await self._track_lag(eio_sid, outbox, outbox.outstanding > self.max_queue)
+        await super()._send_eio_packet(eio_sid, pkt)
+
+    async def _track_lag(self, eio_sid, outbox, lagging):
+        if not lagging:
+            outbox.lagging_since = None
+            return
+        now = time.monotonic()
+        if outbox.lagging_since is None:
+            outbox.lagging_since = now
+        elif now - outbox.lagging_since >= self.slow_client_timeout and not outbox.disconnecting:
+            outbox.disconnecting = True
+            metrics.SOCKETIO_SLOW_CLIENT_DISCONNECTS.inc()
+            logger.warning("Disconnecting slow Socket.IO client %s: lagging for %.0fs with %s packets queued",
+                           self.client_sid(eio_sid), now - outbox.lagging_since, outbox.outstanding)
+            await self.eio.disconnect(eio_sid)
+
+    async def _handle_eio_disconnect(self, eio_sid, reason):
+        self._outboxes.pop(eio_sid, None)
+        await super()._handle_eio_disconnect(eio_sid, reason)
+
+    def client_sid(self, eio_sid):
+        """The Socket.IO sid of an Engine.IO connection, as handlers and logs know the client."""
+        return self.manager.sid_from_eio_sid(eio_sid, '/') or eio_sid
+
+    def queue_depths(self):
+        """Packets waiting per connected client, keyed by (sid,)."""
+        return {(self.client_sid(eio_sid),): outbox.outstanding for eio_sid, outbox in list(self._outboxes.items())}
@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+import logging
+import math
+import time
+
+from data_models import CircuitBreakerItem, TeleSignalItem, TelemetryItem, TapChangerItem, CounterItem
+from .collection import Collection
+from .dependencies import DependencyGraph
+from .libiec60870server import IEC60870_5_104_server
+from .lib60870 import (
+    SinglePointInformation,
+    MeasuredValueScaled,
+    SingleCommand,
+    DoubleCommand,
+    DoublePointInformation,
+    MeasuredValueShort,
+    IntegratedTotals,
+    IEC60870_QUALITY_GOOD,
+    CS104_MODE_SINGLE_REDUNDANCY_GROUP,
+)
+from .point_table import PointTable
+from .tap_changer import LOWER, RAISE
+
+logger = logging.getLogger(__name__)
+
+
+def point_callback(ioa, ioa_object, server, is_select=None):
+    """IOA callback of commandable points: apply the command, accept every select."""
+    return server.update_ioa_from_server(ioa, ioa_object['data']) if not is_select else True
+
+
+def add_circuit_breaker_points(server, item):
+    """Add the status and control IOAs of a circuit breaker."""
+    server.add_ioa(item.ioa_cb_status, SinglePointInformation, 0, point_callback, True)
+    server.add_ioa(item.ioa_cb_status_close, SinglePointInformation, 0, point_callback, True)
+
+    server.add_ioa(item.ioa_control_open, SingleCommand, 0, point_callback, True)
+    server.add_ioa(item.ioa_control_close, SingleCommand, 0, point_callback, True)
+
+    if item.has_double_point:
+        # Check if IOA values are not None before adding them
+        if item.ioa_cb_status_dp is not None:
+            server.add_ioa(item.ioa_cb_status_dp, DoublePointInformation, 0, point_callback, True)
+        if item.ioa_control_dp is not None:
+            server.add_ioa(item.ioa_control_dp, DoubleCommand, 0, point_callback, True)
+
+    server.add_ioa(item.ioa_local_remote_sp, SinglePointInformation, 0, point_callback, True)
+    if item.has_local_remote_dp:
+        server.add_ioa(item.ioa_local_remote_dp, DoublePointInformation, 0, point_callback, True)
+
+    apply_circuit_breaker_sbo(server, item)
+    return 0
+
+
+def apply_circuit_breaker_sbo(server, item):
+    """Mark the control IOAs of a circuit breaker as select-before-operate."""
+    for ioa in [item.ioa_control_open, item.ioa_control_close, item.ioa_control_dp]:
+        if ioa is not None and ioa in server.ioa_list:
+            server.ioa_list[ioa]['sbo'] = item.is_sbo
+            server.ioa_list[ioa]['sbo_timeout'] = item.sbo_timeout
+
+
+def add_tap_changer_points(server, item):
+    """Add the value, limit, status and command IOAs of a tap changer."""
+    server.add_ioa(item.ioa_value, MeasuredValueScaled, item.value, point_callback, True)
+    server.add_ioa(item.ioa_high_limit, MeasuredValueScaled, item.value_high_limit, point_callback, True)
+    server.add_ioa(item.ioa_low_limit, MeasuredValueScaled, item.value_low_limit, point_callback, True)
+    server.add_ioa(item.ioa_status_raise_lower, DoublePointInformation, 0, point_callback, True)  # 0 = neutral
+    server.add_ioa(item.ioa_status_auto_manual, DoublePointInformation, 0, point_callback, True)
+    server.add_ioa(item.ioa_local_remote, DoublePointInformation, 0, point_callback, True)
+    server.add_ioa(item.ioa_command_raise_lower, DoubleCommand, 0, point_callback, True)  # Command IOA with callback
+    server.add_ioa(item.ioa_command_auto_manual, DoubleCommand, 0, point_callback, True)  # Command IOA with callback
+    return 0
+
+
+def add_telesignal_point(server, item):
+    result = server.add_ioa(item.ioa, SinglePointInformation, item.value, point_callback, True)
+    if result == 0:
+        server.ioa_list[item.ioa]['auto_mode'] = item.auto_mode
+    return result
+
+
+def add_telemetry_point(server, item):
+    # Decimal scale factors are sent as MeasuredValueShort for better precision
+    if item.scale_factor >= 1:
+        value_type, value = MeasuredValueScaled, int(item.value / item.scale_factor)
+    else:
+        value_type, value = MeasuredValueShort, item.value
+    result = server.add_ioa(item.ioa, value_type, value, point_callback, True)
+    if result == 0:
+        point = server.ioa_list[item.ioa]
+        point['auto_mode'] = item.auto_mode
+        point['min_value'] = item.min_value
+        point['max_value'] = item.max_value
+        point['scale_factor'] = item.scale_factor
+        point['value_type'] = value_type.__name__
+    return result
+
+
+def add_counter_point(server, item):
+    """Reserve the counter IOA and register it with the counter integrator."""
+    result = server.add_ioa(item.ioa, IntegratedTotals, item.value, None, False)
+    if result != 0:
+        return result
+    server.counter_integrator.add(item.ioa, item.telemetry_id, item.value, item.scale_factor, item.group, item.has_timestamp)
+    return 0
+
+
+def simulate_telesignal(server, item):
+    """Draw the next auto mode value of a telesignal. Returns True if it changed."""
+    new_value = int(server.random.stream('telesignal', item.ioa).integers(0, 2))
+    if new_value == item.value:
+        return False
+    item.value = new_value
+    server.update_ioa(item.ioa, new_value)
+    return True
+
+
+def simulate_telemetry(server, item, dependencies=None):
+    """Draw the next auto mode value of a telemetry, a multiple of its scale factor within its range."""
+    scale_factor = item.scale_factor
+    possible_steps = int(round((item.max_value - item.min_value) / scale_factor)) + 1
+    random_step = int(server.random.stream('telemetry', item.ioa).integers(0, possible_steps))
+    # Round to the precision of the scale factor to avoid floating point errors
+    precision = 0 if scale_factor >= 1 else -int(math.floor(math.log10(scale_factor)))
+    new_value = round(item.min_value + random_step * scale_factor, precision)
+    if dependencies is not None:
+        # Breakers and tap changers the telemetry depends on apply on top
+        new_value = dependencies.apply(item, new_value)
+
+    item.value = new_value
+    if server.ioa_list.get(item.ioa, {}).get('type', MeasuredValueScaled) == MeasuredValueShort:
+        server.update_ioa(item.ioa, new_value)
+    else:
+        server.update_ioa(item.ioa, int(round(new_value / scale_factor)))
+    return new_value
+
+
+def simulate_tap_changer(server, item):
+    """
+    Start one auto mode step of a tap changer, turning back at the limits.
+    The move itself runs on the timer wheel. Returns the position it starts
+    from, or None if the changer is still moving.
+    """
+    operations = server.tap_changer_operations
+    if operations.is_moving(item):
+        return None
+    position = operations.position_of(item)
+    if position >= item.value_high_limit:
+        direction = LOWER
+    elif position <= item.value_low_limit:
+        direction = RAISE
+    else:
+        direction = RAISE if server.random.stream('tap_changer', item.ioa_value).integers(0, 2) else LOWER
+    operations.step(item, direction)
+    return position
+
+
+class PointEntry(dict):
+    """
+    One station's IOA entry, built from a template definition. The keys
+    every update touches (data, quality, type, event) are held here; the
+    rest of the definition (callback, sbo, auto_mode, limits, ...) is read
+    from the `shared` dict of the template until this station assigns it.
+    """
+    __slots__ = ('shared',)
+
+    def __init__(self, shared, value_type, data, event):
+        super().__init__(type=value_type, data=data, event=event, quality=IEC60870_QUALITY_GOOD)
+        self.shared = shared
+
+    def __missing__(self, key):
+        return self.shared[key]
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or key in self.shared
+
+    def get(self, key, default=None):
+        if dict.__contains__(self, key):
+            return dict.__getitem__(self, key)
+        return self.shared.get(key, default)
+
+
+class ItemInstance:
+    """
+    One station's copy of a template item. The field values of the
+    template item are class attributes of a subclass made once per item
+    (see of), so every station reads the same objects; assigning a field
+    stores it on the instance only and, like TrackedModel, touches the
+    Collection holding it.
+    """
+    _collection = None
+    _fields = ()
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name[0] != '_' and self._collection is not None:
+            self._collection.touch()
+
+    def model_dump(self):
+        return {name: getattr(self, name) for name in self._fields}
+
+    @classmethod
+    def of(cls, item):
+        fields = type(item).model_fields
+        attributes = {name: getattr(item, name) for name in fields}
+        return type(type(item).__name__, (cls,), dict(attributes, _fields=tuple(fields)))
+
+
+class _Definitions:
+    """Takes the place of the IEC server while the points of a template are defined."""
+
+    def __init__(self):
+        self.ioa_list = {}
+        self.counter_integrator = self
+        self.counters = []   # arguments of CounterIntegrator.add
+
+    def add_ioa(self, ioa, type=MeasuredValueScaled, data=0, callback=None, event=False):
+        if ioa in self.ioa_list:
+            return -1
+        self.ioa_list[int(ioa)] = {'type': type, 'data': data, 'callback': callback, 'event': event}
+        return 0
+
+    def add(self, ioa, *args):
+        self.counters.append((ioa, *args))
+
+
+class StationTemplate:
+    """
+    A configuration in the export_data format, validated once and shared
+    by every Station built from it.
+
+    Each item is turned into an ItemInstance class holding its fields, and
+    each point into a definition dict, so a farm of identical stations
+    keeps the names, IOAs, limits and types once; a Station only stores
+    the values it changes and its overrides.
+    """
+
+    def __init__(self, config):
+        definitions = _Definitions()
+        self.items = {'circuit_breakers': [], 'telesignals': [], 'telemetries': [], 'tap_changers': [], 'counters': []}
+        for data in config.get('circuit_breakers', []):
+            if 'is_double_point' in data and 'has_double_point' not in data:
+                data = dict(data, has_double_point=data['is_double_point'])
+            item = CircuitBreakerItem(**data)
+            add_circuit_breaker_points(definitions, item)
+            self.items['circuit_breakers'].append(ItemInstance.of(item))
+        for data in config.get('telesignals', []):
+            item = TeleSignalItem(**data)
+            add_telesignal_point(definitions, item)
+            self.items['telesignals'].append(ItemInstance.of(item))
+        for data in config.get('telemetries', []):
+            item = TelemetryItem(**data)
+            add_telemetry_point(definitions, item)
+            self.items['telemetries'].append(ItemInstance.of(item))
+        for data in config.get('tap_changers', []):
+            item = TapChangerItem(**data)
+            add_tap_changer_points(definitions, item)
+            self.items['tap_changers'].append(ItemInstance.of(item))
+        for data in config.get('counters', []):
+            item = CounterItem(**data)
+            if add_counter_point(definitions, item) == 0:
+                self.items['counters'].append(ItemInstance.of(item))
+        # ioa -> (value type, initial data, event, the rest of the entry shared by every station)
+        self.points = {
+            ioa: (entry.pop('type'), entry.pop('data'), entry.pop('event'), entry)
+            for ioa, entry in definitions.ioa_list.items()
+        }
+        self.counters = definitions.counters
+        logger.info("Station template: %s items, %s points", sum(map(len, self.items.values())), len(self.points))
+
+    def point_table(self, ioa_offset=0):
+        """A PointTable of fresh entries for one station."""
+        return PointTable({ioa + ioa_offset: PointEntry(shared, value_type, data, event) for ioa, (value_type, data, event, shared) in self.points.items()})
+
+    def instances(self, name, ioa_offset=0):
+        """Fresh instances of the items of collection `name`, with their IOAs moved up by `ioa_offset`."""
+        instances = []
+        for cls in self.items[name]:
+            item = cls()
+            if ioa_offset:
+                for field in cls._fields:
+                    value = getattr(cls, field)
+                    if (field == 'ioa' or field.startswith('ioa_')) and isinstance(value, int):
+                        object.__setattr__(item, field, value + ioa_offset)
+            instances.append(item)
+        return instances
+
+
+class DeltaBuffer:
+    """
+    IOAs of a station whose value or quality changed since the last take().
+    take() reads them from the point table, so a point that changed several
+    times is sent once, with its latest value and quality.
+    """
+
+    def __init__(self, points):
+        self.points = points
+        self.pending = set()
+
+    def record(self, ioa, value):
+        self.pending.add(ioa)
+
+    def record_quality(self, ioa, quality):
+        self.pending.add(ioa)
+
+    def take(self):
+        """[(ioa, value, quality), ...] of the changed points that still exist."""
+        pending, self.pending = self.pending, set()
+        points = self.points
+        changes = []
+        for ioa in pending:
+            point = points.get(ioa)
+            if point is not None:
+                changes.append((ioa, point['data'], point.get('quality', 0)))
+        return changes
+
+
+class Station:
+    """
+    One simulated RTU with its own IEC server, point table, items and auto
+    mode simulation, built from a StationTemplate (or a configuration in
+    the export_data format) with every IOA moved up by `ioa_offset`.
+
+    This is what a shard worker process runs for each of its stations; the
+    main process keeps running its own station in main.py. poll runs the
+    auto mode of the items that are due, like main.poll_ioa_values_once,
+    and every point change is kept in `deltas` for the coordinator.
+    """
+
+    def __init__(self, ca, host, port, config, seed=None, server_mode=CS104_MODE_SINGLE_REDUNDANCY_GROUP, ioa_offset=0):
+        template = config if isinstance(config, StationTemplate) else StationTemplate(config)
+        self.ca = ca
+        self.port = port
+        self.circuit_breakers = Collection('circuit_breakers')
+        self.telesignals = Collection('telesignals')
+        self.telemetries = Collection('telemetries')
+        self.tap_changers = Collection('tap_changers')
+        self.counters = Collection('counters')
+        self.server = IEC60870_5_104_server(
+            host,
+            port,
+            template.point_table(ioa_offset),
+            circuit_breakers=self.circuit_breakers,
+            telesignals=self.telesignals,
+            telemetries=self.telemetries,
+            tap_changers=self.tap_changers,
+            counters=self.counters,
+            server_mode=server_mode,
+            seed=seed,
+            common_address=ca,
+        )
+        self.dependencies = DependencyGraph(self.server, self.telemetries, self.circuit_breakers, self.tap_changers, lambda name: None)
+        self.server.dependencies = self.dependencies
+        self.deltas = DeltaBuffer(self.server.ioa_list)
+        self._last_update = {}
+        self._last_integration = time.time()
+
+        for name in template.items:
+            collection = getattr(self, name)
+            for item in template.instances(name, ioa_offset):
+                collection[item.id] = item
+        for ioa, *args in template.counters:
+            self.server.counter_integrator.add(ioa + ioa_offset, *args)
+        self.dependencies.rebuild()
+        # Only changes after loading are deltas, the coordinator starts from points()
+        self.server.recorder = self.deltas
+        logger.info("Station %s on port %s: %s points", ca, port, len(self.server.ioa_list))
+
+    def start(self):
+        return self.server.start()
+
+    def stop(self):
+        self.server.stop()
+
+    def points(self):
+        """[(ioa, type name, value, quality), ...] of every point, sorted by IOA."""
+        return [(ioa, entry['type'].__name__, entry['data'], entry.get('quality', 0)) for ioa, entry in sorted(self.server.ioa_list.items())]
+
+    def _due(self, item, now):
+        if now - self._last_update.get(item.id, 0) < item.interval:
+            return False
+        self._last_update[item.id] = now
+        return True
+
+    def poll(self, now=None):
+        """One pass over the auto mode items that are due and the counters."""
+        now = time.time() if now is None else now
+        for item in self.telesignals.values():
+            if item.auto_mode and self._due(item, now):
+                simulate_telesignal(self.server, item)
+        for item in self.telemetries.values():
+            if item.auto_mode and self._due(item, now):
+                simulate_telemetry(self.server, item, self.dependencies)
+        for item in self.tap_changers.values():
+            # 2 = auto mode
+            if item.auto_mode == 2 and self._due(item, now):
+                simulate_tap_changer(self.server, item)
+        if self.counters:
+            self.server.counter_integrator.integrate(now - self._last_integration, {item_id: item.value for item_id, item in self.telemetries.items()})
+        self._last_integration = now
+
+    def set_points(self, points):
+        """Override point values, [(ioa, value), ...] as sent on the wire. Returns the number that changed."""
+        return self.server.update_ioas(points)
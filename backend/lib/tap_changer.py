@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# ioa_command_raise_lower and ioa_status_raise_lower values
+IDLE = 0
+RAISE = 1
+LOWER = 2
+
+
+class TapOperation:
+    __slots__ = ('tc', 'direction', 'remaining', 'origin', 'timer')
+
+    def __init__(self, tc, direction, remaining, origin):
+        self.tc = tc
+        self.direction = direction
+        self.remaining = remaining
+        self.origin = origin
+        self.timer = None
+
+
+class TapChangerOperations:
+    """
+    On-load tap changer movement for commands, auto mode and scripts.
+
+    An operation moves the tap one position at a time: ioa_status_raise_lower
+    shows RAISE or LOWER for the changer's operating_time, then the position
+    changes by one and the status returns to IDLE. A changer that is already
+    moving, or a step past value_low_limit / value_high_limit, is refused,
+    with a negative ACT_TERM to a commanding master. Every operation is a
+    timer on the shared wheel, so hundreds of changers cost nothing between
+    their steps.
+    """
+
+    def __init__(self, server, timer_wheel):
+        self.server = server
+        self.timer_wheel = timer_wheel
+        self._operations = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._operations)
+
+    def is_moving(self, tc):
+        return tc.id in self._operations
+
+    def forget_connection(self, connection_id):
+        """Drop the origins of a closed connection, its operations finish without an ACT_TERM."""
+        with self._lock:
+            operations = [operation for operation in self._operations.values()
+                          if operation.origin is not None and operation.origin.connection_id == connection_id]
+            for operation in operations:
+                operation.origin = None
+        return len(operations)
+
+    def position_of(self, tc):
+        return self.server.ioa_list.get(tc.ioa_value, {}).get('data', tc.value)
+
+    def step(self, tc, direction, steps=1, origin=None):
+        """Start moving `tc` by `steps` positions up (direction RAISE) or down (LOWER). Returns 0 or -1."""
+        operation = TapOperation(tc, direction, steps, origin)
+        with self._lock:
+            refused = tc.id in self._operations or steps < 1 or not self._within_limits(tc, direction)
+            if not refused:
+                self._operations[tc.id] = operation
+        if refused:
+            logger.info("Tap changer %s refused to %s at position %s", tc.name, 'raise' if direction == RAISE else 'lower', self.position_of(tc))
+            self.server.breaker_operations.send_act_term(origin, negative=True)
+            return -1
+        operation.timer = self.timer_wheel.call_later(0, self._begin, operation)
+        return 0
+
+    def _within_limits(self, tc, direction):
+        position = self.position_of(tc)
+        if direction == RAISE:
+            return position + 1 <= tc.value_high_limit
+        return position - 1 >= tc.value_low_limit
+
+    def _begin(self, operation):
+        tc = operation.tc
+        self.server.update_ioa(tc.ioa_status_raise_lower, operation.direction)
+        operation.timer = self.timer_wheel.call_later(getattr(tc, 'operating_time', 0) or 0, self._complete, operation)
+
+    def _complete(self, operation):
+        tc = operation.tc
+        with self._lock:
+            if self._operations.get(tc.id) is not operation:
+                return
+        if self._within_limits(tc, operation.direction):
+            self.server.update_ioa(tc.ioa_value, self.position_of(tc) + (1 if operation.direction == RAISE else -1))
+            operation.remaining -= 1
+        else:
+            # The limits were narrowed while moving
+            operation.remaining = 0
+        if operation.remaining > 0 and self._within_limits(tc, operation.direction):
+            operation.timer = self.timer_wheel.call_later(getattr(tc, 'operating_time', 0) or 0, self._complete, operation)
+            return
+        with self._lock:
+            del self._operations[tc.id]
+        self.server.update_ioa(tc.ioa_status_raise_lower, IDLE)
+        self.server.breaker_operations.send_act_term(operation.origin, negative=operation.remaining > 0)
+
+    def cancel(self, tc):
+        """Stop a moving tap changer where it is, e.g. when it is removed."""
+        with self._lock:
+            operation = self._operations.pop(tc.id, None)
+        if operation is not None and operation.timer is not None:
+            operation.timer.cancel()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+import asyncio
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TimerHandle:
+    """Handle returned by TimerWheel.call_later, used to cancel a pending timer."""
+    __slots__ = ('tick', 'callback', 'args', 'cancelled')
+
+    def __init__(self, tick, callback, args):
+        self.tick = tick
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel shared by all simulation timers.
+
+    Timers are bucketed by tick, so scheduling and cancelling are O(1) and a
+    single asyncio task drives every pending timer instead of one task per
+    timer. call_later and cancel may be used from the lib60870 thread; the
+    callbacks always run on the thread that calls advance (the event loop).
+    """
+
+    def __init__(self, resolution=0.05, slots=512, clock=time.monotonic):
+        self.resolution = resolution
+        self.slots = slots
+        self.clock = clock
+        self._wheel = [[] for _ in range(slots)]
+        self._lock = threading.Lock()
+        self._start = clock()
+        self._tick = 0
+        self._pending = 0
+
+    def __len__(self):
+        return self._pending
+
+    def call_later(self, delay, callback, *args):
+        deadline = self.clock() + max(delay, 0)
+        # Round up so a timer never fires before its delay has elapsed
+        tick = -int(-(deadline - self._start) // self.resolution)
+        with self._lock:
+            tick = max(tick, self._tick + 1)
+            handle = TimerHandle(tick, callback, args)
+            self._wheel[tick % self.slots].append(handle)
+            self._pending += 1
+        return handle
+
+    def advance(self, now=None):
+        """Fire every timer that is due at `now`. Returns the number fired."""
+        if now is None:
+            now = self.clock()
+        target = int((now - self._start) // self.resolution)
+        due = []
+        with self._lock:
+            if target - self._tick >= self.slots:
+                # Fell behind by a full revolution, sweep every bucket once
+                buckets = range(self.slots)
+            else:
+                buckets = (tick % self.slots for tick in range(self._tick + 1, target + 1))
+            for index in buckets:
+                bucket = self._wheel[index]
+                if not bucket:
+                    continue
+                keep = []
+                for handle in bucket:
+                    if handle.cancelled:
+                        self._pending -= 1
+                    elif handle.tick <= target:
+                        due.append(handle)
+                        self._pending -= 1
+                    else:
+                        keep.append(handle)
+                self._wheel[index] = keep
+            self._tick = max(self._tick, target)
+
+        for handle in due:
+            if handle.cancelled:
+                continue
+            try:
+                handle.callback(*handle.args)
+            except Exception as e:
+                logger.error("Error in timer callback %s: %s", handle.callback, e)
+        return len(due)
+
+    async def run(self):
+        """Drive the wheel from the event loop until cancelled."""
+        logger.info("Starting timer wheel (%s slots, %ss resolution)", self.slots, self.resolution)
+        while True:
+            await asyncio.sleep(self.resolution)
+            self.advance()
@@ -1,52 +1,130 @@
 import asyncio
-import math
+import hashlib
+import json
 import time
-from typing import Dict
-from fastapi import FastAPI
+import uuid
+from typing import Any, Dict, List, Optional
+from fastapi import Body, FastAPI, Header, HTTPException
+from fastapi.responses import JSONResponse, Response
+from pydantic import ValidationError
 from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
 import socketio
 import uvicorn
 from dotenv import load_dotenv
 import os
-from lib.libiec60870server import IEC60870_5_104_server
+from lib.libiec60870server import IEC60870_5_104_server, QUALITY_FLAGS
+from lib.point_table import PointTable
+from lib.collection import Collection
+from lib.broadcaster import Broadcaster, DEFAULT_FRAME_RATE
+from lib.capture import ApduCapture, DEFAULT_MAX_BYTES as DEFAULT_CAPTURE_MAX_BYTES, DEFAULT_MAX_FILES as DEFAULT_CAPTURE_FILES
+from lib.dependencies import DependencyGraph
+from lib.recording import ScenarioRecorder, ScenarioReplayer
+from lib import station
+from lib.station import (
+    add_circuit_breaker_points,
+    add_counter_point,
+    add_tap_changer_points,
+    add_telemetry_point,
+    add_telesignal_point,
+    simulate_tap_changer,
+    simulate_telemetry,
+    simulate_telesignal,
+)
+from lib.sharding import ShardCoordinator, farm_specs, parse_port_range
+from lib.shared_points import SharedPointTable, DEFAULT_CAPACITY as DEFAULT_SHARED_POINTS_CAPACITY
+from lib.scenario_script import ScenarioScript, ScriptError, ScriptRun, load_script
+from lib.socketio_server import MeteredAsyncServer, DEFAULT_MAX_CLIENT_QUEUE, DEFAULT_SLOW_CLIENT_TIMEOUT, serializer_for
+from lib import metrics
+from lib.logging_setup import setup_logging
 import logging
-import random
-from data_models import CircuitBreakerItem, TeleSignalItem, TelemetryItem, TapChangerItem
+from data_models import CircuitBreakerItem, TeleSignalItem, TelemetryItem, TapChangerItem, CounterItem
 from lib.lib60870 import (
-    SinglePointInformation,
     MeasuredValueScaled,
-    SingleCommand,
-    DoubleCommand,
-    DoublePointInformation,
-    MeasuredValueShort
+    MeasuredValueShort,
+    CS104_MODE_SINGLE_REDUNDANCY_GROUP,
+    CS104_MODE_CONNECTION_IS_REDUNDANCY_GROUP
 )
 from functools import partial
 
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
-
 load_dotenv()
 
+# LOG_LEVEL, LOG_RATE_LIMIT and LOG_DEBUG_SAMPLE come from the environment
+LOG_LISTENER = setup_logging()
+logger = logging.getLogger(__name__)
+
 FASTAPI_HOST = os.getenv("FASTAPI_HOST")
 FASTAPI_PORT = int(os.getenv("FASTAPI_PORT"))
 
 IEC_SERVER_HOST = os.getenv("IEC_104_SERVER_HOST")
 IEC_SERVER_PORT = int(os.getenv("IEC_104_SERVER_PORT"))
+# "single": one active master at a time, "connection": every connection is its own redundancy group
+IEC_SERVER_MODES = {
+    "single": CS104_MODE_SINGLE_REDUNDANCY_GROUP,
+    "connection": CS104_MODE_CONNECTION_IS_REDUNDANCY_GROUP,
+}
+IEC_SERVER_MODE = IEC_SERVER_MODES.get(os.getenv("IEC_104_SERVER_MODE", "single"), CS104_MODE_SINGLE_REDUNDANCY_GROUP)
+# Path of a pcapng ring capturing every APDU, empty disables the capture
+IEC_CAPTURE_PATH = os.getenv("IEC_104_CAPTURE")
 
-IOA_LIST = {}
+# Seed of the simulated values, empty for a random seed (logged at startup)
+SIMULATION_SEED = int(os.getenv("SIMULATION_SEED")) if os.getenv("SIMULATION_SEED") else None
+
+# Directory of scenario recordings, and a recording to start with the server (empty: none)
+SCENARIO_DIR = os.getenv("SCENARIO_DIR", "scenarios")
+SCENARIO_RECORD = os.getenv("SCENARIO_RECORD")
+
+# Shared memory segment publishing the point values to other processes, empty disables it
+SHARED_POINTS_NAME = os.getenv("SHARED_POINTS_NAME")
+SHARED_POINTS_CAPACITY = int(os.getenv("SHARED_POINTS_CAPACITY") or DEFAULT_SHARED_POINTS_CAPACITY)
+
+# RTU farm: a station on every port of FARM_PORTS ("2404-2603") besides the main station, built from
+# the FARM_TEMPLATE export with CAs from FARM_FIRST_CA and the IOAs of the n-th station moved up by
+# n * FARM_IOA_OFFSET, run by FARM_WORKERS processes (default: one per core)
+FARM_PORTS = os.getenv("FARM_PORTS")
+FARM_TEMPLATE = os.getenv("FARM_TEMPLATE")
+FARM_FIRST_CA = int(os.getenv("FARM_FIRST_CA") or 2)
+FARM_IOA_OFFSET = int(os.getenv("FARM_IOA_OFFSET") or 0)
+FARM_WORKERS = int(os.getenv("FARM_WORKERS") or os.cpu_count() or 1)
+
+# "json" (default) or "msgpack", the frontend must be built with the same VITE_SOCKETIO_SERIALIZER
+SOCKETIO_SERIALIZER = os.getenv("SOCKETIO_SERIALIZER", "json")
+# Collections with at least this many items are sent columnar, 0 always sends a list of items
+SOCKETIO_COLUMNAR_MIN_ITEMS = int(os.getenv("SOCKETIO_COLUMNAR_MIN_ITEMS", 1000))
+
+IOA_LIST = PointTable()
 
 # In-memory storage for items
-circuit_breakers: Dict[str, CircuitBreakerItem] = {}
-telesignals: Dict[str, TeleSignalItem] = {}
-telemetries: Dict[str, TelemetryItem] = {}
-tap_changers: Dict[str, TapChangerItem] = {}
+circuit_breakers: Dict[str, CircuitBreakerItem] = Collection('circuit_breakers', columnar_min_items=SOCKETIO_COLUMNAR_MIN_ITEMS)
+telesignals: Dict[str, TeleSignalItem] = Collection('telesignals', columnar_min_items=SOCKETIO_COLUMNAR_MIN_ITEMS)
+telemetries: Dict[str, TelemetryItem] = Collection('telemetries', columnar_min_items=SOCKETIO_COLUMNAR_MIN_ITEMS)
+tap_changers: Dict[str, TapChangerItem] = Collection('tap_changers', columnar_min_items=SOCKETIO_COLUMNAR_MIN_ITEMS)
+counters: Dict[str, CounterItem] = Collection('counters', columnar_min_items=SOCKETIO_COLUMNAR_MIN_ITEMS)
 
 app = FastAPI()
-sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins='*')
+sio = MeteredAsyncServer(
+    async_mode='asgi',
+    cors_allowed_origins='*',
+    serializer=serializer_for(SOCKETIO_SERIALIZER),
+    # Collection broadcasts are full state, a client only needs the latest one
+    snapshot_events=('circuit_breakers', 'tele_signals', 'telesignals', 'telemetries', 'tap_changers', 'counters'),
+    max_queue=int(os.getenv("SOCKETIO_MAX_CLIENT_QUEUE", DEFAULT_MAX_CLIENT_QUEUE)),
+    slow_client_timeout=float(os.getenv("SOCKETIO_SLOW_CLIENT_TIMEOUT", DEFAULT_SLOW_CLIENT_TIMEOUT)),
+)
+metrics.Callback('socketio_client_queue_depth', 'Packets queued for each Socket.IO client and not yet sent', 'gauge', sio.queue_depths, ('sid',))
+
+# Collection broadcasts are coalesced and sent at most SOCKETIO_FRAME_RATE times per second
+broadcaster = Broadcaster(
+    sio,
+    {
+        'circuit_breakers': circuit_breakers,
+        'telesignals': telesignals,
+        'telemetries': telemetries,
+        'tap_changers': tap_changers,
+        'counters': counters,
+    },
+    frame_rate=float(os.getenv("SOCKETIO_FRAME_RATE", DEFAULT_FRAME_RATE)),
+)
 
 IEC_SERVER = IEC60870_5_104_server(
     IEC_SERVER_HOST, 
@@ -57,8 +135,42 @@ IEC_SERVER = IEC60870_5_104_server(
     telesignals=telesignals,
     telemetries=telemetries,
     tap_changers=tap_changers, 
+    counters=counters,
+    server_mode=IEC_SERVER_MODE,
+    capture=ApduCapture(
+        IEC_CAPTURE_PATH,
+        IEC_SERVER_HOST,
+        IEC_SERVER_PORT,
+        max_bytes=int(os.getenv("IEC_104_CAPTURE_MAX_BYTES", DEFAULT_CAPTURE_MAX_BYTES)),
+        max_files=int(os.getenv("IEC_104_CAPTURE_FILES", DEFAULT_CAPTURE_FILES)),
+    ) if IEC_CAPTURE_PATH else None,
+    seed=SIMULATION_SEED,
 )
 
+# Telemetries coupled to breaker and tap changer state, updated on every point change
+dependencies = DependencyGraph(IEC_SERVER, telemetries, circuit_breakers, tap_changers, broadcaster.mark)
+IEC_SERVER.dependencies = dependencies
+
+# Created when the server starts, so processes importing main do not take over the segment
+shared_points = SharedPointTable(SHARED_POINTS_NAME, IOA_LIST, SHARED_POINTS_CAPACITY) if SHARED_POINTS_NAME else None
+IEC_SERVER.shared_points = shared_points
+
+shards: Optional[ShardCoordinator] = None
+
+def start_farm():
+    global shards
+    if __name__ == "__main__":
+        logger.warning("Started as main.py, every farm worker re-imports it and sets the whole app up again; start the backend with serve.py")
+    ports = parse_port_range(FARM_PORTS)
+    if IEC_SERVER_PORT in ports:
+        logger.warning("Port %s of the farm is the main station's, no farm station is started on it", IEC_SERVER_PORT)
+        ports = [port for port in ports if port != IEC_SERVER_PORT]
+    with open(FARM_TEMPLATE) as f:
+        template = json.load(f)
+    specs = farm_specs(template, ports, FARM_FIRST_CA, FARM_IOA_OFFSET)
+    shards = ShardCoordinator(FARM_WORKERS, specs, IEC_SERVER_HOST, seed=SIMULATION_SEED, server_mode=IEC_SERVER_MODE)
+    shards.start()
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -70,61 +182,46 @@ app.add_middleware(
 @sio.event
 async def connect(sid, environ):
     """Handle new connections."""
-    logger.info(f"Socket client connected: {sid}")
+    logger.info("Socket client connected: %s", sid)
     
-    await sio.emit('circuit_breakers', [item.model_dump() for item in circuit_breakers.values()], room=sid)
-    await sio.emit('tele_signals', [item.model_dump() for item in telesignals.values()], room=sid)
-    await sio.emit('telemetries', [item.model_dump() for item in telemetries.values()], room=sid)
-    await sio.emit('tap_changers', [item.model_dump() for item in tap_changers.values()], room=sid)
+    await sio.emit('circuit_breakers', circuit_breakers.payload(), room=sid)
+    await sio.emit('tele_signals', telesignals.payload(), room=sid)
+    await sio.emit('telemetries', telemetries.payload(), room=sid)
+    await sio.emit('tap_changers', tap_changers.payload(), room=sid)
+    await sio.emit('counters', counters.payload(), room=sid)
 
 @sio.event
 async def disconnect(sid):
-    logger.info(f"Socket client disconnected: {sid}")
+    logger.info("Socket client disconnected: %s", sid)
     
 @sio.event
 async def get_initial_data(sid):
     """Send initial data to the frontend."""
     try:
         data = {
-            "circuit_breakers": [item.model_dump() for item in circuit_breakers.values()],
-            "telesignals": [item.model_dump() for item in telesignals.values()],
-            "telemetries": [item.model_dump() for item in telemetries.values()],
-            "tap_changers": [item.model_dump() for item in tap_changers.values()],
+            "circuit_breakers": circuit_breakers.payload(),
+            "telesignals": telesignals.payload(),
+            "telemetries": telemetries.payload(),
+            "tap_changers": tap_changers.payload(),
+            "counters": counters.payload(),
         }
         await sio.emit('get_initial_data_response', data, room=sid)
-        logger.info(f"Initial data sent to {sid}. Data: {data}")
+        logger.info("Initial data sent to %s", sid)
     except Exception as e:
-        logger.error(f"Error fetching initial data: {e}")
+        logger.error("Error fetching initial data: %s", e)
         await sio.emit('get_initial_data_error', {"error": "Failed to fetch initial data"}, room=sid)
         
 def add_circuit_breaker_ioa(item: CircuitBreakerItem):
-    
-    callback = lambda ioa, ioa_object, server, is_select=None: (
-        server.update_ioa_from_server(ioa, ioa_object['data']) 
-        if not is_select else True
-    )
-    
     """Add IOA for circuit breaker."""
-    IEC_SERVER.add_ioa(item.ioa_cb_status, SinglePointInformation, 0, callback, True)
-    IEC_SERVER.add_ioa(item.ioa_cb_status_close, SinglePointInformation, 0, callback, True)
-    
-    IEC_SERVER.add_ioa(item.ioa_control_open, SingleCommand, 0, callback, True)
-    IEC_SERVER.add_ioa(item.ioa_control_close, SingleCommand, 0, callback, True)
-
-    if item.has_double_point:
-        # Check if IOA values are not None before adding them
-        if item.ioa_cb_status_dp is not None:
-            IEC_SERVER.add_ioa(item.ioa_cb_status_dp, DoublePointInformation, 0, callback, True)
-        if item.ioa_control_dp is not None:
-            IEC_SERVER.add_ioa(item.ioa_control_dp, DoubleCommand, 0, callback, True)
+    add_circuit_breaker_points(IEC_SERVER, item)
     
-    IEC_SERVER.add_ioa(item.ioa_local_remote_sp, SinglePointInformation, 0, callback, True)
-    if item.has_local_remote_dp:
-        IEC_SERVER.add_ioa(item.ioa_local_remote_dp, DoublePointInformation, 0, callback, True)
-    
-    logger.info(f"Added circuit breaker: {item.name} with IOA CB status open (for unique value): {item.id}")
+    logger.info("Added circuit breaker: %s with IOA CB status open (for unique value): %s", item.name, item.id)
     
     return 0
+
+def apply_circuit_breaker_sbo(item: CircuitBreakerItem):
+    """Mark the control IOAs of a circuit breaker as select-before-operate."""
+    station.apply_circuit_breaker_sbo(IEC_SERVER, item)
     
 @sio.event
 async def add_circuit_breaker(sid, data):
@@ -137,7 +234,8 @@ async def add_circuit_breaker(sid, data):
         await sio.emit('error', {'message': f'Failed to add circuit breaker {item.name}'})
         return {"status": "error", "message": f"Failed to add circuit breaker {item.name}"}
     
-    await sio.emit('circuit_breakers', [item.model_dump() for item in circuit_breakers.values()])
+    dependencies.rebuild()
+    broadcaster.mark('circuit_breakers')
     return {"status": "success", "message": f"Added circuit breaker {item.name}"}
     
 @sio.event
@@ -201,9 +299,12 @@ async def update_circuit_breaker(sid, data):
                             IEC_SERVER.update_ioa(item.ioa_control_close, value)
                         elif key == 'control_dp':
                             IEC_SERVER.update_ioa(item.ioa_control_dp, value)
+                        elif key in ('is_sbo', 'sbo_timeout'):
+                            apply_circuit_breaker_sbo(circuit_breakers[item_id])
             
-            logger.info(f"Updated circuit breaker: {item.name}, data: {circuit_breakers[item_id].model_dump()}")
-            await sio.emit('circuit_breakers', [item.model_dump() for item in circuit_breakers.values()])
+            logger.info("Updated circuit breaker: %s, data: %s", item.name, circuit_breakers[item_id])
+            dependencies.rebuild()
+            broadcaster.mark('circuit_breakers')
             return {"status": "success"}
     
     return {"status": "error", "message": "Circuit breaker not found"}
@@ -227,8 +328,9 @@ async def remove_circuit_breaker(sid, data):
         if item.has_local_remote_dp:
             IEC_SERVER.remove_ioa(item.ioa_local_remote_dp)
         
-        logger.info(f"Removed circuit breaker: {item.name}")
-        await sio.emit('circuit_breakers', [item.model_dump() for item in circuit_breakers.values()])
+        logger.info("Removed circuit breaker: %s", item.name)
+        dependencies.rebuild()
+        broadcaster.mark('circuit_breakers')
         return {"status": "success", "message": f"Removed circuit breaker {item.name}"}
     return {"status": "error", "message": "Circuit breaker not found"}
     
@@ -237,17 +339,10 @@ async def add_telesignal(sid, data):
     item = TeleSignalItem(**data)
     telesignals[item.id] = item
     
-    callback = lambda ioa, ioa_object, server, is_select=None: (
-        server.update_ioa_from_server(ioa, ioa_object['data']) 
-        if not is_select else True
-    )
-    
     # Add a SinglePointInformation for telesignal
-    result = IEC_SERVER.add_ioa(item.ioa, SinglePointInformation, item.value, callback, True)
+    result = add_telesignal_point(IEC_SERVER, item)
     if result == 0:
-        # Initialize with auto_mode disabled
-        IEC_SERVER.ioa_list[item.ioa]['auto_mode'] = data.get('auto_mode', False)
-        await sio.emit('telesignals', [item.model_dump() for item in telesignals.values()])
+        broadcaster.mark('telesignals')
         return {"status": "success", "message": f"Added telesignal {item.name}"}
     else:
         await sio.emit('error', {'message': f'Failed to add telesignal IOA {item.ioa}'})
@@ -268,18 +363,10 @@ async def update_telesignal(sid, data):
                 IEC_SERVER.remove_ioa(old_ioa)
                 
                 # Add new IOA
-                callback = lambda ioa, ioa_object, server, is_select=None: (
-                    server.update_ioa_from_server(ioa, ioa_object['data']) 
-                    if not is_select else True
-                )
-                
-                result = IEC_SERVER.add_ioa(new_ioa, SinglePointInformation, item.value, callback, True)
+                result = add_telesignal_point(IEC_SERVER, item.model_copy(update={'ioa': new_ioa}))
                 if result != 0:
                     await sio.emit('error', {'message': f'Failed to update telesignal IOA to {new_ioa}'})
                     return {"status": "error", "message": f"Failed to update IOA to {new_ioa}"}
-                
-                # Update auto_mode for new IOA
-                IEC_SERVER.ioa_list[new_ioa]['auto_mode'] = item.auto_mode
             
             # Update all fields that are provided in the data
             for key, value in data.items():
@@ -290,8 +377,8 @@ async def update_telesignal(sid, data):
                     if key == 'value':
                         IEC_SERVER.update_ioa(item.ioa, value)
             
-            logger.info(f"Updated telesignal: {item.name}, data: {telesignals[item_id].model_dump()}")
-            await sio.emit('telesignals', [item.model_dump() for item in telesignals.values()])
+            logger.info("Updated telesignal: %s, data: %s", item.name, telesignals[item_id])
+            broadcaster.mark('telesignals')
             return {"status": "success"}
     
     return {"status": "error", "message": "Telesignal not found"}
@@ -307,8 +394,8 @@ async def remove_telesignal(sid, data):
         if result != 0:
             await sio.emit('error', {'message': f'Failed to remove telesignal IOA {item.ioa}'})
         
-        logger.info(f"Removed telesignal: {item.name}")
-        await sio.emit('telesignals', [item.model_dump() for item in telesignals.values()])
+        logger.info("Removed telesignal: %s", item.name)
+        broadcaster.mark('telesignals')
         return {"status": "success", "message": f"Removed telesignal {item.name}"}
     return {"status": "error", "message": "Telesignal not found"}
 
@@ -317,37 +404,16 @@ async def add_telemetry(sid, data):
     item = TelemetryItem(**data)
     telemetries[item.id] = item
     
-    # Determine type based on scale factor
-    if item.scale_factor >= 1:
-        # Use MeasuredValueScaled for integer or larger scale factors
-        value_type = MeasuredValueScaled
-        # Scale value as needed for integer representation
-        scaled_value = int(item.value / item.scale_factor)
-    else:
-        # Use MeasuredValueShort for decimal scale factors for better precision
-        value_type = MeasuredValueShort
-        # Use actual value for MeasuredValueShort (float)
-        scaled_value = item.value
-
-    callback = lambda ioa, ioa_object, server, is_select=None: (
-        server.update_ioa_from_server(ioa, ioa_object['data']) 
-        if not is_select else True
-    )
-    
-    result = IEC_SERVER.add_ioa(item.ioa, value_type, scaled_value, callback, True)
+    # MeasuredValueScaled, or MeasuredValueShort for decimal scale factors
+    result = add_telemetry_point(IEC_SERVER, item)
     if result == 0:
-        # Initialize with auto_mode disabled
-        IEC_SERVER.ioa_list[item.ioa]['auto_mode'] = False
-        IEC_SERVER.ioa_list[item.ioa]['min_value'] = item.min_value
-        IEC_SERVER.ioa_list[item.ioa]['max_value'] = item.max_value
-        IEC_SERVER.ioa_list[item.ioa]['scale_factor'] = item.scale_factor  # Store scale factor for reference
-        IEC_SERVER.ioa_list[item.ioa]['value_type'] = value_type.__name__  # Store type name for reference
-        await sio.emit('telemetries', [item.model_dump() for item in telemetries.values()])
+        broadcaster.mark('telemetries')
     else:
         await sio.emit('error', {'message': f'Failed to add telemetry IOA {item.ioa}'})
     
-    logger.info(f"Added telemetry: {item.name} with IOA {item.ioa} using {value_type.__name__}")
-    await sio.emit('telemetries', [item.model_dump() for item in telemetries.values()])
+    logger.info("Added telemetry: %s with IOA %s using %s", item.name, item.ioa, IEC_SERVER.ioa_list.get(item.ioa, {}).get('value_type'))
+    dependencies.rebuild()
+    broadcaster.mark('telemetries')
     return {"status": "success", "message": f"Added telemetry {item.name}"}
 
 @sio.event
@@ -366,40 +432,19 @@ async def update_telemetry(sid, data):
                     # Remove old IOA
                     IEC_SERVER.remove_ioa(old_ioa)
                     
-                    # Determine type based on scale factor
+                    # Add new IOA, typed by the scale factor it will have after this update
                     scale_factor = data.get('scale_factor', item.scale_factor)
-                    if scale_factor >= 1:
-                        # Use MeasuredValueScaled for integer or larger scale factors
-                        value_type = MeasuredValueScaled
-                        # Scale value as needed for integer representation
-                        scaled_value = int(item.value / scale_factor)
-                    else:
-                        # Use MeasuredValueShort for decimal scale factors for better precision
-                        value_type = MeasuredValueShort
-                        # Use actual value for MeasuredValueShort (float)
-                        scaled_value = item.value
-                    
-                    # Add new IOA
-                    callback = lambda ioa, ioa_object, server, is_select=None: (
-                        server.update_ioa_from_server(ioa, ioa_object['data']) 
-                        if not is_select else True
-                    )
-                    
-                    result = IEC_SERVER.add_ioa(new_ioa, value_type, scaled_value, callback, True)
+                    result = add_telemetry_point(IEC_SERVER, item.model_copy(update={'ioa': new_ioa, 'scale_factor': scale_factor}))
                     if result != 0:
                         await sio.emit('error', {'message': f'Failed to update telemetry IOA to {new_ioa}'})
                         return {"status": "error", "message": f"Failed to update IOA to {new_ioa}"}
-                    
-                    # Update auto_mode and other metadata for new IOA
-                    IEC_SERVER.ioa_list[new_ioa]['auto_mode'] = item.auto_mode
-                    IEC_SERVER.ioa_list[new_ioa]['min_value'] = item.min_value
-                    IEC_SERVER.ioa_list[new_ioa]['max_value'] = item.max_value
-                    IEC_SERVER.ioa_list[new_ioa]['scale_factor'] = scale_factor
-                    IEC_SERVER.ioa_list[new_ioa]['value_type'] = value_type.__name__
                 
                 # Update all fields that are provided in the data
                 for key, value in data.items():
                     if hasattr(telemetries[item_id], key) and key != 'id':
+                        if key == 'value':
+                            # A coupled telemetry keeps the value as its base
+                            value = dependencies.apply(telemetries[item_id], value)
                         setattr(telemetries[item_id], key, value)
                         
                         # Update IEC server for the IOA value
@@ -415,8 +460,10 @@ async def update_telemetry(sid, data):
                                 scaled_value = int(round(value / item.scale_factor))
                                 IEC_SERVER.update_ioa(item.ioa, scaled_value)
                 
-                logger.info(f"Updated telemetry: {item.name}, data: {telemetries[item_id].model_dump()}")
-                await sio.emit('telemetries', [item.model_dump() for item in telemetries.values()])
+                logger.info("Updated telemetry: %s, data: %s", item.name, telemetries[item_id])
+                if data.keys() & {'ioa', 'breaker_ids', 'tap_changer_id', 'tap_step', 'tap_neutral'}:
+                    dependencies.rebuild()
+                broadcaster.mark('telemetries')
                 return {"status": "success"}
     return {"status": "error", "message": "Telemetry not found"}
 
@@ -431,29 +478,18 @@ async def remove_telemetry(sid, data):
         if result != 0:
             await sio.emit('error', {'message': f'Failed to remove telemetry IOA {item.ioa}'})
         
-        logger.info(f"Removed telemetry: {item.name}")
-        await sio.emit('telemetries', [item.model_dump() for item in telemetries.values()])
+        logger.info("Removed telemetry: %s", item.name)
+        dependencies.rebuild()
+        broadcaster.mark('telemetries')
         return {"status": "success", "message": f"Removed telemetry {item.name}"}
     return {"status": "error", "message": "Telemetry not found"}
     
 @sio.event
 def add_tap_changer_ioa(item: TapChangerItem):
-    callback = lambda ioa, ioa_object, server, is_select=None: (
-        server.update_ioa_from_server(ioa, ioa_object['data']) 
-        if not is_select else True
-    )
-
     # Add IOAs to the IEC server
-    IEC_SERVER.add_ioa(item.ioa_value, MeasuredValueScaled, item.value, callback, True)
-    IEC_SERVER.add_ioa(item.ioa_high_limit, MeasuredValueScaled, item.value_high_limit, callback, True)
-    IEC_SERVER.add_ioa(item.ioa_low_limit, MeasuredValueScaled, item.value_low_limit, callback, True)
-    IEC_SERVER.add_ioa(item.ioa_status_raise_lower, DoublePointInformation, 0, callback, True)  # 0 = neutral
-    IEC_SERVER.add_ioa(item.ioa_status_auto_manual, DoublePointInformation, 0, callback, True)
-    IEC_SERVER.add_ioa(item.ioa_local_remote, DoublePointInformation, 0, callback, True)
-    IEC_SERVER.add_ioa(item.ioa_command_raise_lower, DoubleCommand, 0, callback, True)  # Command IOA with callback
-    IEC_SERVER.add_ioa(item.ioa_command_auto_manual, DoubleCommand, 0, callback, True)  # Command IOA with callback
-
-    logger.info(f"Added tap changer: {item.name} with IOA {item.ioa_value} for value")
+    add_tap_changer_points(IEC_SERVER, item)
+
+    logger.info("Added tap changer: %s with IOA %s for value", item.name, item.ioa_value)
     
     return 0
     
@@ -472,7 +508,8 @@ async def add_tap_changer(sid, data):
     IEC_SERVER.ioa_list[item.ioa_value]['value_low_limit'] = item.value_low_limit
     IEC_SERVER.ioa_list[item.ioa_value]['value_high_limit'] = item.value_high_limit
     
-    await sio.emit('tap_changers', [item.model_dump() for item in tap_changers.values()])
+    dependencies.rebuild()
+    broadcaster.mark('tap_changers')
     return {"status": "success", "message": f"Added tap changer {item.name}"}
         
 @sio.event
@@ -491,7 +528,7 @@ async def update_tap_changer(sid, data):
                 # If there are IOA changes, remove old IOAs and add new ones
                 if ioa_changes:
                     
-                    logger.info(f"Got IOA changes for tap changer {item.name}: {ioa_changes}")
+                    logger.info("Got IOA changes for tap changer %s: %s", item.name, ioa_changes)
                     
                     # Remove all old IOAs
                     IEC_SERVER.remove_ioa(item.ioa_value)
@@ -512,7 +549,7 @@ async def update_tap_changer(sid, data):
                     add_tap_changer_ioa(tap_changers[item_id])
                 else:
                     # No IOA changes, just update fields and IOA values
-                    logger.info(f"No IOA changes for tap changer {item.name}, updating straight to specific ioa")
+                    logger.info("No IOA changes for tap changer %s, updating straight to specific ioa", item.name)
                     for key, value in data.items():
                         if hasattr(tap_changers[item_id], key) and key != 'id':
                             setattr(tap_changers[item_id], key, value)
@@ -529,8 +566,9 @@ async def update_tap_changer(sid, data):
                             elif key == 'is_local_remote':
                                 IEC_SERVER.update_ioa(item.ioa_local_remote, value)
                 
-                logger.info(f"Updated tap changer: {item.name}, data: {tap_changers[item_id].model_dump()}")
-                await sio.emit('tap_changers', [item.model_dump() for item in tap_changers.values()])
+                logger.info("Updated tap changer: %s, data: %s", item.name, tap_changers[item_id])
+                dependencies.rebuild()
+                broadcaster.mark('tap_changers')
                 return {"status": "success"}
     
     return {"status": "error", "message": "Tap changer not found"}
@@ -540,6 +578,7 @@ async def remove_tap_changer(sid, data):
     item_id = data.get('id')
     if item_id and item_id in tap_changers:
         item = tap_changers.pop(item_id)
+        IEC_SERVER.tap_changer_operations.cancel(item)
         
         # Remove all IOAs from the IEC server
         IEC_SERVER.remove_ioa(item.ioa_value)
@@ -551,12 +590,101 @@ async def remove_tap_changer(sid, data):
         IEC_SERVER.remove_ioa(item.ioa_command_auto_manual)
         IEC_SERVER.remove_ioa(item.ioa_local_remote)
         
-        logger.info(f"Removed tap changer: {item.name}")
-        await sio.emit('tap_changers', [item.model_dump() for item in tap_changers.values()])
+        logger.info("Removed tap changer: %s", item.name)
+        dependencies.rebuild()
+        broadcaster.mark('tap_changers')
         return {"status": "success", "message": f"Removed tap changer {item.name}"}
     
     return {"status": "error", "message": "Tap changer not found"}
 
+def add_counter_ioa(item: CounterItem):
+    """Reserve the counter IOA and register it with the counter integrator."""
+    result = add_counter_point(IEC_SERVER, item)
+    if result != 0:
+        return result
+    
+    logger.info("Added counter: %s with IOA %s integrating telemetry %s", item.name, item.ioa, item.telemetry_id)
+    return 0
+
+def remove_counter_ioa(item: CounterItem):
+    IEC_SERVER.counter_integrator.remove(item.ioa)
+    return IEC_SERVER.remove_ioa(item.ioa)
+
+@sio.event
+async def add_counter(sid, data):
+    item = CounterItem(**data)
+    
+    result = add_counter_ioa(item)
+    if result != 0:
+        await sio.emit('error', {'message': f'Failed to add counter IOA {item.ioa}'})
+        return {"status": "error", "message": f"Failed to add counter {item.name}"}
+    
+    counters[item.id] = item
+    broadcaster.mark('counters')
+    return {"status": "success", "message": f"Added counter {item.name}"}
+
+@sio.event
+async def update_counter(sid, data):
+    id = data.get('id')
+    if id and id in counters:
+        item = counters[id]
+        old_ioa = item.ioa
+        new_ioa = data.get('ioa')
+        
+        # Update all fields that are provided in the data
+        for key, value in data.items():
+            if hasattr(item, key) and key != 'id':
+                setattr(item, key, value)
+        
+        if new_ioa is not None and old_ioa != new_ioa:
+            IEC_SERVER.counter_integrator.remove(old_ioa)
+            IEC_SERVER.remove_ioa(old_ioa)
+            result = add_counter_ioa(item)
+            if result != 0:
+                await sio.emit('error', {'message': f'Failed to update counter IOA to {new_ioa}'})
+                return {"status": "error", "message": f"Failed to update IOA to {new_ioa}"}
+        else:
+            IEC_SERVER.counter_integrator.configure(item.ioa, item.telemetry_id, item.scale_factor, item.group, item.has_timestamp)
+            if 'value' in data:
+                IEC_SERVER.counter_integrator.set_value(item.ioa, item.value)
+        
+        logger.info("Updated counter: %s, data: %s", item.name, item)
+        broadcaster.mark('counters')
+        return {"status": "success"}
+    
+    return {"status": "error", "message": "Counter not found"}
+
+@sio.event
+async def remove_counter(sid, data):
+    item_id = data.get('id')
+    if item_id and item_id in counters:
+        item = counters.pop(item_id)
+        
+        result = remove_counter_ioa(item)
+        if result != 0:
+            await sio.emit('error', {'message': f'Failed to remove counter IOA {item.ioa}'})
+        
+        logger.info("Removed counter: %s", item.name)
+        broadcaster.mark('counters')
+        return {"status": "success", "message": f"Removed counter {item.name}"}
+    return {"status": "error", "message": "Counter not found"}
+
+@sio.event
+async def set_quality(sid, data):
+    """Set the quality flags of an IOA range, e.g. to simulate a feeder losing communication."""
+    try:
+        ioa_start = int(data.get('ioa_start', data.get('ioa')))
+        ioa_end = int(data.get('ioa_end', ioa_start))
+        quality = 0
+        for flag in data.get('flags', []):
+            quality |= QUALITY_FLAGS[flag]
+    except (KeyError, TypeError, ValueError) as e:
+        return {"status": "error", "message": f"Invalid quality request: {e}"}
+    
+    changed = IEC_SERVER.set_quality(ioa_start, ioa_end, quality)
+    logger.info("Set quality %s on IOA %s-%s, %s points changed", data.get('flags', []), ioa_start, ioa_end, changed)
+    return {"status": "success", "changed": changed}
+
 @sio.event
 async def export_data(sid):
     """Export all data as JSON via socket."""
@@ -575,13 +703,14 @@ async def export_data(sid):
         
         data = {
             "circuit_breakers": circuit_breaker_data,
-            "telesignals": [item.model_dump() for item in telesignals.values()],
-            "telemetries": [item.model_dump() for item in telemetries.values()],
-            "tap_changers": [item.model_dump() for item in tap_changers.values()],
+            "telesignals": telesignals.rows(),
+            "telemetries": telemetries.rows(),
+            "tap_changers": tap_changers.rows(),
+            "counters": counters.rows(),
         }
         await sio.emit('export_data_response', data, room=sid)
     except Exception as e:
-        logger.error(f"Error exporting data: {e}")
+        logger.error("Error exporting data: %s", e)
         await sio.emit('export_data_error', {"error": "Failed to export data"}, room=sid)
 
 @sio.event
@@ -594,6 +723,9 @@ async def import_data(sid, data):
         telesignals.clear()
         telemetries.clear()
         tap_changers.clear()
+        for item in counters.values():
+            remove_counter_ioa(item)
+        counters.clear()
 
         # Populate with new data
         for cb in data.get("circuit_breakers", []):
@@ -610,36 +742,19 @@ async def import_data(sid, data):
             item = TeleSignalItem(**ts)
             telesignals[item.id] = item
             # Add IOAs to the IEC server
-            result = IEC_SERVER.add_ioa(item.ioa, SinglePointInformation, item.value, None, True)
+            result = add_telesignal_point(IEC_SERVER, item)
             if result == 0:
-                # Initialize with auto_mode disabled
-                IEC_SERVER.ioa_list[item.ioa]['auto_mode'] = False
-                logger.info(f"Added telesignal: {item.name} with IOA {item.ioa}")
+                logger.info("Added telesignal: %s with IOA %s", item.name, item.ioa)
             else:
                 await sio.emit('error', {'message': f'Failed to add telesignal IOA {item.ioa}'})
 
         for tm in data.get("telemetries", []):
             item = TelemetryItem(**tm)
             telemetries[item.id] = item
-            
-            # Determine type based on scale factor
-            if item.scale_factor >= 1:
-                value_type = MeasuredValueScaled
-                scaled_value = int(item.value / item.scale_factor)
-            else:
-                value_type = MeasuredValueShort
-                scaled_value = item.value
     
-            result = IEC_SERVER.add_ioa(item.ioa, value_type, scaled_value, None, True)
+            result = add_telemetry_point(IEC_SERVER, item)
             if result == 0:
-                # Initialize with auto_mode disabled
-                IEC_SERVER.ioa_list[item.ioa]['auto_mode'] = False
-                IEC_SERVER.ioa_list[item.ioa]['min_value'] = item.min_value
-                IEC_SERVER.ioa_list[item.ioa]['max_value'] = item.max_value
-                IEC_SERVER.ioa_list[item.ioa]['scale_factor'] = item.scale_factor
-                IEC_SERVER.ioa_list[item.ioa]['value_type'] = value_type.__name__
-                
-                logger.info(f"Added telemetry: {item.name} with IOA {item.ioa} using {value_type.__name__}")
+                logger.info("Added telemetry: %s with IOA %s using %s", item.name, item.ioa, IEC_SERVER.ioa_list[item.ioa]['value_type'])
             else:
                 await sio.emit('error', {'message': f'Failed to add telemetry IOA {item.ioa}'})
                 
@@ -650,18 +765,30 @@ async def import_data(sid, data):
             # Add all tap changer IOAs
             result = add_tap_changer_ioa(item)
             if result == 0:
-                logger.info(f"Added tap changer: {item.name} with IOAs")
+                logger.info("Added tap changer: %s with IOAs", item.name)
             else:
                 await sio.emit('error', {'message': f'Failed to add tap changer {item.name}'})
         
+        for ct in data.get("counters", []):
+            item = CounterItem(**ct)
+            
+            result = add_counter_ioa(item)
+            if result == 0:
+                counters[item.id] = item
+            else:
+                await sio.emit('error', {'message': f'Failed to add counter IOA {item.ioa}'})
+        
+        dependencies.rebuild()
+
         # Emit updated data to all clients 
-        await sio.emit('circuit_breakers', [item.model_dump() for item in circuit_breakers.values()], room=sid)
-        await sio.emit('telesignals', [item.model_dump() for item in telesignals.values()], room=sid)
-        await sio.emit('telemetries', [item.model_dump() for item in telemetries.values()], room=sid)
-        await sio.emit('tap_changers', [item.model_dump() for item in tap_changers.values()], room=sid)
+        await sio.emit('circuit_breakers', circuit_breakers.payload(), room=sid)
+        await sio.emit('telesignals', telesignals.payload(), room=sid)
+        await sio.emit('telemetries', telemetries.payload(), room=sid)
+        await sio.emit('tap_changers', tap_changers.payload(), room=sid)
+        await sio.emit('counters', counters.payload(), room=sid)
         await sio.emit('import_data_response', {"status": "success"}, room=sid)
     except Exception as e:
-        logger.error(f"Error importing data: {e}")
+        logger.error("Error importing data: %s", e)
         await sio.emit('import_data_error', {"error": "Failed to import data"}, room=sid)
 
 @sio.event
@@ -669,41 +796,17 @@ async def update_order(sid, data):
     item_type = data.get('type')
     item_ids = data.get('items', [])
     
-    if item_type == 'circuit_breakers':
-        # Reorder circuit_breakers based on item_ids
-        global circuit_breakers
-        ordered_items = {}
-        for id in item_ids:
-            if id in circuit_breakers:
-                ordered_items[id] = circuit_breakers[id]
-        circuit_breakers = ordered_items
-        
-    elif item_type == 'telesignals':
-        # Reorder telesignals
-        global telesignals
-        ordered_items = {}
-        for id in item_ids:
-            if id in telesignals:
-                ordered_items[id] = telesignals[id]
-        telesignals = ordered_items
-        
-    elif item_type == 'telemetries':
-        # Reorder telemetries
-        global telemetries
-        ordered_items = {}
-        for id in item_ids:
-            if id in telemetries:
-                ordered_items[id] = telemetries[id]
-        telemetries = ordered_items
-        
-    elif item_type == 'tap_changers':
-        # Reorder tap_changers
-        global tap_changers
-        ordered_items = {}
-        for id in item_ids:
-            if id in tap_changers:
-                ordered_items[id] = tap_changers[id]
-        tap_changers = ordered_items
+    # Reorder in place: IEC_SERVER holds the same collection objects
+    collections = {
+        'circuit_breakers': circuit_breakers,
+        'telesignals': telesignals,
+        'telemetries': telemetries,
+        'tap_changers': tap_changers,
+        'counters': counters,
+    }
+    if item_type in collections:
+        collections[item_type].reorder(item_ids)
+        dependencies.rebuild()
     
 async def monitor_circuit_breaker_changes():
     """
@@ -744,7 +847,7 @@ async def monitor_circuit_breaker_changes():
                         previous_values[cb_id]["cb_status"] = server_value
                         circuit_breakers[cb_id].cb_status_open = server_value
                         cb_changed = True
-                        logger.info(f"Change detected for CB {cb.name} status open: {server_value}")
+                        logger.info("Change detected for CB %s status open: %s", cb.name, server_value)
                 
                 if cb.ioa_cb_status_close in IEC_SERVER.ioa_list:
                     server_value = IEC_SERVER.ioa_list[cb.ioa_cb_status_close]['data']
@@ -752,7 +855,7 @@ async def monitor_circuit_breaker_changes():
                         previous_values[cb_id]["cb_status_close"] = server_value
                         circuit_breakers[cb_id].cb_status_close = server_value
                         cb_changed = True
-                        logger.info(f"Change detected for CB {cb.name} status close: {server_value}")
+                        logger.info("Change detected for CB %s status close: %s", cb.name, server_value)
                 
                 # Check if double point status value changed
                 if cb.has_double_point and cb.ioa_cb_status_dp and cb.ioa_cb_status_dp in IEC_SERVER.ioa_list:
@@ -761,7 +864,7 @@ async def monitor_circuit_breaker_changes():
                         previous_values[cb_id]["cb_status_dp"] = server_value
                         circuit_breakers[cb_id].cb_status_dp = server_value
                         cb_changed = True
-                        logger.info(f"Change detected for CB {cb.name} status DP: {server_value}")
+                        logger.info("Change detected for CB %s status DP: %s", cb.name, server_value)
                 
                 # Check if control values changed
                 if cb.ioa_control_open in IEC_SERVER.ioa_list:
@@ -770,7 +873,7 @@ async def monitor_circuit_breaker_changes():
                         previous_values[cb_id]["control_open"] = server_value
                         circuit_breakers[cb_id].control_open = server_value
                         cb_changed = True
-                        logger.info(f"Change detected for CB {cb.name} control open: {server_value}")
+                        logger.info("Change detected for CB %s control open: %s", cb.name, server_value)
                 
                 if cb.ioa_control_close in IEC_SERVER.ioa_list:
                     server_value = IEC_SERVER.ioa_list[cb.ioa_control_close]['data']
@@ -778,7 +881,7 @@ async def monitor_circuit_breaker_changes():
                         previous_values[cb_id]["control_close"] = server_value
                         circuit_breakers[cb_id].control_close = server_value
                         cb_changed = True
-                        logger.info(f"Change detected for CB {cb.name} control close: {server_value}")
+                        logger.info("Change detected for CB %s control close: %s", cb.name, server_value)
                 
                 if cb.has_double_point and cb.ioa_control_dp and cb.ioa_control_dp in IEC_SERVER.ioa_list:
                     server_value = IEC_SERVER.ioa_list[cb.ioa_control_dp]['data']
@@ -786,7 +889,7 @@ async def monitor_circuit_breaker_changes():
                         previous_values[cb_id]["control_dp"] = server_value
                         circuit_breakers[cb_id].control_dp = server_value
                         cb_changed = True
-                        logger.info(f"Change detected for CB {cb.name} control DP: {server_value}")
+                        logger.info("Change detected for CB %s control DP: %s", cb.name, server_value)
                 
                 # Check if local/remote single point changed
                 if cb.ioa_local_remote_sp in IEC_SERVER.ioa_list:
@@ -795,7 +898,7 @@ async def monitor_circuit_breaker_changes():
                         previous_values[cb_id]["remote_sp"] = server_value
                         circuit_breakers[cb_id].remote_sp = server_value
                         cb_changed = True
-                        logger.info(f"Change detected for CB {cb.name} remote SP: {server_value}")
+                        logger.info("Change detected for CB %s remote SP: %s", cb.name, server_value)
                 
                 # Check if local/remote double point changed
                 if cb.has_local_remote_dp and cb.ioa_local_remote_dp in IEC_SERVER.ioa_list:
@@ -804,20 +907,20 @@ async def monitor_circuit_breaker_changes():
                         previous_values[cb_id]["remote_dp"] = server_value
                         circuit_breakers[cb_id].remote_dp = server_value
                         cb_changed = True
-                        logger.info(f"Change detected for CB {cb.name} remote DP: {server_value}")
+                        logger.info("Change detected for CB %s remote DP: %s", cb.name, server_value)
 
                 if cb_changed:
                     changes_detected = True
             
             # If any circuit breaker changed, emit the updated list to all connected clients
             if changes_detected:
-                await sio.emit('circuit_breakers', [item.model_dump() for item in circuit_breakers.values()])
+                broadcaster.mark('circuit_breakers')
             
             # Sleep briefly to avoid excessive CPU usage
             await asyncio.sleep(0.1)
             
         except Exception as e:
-            logger.error(f"Error in circuit breaker monitoring task: {str(e)}")
+            logger.error("Error in circuit breaker monitoring task: %s", e)
             await asyncio.sleep(3)  # Wait before retrying if there's an error
             
 async def monitor_tap_changer_changes():
@@ -856,7 +959,7 @@ async def monitor_tap_changer_changes():
                         previous_values[tc_id]["value"] = server_value
                         tap_changers[tc_id].value = server_value
                         tc_changed = True
-                        logger.info(f"Change detected for TC {tc.name} value: {server_value}")
+                        logger.info("Change detected for TC %s value: %s", tc.name, server_value)
                 
                 # Check if auto/manual status changed
                 if tc.ioa_status_auto_manual in IEC_SERVER.ioa_list:
@@ -865,7 +968,7 @@ async def monitor_tap_changer_changes():
                         previous_values[tc_id]["auto_mode"] = server_value
                         tap_changers[tc_id].auto_mode = server_value
                         tc_changed = True
-                        logger.info(f"Change detected for TC {tc.name} auto mode: {server_value}")
+                        logger.info("Change detected for TC %s auto mode: %s", tc.name, server_value)
                 
                 # Check if local/remote status changed
                 if tc.ioa_local_remote in IEC_SERVER.ioa_list:
@@ -874,7 +977,7 @@ async def monitor_tap_changer_changes():
                         previous_values[tc_id]["is_local_remote"] = server_value
                         tap_changers[tc_id].is_local_remote = server_value
                         tc_changed = True
-                        logger.info(f"Change detected for TC {tc.name} local/remote: {server_value}")
+                        logger.info("Change detected for TC %s local/remote: %s", tc.name, server_value)
                 
                 # Check if raise/lower status changed
                 if tc.ioa_status_raise_lower in IEC_SERVER.ioa_list:
@@ -882,7 +985,7 @@ async def monitor_tap_changer_changes():
                     if previous_values[tc_id]["status_raise_lower"] != server_value:
                         previous_values[tc_id]["status_raise_lower"] = server_value
                         tc_changed = True
-                        logger.info(f"Change detected for TC {tc.name} raise/lower status: {server_value}")
+                        logger.info("Change detected for TC %s raise/lower status: %s", tc.name, server_value)
                 
                 # Check if raise/lower command changed
                 if tc.ioa_command_raise_lower in IEC_SERVER.ioa_list:
@@ -890,7 +993,7 @@ async def monitor_tap_changer_changes():
                     if previous_values[tc_id]["command_raise_lower"] != server_value:
                         previous_values[tc_id]["command_raise_lower"] = server_value
                         tc_changed = True
-                        logger.info(f"Change detected for TC {tc.name} raise/lower command: {server_value}")
+                        logger.info("Change detected for TC %s raise/lower command: %s", tc.name, server_value)
                 
                 # Check if auto/manual command changed
                 if tc.ioa_command_auto_manual in IEC_SERVER.ioa_list:
@@ -898,22 +1001,140 @@ async def monitor_tap_changer_changes():
                     if previous_values[tc_id]["command_auto_manual"] != server_value:
                         previous_values[tc_id]["command_auto_manual"] = server_value
                         tc_changed = True
-                        logger.info(f"Change detected for TC {tc.name} auto/manual command: {server_value}")
+                        logger.info("Change detected for TC %s auto/manual command: %s", tc.name, server_value)
 
                 if tc_changed:
                     changes_detected = True
             
             # If any tap changer changed, emit the updated list to all connected clients
             if changes_detected:
-                await sio.emit('tap_changers', [item.model_dump() for item in tap_changers.values()])
+                broadcaster.mark('tap_changers')
             
             # Sleep briefly to avoid excessive CPU usage
             await asyncio.sleep(0.1)
             
         except Exception as e:
-            logger.error(f"Error in tap changer monitoring task: {str(e)}")
+            logger.error("Error in tap changer monitoring task: %s", e)
             await asyncio.sleep(3)  # Wait before retrying if there's an error
 
+def new_poll_state():
+    """Per-item last update times kept between poll_ioa_values iterations."""
+    return {
+        "last_update_times": {
+            "circuit_breakers": {},
+            "telesignals": {},
+            "telemetries": {},
+            "tap_changers": {},
+            "counters": {}
+        },
+        "last_integration_time": time.time(),
+    }
+
+async def poll_ioa_values_once(state):
+    """
+    One polling pass: simulate the auto mode items that are due, integrate
+    the counters and mark the collections that changed for broadcast.
+    """
+    current_time = time.time()
+    has_updates = {
+        "circuit_breakers": False,
+        "telesignals": False,
+        "telemetries": False,
+        "tap_changers": False,
+        "counters": False
+    }
+
+    # Simulate telesignals in auto mode
+    for item_id, item in list(telesignals.items()):
+        # Skip if not due for update yet
+        last_update = state["last_update_times"]["telesignals"].get(item_id, 0)
+        if current_time - last_update < item.interval:
+            continue
+
+        # Check if auto mode is enabled
+        if not getattr(item, 'auto_mode', True):  # Default to True for backward compatibility
+            continue
+
+        if simulate_telesignal(IEC_SERVER, item):
+            logger.debug("Telesignal auto-updated: %s (IOA: %s) value: %s", item.name, item.ioa, telesignals[item_id].value)
+
+            # Record update time
+            state["last_update_times"]["telesignals"][item_id] = current_time
+            has_updates["telesignals"] = True
+
+    # Simulate telemetry in auto mode
+    for item_id, item in list(telemetries.items()):
+        # Skip if not due for update yet
+        last_update = state["last_update_times"]["telemetries"].get(item_id, 0)
+        if current_time - last_update < item.interval:
+            continue
+
+        # Check if auto mode is enabled
+        if not getattr(item, 'auto_mode', True):  # Default to True for backward compatibility
+            continue
+
+        # A random multiple of the scale factor within range, coupled to breakers and tap changers
+        simulate_telemetry(IEC_SERVER, item, dependencies)
+
+        logger.debug("Telemetry auto-updated: %s (IOA: %s) value: %s", item.name, item.ioa, telemetries[item_id].value)
+
+        # Record update time
+        state["last_update_times"]["telemetries"][item_id] = current_time
+        has_updates["telemetries"] = True
+
+    # Poll tap changers in auto mode
+    for item_id, item in list(tap_changers.items()):
+        # Check if item should be updated based on interval
+        last_update = state["last_update_times"]["tap_changers"].get(item_id, 0)
+        # Use number comparison: 2 = auto mode
+        if current_time - last_update >= item.interval and item.auto_mode == 2:
+            # One step up or down, turning back at the limits; the move itself runs on the timer wheel
+            position = simulate_tap_changer(IEC_SERVER, item)
+            if position is not None:
+                logger.debug("Tap changer auto-step: %s (IOA: %s) from %s", item.name, item.ioa_value, position)
+
+            # Record update time, monitor_tap_changer_changes reports the new position
+            state["last_update_times"]["tap_changers"][item_id] = current_time
+
+    # Integrate energy counters from their linked telemetries
+    if counters:
+        IEC_SERVER.counter_integrator.integrate(
+            current_time - state["last_integration_time"],
+            {item_id: item.value for item_id, item in telemetries.items()}
+        )
+    state["last_integration_time"] = current_time
+
+    counter_values = None
+    for item_id, item in list(counters.items()):
+        last_update = state["last_update_times"]["counters"].get(item_id, 0)
+        if current_time - last_update < item.interval:
+            continue
+
+        if counter_values is None:
+            counter_values = IEC_SERVER.counter_integrator.values()
+        new_value = counter_values.get(item.ioa, item.value)
+        if new_value != item.value:
+            counters[item_id].value = new_value
+            has_updates["counters"] = True
+        state["last_update_times"]["counters"][item_id] = current_time
+
+    # Broadcast updates only if there were changes
+    if has_updates["circuit_breakers"] and circuit_breakers:
+        broadcaster.mark('circuit_breakers')
+    if has_updates["telesignals"] and telesignals:
+        broadcaster.mark('telesignals')
+    if has_updates["telemetries"] and telemetries:
+        broadcaster.mark('telemetries')
+    if has_updates["tap_changers"] and tap_changers:
+        broadcaster.mark('tap_changers')
+    if has_updates["counters"] and counters:
+        broadcaster.mark('counters')
+
+    # Publish the points added or removed since the last pass
+    if shared_points is not None:
+        shared_points.refresh()
+    return has_updates
+
 async def poll_ioa_values():
     """
     Continuously poll IOA values from the IEC server and send them to frontend clients.
@@ -922,144 +1143,52 @@ async def poll_ioa_values():
     """
     logger.info("Starting IOA polling task")
     
-    # Store last update times
-    last_update_times = {
-        "circuit_breakers": {},
-        "telesignals": {},
-        "telemetries": {},
-        "tap_changers": {}
-    }
+    state = new_poll_state()
     
     while True:
         try:
-            current_time = time.time()
-            has_updates = {
-                "circuit_breakers": False,
-                "telesignals": False,
-                "telemetries": False,
-                "tap_changers": False
-            }
-            
-            # Simulate telesignals in auto mode
-            for item_id, item in list(telesignals.items()):
-                # Skip if not due for update yet
-                last_update = last_update_times["telesignals"].get(item_id, 0)
-                if current_time - last_update < item.interval:
-                    continue
-                
-                # Check if auto mode is enabled
-                if not getattr(item, 'auto_mode', True):  # Default to True for backward compatibility
-                    continue
-                    
-                new_value = random.randint(0, 1)  # Simulate a random value for the telesignal
-                if new_value != item.value:
-                    telesignals[item_id].value = new_value
-                    IEC_SERVER.update_ioa(item.ioa, new_value)
-                    
-                    logger.info(f"Telesignal auto-updated: {item.name} (IOA: {item.ioa}) value: {telesignals[item_id].value}")
-                    
-                    # Record update time
-                    last_update_times["telesignals"][item_id] = current_time
-                    has_updates["telesignals"] = True
-            
-            # Simulate telemetry in auto mode
-            for item_id, item in list(telemetries.items()):
-                # Skip if not due for update yet
-                last_update = last_update_times["telemetries"].get(item_id, 0)
-                if current_time - last_update < item.interval:
-                    continue
-                    
-                # Check if auto mode is enabled
-                if not getattr(item, 'auto_mode', True):  # Default to True for backward compatibility
-                    continue
-                    
-                # Generate a random value within range that's a multiple of the scale factor
-                scale_factor = item.scale_factor
-                # Determine how many possible steps exist within the range
-                possible_steps = int(round((item.max_value - item.min_value) / scale_factor)) + 1
-                # Choose a random step
-                random_step = random.randint(0, possible_steps - 1)
-                new_value = item.min_value + (random_step * scale_factor)
-                # Determine precision based on scale factor
-                precision = 0 if scale_factor >= 1 else -int(math.floor(math.log10(scale_factor)))
-                # Round to appropriate precision to avoid floating point errors
-                new_value = round(new_value, precision)
-                
-                # Update the telemetry object with the new value
-                telemetries[item_id].value = new_value
-                
-                # Get the value type from IOA list
-                value_type = IEC_SERVER.ioa_list.get(item.ioa, {}).get('type', MeasuredValueScaled)
-                
-                # Update based on value type
-                if value_type == MeasuredValueShort:
-                    # For MeasuredValueShort, use the actual value
-                    IEC_SERVER.update_ioa(item.ioa, new_value)
-                else:
-                    # For MeasuredValueScaled, scale the value
-                    scaled_value = int(round(new_value / scale_factor))
-                    IEC_SERVER.update_ioa(item.ioa, scaled_value)
-                
-                logger.info(f"Telemetry auto-updated: {item.name} (IOA: {item.ioa}) value: {telemetries[item_id].value}")
-                
-                # Record update time
-                last_update_times["telemetries"][item_id] = current_time
-                has_updates["telemetries"] = True
-            
-            # Poll tap changers in auto mode
-            for item_id, item in list(tap_changers.items()):
-                # Check if item should be updated based on interval
-                last_update = last_update_times["tap_changers"].get(item_id, 0)
-                # Use number comparison: 2 = auto mode
-                if current_time - last_update >= item.interval and item.auto_mode == 2:
-                    # random value between high and low limit
-                    new_value = random.randint(item.value_low_limit, item.value_high_limit)
-                    
-                    # Update the tap changer value
-                    tap_changers[item_id].value = new_value
-                    
-                    # Update IEC server
-                    IEC_SERVER.update_ioa(item.ioa_value, new_value)
-                    
-                    logger.info(f"Tap changer auto-updated: {item.name} (IOA: {item.ioa_value}) value: {new_value}")
-                    
-                    # Record update time
-                    last_update_times["tap_changers"][item_id] = current_time
-                    has_updates["tap_changers"] = True   
-            
-            # Broadcast updates only if there were changes
-            if has_updates["circuit_breakers"] and circuit_breakers:
-                await sio.emit('circuit_breakers', [item.model_dump() for item in circuit_breakers.values()])
-            if has_updates["telesignals"] and telesignals:
-                await sio.emit('telesignals', [item.model_dump() for item in telesignals.values()])
-            if has_updates["telemetries"] and telemetries:
-                await sio.emit('telemetries', [item.model_dump() for item in telemetries.values()])
-            if has_updates["tap_changers"] and tap_changers:
-                await sio.emit('tap_changers', [item.model_dump() for item in tap_changers.values()])
+            await poll_ioa_values_once(state)
 
             # Use a shorter sleep time to check more frequently, but not burn CPU
+            sleep_started = time.perf_counter()
             await asyncio.sleep(0.1)
+            metrics.POLL_LOOP_LAG.observe(max(time.perf_counter() - sleep_started - 0.1, 0.0))
             
         except Exception as e:
-            logger.error(f"Error in IOA polling task: {str(e)}")
+            logger.error("Error in IOA polling task: %s", e)
             await asyncio.sleep(3)  # Wait before retrying if there's an error
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("Starting IEC 60870-5-104 server...")
     IEC_SERVER.start()
+    if shared_points is not None:
+        shared_points.open()
+    if SCENARIO_RECORD:
+        start_recording(SCENARIO_RECORD)
+    if FARM_PORTS and FARM_TEMPLATE:
+        start_farm()
         
     # Start the IOA polling task
+    timer_wheel_task = asyncio.create_task(IEC_SERVER.timer_wheel.run())
     circuit_breaker_task = asyncio.create_task(monitor_circuit_breaker_changes())
     tap_changer_task = asyncio.create_task(monitor_tap_changer_changes())
     polling_task = asyncio.create_task(poll_ioa_values())
+    broadcaster_task = asyncio.create_task(broadcaster.run())
 
     yield
 
     # Cancel the polling task when shutting down
+    timer_wheel_task.cancel()
     circuit_breaker_task.cancel()
     tap_changer_task.cancel()
     polling_task.cancel()
+    broadcaster_task.cancel()
+    
+    try:
+        await timer_wheel_task
+    except asyncio.CancelledError:
+        pass
     
     try:
         await circuit_breaker_task
@@ -1075,9 +1204,25 @@ async def lifespan(app: FastAPI):
         await polling_task
     except asyncio.CancelledError:
         pass
+        
+    try:
+        await broadcaster_task
+    except asyncio.CancelledError:
+        pass
     
+    if replay_task is not None:
+        replay_task.cancel()
+    if script_run is not None:
+        script_run.stop()
+    stop_recording()
+    if shards is not None:
+        shards.stop()
+    if shared_points is not None:
+        shared_points.close()
+
     logger.info("Stopping IEC 60870-5-104 server...")
     IEC_SERVER.stop()
+    LOG_LISTENER.stop()
     
 app = FastAPI(lifespan=lifespan)
 socket_app = socketio.ASGIApp(sio, app)
@@ -1086,16 +1231,411 @@ socket_app = socketio.ASGIApp(sio, app)
 @app.get("/")
 async def root():
     return {
-        "message": "Modbus TCP Server Simulator API", 
+        "message": "IEC 60870-5-104 Server Simulator API", 
         "status": "running",
         "items": {
             "circuit_breakers": len(circuit_breakers),
             "telesignals": len(telesignals),
             "telemetries": len(telemetries),
-            "tap_changers": len(tap_changers)
+            "tap_changers": len(tap_changers),
+            "counters": len(counters)
         }
     }
 
+@app.get("/metrics")
+async def get_metrics():
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+# REST API for automation, sharing the Socket.IO handlers' update and IOA registration code.
+# Responses carry only what the caller asked for; dashboards get the change with the next broadcast frame.
+
+# Common address of every ASDU the server sends
+STATION_CA = 1
+# Collection ETags embed the process, versions restart from 0 on every start
+BOOT_ID = uuid.uuid4().hex[:8]
+
+def item_etag(item):
+    return '"' + hashlib.blake2b(item.model_dump_json().encode(), digest_size=8).hexdigest() + '"'
+
+def collection_etag(collection):
+    return f'"{BOOT_ID}-{collection.version}"'
+
+def etag_matches(header, etag):
+    """True if an If-Match / If-None-Match header value names `etag`."""
+    if header.strip() == '*':
+        return True
+    return etag in (tag.strip().removeprefix('W/') for tag in header.split(','))
+
+def check_if_match(if_match, etag):
+    if if_match is not None and not etag_matches(if_match, etag):
+        raise HTTPException(status_code=412, detail="ETag does not match")
+
+def validated_changes(model, item, patch):
+    """The fields of `patch` as the model validates them on top of `item`. Raises HTTPException 422."""
+    unknown = [key for key in patch if key not in model.model_fields]
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unknown fields: {', '.join(unknown)}")
+    try:
+        validated = model.model_validate({**item.model_dump(), **patch})
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False))
+    return {key: getattr(validated, key) for key in patch if key != 'id'}
+
+async def apply_patch(collection, model, update, item_id, patch):
+    item = collection.get(item_id)
+    if item is None:
+        raise HTTPException(status_code=404, detail=f"{item_id} not found")
+    changes = validated_changes(model, item, patch)
+    if changes:
+        result = await update(None, {'id': item_id, **changes})
+        if result.get("status") != "success":
+            raise HTTPException(status_code=409, detail=result.get("message"))
+    return collection[item_id]
+
+def add_collection_routes(name, collection, model, add, update, remove):
+    """GET/POST /<name>, batch PATCH /<name>, and GET/PATCH/DELETE /<name>/{item_id}."""
+
+    async def list_items(if_none_match: Optional[str] = Header(None)):
+        etag = collection_etag(collection)
+        if if_none_match is not None and etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={'ETag': etag})
+        return JSONResponse(collection.rows(), headers={'ETag': etag})
+
+    async def get_item(item_id: str, if_none_match: Optional[str] = Header(None)):
+        item = collection.get(item_id)
+        if item is None:
+            raise HTTPException(status_code=404, detail=f"{item_id} not found")
+        etag = item_etag(item)
+        if if_none_match is not None and etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={'ETag': etag})
+        return JSONResponse(item.model_dump(), headers={'ETag': etag})
+
+    async def create_item(data: Dict[str, Any] = Body(...)):
+        try:
+            item = model.model_validate(data)
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=e.errors(include_url=False))
+        if item.id in collection:
+            raise HTTPException(status_code=409, detail=f"{item.id} already exists")
+        result = await add(None, item.model_dump())
+        if not result or result.get("status") != "success":
+            raise HTTPException(status_code=409, detail=(result or {}).get("message", f"Failed to add {item.id}"))
+        item = collection[item.id]
+        return JSONResponse(item.model_dump(), status_code=201, headers={'ETag': item_etag(item)})
+
+    async def patch_item(item_id: str, patch: Dict[str, Any] = Body(...), if_match: Optional[str] = Header(None)):
+        item = collection.get(item_id)
+        if item is None:
+            raise HTTPException(status_code=404, detail=f"{item_id} not found")
+        check_if_match(if_match, item_etag(item))
+        item = await apply_patch(collection, model, update, item_id, patch)
+        return JSONResponse(item.model_dump(), headers={'ETag': item_etag(item)})
+
+    async def patch_items(patches: List[Dict[str, Any]] = Body(...)):
+        """Apply many partial updates, each {"id": ..., fields...} with an optional "etag" to match."""
+        results = []
+        for patch in patches:
+            patch = dict(patch)
+            item_id = patch.pop('id', None)
+            expected = patch.pop('etag', None)
+            try:
+                if expected is not None and item_id in collection:
+                    check_if_match(expected, item_etag(collection[item_id]))
+                item = await apply_patch(collection, model, update, item_id, patch)
+                results.append({'id': item_id, 'status': 'success', 'etag': item_etag(item)})
+            except HTTPException as e:
+                results.append({'id': item_id, 'status': 'error', 'code': e.status_code, 'message': e.detail})
+        return {'results': results}
+
+    async def delete_item(item_id: str, if_match: Optional[str] = Header(None)):
+        item = collection.get(item_id)
+        if item is None:
+            raise HTTPException(status_code=404, detail=f"{item_id} not found")
+        check_if_match(if_match, item_etag(item))
+        await remove(None, {'id': item_id})
+        return Response(status_code=204)
+
+    app.add_api_route(f"/{name}", list_items, methods=["GET"])
+    app.add_api_route(f"/{name}", create_item, methods=["POST"])
+    app.add_api_route(f"/{name}", patch_items, methods=["PATCH"])
+    app.add_api_route(f"/{name}/{{item_id}}", get_item, methods=["GET"])
+    app.add_api_route(f"/{name}/{{item_id}}", patch_item, methods=["PATCH"])
+    app.add_api_route(f"/{name}/{{item_id}}", delete_item, methods=["DELETE"])
+
+add_collection_routes('circuit_breakers', circuit_breakers, CircuitBreakerItem, add_circuit_breaker, update_circuit_breaker, remove_circuit_breaker)
+add_collection_routes('telesignals', telesignals, TeleSignalItem, add_telesignal, update_telesignal, remove_telesignal)
+add_collection_routes('telemetries', telemetries, TelemetryItem, add_telemetry, update_telemetry, remove_telemetry)
+add_collection_routes('tap_changers', tap_changers, TapChangerItem, add_tap_changer, update_tap_changer, remove_tap_changer)
+add_collection_routes('counters', counters, CounterItem, add_counter, update_counter, remove_counter)
+
+def check_station(ca):
+    if ca != STATION_CA:
+        raise HTTPException(status_code=404, detail=f"Station {ca} not found")
+
+def sharded_station(ca):
+    """The coordinator's copy of station `ca` if it runs in a shard worker, else None."""
+    return shards.stations.get(ca) if shards is not None else None
+
+def point_json(ioa, entry):
+    return {'ioa': ioa, 'type': entry['type'].__name__, 'value': entry['data'], 'quality': entry.get('quality', 0)}
+
+@app.get("/stations")
+async def get_stations():
+    stations = [{'ca': STATION_CA, 'points': len(IEC_SERVER.ioa_list)}]
+    if shards is not None:
+        stations += [
+            {'ca': station.ca, 'points': len(station.points), 'port': station.port, 'shard': station.shard}
+            for station in sorted(shards.stations.values(), key=lambda station: station.ca)
+        ]
+    return stations
+
+@app.get("/stations/{ca}/points")
+async def get_points(ca: int, if_none_match: Optional[str] = Header(None)):
+    sharded = sharded_station(ca)
+    if sharded is not None:
+        points = [sharded.point_json(ioa) for ioa in sorted(sharded.points)]
+    else:
+        check_station(ca)
+        points = [point_json(ioa, entry) for ioa, entry in sorted(IEC_SERVER.ioa_list.items())]
+    body = json.dumps(points, separators=(',', ':'))
+    etag = '"' + hashlib.blake2b(body.encode(), digest_size=8).hexdigest() + '"'
+    if if_none_match is not None and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={'ETag': etag})
+    return Response(body, media_type='application/json', headers={'ETag': etag})
+
+@app.get("/stations/{ca}/points/{ioa}")
+async def get_point(ca: int, ioa: int):
+    sharded = sharded_station(ca)
+    if sharded is not None:
+        if ioa not in sharded.points:
+            raise HTTPException(status_code=404, detail=f"IOA {ioa} not found")
+        return sharded.point_json(ioa)
+    check_station(ca)
+    entry = IEC_SERVER.ioa_list.get(ioa)
+    if entry is None:
+        raise HTTPException(status_code=404, detail=f"IOA {ioa} not found")
+    return point_json(ioa, entry)
+
+def patch_sharded_points(sharded, points):
+    """Validate overrides of a station in a shard worker and send the valid ones to it in one message."""
+    results = []
+    updates = []
+    for point in points:
+        ioa = point.get('ioa')
+        value = point.get('value')
+        known = isinstance(ioa, int) and ioa in sharded.points
+        if not known or not isinstance(value, (int, float)):
+            results.append({'ioa': ioa, 'status': 'error', 'message': "Unknown IOA" if not known else "Value must be a number"})
+            continue
+        updates.append((ioa, value))
+        results.append({'ioa': ioa, 'status': 'success'})
+    if updates and shards.set_points(sharded.ca, updates) != 0:
+        for result in results:
+            if result['status'] == 'success':
+                result.update(status='error', message="Shard worker is not running")
+    return {'results': results}
+
+@app.patch("/stations/{ca}/points")
+async def patch_points(ca: int, points: List[Dict[str, Any]] = Body(...)):
+    """
+    Override point values, [{"ioa": ..., "value": ...}, ...], with values as
+    sent on the wire (scaled for MeasuredValueScaled). A telemetry or
+    telesignal value IOA is updated through its item, so the dashboards
+    show it too; other IOAs are updated on the IEC server directly. For a
+    station in a shard worker the values are sent to the worker, and show
+    in the points once its next deltas arrive.
+    """
+    sharded = sharded_station(ca)
+    if sharded is not None:
+        return patch_sharded_points(sharded, points)
+    check_station(ca)
+    owners = {item.ioa: ('telemetries', item) for item in telemetries.values()}
+    owners.update({item.ioa: ('telesignals', item) for item in telesignals.values()})
+    results = []
+    for point in points:
+        ioa = point.get('ioa')
+        value = point.get('value')
+        entry = IEC_SERVER.ioa_list.get(ioa) if isinstance(ioa, int) else None
+        if entry is None or not isinstance(value, (int, float)):
+            results.append({'ioa': ioa, 'status': 'error', 'message': "Unknown IOA" if entry is None else "Value must be a number"})
+            continue
+        owner = owners.get(ioa)
+        if owner is None:
+            ok = IEC_SERVER.update_ioa(ioa, value) == 0
+        elif owner[0] == 'telemetries':
+            item = owner[1]
+            item_value = value if entry['type'] == MeasuredValueShort else value * item.scale_factor
+            ok = (await update_telemetry(None, {'id': item.id, 'value': item_value})).get("status") == "success"
+        else:
+            ok = (await update_telesignal(None, {'id': owner[1].id, 'value': int(value)})).get("status") == "success"
+        results.append({'ioa': ioa, 'status': 'success' if ok else 'error'})
+    return {'results': results}
+
+@app.get("/shards")
+async def get_shards():
+    return shards.status() if shards is not None else []
+
+# Scenario recording and replay, see lib/recording.py
+replayer: Optional[ScenarioReplayer] = None
+replay_task: Optional[asyncio.Task] = None
+
+def scenario_path(name):
+    if not isinstance(name, str) or not name or os.path.basename(name) != name or name.startswith('.'):
+        raise HTTPException(status_code=422, detail="Scenario name must be a plain file name")
+    return os.path.join(SCENARIO_DIR, name)
+
+def start_recording(name):
+    path = scenario_path(name)
+    os.makedirs(SCENARIO_DIR, exist_ok=True)
+    IEC_SERVER.recorder = ScenarioRecorder(path)
+    logger.info("Recording point changes to %s", path)
+
+def stop_recording():
+    recorder, IEC_SERVER.recorder = IEC_SERVER.recorder, None
+    if recorder is not None:
+        recorder.close()
+    return recorder
+
+def replayed_item_updater():
+    """
+    on_applied of a replay: set the telemetry and telesignal items of the
+    replayed IOAs from the values sent on the wire, so the dashboards show
+    what the masters see.
+    """
+    telemetry_items = {item.ioa: item for item in telemetries.values()}
+    telesignal_items = {item.ioa: item for item in telesignals.values()}
+
+    def apply(batch):
+        changed = set()
+        for ioa, value in batch:
+            item = telemetry_items.get(ioa)
+            if item is not None:
+                entry = IEC_SERVER.ioa_list.get(ioa)
+                item.value = value if entry is not None and entry['type'] == MeasuredValueShort else round(value * item.scale_factor, 6)
+                changed.add('telemetries')
+                continue
+            item = telesignal_items.get(ioa)
+            if item is not None:
+                item.value = int(value)
+                changed.add('telesignals')
+        for name in changed:
+            broadcaster.mark(name)
+
+    return apply
+
+async def run_replay(replayer):
+    try:
+        await replayer.run()
+    except asyncio.CancelledError:
+        logger.info("Replay of %s cancelled after %s of %s point changes", replayer.path, replayer.applied, replayer.total)
+        raise
+    except Exception as e:
+        logger.error("Error replaying %s: %s", replayer.path, e)
+
+@app.get("/scenarios")
+async def get_scenarios():
+    if not os.path.isdir(SCENARIO_DIR):
+        return []
+    return [{'name': name, 'bytes': os.path.getsize(os.path.join(SCENARIO_DIR, name))} for name in sorted(os.listdir(SCENARIO_DIR))]
+
+@app.get("/scenarios/recording")
+async def get_recording():
+    recorder = IEC_SERVER.recorder
+    if recorder is None:
+        return {'recording': False}
+    return {'recording': True, 'name': os.path.basename(recorder.path), 'records': recorder.records}
+
+@app.post("/scenarios/recording", status_code=201)
+async def post_recording(body: Dict[str, Any] = Body(...)):
+    """Start recording every point change to {"name": ...} in SCENARIO_DIR."""
+    if IEC_SERVER.recorder is not None:
+        raise HTTPException(status_code=409, detail=f"Already recording to {os.path.basename(IEC_SERVER.recorder.path)}")
+    start_recording(body.get('name'))
+    return await get_recording()
+
+@app.delete("/scenarios/recording")
+async def delete_recording():
+    recorder = stop_recording()
+    if recorder is None:
+        raise HTTPException(status_code=404, detail="Not recording")
+    return {'recording': False, 'name': os.path.basename(recorder.path), 'records': recorder.records}
+
+@app.get("/scenarios/replay")
+async def get_replay():
+    if replayer is None:
+        return {'running': False}
+    return dict(replayer.status(), running=not replay_task.done())
+
+@app.post("/scenarios/replay", status_code=202)
+async def post_replay(body: Dict[str, Any] = Body(...)):
+    """Replay {"name": ..., "speed": 1, 10, ... or "max"} through the bulk update path."""
+    global replayer, replay_task
+    if replay_task is not None and not replay_task.done():
+        raise HTTPException(status_code=409, detail=f"Already replaying {os.path.basename(replayer.path)}")
+    path = scenario_path(body.get('name'))
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail=f"Scenario {body.get('name')} not found")
+    speed = body.get('speed', 1)
+    if speed == 'max':
+        speed = 0
+    elif isinstance(speed, bool) or not isinstance(speed, (int, float)) or not speed > 0:
+        raise HTTPException(status_code=422, detail='Speed must be a positive number or "max"')
+    replayer = ScenarioReplayer(IEC_SERVER, path, speed, on_applied=replayed_item_updater())
+    replay_task = asyncio.create_task(run_replay(replayer))
+    return {'running': True, 'name': body.get('name'), 'speed': speed}
+
+@app.delete("/scenarios/replay")
+async def delete_replay():
+    if replay_task is None or replay_task.done():
+        raise HTTPException(status_code=404, detail="No replay running")
+    replay_task.cancel()
+    try:
+        await replay_task
+    except asyncio.CancelledError:
+        pass
+    return dict(replayer.status(), running=False)
+
+# Scenario scripts, see lib/scenario_script.py
+script_run: Optional[ScriptRun] = None
+
+@app.get("/scenarios/script")
+async def get_script():
+    if script_run is None:
+        return {'running': False}
+    return script_run.status()
+
+@app.post("/scenarios/script", status_code=202)
+async def post_script(body: Dict[str, Any] = Body(...)):
+    """Compile and run a scenario script, {"name": file in SCENARIO_DIR} or {"script": {...}}."""
+    global script_run
+    if script_run is not None and script_run.running:
+        raise HTTPException(status_code=409, detail=f"Already running scenario script {script_run.script.name}")
+    if 'script' in body:
+        spec = body['script']
+    else:
+        path = scenario_path(body.get('name'))
+        if not os.path.isfile(path):
+            raise HTTPException(status_code=404, detail=f"Scenario script {body.get('name')} not found")
+        try:
+            spec = load_script(path)
+        except Exception as e:
+            raise HTTPException(status_code=422, detail=f"Could not read {body.get('name')}: {e}")
+    try:
+        script = ScenarioScript(spec, IEC_SERVER, broadcaster.collections, broadcaster.mark)
+    except ScriptError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    script_run = ScriptRun(script, IEC_SERVER.timer_wheel)
+    script_run.start()
+    return script_run.status()
+
+@app.delete("/scenarios/script")
+async def delete_script():
+    if script_run is None or not script_run.running:
+        raise HTTPException(status_code=404, detail="No scenario script running")
+    script_run.stop()
+    return script_run.status()
+
 # Run the FastAPI app with Uvicorn
+# Fine without a farm, its workers re-import the __main__ module: start the backend with serve.py
 if __name__ == "__main__":
     uvicorn.run(socket_app, host=FASTAPI_HOST, port=FASTAPI_PORT)
\ No newline at end of file
@@ -0,0 +1,14 @@
+#!/usr/bin/env python3
+"""
+Backend entry point: python3 serve.py
+
+Runs the app of main.py under uvicorn. The RTU farm workers are spawned
+processes, and a spawned process re-imports the __main__ module of its
+parent. main.py is only imported under the guard here, so the workers do
+not build a second IEC server, Socket.IO app and log listener on start.
+"""
+import uvicorn
+
+if __name__ == "__main__":
+    import main
+    uvicorn.run(main.socket_app, host=main.FASTAPI_HOST, port=main.FASTAPI_PORT)
@@ -0,0 +1,54 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip('lib.lib60870', reason="needs the lib60870 shared library", exc_type=ImportError)
+
+from benchmarks import hot_path
+
+BACKEND = Path(__file__).resolve().parent.parent
+
+
+def run_benchmark(module, *args, timeout=300):
+    return subprocess.run([sys.executable, '-m', module, *args], cwd=BACKEND, capture_output=True, text=True, timeout=timeout)
+
+
+def test_compare_flags_cases_slower_than_the_threshold(tmp_path):
+    baseline = tmp_path / 'baseline.json'
+    baseline.write_text(json.dumps({'results': [
+        {'case': 'update_ioa', 'points': 1000, 'best_s': 0.010},
+        {'case': 'gi', 'points': 1000, 'best_s': 0.020},
+    ]}))
+    results = [
+        {'case': 'update_ioa', 'points': 1000, 'best_s': 0.0125},
+        {'case': 'gi', 'points': 1000, 'best_s': 0.021},
+        {'case': 'add_ioa', 'points': 1000, 'best_s': 1.0},   # not in the baseline
+    ]
+    regressions = hot_path.compare(results, str(baseline), threshold=1.2)
+    assert [(r['case'], r['points']) for r in regressions] == [('update_ioa', 1000)]
+
+
+def test_hot_path_smoke(tmp_path):
+    output = tmp_path / 'results.json'
+    result = run_benchmark('benchmarks.hot_path', '--sizes', '100', '--repeat', '1', '--port', '24310', '--output', str(output))
+    assert result.returncode == 0, result.stderr
+    report = json.loads(output.read_text())
+    assert {r['case'] for r in report['results']} == set(hot_path.CASES)
+    assert all(r['ops'] > 0 for r in report['results'])
+
+    # The same results as their own baseline are no regression
+    result = run_benchmark('benchmarks.hot_path', '--sizes', '100', '--repeat', '1', '--cases', 'add_ioa', '--port', '24320',
+                           '--output', str(tmp_path / 'again.json'), '--compare', str(output), '--threshold', '100')
+    assert result.returncode == 0, result.stdout + result.stderr
+
+
+def test_socketio_fanout_smoke(tmp_path):
+    output = tmp_path / 'fanout.json'
+    result = run_benchmark('benchmarks.socketio_fanout', '--points', '20', '--clients', '1', '--seconds', '2',
+                           '--port', '6206', '--iec-port', '24330', '--json', str(output))
+    assert result.returncode == 0, result.stderr
+    report = json.loads(output.read_text())
+    assert report['results'][0]['clients'] == 1
@@ -0,0 +1,149 @@
+import asyncio
+import socket
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('lib.lib60870', reason="needs the lib60870 shared library", exc_type=ImportError)
+
+from data_models import CircuitBreakerItem
+from lib.lib60870 import *
+from lib.libiec60870server import IEC60870_5_104_server
+
+STATUS_OPEN, STATUS_CLOSE, CONTROL_OPEN, CONTROL_CLOSE = 100, 101, 102, 103
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def callback(ioa, ioa_object, server, is_select=None):
+    return server.update_ioa_from_server(ioa, ioa_object['data']) if not is_select else True
+
+
+def breaker_server(port, travel_time):
+    cb = CircuitBreakerItem(id='cb1', name='CB 1', ioa_cb_status=STATUS_OPEN, ioa_cb_status_close=STATUS_CLOSE,
+                            ioa_control_open=CONTROL_OPEN, ioa_control_close=CONTROL_CLOSE,
+                            ioa_local_remote_sp=104, ioa_local_remote_dp=105, is_sbo=False, has_double_point=False,
+                            travel_time=travel_time)
+    server = IEC60870_5_104_server('127.0.0.1', port, circuit_breakers={cb.id: cb})
+    server.add_ioa(STATUS_OPEN, SinglePointInformation, 1, callback, True)
+    server.add_ioa(STATUS_CLOSE, SinglePointInformation, 0, callback, True)
+    server.add_ioa(CONTROL_OPEN, SingleCommand, 0, callback, True)
+    server.add_ioa(CONTROL_CLOSE, SingleCommand, 0, callback, True)
+    return server, cb
+
+
+class Master:
+    """Records the COT and negative flag of every command reply."""
+
+    def __init__(self, port):
+        self.replies = []
+        self.started = threading.Event()
+        self.connection = CS104_Connection_create('127.0.0.1', port)
+        self.asduHandler = CS101_ASDUReceivedHandler(self.asdu_received)
+        self.connectionHandler = CS104_ConnectionHandler(self.connection_event)
+        CS104_Connection_setASDUReceivedHandler(self.connection, self.asduHandler, None)
+        CS104_Connection_setConnectionHandler(self.connection, self.connectionHandler, None)
+
+    def connection_event(self, param, connection, event):
+        if event == CS104_CONNECTION_STARTDT_CON_RECEIVED:
+            self.started.set()
+
+    def asdu_received(self, param, address, asdu):
+        if CS101_ASDU_getTypeID(asdu) == C_SC_NA_1:
+            self.replies.append((CS101_ASDU_getCOT(asdu), bool(CS101_ASDU_isNegative(asdu))))
+        return True
+
+    def connect(self):
+        assert CS104_Connection_connect(self.connection)
+        CS104_Connection_sendStartDT(self.connection)
+        assert self.started.wait(5)
+
+    def command(self, ioa, state):
+        io = cast(SingleCommand_create(None, ioa, state, False, 0), InformationObject)
+        assert CS104_Connection_sendProcessCommandEx(self.connection, CS101_COT_ACTIVATION, 1, io)
+        InformationObject_destroy(io)
+
+    def close(self):
+        CS104_Connection_destroy(self.connection)
+
+
+async def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        await asyncio.sleep(0.02)
+
+
+def run_with_server(travel_time, test):
+    async def run():
+        port = free_port()
+        server, cb = breaker_server(port, travel_time)
+        # Started on the loop like in main.py: commands are applied on the loop, operations run on its timer wheel
+        assert server.start() == 0
+        wheel = asyncio.create_task(server.timer_wheel.run())
+        try:
+            await test(server, cb, port)
+        finally:
+            wheel.cancel()
+            server.stop()
+
+    asyncio.run(run())
+
+
+def test_act_term_follows_act_con():
+    async def test(server, cb, port):
+        master = Master(port)
+        await asyncio.to_thread(master.connect)
+        try:
+            master.command(CONTROL_CLOSE, True)
+            await wait_for(lambda: len(master.replies) == 2)
+            assert master.replies == [(CS101_COT_ACTIVATION_CON, False), (CS101_COT_ACTIVATION_TERMINATION, False)]
+            assert server.ioa_list[STATUS_CLOSE]['data'] == 1
+            assert server.ioa_list[STATUS_OPEN]['data'] == 0
+        finally:
+            master.close()
+
+    run_with_server(0.2, test)
+
+
+def test_no_act_term_after_the_master_disconnected():
+    async def test(server, cb, port):
+        first = Master(port)
+        await asyncio.to_thread(first.connect)
+        first.command(CONTROL_CLOSE, True)
+        await wait_for(lambda: first.replies == [(CS101_COT_ACTIVATION_CON, False)])
+        first.close()
+        await wait_for(lambda: not server.open_connections)
+        # The breaker is still travelling, without anyone to answer
+        assert len(server.breaker_operations) == 1
+        assert server.breaker_operations._operations[cb.id].origin is None
+
+        # A new connection may get the memory of the closed one, it must not receive the old ACT_TERM
+        second = Master(port)
+        await asyncio.to_thread(second.connect)
+        try:
+            await wait_for(lambda: len(server.breaker_operations) == 0)
+            await asyncio.sleep(0.2)
+            assert server.ioa_list[STATUS_CLOSE]['data'] == 1
+            assert second.replies == []
+        finally:
+            second.close()
+
+    run_with_server(2.0, test)
+
+
+def test_connections_get_new_serials():
+    server, cb = breaker_server(0, 0)
+    connection = cast(c_void_p(0x1000), IMasterConnection)
+    for serial in (1, 2):
+        server.connection_event(None, connection, CS104_CON_EVENT_CONNECTION_OPENED)
+        assert server.connection_id(connection) == serial
+        assert server.open_connections == {serial}
+        server.connection_event(None, connection, CS104_CON_EVENT_CONNECTION_CLOSED)
+        assert server.connection_id(connection) is None
+        assert server.open_connections == set()
@@ -0,0 +1,84 @@
+import asyncio
+
+from data_models import TeleSignalItem, TelemetryItem
+from lib.broadcaster import Broadcaster
+from lib.collection import Collection
+
+
+class FakeSio:
+    def __init__(self, fail=()):
+        self.emits = []
+        self.fail = set(fail)
+
+    async def emit(self, event, data):
+        if event in self.fail:
+            self.fail.discard(event)
+            raise RuntimeError("client gone")
+        self.emits.append((event, data))
+
+
+def collections():
+    telemetries = Collection('telemetries')
+    telemetries['t1'] = TelemetryItem(id='t1', name='Feeder', ioa=1000, unit='A', value=0.0, scale_factor=1,
+                                      min_value=0, max_value=100)
+    telesignals = Collection('telesignals')
+    telesignals['s1'] = TeleSignalItem(id='s1', name='Alarm', ioa=2000)
+    return {'telesignals': telesignals, 'telemetries': telemetries}
+
+
+def test_marks_between_frames_are_emitted_once_with_the_latest_payload():
+    sio = FakeSio()
+    items = collections()
+    broadcaster = Broadcaster(sio, items)
+
+    async def run():
+        for value in range(100):
+            items['telemetries']['t1'].value = float(value)
+            broadcaster.mark('telemetries')
+        broadcaster.mark('telesignals')
+        assert await broadcaster.flush() == 2
+        # Nothing changed since the last frame
+        assert await broadcaster.flush() == 0
+
+    asyncio.run(run())
+    # One emit per collection, in the collections' order rather than the order they were marked
+    assert [event for event, _ in sio.emits] == ['telesignals', 'telemetries']
+    assert sio.emits[1][1][0]['value'] == 99.0
+
+
+def test_run_emits_at_most_once_per_frame():
+    sio = FakeSio()
+    items = collections()
+    broadcaster = Broadcaster(sio, items, frame_rate=20.0)
+
+    async def run():
+        task = asyncio.create_task(broadcaster.run())
+        marks = 0
+        started = asyncio.get_running_loop().time()
+        while asyncio.get_running_loop().time() - started < 0.5:
+            items['telemetries']['t1'].value += 1
+            broadcaster.mark('telemetries')
+            marks += 1
+            await asyncio.sleep(0.001)
+        task.cancel()
+        return marks
+
+    marks = asyncio.run(run())
+    # About 10 frames in 0.5s at 20 frames/s, for far more marks
+    assert 5 <= len(sio.emits) <= 12 < marks
+
+
+def test_a_failed_emit_does_not_stop_the_broadcaster():
+    sio = FakeSio(fail={'telemetries'})
+    broadcaster = Broadcaster(sio, collections(), frame_rate=50.0)
+
+    async def run():
+        task = asyncio.create_task(broadcaster.run())
+        broadcaster.mark('telemetries')
+        await asyncio.sleep(0.1)
+        broadcaster.mark('telemetries')
+        await asyncio.sleep(0.1)
+        task.cancel()
+
+    asyncio.run(run())
+    assert [event for event, _ in sio.emits] == ['telemetries']
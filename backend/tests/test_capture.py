@@ -0,0 +1,118 @@
+import socket
+import struct
+
+import pytest
+
+pytest.importorskip('lib.lib60870', reason="needs the lib60870 shared library", exc_type=ImportError)
+
+from lib.capture import LINKTYPE_RAW, SHB_MAGIC, ApduCapture, ip_checksum
+
+# STARTDT act and con, then a short I frame
+STARTDT_ACT = bytes.fromhex('680407000000')
+STARTDT_CON = bytes.fromhex('68040b000000')
+I_FRAME = bytes.fromhex('680e0000000064010600010000000014')
+
+
+def blocks(data):
+    """(type, body) of every pcapng block, checking both length fields and the alignment."""
+    offset = 0
+    result = []
+    while offset < len(data):
+        block_type, length = struct.unpack_from('<II', data, offset)
+        assert length % 4 == 0
+        assert struct.unpack_from('<I', data, offset + length - 4)[0] == length
+        result.append((block_type, data[offset + 8:offset + length - 4]))
+        offset += length
+    assert offset == len(data)
+    return result
+
+
+def capture_to(tmp_path, **kwargs):
+    capture = ApduCapture(str(tmp_path / 'apdu.pcapng'), '10.0.0.1', 2404, **kwargs)
+    peer = (bytes([10, 0, 0, 2]), 50000)
+    capture._write(1_700_000_000_123_456_789, 1, peer, False, STARTDT_ACT)
+    capture._write(1_700_000_000_223_456_789, 1, peer, True, STARTDT_CON)
+    capture._write(1_700_000_000_323_456_789, 1, peer, True, I_FRAME)
+    capture._file.close()
+    return capture
+
+
+def test_pcapng_block_layout(tmp_path):
+    capture_to(tmp_path)
+    data = (tmp_path / 'apdu.0.pcapng').read_bytes()
+    (shb_type, shb), (idb_type, idb), *packets = blocks(data)
+
+    assert shb_type == 0x0A0D0D0A
+    magic, major, minor, section_length = struct.unpack_from('<IHHq', shb)
+    assert (magic, major, minor, section_length) == (SHB_MAGIC, 1, 0, -1)
+
+    assert idb_type == 1
+    link_type, _, _ = struct.unpack_from('<HHI', idb)
+    assert link_type == LINKTYPE_RAW
+    # if_tsresol option: nanosecond timestamps
+    assert struct.unpack_from('<HHB', idb, 8) == (9, 1, 9)
+
+    assert [block_type for block_type, _ in packets] == [6, 6, 6]
+    timestamps = []
+    for (_, body), apdu in zip(packets, (STARTDT_ACT, STARTDT_CON, I_FRAME)):
+        interface, high, low, captured, original = struct.unpack_from('<IIIII', body)
+        assert interface == 0
+        assert captured == original == 40 + len(apdu)
+        timestamps.append(high << 32 | low)
+        packet = body[20:20 + captured]
+        assert packet[40:] == apdu
+    assert timestamps == [1_700_000_000_123_456_789, 1_700_000_000_223_456_789, 1_700_000_000_323_456_789]
+
+
+def test_synthetic_ip_and_tcp_headers(tmp_path):
+    capture_to(tmp_path)
+    _, _, *packets = blocks((tmp_path / 'apdu.0.pcapng').read_bytes())
+    seen = {}
+    for _, body in packets:
+        packet = body[20:20 + struct.unpack_from('<I', body, 12)[0]]
+        version_ihl, _, total_length, _, _, _, protocol, _, src, dst = struct.unpack('!BBHHHBBH4s4s', packet[:20])
+        assert version_ihl == 0x45
+        assert total_length == len(packet)
+        assert protocol == socket.IPPROTO_TCP
+        assert ip_checksum(packet[:20]) == 0
+        src_port, dst_port, seq, ack = struct.unpack('!HHII', packet[20:32])
+        seen.setdefault((src, src_port, dst, dst_port), []).append((seq, ack, len(packet) - 40))
+
+    master = (bytes([10, 0, 0, 2]), 50000)
+    server = (bytes([10, 0, 0, 1]), 2404)
+    assert seen[(*master, *server)] == [(1, 1, 6)]
+    # Sequence numbers count the bytes sent in each direction, acks the bytes received
+    assert seen[(*server, *master)] == [(1, 7, 6), (7, 7, 16)]
+
+
+def test_files_rotate_in_a_ring(tmp_path):
+    capture = ApduCapture(str(tmp_path / 'ring.pcapng'), '10.0.0.1', 2404, max_bytes=300, max_files=2)
+    peer = (bytes([10, 0, 0, 2]), 50000)
+    for n in range(10):
+        capture._write(n, 1, peer, bool(n % 2), I_FRAME)
+    capture._file.close()
+    files = sorted(path.name for path in tmp_path.iterdir())
+    assert files == ['ring.0.pcapng', 'ring.1.pcapng']
+    for name in files:
+        data = (tmp_path / name).read_bytes()
+        assert len(data) <= 300
+        assert blocks(data)[0][0] == 0x0A0D0D0A
+
+
+def test_forget_restarts_the_sequence_numbers_of_a_reused_id(tmp_path):
+    capture = ApduCapture(str(tmp_path / 'apdu.pcapng'), '10.0.0.1', 2404)
+    peer = (bytes([10, 0, 0, 2]), 50000)
+    capture._pending.append((1, 1, peer, True, STARTDT_CON))
+    capture._peers[1] = peer
+    # Closed while its APDU still waits for the writer
+    capture.forget(1)
+    assert 1 not in capture._peers
+    capture._pending.append((2, 1, (bytes([10, 0, 0, 3]), 50001), True, I_FRAME))
+    capture._drain()
+    capture._file.close()
+    assert capture._sequences == {(1, True): 1 + len(I_FRAME)}
+
+    _, _, *packets = blocks((tmp_path / 'apdu.0.pcapng').read_bytes())
+    seqs = [struct.unpack_from('!I', body, 20 + 24)[0] for _, body in packets]
+    # The pending APDU keeps its place in the old stream, the new connection starts again from 1
+    assert seqs == [1, 1]
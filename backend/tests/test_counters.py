@@ -0,0 +1,159 @@
+import pytest
+
+from lib.counters import COUNTER_MAX, SEQUENCE_MAX, GROUP_GENERAL, CounterIntegrator
+
+
+def integrator():
+    counters = CounterIntegrator()
+    counters.add(300, 'feeder', value=10, scale_factor=1.0, group=1)
+    counters.add(100, 'feeder', value=0, scale_factor=0.5, group=2)
+    counters.add(200, None, value=7, group=1, timestamped=True)
+    return counters
+
+
+def test_integrate_scales_per_hour_and_holds_without_a_source():
+    counters = integrator()
+    counters.integrate(1800, {'feeder': 100.0})
+    # 100 units per hour for half an hour, one count per unit or per half unit
+    assert counters.values() == {300: 60, 100: 100, 200: 7}
+    counters.integrate(0, {'feeder': 100.0})
+    assert counters.values() == {300: 60, 100: 100, 200: 7}
+
+
+def test_freeze_without_reset_keeps_counting():
+    counters = integrator()
+    counters.integrate(3600, {'feeder': 1.5})
+    assert counters.freeze() == 3
+    assert counters.read() == [(100, 3, 1, False), (200, 7, 1, True), (300, 11, 1, False)]
+    counters.integrate(3600, {'feeder': 1.0})
+    # The frozen readings stay until the next freeze
+    assert counters.read() == [(100, 3, 1, False), (200, 7, 1, True), (300, 11, 1, False)]
+    assert counters.values() == {300: 12, 100: 5, 200: 7}
+
+
+def test_freeze_with_reset_starts_from_zero():
+    counters = integrator()
+    counters.integrate(3600, {'feeder': 2.0})
+    assert counters.freeze(GROUP_GENERAL, reset=True) == 3
+    assert counters.read() == [(100, 4, 1, False), (200, 7, 1, True), (300, 12, 1, False)]
+    assert counters.values() == {300: 0, 100: 0, 200: 0}
+
+
+def test_counter_reset_leaves_the_frozen_readings():
+    counters = integrator()
+    assert counters.reset(1) == 2
+    assert counters.values() == {300: 0, 100: 0, 200: 0}
+    assert counters.read() == [(100, 0, 0, False), (200, 7, 0, True), (300, 10, 0, False)]
+
+
+def test_group_request_only_touches_its_counters():
+    counters = integrator()
+    counters.integrate(3600, {'feeder': 1.0})
+    assert counters.freeze(2, reset=True) == 1
+    assert counters.read(2) == [(100, 2, 1, False)]
+    assert counters.read(1) == [(200, 7, 0, True), (300, 10, 0, False)]
+    assert counters.values() == {300: 11, 100: 0, 200: 7}
+    # Groups without counters answer with nothing
+    assert counters.freeze(3) == 0
+    assert counters.read(3) == []
+
+
+def test_sequence_number_wraps_at_5_bits():
+    counters = integrator()
+    for _ in range(SEQUENCE_MAX + 1):
+        counters.freeze(2)
+    assert counters.read(2) == [(100, 0, 1, False)]
+
+
+def test_counter_wraps_at_32_bits():
+    counters = CounterIntegrator()
+    counters.add(1, 'feeder', value=COUNTER_MAX - 2)
+    counters.integrate(3600, {'feeder': 5.0})
+    assert counters.values() == {1: 3}
+    counters.freeze()
+    assert counters.read() == [(1, 3, 1, False)]
+
+
+def test_add_remove_and_configure():
+    counters = integrator()
+    assert counters.add(100) == -1
+    assert counters.remove(300) == 0
+    assert counters.remove(300) == -1
+    assert 300 not in counters and len(counters) == 2
+    assert counters.configure(100, 'feeder', scale_factor=1.0, group=3) == 0
+    assert counters.set_value(100, 42) == 0
+    counters.freeze(3)
+    assert counters.read(3) == [(100, 42, 1, False)]
+    assert counters.configure(300) == -1
+
+
+@pytest.fixture
+def server(monkeypatch):
+    pytest.importorskip('lib.lib60870', reason="needs the lib60870 shared library", exc_type=ImportError)
+    from data_models import CounterItem
+    from lib import libiec60870server
+    from lib.libiec60870server import IEC60870_5_104_server
+    from lib.station import add_counter_point
+
+    server = IEC60870_5_104_server('127.0.0.1', 0)
+    add_counter_point(server, CounterItem(id='c1', name='Import', ioa=300, telemetry_id='feeder', value=10, group=1))
+    add_counter_point(server, CounterItem(id='c2', name='Export', ioa=100, telemetry_id='feeder', group=2, has_timestamp=True))
+
+    server.replies = []
+    monkeypatch.setattr(libiec60870server, 'IMasterConnection_sendACT_CON',
+                        lambda connection, asdu, negative: server.replies.append(('ACT_CON', negative)))
+    monkeypatch.setattr(libiec60870server, 'IMasterConnection_sendACT_TERM',
+                        lambda connection, asdu: server.replies.append(('ACT_TERM',)))
+    server.sent = []
+
+    def send_packed(connection, cot, is_sequence, objects):
+        ioas = [ioa for ioa, create in objects]
+        if ioas:
+            server.sent.append((cot, ioas))
+        return len(ioas)
+    server.send_packed = send_packed
+    return server
+
+
+def test_counter_interrogation_read(server):
+    from lib.lib60870 import CS101_COT_REQUESTED_BY_GENERAL_COUNTER, IEC60870_QCC_FRZ_READ, IEC60870_QCC_RQT_GENERAL
+
+    assert server.CI_h(None, None, None, IEC60870_QCC_RQT_GENERAL | IEC60870_QCC_FRZ_READ)
+    assert server.replies == [('ACT_CON', False), ('ACT_TERM',)]
+    # Plain and timestamped counters go out in their own ASDUs
+    assert server.sent == [(CS101_COT_REQUESTED_BY_GENERAL_COUNTER, [300]), (CS101_COT_REQUESTED_BY_GENERAL_COUNTER, [100])]
+
+    server.sent.clear()
+    server.CI_h(None, None, None, 2 | IEC60870_QCC_FRZ_READ)
+    assert server.sent == [(CS101_COT_REQUESTED_BY_GENERAL_COUNTER + 2, [100])]
+
+
+def test_counter_interrogation_freeze_and_reset(server):
+    from lib.lib60870 import (IEC60870_QCC_FRZ_COUNTER_RESET, IEC60870_QCC_FRZ_FREEZE_WITH_RESET,
+                              IEC60870_QCC_FRZ_FREEZE_WITHOUT_RESET, IEC60870_QCC_RQT_GENERAL)
+
+    counters = server.counter_integrator
+    counters.integrate(3600, {'feeder': 5.0})
+    server.CI_h(None, None, None, 1 | IEC60870_QCC_FRZ_FREEZE_WITHOUT_RESET)
+    assert counters.read() == [(100, 0, 0, True), (300, 15, 1, False)]
+    assert counters.values() == {300: 15, 100: 5}
+
+    server.CI_h(None, None, None, IEC60870_QCC_RQT_GENERAL | IEC60870_QCC_FRZ_FREEZE_WITH_RESET)
+    assert counters.read() == [(100, 5, 1, True), (300, 15, 2, False)]
+    assert counters.values() == {300: 0, 100: 0}
+
+    counters.integrate(3600, {'feeder': 5.0})
+    server.CI_h(None, None, None, 2 | IEC60870_QCC_FRZ_COUNTER_RESET)
+    assert counters.values() == {300: 5, 100: 0}
+    # Freezing and resetting answer without sending counters
+    assert server.sent == []
+    assert server.replies == [('ACT_CON', False), ('ACT_TERM',)] * 3
+
+
+def test_counter_interrogation_rejects_an_unknown_group(server):
+    from lib.lib60870 import IEC60870_QCC_FRZ_FREEZE_WITH_RESET
+
+    server.counter_integrator.integrate(3600, {'feeder': 5.0})
+    server.CI_h(None, None, None, 6 | IEC60870_QCC_FRZ_FREEZE_WITH_RESET)
+    assert server.replies == [('ACT_CON', True)]
+    assert server.counter_integrator.values() == {300: 15, 100: 5}
@@ -0,0 +1,97 @@
+import pytest
+
+pytest.importorskip('lib.lib60870', reason="needs the lib60870 shared library", exc_type=ImportError)
+
+from data_models import CircuitBreakerItem, TapChangerItem, TelemetryItem
+from lib.breaker import POSITION_CLOSED, POSITION_OPEN, BreakerOperations
+from lib.collection import Collection
+from lib.dependencies import DependencyGraph
+from lib.lib60870 import MeasuredValueScaled, MeasuredValueShort
+from lib.timer_wheel import TimerWheel
+
+
+class FakeServer:
+    """Keeps the IOA values and tells the graph about every change, like the IEC server."""
+
+    def __init__(self):
+        self.ioa_list = {}
+        self.breaker_operations = BreakerOperations(self, TimerWheel())
+        self.dependencies = None
+
+    def update_ioa(self, ioa, value):
+        self.ioa_list.setdefault(ioa, {'type': MeasuredValueScaled})['data'] = value
+        if self.dependencies is not None:
+            self.dependencies.on_change(ioa)
+
+
+def breaker(cb_id, ioa):
+    return CircuitBreakerItem(id=cb_id, name=cb_id, ioa_cb_status=ioa, ioa_cb_status_close=ioa + 1, ioa_control_open=ioa + 2,
+                              ioa_control_close=ioa + 3, ioa_local_remote_sp=ioa + 4, ioa_local_remote_dp=ioa + 5,
+                              is_sbo=False, has_double_point=False)
+
+
+@pytest.fixture
+def station():
+    server = FakeServer()
+    breakers = Collection('circuit_breakers', {'cb1': breaker('cb1', 100), 'cb2': breaker('cb2', 110)})
+    tap_changers = Collection('tap_changers', {'tc1': TapChangerItem(
+        id='tc1', name='TC1', ioa_value=300, value=5, value_high_limit=9, value_low_limit=1, ioa_high_limit=301,
+        ioa_low_limit=302, ioa_status_raise_lower=303, ioa_command_raise_lower=304, ioa_status_auto_manual=305,
+        ioa_command_auto_manual=306, is_local_remote=1, ioa_local_remote=307)})
+    telemetries = Collection('telemetries', {
+        'current': TelemetryItem(id='current', name='Feeder', ioa=200, unit='A', value=40.0, scale_factor=1,
+                                 min_value=0, max_value=100, breaker_ids=['cb1', 'cb2']),
+        'voltage': TelemetryItem(id='voltage', name='Bus', ioa=210, unit='kV', value=20.0, scale_factor=0.01,
+                                 min_value=18, max_value=22, tap_changer_id='tc1', tap_step=0.1, tap_neutral=5),
+        'free': TelemetryItem(id='free', name='Free', ioa=220, unit='A', value=7.0, scale_factor=1, min_value=0, max_value=10),
+    })
+    server.ioa_list[200] = {'type': MeasuredValueScaled, 'data': 40}
+    server.ioa_list[210] = {'type': MeasuredValueShort, 'data': 20.0}
+    server.ioa_list[300] = {'type': MeasuredValueScaled, 'data': 5}
+    for cb in breakers.values():
+        server.breaker_operations.apply_position(cb, POSITION_CLOSED)
+    marks = []
+    graph = DependencyGraph(server, telemetries, breakers, tap_changers, marks.append)
+    server.dependencies = graph
+    graph.rebuild()
+    return server, graph, breakers, telemetries, marks
+
+
+def test_open_breaker_forces_its_telemetries_to_zero(station):
+    server, graph, breakers, telemetries, marks = station
+    assert len(graph) == 2
+    current = telemetries['current']
+    server.breaker_operations.apply_position(breakers['cb2'], POSITION_OPEN)
+    assert current.value == 0.0 and server.ioa_list[200]['data'] == 0
+    assert marks == ['telemetries']
+    # A new simulated value is kept as the base while the breaker is open
+    assert graph.apply(current, 55.0) == 0.0
+    assert graph.base(current) == 55.0
+    server.breaker_operations.apply_position(breakers['cb2'], POSITION_CLOSED)
+    assert current.value == 55.0 and server.ioa_list[200]['data'] == 55
+
+
+def test_tap_position_offsets_the_regulated_telemetry(station):
+    server, graph, breakers, telemetries, marks = station
+    voltage = telemetries['voltage']
+    server.update_ioa(300, 7)
+    assert voltage.value == 20.2 and server.ioa_list[210]['data'] == 20.2
+    server.update_ioa(300, 4)
+    assert voltage.value == 19.9
+    assert graph.apply(voltage, 21.0) == 20.9
+
+
+def test_only_dependents_of_the_changed_ioa_are_recomputed(station):
+    server, graph, breakers, telemetries, marks = station
+    server.update_ioa(220, 3)
+    server.update_ioa(300, 5)
+    assert marks == []
+    assert graph.apply(telemetries['free'], 9.0) == 9.0
+
+    # Unlinked from its breakers, the telemetry no longer follows them
+    telemetries['current'].breaker_ids = []
+    graph.rebuild()
+    assert len(graph) == 1
+    server.breaker_operations.apply_position(breakers['cb1'], POSITION_OPEN)
+    assert telemetries['current'].value == 40.0
+    assert graph.apply(telemetries['current'], 30.0) == 30.0
@@ -0,0 +1,78 @@
+import os
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[2]
+
+# Records its arguments, and the manifests kubectl applies
+STUB = """#!/bin/bash
+echo "$(basename "$0") $*" >> "$STUB_LOG"
+if [ "$1" = "apply" ]; then
+  cat "$3" >> "$STUB_LOG"
+fi
+"""
+
+# image-tag fastapi-port iec104-port fastapi-nodeport iec104-nodeport react-port react-nodeport fastapi-host
+ARGS = ['test', '8000', '2404', '30800', '32404', '3000', '30300', 'http://simulator']
+
+
+@pytest.fixture
+def install(tmp_path):
+    if shutil.which('bash') is None:
+        pytest.skip("needs bash")
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    for name in ('docker', 'kubectl'):
+        stub = bin_dir / name
+        stub.write_text(STUB)
+        stub.chmod(0o755)
+    template = tmp_path / 'export.json'
+    template.write_text('{"telesignals": []}')
+    log = tmp_path / 'stub.log'
+
+    def run(**farm):
+        env = dict(os.environ, PATH=f"{bin_dir}{os.pathsep}{os.environ['PATH']}", STUB_LOG=str(log), FARM_TEMPLATE=str(template))
+        env.update(farm)
+        result = subprocess.run(['bash', 'install.sh', *ARGS], cwd=ROOT, env=env, capture_output=True, text=True, timeout=60)
+        return result, log.read_text() if log.exists() else ''
+
+    return run
+
+
+def test_farm_node_port_colliding_with_the_simulator_is_refused(install):
+    # 2405 + 29999 is the IEC 104 node port
+    result, calls = install(FARM_PORTS='2404-2410', FARM_NODEPORT_OFFSET='29999')
+    assert result.returncode == 1
+    assert "Farm port 2405 would get node port 32404, which is already used by the simulator" in result.stdout
+    # Refused before anything was built or applied
+    assert calls == ''
+
+
+def test_farm_node_port_colliding_with_the_web_ports_is_refused(install):
+    result, calls = install(FARM_PORTS='2404-2410', FARM_NODEPORT_OFFSET=str(30300 - 2407))
+    assert result.returncode == 1
+    assert "Farm port 2407 would get node port 30300" in result.stdout
+    assert calls == ''
+
+
+def test_farm_without_a_template_is_refused(install):
+    result, calls = install(FARM_PORTS='2404-2410', FARM_TEMPLATE='missing.json')
+    assert result.returncode == 1
+    assert "FARM_TEMPLATE must name an exported JSON file" in result.stdout
+    assert calls == ''
+
+
+@pytest.mark.skipif(shutil.which('envsubst') is None, reason="needs envsubst")
+def test_farm_ports_are_listed_with_their_node_ports(install):
+    result, calls = install(FARM_PORTS='2404-2406')
+    assert result.returncode == 0, result.stdout + result.stderr
+    # The simulator's own port is not listed twice
+    assert 'name: iec104-farm-2404' not in calls
+    for port in (2405, 2406):
+        assert f'- containerPort: {port}' in calls
+        assert f'name: iec104-farm-{port}' in calls
+        assert f'nodePort: {port + 30000}' in calls
+    assert 'kubectl create configmap iconics-iec104-simulator-backend-test-farm' in calls
@@ -0,0 +1,97 @@
+import logging
+
+import pytest
+
+from lib.logging_setup import DeferredQueueHandler, HotPathFilter, setup_logging
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def record(msg, *args, level=logging.INFO, name='test', **extra):
+    result = logging.LogRecord(name, level, __file__, 1, msg, args, None)
+    result.__dict__.update(extra)
+    return result
+
+
+def passed(log_filter, records):
+    return [r.getMessage() for r in records if log_filter.filter(r)]
+
+
+def test_rate_limit_per_call_site_reports_suppressed_records():
+    clock = Clock()
+    log_filter = HotPathFilter(rate_limit=2, debug_sample=1, clock=clock)
+    assert passed(log_filter, [record("IOA %s changed", n) for n in range(5)]) == ['IOA 0 changed', 'IOA 1 changed']
+    # Another message template is another category
+    assert passed(log_filter, [record("Connection %s closed", 1)]) == ['Connection 1 closed']
+
+    clock.now = 1.0
+    assert passed(log_filter, [record("IOA %s changed", 5)]) == ['IOA 5 changed (3 similar messages suppressed)']
+    assert passed(log_filter, [record("IOA %s changed", 6)]) == ['IOA 6 changed']
+
+
+def test_category_extra_groups_call_sites():
+    log_filter = HotPathFilter(rate_limit=1, debug_sample=1, clock=Clock())
+    records = [record("first %s", 1, category='asdu'), record("second %s", 2, category='asdu'), record("third", category='gi')]
+    assert passed(log_filter, records) == ['first 1', 'third']
+
+
+def test_debug_records_are_sampled():
+    log_filter = HotPathFilter(rate_limit=0, debug_sample=3, clock=Clock())
+    records = [record("ASDU %s", n, level=logging.DEBUG) for n in range(7)]
+    assert passed(log_filter, records) == ['ASDU 0', 'ASDU 3', 'ASDU 6']
+    # Only DEBUG is sampled
+    assert passed(log_filter, [record("ASDU %s", n) for n in range(3)]) == ['ASDU 0', 'ASDU 1', 'ASDU 2']
+
+
+def test_queue_handler_defers_formatting_of_immutable_args():
+    queued = []
+
+    class Queue:
+        def put_nowait(self, item):
+            queued.append(item)
+
+    handler = DeferredQueueHandler(Queue())
+    handler.handle(record("IOA %s set to %s", 100, 1.5))
+    handler.handle(record("Changes %s", [1, 2]))
+    lazy, formatted = queued
+    assert (lazy.msg, lazy.args) == ("IOA %s set to %s", (100, 1.5))
+    # A list could change before the listener formats it, so it is formatted now
+    assert (formatted.msg, formatted.args) == ("Changes [1, 2]", None)
+
+
+@pytest.fixture
+def root_logger(monkeypatch):
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    for name in ('logProcesses', 'logMultiprocessing', 'logAsyncioTasks'):
+        monkeypatch.setattr(logging, name, getattr(logging, name, True), raising=False)
+    yield root
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+
+
+def test_setup_logging_routes_records_through_the_listener(root_logger, monkeypatch, capsys):
+    monkeypatch.setenv('LOG_LEVEL', 'warning')
+    monkeypatch.setenv('LOG_RATE_LIMIT', '1')
+    listener = setup_logging()
+    try:
+        assert [type(handler) for handler in root_logger.handlers] == [DeferredQueueHandler]
+        assert root_logger.level == logging.WARNING
+        logger = logging.getLogger('test.setup')
+        logger.info("not shown")
+        for n in range(3):
+            logger.warning("shown %s", n)
+    finally:
+        listener.stop()
+    lines = capsys.readouterr().err.splitlines()
+    assert len(lines) == 1
+    assert lines[0].endswith(' - test.setup - WARNING - shown 0')
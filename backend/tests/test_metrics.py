@@ -0,0 +1,105 @@
+import asyncio
+import json
+
+import pytest
+import socketio
+
+from lib import metrics
+from lib.socketio_server import MeteredAsyncServer, wire_size
+
+
+def test_counter_renders_labelled_totals():
+    registry = metrics.Registry()
+    counter = metrics.Counter('test_commands', 'Commands', ('type', 'cot'), registry=registry)
+    counter.inc('C_SC_NA_1', 'ACT_CON')
+    counter.inc('C_SC_NA_1', 'ACT_CON', amount=2)
+    counter.inc('C_DC_NA_1', 'say "hi"\n')
+    assert counter.value('C_SC_NA_1', 'ACT_CON') == 3
+    assert counter.value('C_RD_NA_1', 'ACT_CON') == 0
+    assert registry.render().splitlines() == [
+        '# HELP test_commands Commands',
+        '# TYPE test_commands counter',
+        'test_commands_total{type="C_DC_NA_1",cot="say \\"hi\\"\\n"} 1',
+        'test_commands_total{type="C_SC_NA_1",cot="ACT_CON"} 3',
+    ]
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = metrics.Registry()
+    histogram = metrics.Histogram('test_seconds', 'Durations', buckets=(0.1, 1.0), registry=registry)
+    for value in (0.05, 0.1, 0.5, 5.0):
+        histogram.observe(value)
+    assert histogram.totals() == (4, 5.65)
+    lines = registry.render().splitlines()
+    assert lines[2:] == [
+        'test_seconds_bucket{le="0.1"} 2',
+        'test_seconds_bucket{le="1.0"} 3',
+        'test_seconds_bucket{le="+Inf"} 4',
+        f'test_seconds_sum {5.65!r}',
+        'test_seconds_count 4',
+    ]
+
+
+def test_callback_is_read_when_rendered():
+    registry = metrics.Registry()
+    depths = {('a',): 1}
+    metrics.Callback('test_depth', 'Depth', 'gauge', lambda: depths, ('sid',), registry=registry)
+    depths[('b',)] = 2
+    assert registry.render().splitlines()[2:] == ['test_depth{sid="a"} 1.0', 'test_depth{sid="b"} 2.0']
+
+
+def test_wire_size_counts_utf8_bytes():
+    assert wire_size('abc') == 3
+    assert wire_size('Ω°C') == 5
+    assert wire_size(b'\x00\x01') == 2
+
+
+class Transport:
+    def __init__(self, eio):
+        self.sent = []
+        eio.send_packet = self.send_packet
+
+    async def send_packet(self, eio_sid, pkt):
+        self.sent.append(pkt)
+
+
+class Utf8Json:
+    """JSON module that keeps non-ASCII text as is, like a serializer without ensure_ascii."""
+
+    @staticmethod
+    def dumps(*args, **kwargs):
+        return json.dumps(*args, **kwargs, ensure_ascii=False)
+
+    loads = staticmethod(json.loads)
+
+
+def test_emit_bytes_count_encoded_text(monkeypatch):
+    # The json module is set on the packet class for every server, put the default back afterwards
+    monkeypatch.setattr(socketio.packet.Packet, 'json', socketio.packet.Packet.json)
+    server = MeteredAsyncServer(async_mode='asgi', json=Utf8Json)
+    transport = Transport(server.eio)
+    before = metrics.SOCKETIO_EMIT_BYTES.value('test_unicode')
+
+    async def main():
+        for n in range(2):
+            await server.manager.connect(f'eio{n}', '/')
+        await server.emit('test_unicode', {'unit': 'Ω°C'})
+
+    asyncio.run(main())
+    assert len(transport.sent) == 2
+    sent = sum(len(pkt.data.encode()) for pkt in transport.sent)
+    assert sent > sum(len(pkt.data) for pkt in transport.sent)
+    assert metrics.SOCKETIO_EMIT_BYTES.value('test_unicode') - before == sent
+
+
+def test_metrics_endpoint_serves_the_registry():
+    pytest.importorskip('lib.lib60870', reason="needs the lib60870 shared library", exc_type=ImportError)
+    import main
+
+    metrics.SOCKETIO_EMITS.inc('test_endpoint')
+    response = asyncio.run(main.get_metrics())
+    assert response.media_type == metrics.CONTENT_TYPE
+    body = response.body.decode()
+    assert '# TYPE iec104_commands counter' in body
+    assert 'socketio_emits_total{event="test_endpoint"} 1' in body
+    assert body.endswith('\n')
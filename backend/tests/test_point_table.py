@@ -0,0 +1,96 @@
+import argparse
+import asyncio
+import threading
+
+from lib.point_table import PointTable
+from tools.stress_point_table import make_point, run
+
+
+def test_stress_gi_commands_and_crud_without_errors(capsys):
+    args = argparse.Namespace(seconds=1.0, points=2000, gi_threads=2, command_threads=2, seed=104, plain_dict=False)
+    assert asyncio.run(run(args)) == 0
+    assert "ERROR" not in capsys.readouterr().out
+
+
+def test_snapshots_never_change_under_concurrent_writes():
+    table = PointTable({ioa: make_point(ioa) for ioa in range(1000)})
+    stop = threading.Event()
+    errors = []
+
+    def reader():
+        while not stop.is_set():
+            try:
+                snapshot = table.snapshot()
+                keys = list(snapshot)
+                # Walk it like a GI while the loop adds and removes points
+                for ioa, point in snapshot.items():
+                    point['data']
+                if list(snapshot) != keys or len(snapshot) != len(keys):
+                    errors.append("snapshot changed after it was taken")
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+
+    async def writer():
+        table.bind(asyncio.get_running_loop())
+        readers = [threading.Thread(target=reader) for _ in range(3)]
+        for thread in readers:
+            thread.start()
+        try:
+            for round in range(200):
+                for ioa in range(1000, 1050):
+                    if round % 2:
+                        del table[ioa]
+                    else:
+                        table[ioa] = make_point(ioa)
+                await asyncio.sleep(0)
+        finally:
+            stop.set()
+            for thread in readers:
+                thread.join()
+
+    asyncio.run(writer())
+    assert errors == []
+    assert len(table) == 1000
+    assert table.version == 1000 + 200 * 50
+
+
+def test_submit_runs_on_the_writer_thread_in_order():
+    table = PointTable({1: make_point(1)})
+    applied = []
+
+    def apply(value):
+        applied.append((value, threading.get_ident()))
+        table[1]['data'] = value
+
+    async def main():
+        table.bind(asyncio.get_running_loop())
+        loop_thread = threading.get_ident()
+        submitters = [threading.Thread(target=lambda: [table.submit(apply, value) for value in range(100)]) for _ in range(4)]
+        for thread in submitters:
+            thread.start()
+        for thread in submitters:
+            thread.join()
+        await asyncio.sleep(0.1)
+        return loop_thread
+
+    loop_thread = asyncio.run(main())
+    assert len(applied) == 400
+    assert {thread for _, thread in applied} == {loop_thread}
+    assert table[1]['data'] == 99
+
+
+def test_submit_failure_is_logged_not_raised(caplog):
+    table = PointTable()
+
+    def fail():
+        raise ValueError("boom")
+
+    async def main():
+        table.bind(asyncio.get_running_loop())
+        thread = threading.Thread(target=table.submit, args=(fail,))
+        thread.start()
+        thread.join()
+        await asyncio.sleep(0.05)
+
+    asyncio.run(main())
+    assert "boom" in caplog.text
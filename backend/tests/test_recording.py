@@ -0,0 +1,115 @@
+import asyncio
+import struct
+
+import pytest
+
+from lib import recording
+from lib.recording import HEADER, MAGIC, RECORD, ScenarioRecorder, ScenarioReplayer, read_scenario
+
+
+class FakeServer:
+    def __init__(self):
+        self.batches = []
+
+    def update_ioas(self, updates):
+        batch = list(updates)
+        self.batches.append(batch)
+        return len(batch)
+
+
+def record(path, changes):
+    recorder = ScenarioRecorder(str(path))
+    for ioa, value in changes:
+        recorder.record(ioa, value)
+    recorder.close()
+    return recorder
+
+
+def test_recording_round_trip(tmp_path):
+    changes = [(1001, 1.5), (1002, 0.0), (1001, -3.25), (2000, 7.0)]
+    recorder = record(tmp_path / 'scenario.rec', changes)
+    assert recorder.records == 4
+
+    started, records = read_scenario(str(tmp_path / 'scenario.rec'))
+    assert started > 0
+    assert [(ioa, value) for _, ioa, value in records] == changes
+    offsets = [offset for offset, _, _ in records]
+    assert offsets == sorted(offsets)
+    assert (tmp_path / 'scenario.rec').stat().st_size == HEADER.size + 4 * RECORD.size
+
+
+def test_partial_last_record_is_ignored(tmp_path):
+    path = tmp_path / 'crashed.rec'
+    record(path, [(1, 1.0), (2, 2.0)])
+    with open(path, 'ab') as f:
+        f.write(RECORD.pack(99, 3, 3.0)[:7])
+    _, records = read_scenario(str(path))
+    assert [ioa for _, ioa, _ in records] == [1, 2]
+
+
+@pytest.mark.parametrize('content', [b'', b'short', struct.pack('<8sQ', b'NOTASCN\n', 0)])
+def test_other_files_are_rejected(tmp_path, content):
+    path = tmp_path / 'other.rec'
+    path.write_bytes(content)
+    with pytest.raises(ValueError):
+        read_scenario(str(path))
+
+
+def write_records(path, records):
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, 0))
+        for offset, ioa, value in records:
+            f.write(RECORD.pack(offset, ioa, value))
+
+
+def test_replay_at_max_speed_applies_every_record_in_order(tmp_path):
+    path = tmp_path / 'many.rec'
+    records = [(n * 1000, 1000 + n % 10, float(n)) for n in range(2500)]
+    write_records(path, records)
+    server = FakeServer()
+    status = asyncio.run(ScenarioReplayer(server, str(path), speed=0).run())
+    applied = [update for batch in server.batches for update in batch]
+    assert applied == [(ioa, value) for _, ioa, value in records]
+    # MAX_BATCH records per update_ioas call
+    assert [len(batch) for batch in server.batches] == [1000, 1000, 500]
+    assert status['applied'] == status['total'] == 2500
+
+
+def test_replay_keeps_the_recorded_schedule(tmp_path):
+    path = tmp_path / 'timed.rec'
+    # Two bursts 200ms apart, replayed at 2x
+    write_records(path, [(0, 1, 1.0), (1000, 2, 2.0), (200_000_000, 1, 0.0), (200_001_000, 2, 0.0)])
+    server = FakeServer()
+    replayer = ScenarioReplayer(server, str(path), speed=2.0)
+    status = asyncio.run(replayer.run())
+    assert [update for batch in server.batches for update in batch] == [(1, 1.0), (2, 2.0), (1, 0.0), (2, 0.0)]
+    assert 0.09 <= status['elapsed'] < 0.5
+    assert status['applied'] == 4
+    assert status['lag_max_ms'] is not None
+
+
+def test_replay_keeps_a_bounded_lag_history(tmp_path, monkeypatch):
+    monkeypatch.setattr(recording, 'LAG_WINDOW', 50)
+    path = tmp_path / 'long.rec'
+    write_records(path, [(n * 1_000_000_000, 1, float(n)) for n in range(300)])
+    # Every record is applied late, the one at 3s by 500ms
+    lags = [0.5 if n == 3 else (n % 100) / 1000 for n in range(300)]
+    clock = iter([0.0, *(n + lag for n, lag in enumerate(lags)), 300.0])
+    replayer = ScenarioReplayer(FakeServer(), str(path), speed=1.0, clock=lambda: next(clock))
+    status = asyncio.run(replayer.run())
+    assert status['applied'] == 300
+    assert len(replayer.lags) == 50
+    # p99 of the latest wakeups, the maximum of the whole replay
+    assert status['lag_p99_ms'] == 99.0
+    assert status['lag_max_ms'] == 500.0
+
+
+def test_replay_hands_every_batch_to_on_applied(tmp_path):
+    path = tmp_path / 'items.rec'
+    records = [(n * 1000, 1000 + n % 3, float(n)) for n in range(1500)]
+    write_records(path, records)
+    server = FakeServer()
+    applied = []
+    asyncio.run(ScenarioReplayer(server, str(path), speed=0, on_applied=applied.append).run())
+    assert applied == server.batches
+    assert [update for batch in applied for update in batch] == [(ioa, value) for _, ioa, value in records]
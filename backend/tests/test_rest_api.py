@@ -0,0 +1,107 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip('lib.lib60870', reason="needs the lib60870 shared library", exc_type=ImportError)
+
+import main
+
+
+def request(method, path, body=None, **headers):
+    """Run one request through the FastAPI app. Returns (status, headers, parsed body)."""
+    raw_headers = [(name.replace('_', '-').encode(), value.encode()) for name, value in headers.items()]
+    payload = b''
+    if body is not None:
+        payload = json.dumps(body).encode()
+        raw_headers.append((b'content-type', b'application/json'))
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method, 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '', 'headers': raw_headers,
+        'client': ('127.0.0.1', 50000), 'server': ('127.0.0.1', 80),
+    }
+    messages = [{'type': 'http.request', 'body': payload, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(main.app(scope, receive, send))
+    start, *parts = sent
+    content = b''.join(part.get('body', b'') for part in parts)
+    return start['status'], {name.decode(): value.decode() for name, value in start['headers']}, json.loads(content) if content else None
+
+
+@pytest.fixture
+def telesignal():
+    item = {'id': 'rest_ts', 'name': 'REST alarm', 'ioa': 64001, 'auto_mode': False}
+    yield item
+    if item['id'] in main.telesignals:
+        request('DELETE', f"/telesignals/{item['id']}")
+
+
+def test_collection_etag_changes_with_the_collection(telesignal):
+    status, headers, _ = request('GET', '/telesignals')
+    assert status == 200
+    etag = headers['etag']
+    assert request('GET', '/telesignals', if_none_match=etag)[0] == 304
+    assert request('GET', '/telesignals', if_none_match=f'"other", W/{etag}')[0] == 304
+
+    status, headers, created = request('POST', '/telesignals', telesignal)
+    assert status == 201
+    assert created['ioa'] == 64001 and headers['etag']
+    status, headers, rows = request('GET', '/telesignals', if_none_match=etag)
+    assert status == 200 and headers['etag'] != etag
+    assert any(row['id'] == 'rest_ts' for row in rows)
+
+    assert request('POST', '/telesignals', telesignal)[0] == 409
+    assert request('POST', '/telesignals', {'id': 'rest_bad', 'name': 'No IOA'})[0] == 422
+
+
+def test_conditional_item_get_patch_and_delete(telesignal):
+    _, headers, _ = request('POST', '/telesignals', telesignal)
+    etag = headers['etag']
+    path = f"/telesignals/{telesignal['id']}"
+    assert request('GET', path, if_none_match=etag)[0] == 304
+
+    # A stale If-Match is refused and changes nothing
+    assert request('PATCH', path, {'value': 1}, if_match='"stale"')[0] == 412
+    status, headers, item = request('PATCH', path, {'value': 1}, if_match=etag)
+    assert status == 200 and item['value'] == 1
+    assert headers['etag'] != etag
+    assert main.IEC_SERVER.ioa_list[64001]['data'] == 1
+    assert request('PATCH', path, {'colour': 'red'})[0] == 422
+
+    assert request('DELETE', path, if_match=etag)[0] == 412
+    assert request('DELETE', path, if_match=headers['etag'])[0] == 204
+    assert request('GET', path)[0] == 404
+    assert 64001 not in main.IEC_SERVER.ioa_list
+
+
+def test_batch_patch_reports_each_item(telesignal):
+    _, headers, _ = request('POST', '/telesignals', telesignal)
+    status, _, body = request('PATCH', '/telesignals', [
+        {'id': 'rest_ts', 'value': 1, 'etag': headers['etag']},
+        {'id': 'rest_ts', 'value': 0, 'etag': headers['etag']},
+        {'id': 'rest_missing', 'value': 1},
+    ])
+    assert status == 200
+    first, stale, missing = body['results']
+    assert first['status'] == 'success' and first['etag'] != headers['etag']
+    assert (stale['status'], stale['code']) == ('error', 412)
+    assert (missing['status'], missing['code']) == ('error', 404)
+    assert main.telesignals['rest_ts'].value == 1
+
+
+def test_station_points_etag(telesignal):
+    status, headers, points = request('GET', '/stations/1/points')
+    assert status == 200
+    assert request('GET', '/stations/1/points', if_none_match=headers['etag'])[0] == 304
+    request('POST', '/telesignals', telesignal)
+    status, changed, points = request('GET', '/stations/1/points', if_none_match=headers['etag'])
+    assert status == 200 and changed['etag'] != headers['etag']
+    assert {'ioa': 64001, 'type': 'SinglePointInformation', 'value': 0, 'quality': 0} in points
+    assert request('GET', '/stations/9/points')[0] == 404
@@ -0,0 +1,65 @@
+import logging
+
+import pytest
+
+from data_models import TelemetryItem
+from lib.rng import StationRandom
+
+
+def draws(random, kind, ioa, count=5):
+    return random.stream(kind, ioa).integers(0, 1000, count).tolist()
+
+
+def test_same_seed_gives_every_point_the_same_values_in_any_order():
+    first, second = StationRandom(104), StationRandom(104)
+    expected = {ioa: draws(first, 'telemetry', ioa) for ioa in (1000, 1001, 1002)}
+    # Other order, and other points drawn in between
+    for ioa in (1002, 1000, 1001):
+        draws(second, 'telesignal', ioa, count=ioa)
+        assert draws(second, 'telemetry', ioa) == expected[ioa]
+
+
+def test_streams_differ_per_point_kind_and_seed():
+    random = StationRandom(104)
+    assert draws(random, 'telemetry', 1000) != draws(random, 'telemetry', 1001)
+    assert draws(StationRandom(104), 'telemetry', 1000) != draws(StationRandom(104), 'telesignal', 1000)
+    assert draws(StationRandom(104), 'telemetry', 1000) != draws(StationRandom(105), 'telemetry', 1000)
+    # The same point is one stream, not a fresh one per call
+    assert random.stream('telemetry', 1000) is random.stream('telemetry', 1000)
+
+
+def test_unseeded_run_logs_a_seed_that_repeats_it(caplog):
+    with caplog.at_level(logging.INFO, logger='lib.rng'):
+        random = StationRandom()
+    assert caplog.messages == [f"Simulation seed {random.seed}"]
+    assert draws(StationRandom(random.seed), 'telemetry', 1000) == draws(random, 'telemetry', 1000)
+
+
+class Server:
+    def __init__(self, seed):
+        self.random = StationRandom(seed)
+        self.ioa_list = {}
+        self.updates = []
+
+    def update_ioa(self, ioa, value):
+        self.updates.append((ioa, value))
+
+
+def test_auto_mode_telemetry_repeats_with_the_seed():
+    pytest.importorskip('lib.lib60870', reason="needs the lib60870 shared library", exc_type=ImportError)
+    from lib.station import simulate_telemetry
+
+    def run(order):
+        server = Server(104)
+        items = {ioa: TelemetryItem(id=f't{ioa}', name='Feeder', ioa=ioa, unit='A', value=0.0, scale_factor=0.5,
+                                    min_value=0, max_value=100) for ioa in order}
+        values = {ioa: [] for ioa in order}
+        for _ in range(20):
+            for ioa in order:
+                values[ioa].append(simulate_telemetry(server, items[ioa]))
+        return values
+
+    values = run([1000, 1001])
+    assert values == run([1001, 1000])
+    assert all(0 <= value <= 100 and (value * 2).is_integer() for value in values[1000])
+    assert values[1000] != values[1001]
@@ -0,0 +1,105 @@
+from lib.sbo import SelectBeforeOperate
+from lib.timer_wheel import TimerWheel
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def new_sbo(timeout=10.0):
+    clock = FakeClock()
+    wheel = TimerWheel(clock=clock)
+    return SelectBeforeOperate(wheel, timeout), wheel, clock
+
+
+def test_execute_consumes_a_matching_selection():
+    sbo, wheel, clock = new_sbo()
+    assert sbo.select(100, 1, owner='a')
+    assert sbo.is_selected(100)
+    assert sbo.execute(100, 1, owner='a')
+    assert not sbo.is_selected(100)
+    # Consumed, a second execute needs a new select
+    assert not sbo.execute(100, 1, owner='a')
+    # Its timeout was cancelled with it
+    assert wheel.advance(clock.now + 60) == 0
+
+
+def test_execute_without_select_or_with_other_state_or_owner_is_rejected():
+    sbo, _, _ = new_sbo()
+    assert not sbo.execute(100, 1, owner='a')
+    sbo.select(100, 1, owner='a')
+    assert not sbo.execute(100, 0, owner='a')
+    assert not sbo.execute(100, 1, owner='b')
+    assert sbo.execute(100, 1, owner='a')
+
+
+def test_selection_held_by_another_connection_rejects_select():
+    sbo, _, _ = new_sbo()
+    assert sbo.select(100, 1, owner='a')
+    assert not sbo.select(100, 1, owner='b')
+    assert sbo.execute(100, 1, owner='a')
+    assert sbo.select(100, 1, owner='b')
+
+
+def test_selection_expires_after_its_timeout():
+    sbo, wheel, clock = new_sbo(timeout=5.0)
+    sbo.select(100, 1, owner='a')
+    clock.now += 4.9
+    wheel.advance()
+    assert sbo.is_selected(100)
+    clock.now += 0.2
+    wheel.advance()
+    assert not sbo.is_selected(100)
+    assert not sbo.execute(100, 1, owner='a')
+    assert len(sbo) == 0
+
+
+def test_per_select_timeout_overrides_the_default():
+    sbo, wheel, clock = new_sbo(timeout=60.0)
+    sbo.select(100, 1, timeout=1.0, owner='a')
+    clock.now += 1.1
+    wheel.advance()
+    assert not sbo.is_selected(100)
+
+
+def test_reselect_restarts_the_timeout():
+    sbo, wheel, clock = new_sbo(timeout=5.0)
+    sbo.select(100, 1, owner='a')
+    clock.now += 4.0
+    wheel.advance()
+    sbo.select(100, 1, owner='a')
+    clock.now += 4.0
+    wheel.advance()
+    # 8s after the first select, 4s after the second
+    assert sbo.is_selected(100)
+    clock.now += 1.1
+    wheel.advance()
+    assert not sbo.is_selected(100)
+
+
+def test_expired_selection_does_not_drop_a_newer_one():
+    sbo, wheel, clock = new_sbo(timeout=5.0)
+    sbo.select(100, 1, owner='a')
+    sbo.execute(100, 1, owner='a')
+    sbo.select(100, 0, timeout=30.0, owner='b')
+    clock.now += 6.0
+    wheel.advance()
+    assert sbo.is_selected(100)
+    assert sbo.execute(100, 0, owner='b')
+
+
+def test_cancel_and_cancel_owner():
+    sbo, _, _ = new_sbo()
+    sbo.select(100, 1, owner='a')
+    sbo.select(101, 1, owner='a')
+    sbo.select(102, 1, owner='b')
+    assert not sbo.cancel(100, owner='b')
+    assert sbo.cancel(100, owner='a')
+    assert not sbo.cancel(100, owner='a')
+    assert sbo.cancel_owner('a') == 1
+    assert not sbo.is_selected(101)
+    assert sbo.is_selected(102)
@@ -0,0 +1,173 @@
+import asyncio
+import socket
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('lib.lib60870', reason="needs the lib60870 shared library", exc_type=ImportError)
+
+from lib.lib60870 import *
+from lib.libiec60870server import IEC60870_5_104_server
+
+CONTROL = 200
+
+ACT_CON = (CS101_COT_ACTIVATION_CON, False)
+ACT_CON_NEGATIVE = (CS101_COT_ACTIVATION_CON, True)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class Master:
+    """Sends single commands and records the COT and negative flag of every reply."""
+
+    def __init__(self, port):
+        self.replies = []
+        self.started = threading.Event()
+        self.connection = CS104_Connection_create('127.0.0.1', port)
+        self.asduHandler = CS101_ASDUReceivedHandler(self.asdu_received)
+        self.connectionHandler = CS104_ConnectionHandler(self.connection_event)
+        CS104_Connection_setASDUReceivedHandler(self.connection, self.asduHandler, None)
+        CS104_Connection_setConnectionHandler(self.connection, self.connectionHandler, None)
+
+    def connection_event(self, param, connection, event):
+        if event == CS104_CONNECTION_STARTDT_CON_RECEIVED:
+            self.started.set()
+
+    def asdu_received(self, param, address, asdu):
+        if CS101_ASDU_getTypeID(asdu) == C_SC_NA_1:
+            self.replies.append((CS101_ASDU_getCOT(asdu), bool(CS101_ASDU_isNegative(asdu))))
+        return True
+
+    def connect(self):
+        assert CS104_Connection_connect(self.connection)
+        CS104_Connection_sendStartDT(self.connection)
+        assert self.started.wait(5)
+
+    async def send(self, state, select=False, cot=CS101_COT_ACTIVATION):
+        """Send a C_SC and wait for its reply."""
+        count = len(self.replies)
+        io = cast(SingleCommand_create(None, CONTROL, state, select, 0), InformationObject)
+        assert CS104_Connection_sendProcessCommandEx(self.connection, cot, 1, io)
+        InformationObject_destroy(io)
+        deadline = time.monotonic() + 5
+        while len(self.replies) == count:
+            assert time.monotonic() < deadline
+            await asyncio.sleep(0.02)
+        return self.replies[-1]
+
+    async def select(self, state):
+        return await self.send(state, select=True)
+
+    async def execute(self, state):
+        return await self.send(state)
+
+    async def deactivate(self, state):
+        return await self.send(state, select=True, cot=CS101_COT_DEACTIVATION)
+
+    def close(self):
+        if self.connection is not None:
+            CS104_Connection_destroy(self.connection)
+            self.connection = None
+
+
+def run_with_masters(count, test, sbo_timeout=10.0):
+    async def run():
+        port = free_port()
+        server = IEC60870_5_104_server('127.0.0.1', port)
+        server.add_ioa(CONTROL, SingleCommand, 0, None, True)
+        server.ioa_list[CONTROL]['sbo'] = True
+        server.ioa_list[CONTROL]['sbo_timeout'] = sbo_timeout
+        # Started on the loop like in main.py, select timeouts run on its timer wheel
+        assert server.start() == 0
+        wheel = asyncio.create_task(server.timer_wheel.run())
+        masters = [Master(port) for _ in range(count)]
+        try:
+            for master in masters:
+                await asyncio.to_thread(master.connect)
+            await test(server, *masters)
+        finally:
+            for master in masters:
+                master.close()
+            wheel.cancel()
+            server.stop()
+
+    asyncio.run(run())
+
+
+def test_select_then_execute():
+    async def test(server, master):
+        assert await master.select(1) == ACT_CON
+        # The select alone does not operate
+        assert server.ioa_list[CONTROL]['data'] == 0
+        assert await master.execute(1) == ACT_CON
+        assert server.ioa_list[CONTROL]['data'] == 1
+        # The selection was consumed
+        assert await master.execute(1) == ACT_CON_NEGATIVE
+
+    run_with_masters(1, test)
+
+
+def test_execute_without_or_mismatching_the_select_is_refused():
+    async def test(server, master):
+        assert await master.execute(1) == ACT_CON_NEGATIVE
+        assert await master.select(1) == ACT_CON
+        assert await master.execute(0) == ACT_CON_NEGATIVE
+        assert server.ioa_list[CONTROL]['data'] == 0
+        # The selection stays armed for the selected state
+        assert await master.execute(1) == ACT_CON
+        assert server.ioa_list[CONTROL]['data'] == 1
+
+    run_with_masters(1, test)
+
+
+def test_expired_select_is_refused():
+    async def test(server, master):
+        assert await master.select(1) == ACT_CON
+        await asyncio.sleep(0.5)
+        assert not server.sbo.is_selected(CONTROL)
+        assert await master.execute(1) == ACT_CON_NEGATIVE
+        assert server.ioa_list[CONTROL]['data'] == 0
+
+    run_with_masters(1, test, sbo_timeout=0.2)
+
+
+def test_deactivation_cancels_the_select():
+    async def test(server, master):
+        assert await master.select(1) == ACT_CON
+        assert await master.deactivate(1) == (CS101_COT_DEACTIVATION_CON, False)
+        assert await master.execute(1) == ACT_CON_NEGATIVE
+        # Nothing left to cancel
+        assert await master.deactivate(1) == (CS101_COT_DEACTIVATION_CON, True)
+
+    run_with_masters(1, test)
+
+
+def test_selection_belongs_to_the_selecting_connection():
+    async def test(server, first, second):
+        assert await first.select(1) == ACT_CON
+        assert await second.select(1) == ACT_CON_NEGATIVE
+        assert await second.execute(1) == ACT_CON_NEGATIVE
+        assert await second.deactivate(1) == (CS101_COT_DEACTIVATION_CON, True)
+        assert await first.execute(1) == ACT_CON
+        assert server.ioa_list[CONTROL]['data'] == 1
+
+    run_with_masters(2, test)
+
+
+def test_closing_the_connection_drops_its_selection():
+    async def test(server, first, second):
+        assert await first.select(1) == ACT_CON
+        first.close()
+        deadline = time.monotonic() + 5
+        while server.sbo.is_selected(CONTROL):
+            assert time.monotonic() < deadline
+            await asyncio.sleep(0.02)
+        assert await second.select(1) == ACT_CON
+        assert await second.execute(1) == ACT_CON
+
+    run_with_masters(2, test)
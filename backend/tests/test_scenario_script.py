@@ -0,0 +1,74 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('lib.lib60870', reason="needs the lib60870 shared library", exc_type=ImportError)
+
+from data_models import TelemetryItem
+from lib.breaker import POSITION_CLOSED, POSITION_OPEN
+from lib.dependencies import DependencyGraph
+from lib.lib60870 import MeasuredValueShort
+from lib.scenario_script import ScenarioScript
+
+
+class FakeServer:
+    def __init__(self):
+        self.ioa_list = {}
+        self.position = POSITION_CLOSED
+        self.breaker_operations = SimpleNamespace(position_of=lambda cb: self.position)
+        self.dependencies = None
+
+    def update_ioa(self, ioa, value):
+        self.ioa_list[ioa]['data'] = value
+
+
+def coupled_feeder():
+    server = FakeServer()
+    cb = SimpleNamespace(id='cb', ioa_cb_status=10, ioa_cb_status_close=11, is_dp_mode=False, ioa_cb_status_dp=None)
+    item = TelemetryItem(id='i', name='Feeder', ioa=1000, unit='A', value=100.0, scale_factor=1,
+                         min_value=0, max_value=1000, breaker_ids=['cb'])
+    server.ioa_list[1000] = {'type': MeasuredValueShort, 'data': 100.0}
+    telemetries = {'i': item}
+    server.dependencies = DependencyGraph(server, telemetries, {'cb': cb}, {}, lambda name: None)
+    server.dependencies.rebuild()
+    return server, item, telemetries
+
+
+def run_all(script):
+    for event in script.events:
+        event.apply(*event.args)
+
+
+def test_scripted_value_is_kept_as_the_base_of_a_coupled_telemetry():
+    server, item, telemetries = coupled_feeder()
+    script = ScenarioScript({'actions': [{'at': 0, 'action': 'set', 'telemetry': 'Feeder', 'value': 250}]},
+                            server, {'telemetries': telemetries}, lambda name: None)
+
+    server.position = POSITION_OPEN
+    run_all(script)
+    # Forced to 0 behind the open breaker
+    assert item.value == 0.0
+    assert server.ioa_list[1000]['data'] == 0.0
+
+    # Closing it restores the scripted value, not the one from before the script
+    server.position = POSITION_CLOSED
+    server.dependencies.on_change(10)
+    assert item.value == 250.0
+    assert server.ioa_list[1000]['data'] == 250.0
+
+
+def test_ramp_starts_from_the_base_of_a_coupled_telemetry():
+    server, item, telemetries = coupled_feeder()
+    server.position = POSITION_OPEN
+    server.dependencies.on_change(10)
+    assert item.value == 0.0
+
+    script = ScenarioScript({'actions': [{'at': 0, 'action': 'ramp', 'telemetry': 'Feeder', 'to': 200, 'over': 2}]},
+                            server, {'telemetries': telemetries}, lambda name: None)
+    server.position = POSITION_CLOSED
+    event = script.events[0]
+    event.apply(*event.args)
+    # Half way from the base of 100, not from the forced 0
+    assert item.value == 150.0
+    run_all(script)
+    assert item.value == 200.0
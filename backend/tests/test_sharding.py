@@ -0,0 +1,125 @@
+import asyncio
+import socket
+import time
+
+import pytest
+
+pytest.importorskip('lib.lib60870', reason="needs the lib60870 shared library", exc_type=ImportError)
+
+from lib.lib60870 import *
+from lib.sharding import ShardCoordinator, ShardedStation, decode_deltas, encode_deltas, farm_specs
+from lib.station import Station
+
+STATUS_OPEN, STATUS_CLOSE, CONTROL_OPEN, CONTROL_CLOSE = 100, 101, 102, 103
+
+TEMPLATE = {
+    'circuit_breakers': [{
+        'id': 'cb1',
+        'name': 'CB 1',
+        'ioa_cb_status': STATUS_OPEN,
+        'ioa_cb_status_close': STATUS_CLOSE,
+        'ioa_control_open': CONTROL_OPEN,
+        'ioa_control_close': CONTROL_CLOSE,
+        'ioa_local_remote_sp': 104,
+        'ioa_local_remote_dp': 105,
+        'is_sbo': False,
+        'has_double_point': False,
+        'has_local_remote_dp': False,
+    }],
+    'telemetries': [{
+        'id': 't1', 'name': 'T 1', 'ioa': 200, 'unit': 'A', 'value': 0,
+        'min_value': 0, 'max_value': 10, 'scale_factor': 1, 'interval': 3600, 'auto_mode': False,
+    }],
+}
+
+
+def free_ports(count):
+    sockets = [socket.socket() for _ in range(count)]
+    try:
+        for s in sockets:
+            s.bind(('127.0.0.1', 0))
+        return [s.getsockname()[1] for s in sockets]
+    finally:
+        for s in sockets:
+            s.close()
+
+
+def copy_of(station):
+    return ShardedStation(station.ca, station.port, 0, station.points())
+
+
+def forward(station, copy):
+    for ca, records in decode_deltas(encode_deltas([station])):
+        assert ca == station.ca
+        copy.apply(records)
+
+
+def test_deltas_carry_commands_and_quality():
+    station = Station(2, '127.0.0.1', 0, TEMPLATE)
+    copy = copy_of(station)
+    server = station.server
+
+    # A close command: the control point is written by execute_command, the status by the breaker
+    server.execute_command(CONTROL_CLOSE, 1)
+    # The operation starts, then completes after a travel time of 0
+    for seconds in (1, 2):
+        server.timer_wheel.advance(server.timer_wheel.clock() + seconds)
+    server.set_quality(200, 200, IEC60870_QUALITY_INVALID)
+    forward(station, copy)
+
+    assert copy.point_json(CONTROL_CLOSE)['value'] == 1
+    assert copy.point_json(STATUS_CLOSE)['value'] == 1
+    assert copy.point_json(200)['quality'] == IEC60870_QUALITY_INVALID
+    assert [copy.point_json(ioa) for ioa in sorted(copy.points)] == [
+        {'ioa': ioa, 'type': type_name, 'value': value, 'quality': quality} for ioa, type_name, value, quality in station.points()
+    ]
+    # Nothing changed since, nothing is sent
+    assert encode_deltas([station]) == b''
+
+
+def send_single_command(port, ca, ioa, state):
+    connection = CS104_Connection_create('127.0.0.1', port)
+    try:
+        assert CS104_Connection_connect(connection)
+        CS104_Connection_sendStartDT(connection)
+        time.sleep(0.2)
+        io = cast(SingleCommand_create(None, ioa, state, False, 0), InformationObject)
+        assert CS104_Connection_sendProcessCommandEx(connection, CS101_COT_ACTIVATION, ca, io)
+        InformationObject_destroy(io)
+        time.sleep(0.2)
+    finally:
+        CS104_Connection_destroy(connection)
+
+
+async def wait_for(condition, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        await asyncio.sleep(0.05)
+
+
+def test_coordinator_follows_a_command_on_a_shard():
+    async def run():
+        ports = free_ports(2)
+        coordinator = ShardCoordinator(2, farm_specs(TEMPLATE, ports), '127.0.0.1', seed=1, tick=0.05)
+        coordinator.start()
+        shards = list(coordinator.shards)
+        try:
+            await wait_for(lambda: len(coordinator.stations) == 2)
+            assert {station.shard for station in coordinator.stations.values()} == {0, 1}
+
+            await asyncio.to_thread(send_single_command, ports[1], 3, CONTROL_CLOSE, True)
+            commanded = coordinator.stations[3]
+            await wait_for(lambda: commanded.point_json(STATUS_CLOSE)['value'] == 1)
+            assert commanded.point_json(CONTROL_CLOSE)['value'] == 1
+            # The other shard's station is untouched
+            other = coordinator.stations[2]
+            assert other.point_json(STATUS_CLOSE)['value'] == 0
+            assert other.point_json(CONTROL_CLOSE)['value'] == 0
+            assert other.changes == 0
+        finally:
+            coordinator.stop()
+        # The readers end with their workers
+        assert not any(shard.reader.is_alive() for shard in shards)
+
+    asyncio.run(run())
@@ -0,0 +1,158 @@
+import threading
+import time
+import uuid
+
+import numpy as np
+import pytest
+
+from lib.point_table import PointTable
+from lib.shared_points import SharedPointReader, SharedPointTable
+
+
+@pytest.fixture
+def table():
+    points = PointTable({ioa: {'type': None, 'data': float(ioa), 'quality': 0} for ioa in (30, 10, 20)})
+    shared = SharedPointTable(f'iec104-test-{uuid.uuid4().hex[:8]}', points, capacity=64)
+    shared.open()
+    yield shared
+    shared.close()
+
+
+def test_snapshot_is_sorted_by_ioa(table):
+    reader = SharedPointReader(table.name)
+    try:
+        snapshot = reader.snapshot()
+        assert snapshot.ioas.tolist() == [10, 20, 30]
+        assert snapshot.to_dict() == {10: 10.0, 20: 20.0, 30: 30.0}
+        assert snapshot.value(20) == 20.0
+        with pytest.raises(KeyError):
+            snapshot.value(25)
+    finally:
+        reader.close()
+
+
+def test_set_and_refresh_are_published(table):
+    reader = SharedPointReader(table.name)
+    try:
+        before = reader.sequence
+        point = table.points[20]
+        point['data'] = 2.5
+        point['quality'] = 0x80
+        table.set(20, point)
+        assert reader.sequence == before + 2
+        snapshot = reader.snapshot()
+        assert snapshot.value(20) == 2.5
+        assert snapshot.quality[1] == 0x80
+
+        generation = snapshot.generation
+        table.points[15] = {'type': None, 'data': 1.0, 'quality': 0}
+        del table.points[30]
+        table.refresh()
+        snapshot = reader.snapshot()
+        assert snapshot.ioas.tolist() == [10, 15, 20]
+        assert snapshot.generation == generation + 1
+        # Nothing added or removed since, refresh leaves the segment alone
+        sequence = reader.sequence
+        table.refresh()
+        assert reader.sequence == sequence
+    finally:
+        reader.close()
+
+
+def test_reader_waits_for_a_write_in_progress(table):
+    reader = SharedPointReader(table.name, timeout=2.0)
+    try:
+        # Hold the seqlock the way a writer does in the middle of a write
+        table._sequence[0] += 1
+        released = threading.Timer(0.1, lambda: table._sequence.__setitem__(0, table._sequence[0] + 1))
+        started = time.monotonic()
+        released.start()
+        snapshot = reader.snapshot()
+        assert time.monotonic() - started >= 0.09
+        assert snapshot.sequence % 2 == 0
+    finally:
+        reader.close()
+
+
+def test_reader_times_out_when_the_writer_never_finishes(table):
+    reader = SharedPointReader(table.name, timeout=0.05)
+    try:
+        table._sequence[0] += 1
+        with pytest.raises(TimeoutError):
+            reader.snapshot()
+    finally:
+        table._sequence[0] += 1
+        reader.close()
+
+
+def test_snapshots_are_never_torn(table):
+    # The writer always gives every point the same value, a consistent copy agrees on it
+    points = table.points
+    for ioa in range(100, 140):
+        points[ioa] = {'type': None, 'data': 0.0, 'quality': 0}
+    table.refresh()
+    stop = threading.Event()
+
+    def writer():
+        value = 0.0
+        while not stop.is_set():
+            value += 1
+            with table._lock:
+                table._sequence[0] += 1
+                table._values[:table._count[0]] = value
+                table._sequence[0] += 1
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    reader = SharedPointReader(table.name, retry_interval=0, timeout=5.0)
+    try:
+        for _ in range(2000):
+            snapshot = reader.snapshot()
+            assert np.all(snapshot.values == snapshot.values[0])
+    finally:
+        stop.set()
+        thread.join()
+        reader.close()
+
+
+def test_set_never_writes_to_a_slot_of_an_old_layout(table):
+    # Every point holds its own IOA as the value, a set racing a refresh must not break that
+    points = table.points
+    for ioa in range(100, 140):
+        points[ioa] = {'type': None, 'data': float(ioa), 'quality': 0}
+    table.refresh()
+    stop = threading.Event()
+
+    def writer():
+        while not stop.is_set():
+            for ioa in range(100, 140, 7):
+                table.set(ioa, {'data': float(ioa), 'quality': 0})
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    reader = SharedPointReader(table.name, retry_interval=0, timeout=5.0)
+    try:
+        for i in range(500):
+            # Adding and removing a low IOA moves every point behind it to another slot
+            if i % 2:
+                del points[15]
+            else:
+                points[15] = {'type': None, 'data': 15.0, 'quality': 0}
+            table.refresh()
+            snapshot = reader.snapshot()
+            assert np.array_equal(snapshot.values, snapshot.ioas.astype(snapshot.values.dtype))
+    finally:
+        stop.set()
+        thread.join()
+        reader.close()
+
+
+def test_attaching_to_something_else_fails():
+    from multiprocessing import shared_memory
+    other = shared_memory.SharedMemory(name=f'iec104-other-{uuid.uuid4().hex[:8]}', create=True, size=4096)
+    try:
+        with pytest.raises(ValueError):
+            SharedPointReader(other.name)
+    finally:
+        other.close()
+        other.unlink()
@@ -0,0 +1,106 @@
+import asyncio
+import inspect
+
+import socketio
+from engineio import packet as eio_packet
+
+from lib.socketio_server import MeteredAsyncServer, OutboundPacket
+
+# MeteredAsyncServer hooks into these python-socketio/engineio internals,
+# an upgrade that changes them must fail here before it reaches a dashboard
+
+
+def parameters(function):
+    return list(inspect.signature(function).parameters)
+
+
+def test_private_hooks_still_exist_with_the_same_signatures():
+    assert inspect.iscoroutinefunction(socketio.AsyncServer._send_eio_packet)
+    assert parameters(socketio.AsyncServer._send_eio_packet) == ['self', 'eio_sid', 'eio_pkt']
+    assert inspect.iscoroutinefunction(socketio.AsyncServer._handle_eio_disconnect)
+    assert parameters(socketio.AsyncServer._handle_eio_disconnect) == ['self', 'eio_sid', 'reason']
+    assert parameters(eio_packet.Packet.encode) == ['self', 'b64']
+    assert parameters(socketio.AsyncManager.sid_from_eio_sid) == ['self', 'eio_sid', 'namespace']
+
+
+class Transport:
+    """Stands in for the Engine.IO transports: records the packets handed to them, without encoding."""
+
+    def __init__(self, eio):
+        self.sent = []
+        self.disconnected = []
+        eio.send_packet = self.send_packet
+        eio.disconnect = self.disconnect
+
+    async def send_packet(self, eio_sid, pkt):
+        self.sent.append((eio_sid, pkt))
+
+    async def disconnect(self, eio_sid):
+        self.disconnected.append(eio_sid)
+
+
+def server_with_clients(count, **kwargs):
+    server = MeteredAsyncServer(async_mode='asgi', snapshot_events=('telemetries',), **kwargs)
+    transport = Transport(server.eio)
+
+    async def connect():
+        for n in range(count):
+            await server.manager.connect(f'eio{n}', '/')
+
+    return server, transport, connect
+
+
+def test_broadcasts_go_through_the_backpressure_hook():
+    server, transport, connect = server_with_clients(2)
+
+    async def main():
+        await connect()
+        await server.emit('telemetries', [{'id': 't1', 'value': 1}])
+
+    asyncio.run(main())
+    assert sorted(eio_sid for eio_sid, _ in transport.sent) == ['eio0', 'eio1']
+    assert all(isinstance(pkt, OutboundPacket) for _, pkt in transport.sent)
+    assert server.queue_depths() == {(server.client_sid('eio0'),): 1, (server.client_sid('eio1'),): 1}
+
+    # Counted out once the transport encodes it
+    for _, pkt in transport.sent:
+        pkt.encode()
+    assert set(server.queue_depths().values()) == {0}
+
+
+def test_unsent_snapshot_is_replaced_by_the_next_one():
+    server, transport, connect = server_with_clients(1)
+
+    async def main():
+        await connect()
+        await server.emit('telemetries', [{'value': 1}])
+        await server.emit('telemetries', [{'value': 2}])
+
+    asyncio.run(main())
+    assert len(transport.sent) == 1
+    assert '"value":2' in transport.sent[0][1].data
+
+
+def test_other_events_are_dropped_past_max_queue():
+    server, transport, connect = server_with_clients(1, max_queue=3, slow_client_timeout=3600)
+
+    async def main():
+        await connect()
+        for n in range(10):
+            await server.emit('log', n)
+
+    asyncio.run(main())
+    assert len(transport.sent) == 3
+    assert transport.disconnected == []
+
+
+def test_client_lagging_too_long_is_disconnected():
+    server, transport, connect = server_with_clients(1, max_queue=1, slow_client_timeout=0)
+
+    async def main():
+        await connect()
+        for n in range(3):
+            await server.emit('log', n)
+
+    asyncio.run(main())
+    assert transport.disconnected == ['eio0']
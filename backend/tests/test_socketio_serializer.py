@@ -0,0 +1,83 @@
+import json
+
+import pytest
+from socketio import msgpack_packet, packet
+
+from data_models import TelemetryItem
+from lib.collection import Collection
+from lib.socketio_server import MeteredAsyncServer, serializer_for
+
+
+def telemetries(count, columnar_min_items):
+    collection = Collection('telemetries', columnar_min_items=columnar_min_items)
+    for i in range(count):
+        collection[f't{i}'] = TelemetryItem(
+            id=f't{i}', name=f'Feeder {i} ü', ioa=1000 + i, unit='A', value=i * 0.5,
+            scale_factor=0.5, min_value=-100, max_value=100.25, auto_mode=bool(i % 2), breaker_ids=[f'cb{i}'],
+        )
+    return collection
+
+
+def to_rows(value):
+    """What the frontend's ColumnarDecoder does with a columnar payload (socket.ts)."""
+    if isinstance(value, dict) and 'fields' in value and 'columns' in value:
+        columns = value['columns']
+        return [dict(zip(value['fields'], row)) for row in zip(*columns)] if columns else []
+    return value
+
+
+def round_trip(packet_class, data):
+    encoded = packet_class(packet.EVENT, data=data, namespace='/').encode()
+    decoded = packet_class(encoded_packet=encoded)
+    assert decoded.packet_type == packet.EVENT
+    return decoded.data
+
+
+@pytest.mark.parametrize('packet_class', [packet.Packet, msgpack_packet.MsgPackPacket])
+@pytest.mark.parametrize('count,columnar_min_items', [(50, 10), (50, 0), (5, 10), (0, 10)])
+def test_collection_payload_round_trip(packet_class, count, columnar_min_items):
+    collection = telemetries(count, columnar_min_items)
+    payload = collection.payload()
+    if columnar_min_items and count >= columnar_min_items:
+        assert set(payload) == {'fields', 'columns'}
+    else:
+        assert isinstance(payload, list)
+    event, data = round_trip(packet_class, ['telemetries', payload])
+    assert event == 'telemetries'
+    assert to_rows(data) == collection.rows()
+
+
+def test_msgpack_payload_is_binary_and_smaller_columnar():
+    collection = telemetries(500, 100)
+    rows = msgpack_packet.MsgPackPacket(packet.EVENT, data=['telemetries', collection.rows()]).encode()
+    columns = msgpack_packet.MsgPackPacket(packet.EVENT, data=['telemetries', collection.columns()]).encode()
+    assert isinstance(rows, bytes) and isinstance(columns, bytes)
+    assert len(columns) < len(rows)
+
+
+def test_payload_is_cached_until_the_collection_changes():
+    collection = telemetries(20, 10)
+    payload = collection.payload()
+    assert collection.payload() is payload
+    collection['t3'].value = 42.0
+    changed = collection.payload()
+    assert changed is not payload
+    assert to_rows(changed)[3]['value'] == 42.0
+
+
+@pytest.mark.parametrize('name,expected', [
+    ('msgpack', 'msgpack'), ('MsgPack', 'msgpack'), ('json', 'default'), ('', 'default'), (None, 'default'), ('cbor', 'default'),
+])
+def test_serializer_falls_back_to_json(name, expected):
+    assert serializer_for(name) == expected
+
+
+def test_json_server_sends_text_packets_json_clients_can_parse():
+    server = MeteredAsyncServer(async_mode='asgi', serializer=serializer_for('json'))
+    assert server.packet_class is packet.Packet
+    encoded = server.packet_class(packet.EVENT, data=['telemetries', telemetries(3, 0).payload()], namespace='/').encode()
+    assert isinstance(encoded, str)
+    assert json.loads(encoded[1:])[0] == 'telemetries'
+
+    server = MeteredAsyncServer(async_mode='asgi', serializer=serializer_for('msgpack'))
+    assert server.packet_class is msgpack_packet.MsgPackPacket
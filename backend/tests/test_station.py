@@ -0,0 +1,61 @@
+import pytest
+
+pytest.importorskip('lib.lib60870', reason="needs the lib60870 shared library", exc_type=ImportError)
+
+from lib.collection import Collection
+from lib.lib60870 import MeasuredValueShort, SinglePointInformation
+from lib.station import Station, StationTemplate
+
+CONFIG = {
+    'telesignals': [{'id': 'ts1', 'name': 'Alarm', 'ioa': 100, 'value': 1}],
+    'telemetries': [{'id': 'tm1', 'name': 'Feeder', 'ioa': 200, 'unit': 'A', 'value': 12.5, 'scale_factor': 0.5,
+                     'min_value': 0, 'max_value': 100}],
+}
+
+
+def test_point_tables_share_definitions_until_a_station_assigns_them():
+    template = StationTemplate(CONFIG)
+    first, second = template.point_table(), template.point_table(ioa_offset=1000)
+    assert sorted(first) == [100, 200] and sorted(second) == [1100, 1200]
+    assert first[200].shared is second[1200].shared
+    assert (first[200]['type'], first[200]['data'], first[200]['max_value']) == (MeasuredValueShort, 12.5, 100)
+
+    first[200]['data'] = 50.0
+    first[200]['max_value'] = 60
+    first[100]['auto_mode'] = False
+    assert first[200]['max_value'] == 60 and first[100].get('auto_mode') is False
+    # The other station and the template keep theirs
+    assert (second[1200]['data'], second[1200]['max_value'], second[1100]['auto_mode']) == (12.5, 100, True)
+    assert template.points[200][3]['max_value'] == 100
+    assert 'callback' in second[1100] and 'missing' not in second[1100]
+
+
+def test_instances_share_field_values_until_assigned():
+    template = StationTemplate(CONFIG)
+    first, = template.instances('telemetries')
+    second, = template.instances('telemetries', ioa_offset=1000)
+    assert type(first) is type(second)
+    assert (first.ioa, second.ioa) == (200, 1200)
+    assert vars(first) == {}
+
+    collection = Collection('telemetries')
+    collection['tm1'] = first
+    version = collection.version
+    first.value = 40.0
+    assert collection.version == version + 1
+    assert vars(first)['value'] == 40.0 and 'name' not in vars(first)
+    assert second.value == 12.5 and type(first).value == 12.5
+    assert first.model_dump() == {**second.model_dump(), 'ioa': 200, 'value': 40.0}
+
+
+def test_stations_from_one_template_change_independently():
+    template = StationTemplate(CONFIG)
+    first = Station(1, '127.0.0.1', 0, template)
+    second = Station(2, '127.0.0.1', 0, template, ioa_offset=1000)
+    first.server.update_ioa(100, 0)
+    first.telesignals['ts1'].value = 0
+    assert first.points()[0] == (100, SinglePointInformation.__name__, 0, 0)
+    assert second.points()[0] == (1100, SinglePointInformation.__name__, 1, 0)
+    assert second.telesignals['ts1'].value == 1
+    # Only the change after loading is a delta
+    assert first.deltas.take() == [(100, 0, 0)] and second.deltas.take() == []
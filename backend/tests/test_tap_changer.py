@@ -0,0 +1,106 @@
+from types import SimpleNamespace
+
+from data_models import TapChangerItem
+from lib.tap_changer import IDLE, LOWER, RAISE, TapChangerOperations
+from lib.timer_wheel import TimerWheel
+
+VALUE = 3000
+STATUS = 3001
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeServer:
+    """Keeps the IOA values and records every status update and ACT_TERM."""
+
+    def __init__(self, position):
+        self.ioa_list = {VALUE: {'data': position}, STATUS: {'data': IDLE}}
+        self.statuses = []
+        self.act_terms = []
+        self.breaker_operations = self
+
+    def update_ioa(self, ioa, value):
+        self.ioa_list[ioa]['data'] = value
+        if ioa == STATUS:
+            self.statuses.append(value)
+
+    def send_act_term(self, origin, negative=False):
+        self.act_terms.append((origin, negative))
+
+
+def new_operations(position=3, operating_time=1.0):
+    clock = FakeClock()
+    server = FakeServer(position)
+    operations = TapChangerOperations(server, TimerWheel(resolution=0.05, clock=clock))
+    tc = TapChangerItem(id='tc1', name='TC1', ioa_value=VALUE, value=position, value_high_limit=5, value_low_limit=1,
+                        ioa_high_limit=3002, ioa_low_limit=3003, ioa_status_raise_lower=STATUS, ioa_command_raise_lower=3004,
+                        operating_time=operating_time, ioa_status_auto_manual=3005, ioa_command_auto_manual=3006,
+                        is_local_remote=1, ioa_local_remote=3007)
+    return operations, server, tc, clock
+
+
+def advance(operations, clock, seconds):
+    """Move the clock on one wheel tick at a time, like TimerWheel.run does."""
+    end = clock.now + seconds
+    while clock.now < end:
+        clock.now = min(clock.now + 0.05, end)
+        operations.timer_wheel.advance()
+
+
+def test_step_shows_the_direction_for_the_operating_time():
+    operations, server, tc, clock = new_operations()
+    origin = SimpleNamespace(connection_id=1)
+    assert operations.step(tc, RAISE, origin=origin) == 0
+    advance(operations, clock, 0.1)
+    assert server.statuses == [RAISE]
+    assert operations.is_moving(tc) and operations.position_of(tc) == 3
+    advance(operations, clock, 0.5)
+    assert operations.position_of(tc) == 3
+    advance(operations, clock, 0.6)
+    assert operations.position_of(tc) == 4
+    assert server.statuses == [RAISE, IDLE]
+    assert server.act_terms == [(origin, False)]
+    assert not operations.is_moving(tc)
+
+
+def test_step_past_a_limit_or_while_moving_is_refused():
+    operations, server, tc, clock = new_operations(position=1)
+    assert operations.step(tc, LOWER, origin='lower') == -1
+    assert operations.step(tc, RAISE) == 0
+    assert operations.step(tc, RAISE, origin='busy') == -1
+    assert server.act_terms == [('lower', True), ('busy', True)]
+    advance(operations, clock, 1.2)
+    assert operations.position_of(tc) == 2
+
+
+def test_multi_step_stops_at_the_limit():
+    operations, server, tc, clock = new_operations(position=3)
+    assert operations.step(tc, RAISE, steps=4, origin='raise') == 0
+    for _ in range(5):
+        advance(operations, clock, 1.1)
+    assert operations.position_of(tc) == 5
+    # Two of the four steps were made
+    assert server.act_terms == [('raise', True)]
+    assert server.statuses == [RAISE, IDLE]
+
+
+def test_cancel_and_closed_connection():
+    operations, server, tc, clock = new_operations()
+    operations.step(tc, LOWER, origin=SimpleNamespace(connection_id=7))
+    assert operations.forget_connection(7) == 1
+    advance(operations, clock, 1.2)
+    assert operations.position_of(tc) == 2
+    # The operation finished without an origin to answer
+    assert server.act_terms == [(None, False)]
+
+    operations.step(tc, LOWER)
+    advance(operations, clock, 0.1)
+    operations.cancel(tc)
+    advance(operations, clock, 2.0)
+    assert operations.position_of(tc) == 2 and len(operations) == 0
@@ -0,0 +1,109 @@
+import threading
+
+from lib.timer_wheel import TimerWheel
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def new_wheel(**kwargs):
+    clock = FakeClock()
+    return TimerWheel(clock=clock, **kwargs), clock
+
+
+def test_timer_never_fires_before_its_delay():
+    wheel, clock = new_wheel(resolution=0.05)
+    fired = []
+    wheel.call_later(0.12, fired.append, 'a')
+    clock.now += 0.11
+    assert wheel.advance() == 0
+    assert fired == []
+    clock.now += 0.05
+    assert wheel.advance() == 1
+    assert fired == ['a']
+    assert len(wheel) == 0
+
+
+def test_timers_fire_in_their_own_tick_only():
+    wheel, clock = new_wheel(resolution=0.05)
+    fired = []
+    for delay in (0.05, 0.2, 1.0):
+        wheel.call_later(delay, fired.append, delay)
+    assert len(wheel) == 3
+    clock.now += 0.3
+    wheel.advance()
+    assert fired == [0.05, 0.2]
+    clock.now += 1.0
+    wheel.advance()
+    assert fired == [0.05, 0.2, 1.0]
+
+
+def test_cancelled_timer_does_not_fire():
+    wheel, clock = new_wheel()
+    fired = []
+    handle = wheel.call_later(0.1, fired.append, 'cancelled')
+    wheel.call_later(0.1, fired.append, 'kept')
+    handle.cancel()
+    clock.now += 1
+    assert wheel.advance() == 1
+    assert fired == ['kept']
+    assert len(wheel) == 0
+
+
+def test_timer_beyond_one_revolution_waits_for_its_tick():
+    wheel, clock = new_wheel(resolution=0.1, slots=8)
+    fired = []
+    # 2.05s is past one revolution of 8 * 0.1s, it shares a bucket with earlier ticks
+    wheel.call_later(2.05, fired.append, 'late')
+    for _ in range(20):
+        clock.now += 0.1
+        wheel.advance()
+    assert fired == []
+    clock.now += 0.2
+    wheel.advance()
+    assert fired == ['late']
+
+
+def test_falling_behind_a_full_revolution_fires_everything_due():
+    wheel, clock = new_wheel(resolution=0.1, slots=8)
+    fired = []
+    for delay in (0.1, 0.4, 0.7, 5.0):
+        wheel.call_later(delay, fired.append, delay)
+    clock.now += 3.0
+    assert wheel.advance() == 3
+    assert sorted(fired) == [0.1, 0.4, 0.7]
+    assert len(wheel) == 1
+
+
+def test_callback_errors_are_logged_and_the_rest_still_fire(caplog):
+    wheel, clock = new_wheel()
+    fired = []
+
+    def fail():
+        raise RuntimeError("boom")
+
+    wheel.call_later(0.1, fail)
+    wheel.call_later(0.1, fired.append, 'after')
+    clock.now += 1
+    wheel.advance()
+    assert fired == ['after']
+    assert "boom" in caplog.text
+
+
+def test_call_later_from_other_threads():
+    wheel, clock = new_wheel()
+    fired = []
+    threads = [threading.Thread(target=lambda: [wheel.call_later(0.1, fired.append, i) for i in range(250)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(wheel) == 1000
+    clock.now += 1
+    assert wheel.advance() == 1000
+    assert len(fired) == 1000
@@ -0,0 +1,504 @@
+#!/usr/bin/env python3
+"""
+IEC 104 master load generator.
+
+Opens N concurrent master connections, each driving a weighted mix of
+station interrogations, reads and double commands, and reports throughput
+and latency percentiles for command -> ACT_CON, command -> status change,
+GI -> ACT_TERM and read -> response.
+
+    python -m tools.load_master --self-host --connections 8 --seconds 30
+    python -m tools.load_master --host 10.0.0.5 --port 2451 --config export.json
+
+--self-host runs a simulator in this process on --port with generated
+breakers and telemetries, so a run only needs lib60870 and works offline in
+CI. Against a running simulator, --config names an exported JSON file and
+its double point breakers without SBO are commanded. Start that simulator
+with IEC_104_SERVER_MODE=connection, in the default mode only one master is
+active at a time.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import threading
+import time
+
+import numpy as np
+
+from lib.lib60870 import *
+
+OPERATIONS = ('gi', 'read', 'command')
+
+
+def new_stats():
+    return dict.fromkeys([
+        'asdus_received', 'gi_sent', 'gi_done', 'reads_sent', 'reads_answered', 'reads_unknown',
+        'commands_sent', 'commands_confirmed', 'commands_negative', 'commands_status_seen',
+        'commands_act_term', 'commands_act_term_negative', 'commands_timed_out', 'send_blocked',
+    ], 0)
+
+
+class Breaker:
+    __slots__ = ('control', 'status')
+
+    def __init__(self, control, status):
+        self.control = control
+        self.status = status
+
+
+class Command:
+    __slots__ = ('breaker', 'state', 'sent', 'confirmed', 'status_seen')
+
+    def __init__(self, breaker, state, sent):
+        self.breaker = breaker
+        self.state = state
+        self.sent = sent
+        self.confirmed = False
+        self.status_seen = False
+
+
+class Master:
+    """One master connection and the load it drives, run on its own thread."""
+
+    def __init__(self, index, args, breakers, read_ioas, weights, seed):
+        self.index = index
+        self.args = args
+        self.breakers = breakers
+        self.read_ioas = read_ioas
+        self.weights = weights
+        self.rng = random.Random(seed)
+        self.stats = new_stats()
+        self.latencies = {'act_con': [], 'status': [], 'gi': [], 'read': []}
+        self.error = None
+
+        self.lock = threading.Lock()
+        self.active = threading.Event()
+        self.closed = False
+        # Keyed by control IOA and by status IOA, one command in flight per breaker
+        self.commands = {}
+        self.awaiting_status = {}
+        self.positions = {}
+        self.gi_sent = None
+        self.reads = {}
+
+        self.connection = CS104_Connection_create(args.host, args.port)
+        self.asduHandler = CS101_ASDUReceivedHandler(self.asdu_received)
+        self.connectionHandler = CS104_ConnectionHandler(self.connection_event)
+        CS104_Connection_setASDUReceivedHandler(self.connection, self.asduHandler, None)
+        CS104_Connection_setConnectionHandler(self.connection, self.connectionHandler, None)
+
+    def connect(self):
+        if not CS104_Connection_connect(self.connection):
+            self.error = f"connection {self.index}: connect to {self.args.host}:{self.args.port} failed"
+            return False
+        CS104_Connection_sendStartDT(self.connection)
+        if not self.active.wait(5):
+            self.error = f"connection {self.index}: no STARTDT_CON"
+            return False
+        return True
+
+    def close(self):
+        CS104_Connection_destroy(self.connection)
+
+    def connection_event(self, param, connection, event):
+        if event == CS104_CONNECTION_STARTDT_CON_RECEIVED:
+            self.active.set()
+        elif event == CS104_CONNECTION_CLOSED:
+            self.closed = True
+
+    def asdu_received(self, param, address, asdu):
+        now = time.perf_counter()
+        type_id = CS101_ASDU_getTypeID(asdu)
+        cot = CS101_ASDU_getCOT(asdu)
+        with self.lock:
+            self.stats['asdus_received'] += 1
+            if type_id == C_DC_NA_1:
+                io = CS101_ASDU_getElement(asdu, 0)
+                self.command_answered(InformationObject_getObjectAddress(io), cot, CS101_ASDU_isNegative(asdu), now)
+                InformationObject_destroy(io)
+            elif type_id == C_IC_NA_1:
+                if cot == CS101_COT_ACTIVATION_TERMINATION and self.gi_sent is not None:
+                    self.latencies['gi'].append(now - self.gi_sent)
+                    self.stats['gi_done'] += 1
+                    self.gi_sent = None
+            elif type_id == C_RD_NA_1:
+                if cot == CS101_COT_UNKNOWN_IOA:
+                    io = CS101_ASDU_getElement(asdu, 0)
+                    if self.reads.pop(InformationObject_getObjectAddress(io), None) is not None:
+                        self.stats['reads_unknown'] += 1
+                    InformationObject_destroy(io)
+            elif self.reads or self.awaiting_status or type_id in (M_DP_NA_1, M_DP_TB_1):
+                self.monitored(asdu, type_id, cot, now)
+        return True
+
+    def command_answered(self, ioa, cot, negative, now):
+        if cot == CS101_COT_ACTIVATION_TERMINATION:
+            # Usually arrives after the status change already finished the command
+            self.stats['commands_act_term_negative' if negative else 'commands_act_term'] += 1
+            return
+        command = self.commands.get(ioa)
+        if command is None or cot != CS101_COT_ACTIVATION_CON:
+            return
+        if negative:
+            self.stats['commands_negative'] += 1
+            self.finish(command)
+        elif not command.confirmed:
+            command.confirmed = True
+            self.stats['commands_confirmed'] += 1
+            self.latencies['act_con'].append(now - command.sent)
+            if command.status_seen:
+                self.finish(command)
+
+    def monitored(self, asdu, type_id, cot, now):
+        is_double_point = type_id in (M_DP_NA_1, M_DP_TB_1)
+        for i in range(CS101_ASDU_getNumberOfElements(asdu)):
+            io = CS101_ASDU_getElement(asdu, i)
+            ioa = InformationObject_getObjectAddress(io)
+            if cot != CS101_COT_INTERROGATED_BY_STATION:
+                sent = self.reads.pop(ioa, None)
+                if sent is not None:
+                    self.stats['reads_answered'] += 1
+                    self.latencies['read'].append(now - sent)
+            if is_double_point:
+                value = DoublePointInformation_getValue(cast(io, DoublePointInformation))
+                if value in (IEC60870_DOUBLE_POINT_OFF, IEC60870_DOUBLE_POINT_ON):
+                    self.positions[ioa] = value
+                    command = self.awaiting_status.get(ioa)
+                    if command is not None and value == command.state and cot != CS101_COT_INTERROGATED_BY_STATION:
+                        self.stats['commands_status_seen'] += 1
+                        self.latencies['status'].append(now - command.sent)
+                        command.status_seen = True
+                        del self.awaiting_status[ioa]
+                        # The status change can overtake the ACT_CON
+                        if command.confirmed:
+                            self.finish(command)
+            InformationObject_destroy(io)
+
+    def finish(self, command):
+        self.commands.pop(command.breaker.control, None)
+        self.awaiting_status.pop(command.breaker.status, None)
+
+    def expire(self, now):
+        timeout = self.args.timeout
+        with self.lock:
+            for command in [c for c in self.commands.values() if now - c.sent > timeout]:
+                self.stats['commands_timed_out'] += 1
+                self.finish(command)
+            if self.gi_sent is not None and now - self.gi_sent > timeout:
+                self.gi_sent = None
+            for ioa in [ioa for ioa, sent in self.reads.items() if now - sent > timeout]:
+                del self.reads[ioa]
+
+    def send_gi(self):
+        with self.lock:
+            if self.gi_sent is not None:
+                return False
+            self.gi_sent = time.perf_counter()
+        if not CS104_Connection_sendInterrogationCommand(self.connection, CS101_COT_ACTIVATION, self.args.ca, IEC60870_QOI_STATION):
+            with self.lock:
+                self.gi_sent = None
+            self.stats['send_blocked'] += 1
+            return False
+        self.stats['gi_sent'] += 1
+        return True
+
+    def send_read(self):
+        if not self.read_ioas:
+            return False
+        ioa = self.rng.choice(self.read_ioas)
+        with self.lock:
+            if ioa in self.reads:
+                return False
+            self.reads[ioa] = time.perf_counter()
+        if not CS104_Connection_sendReadCommand(self.connection, self.args.ca, ioa):
+            with self.lock:
+                self.reads.pop(ioa, None)
+            self.stats['send_blocked'] += 1
+            return False
+        self.stats['reads_sent'] += 1
+        return True
+
+    def send_command(self):
+        with self.lock:
+            idle = [b for b in self.breakers if b.control not in self.commands]
+            if not idle:
+                return False
+            breaker = self.rng.choice(idle)
+            # Always command the position the breaker is not in, so the status changes
+            state = IEC60870_DOUBLE_POINT_OFF if self.positions.get(breaker.status) == IEC60870_DOUBLE_POINT_ON else IEC60870_DOUBLE_POINT_ON
+            command = Command(breaker, state, time.perf_counter())
+            # Registered before sending, the ACT_CON can arrive before the send returns
+            self.commands[breaker.control] = command
+            self.awaiting_status[breaker.status] = command
+        io = cast(DoubleCommand_create(None, breaker.control, state, False, 0), InformationObject)
+        sent = CS104_Connection_sendProcessCommandEx(self.connection, CS101_COT_ACTIVATION, self.args.ca, io)
+        InformationObject_destroy(io)
+        if not sent:
+            with self.lock:
+                self.finish(command)
+            self.stats['send_blocked'] += 1
+            return False
+        self.stats['commands_sent'] += 1
+        return True
+
+    def run(self, deadline):
+        senders = {'gi': self.send_gi, 'read': self.send_read, 'command': self.send_command}
+        interval = 1.0 / self.args.rate if self.args.rate > 0 else 0
+        next_at = time.perf_counter()
+        try:
+            while not self.closed:
+                now = time.perf_counter()
+                if now >= deadline:
+                    break
+                self.expire(now)
+                operation = self.rng.choices(OPERATIONS, self.weights)[0]
+                sent = senders[operation]()
+                if interval:
+                    next_at += interval
+                    time.sleep(max(next_at - time.perf_counter(), 0))
+                elif not sent:
+                    time.sleep(0.0005)
+        except Exception as e:
+            self.error = f"connection {self.index}: {type(e).__name__}: {e}"
+
+
+class SelfHostedSimulator:
+    """A simulator with generated breakers and telemetries, served from a background event loop."""
+
+    def __init__(self, args):
+        from data_models import CircuitBreakerItem
+        from lib.libiec60870server import IEC60870_5_104_server
+
+        self.args = args
+        self.circuit_breakers = {}
+        self.server = IEC60870_5_104_server(
+            '127.0.0.1', args.port,
+            circuit_breakers=self.circuit_breakers,
+            server_mode=CS104_MODE_CONNECTION_IS_REDUNDANCY_GROUP,
+            seed=args.seed,
+        )
+        callback = lambda ioa, ioa_object, server, is_select=None: (
+            server.update_ioa_from_server(ioa, ioa_object['data'])
+            if not is_select else True
+        )
+        self.breakers = []
+        for i in range(args.breakers):
+            base = 10000 + i * 10
+            item = CircuitBreakerItem(
+                id=f"cb{i}", name=f"LOAD_CB_{i}",
+                ioa_cb_status=base, ioa_cb_status_close=base + 1, ioa_cb_status_dp=base + 2,
+                ioa_control_open=base + 3, ioa_control_close=base + 4, ioa_control_dp=base + 5,
+                ioa_local_remote_sp=base + 6, ioa_local_remote_dp=base + 7,
+                is_sbo=False, has_double_point=True, is_dp_mode=True, travel_time=args.travel_time,
+            )
+            self.circuit_breakers[item.id] = item
+            self.server.add_ioa(item.ioa_cb_status, SinglePointInformation, 0, callback, True)
+            self.server.add_ioa(item.ioa_cb_status_close, SinglePointInformation, 0, callback, True)
+            self.server.add_ioa(item.ioa_cb_status_dp, DoublePointInformation, 0, callback, True)
+            self.server.add_ioa(item.ioa_control_dp, DoubleCommand, 0, callback, True)
+            self.breakers.append(Breaker(item.ioa_control_dp, item.ioa_cb_status_dp))
+        self.telemetry_ioas = list(range(1000, 1000 + args.telemetries))
+        for ioa in self.telemetry_ioas:
+            self.server.add_ioa(ioa, MeasuredValueScaled, 0, None, True)
+
+        self.loop = None
+        self.stopping = None
+        self.start_result = None
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target=asyncio.run, args=(self.serve(),), daemon=True)
+
+    def start(self):
+        self.thread.start()
+        if not self.ready.wait(5) or self.start_result != 0:
+            raise RuntimeError(f"could not start the simulator on port {self.args.port}")
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.stopping.set)
+        self.thread.join()
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+        self.start_result = self.server.start()
+        timer_wheel_task = asyncio.create_task(self.server.timer_wheel.run())
+        self.ready.set()
+        rng = random.Random(self.args.seed)
+        # Spontaneous telemetry traffic alongside the commands
+        interval = 1.0 / self.args.telemetry_rate if self.args.telemetry_rate > 0 else None
+        while not self.stopping.is_set():
+            if interval and self.telemetry_ioas:
+                self.server.update_ioa(rng.choice(self.telemetry_ioas), rng.randint(0, 32767))
+            try:
+                await asyncio.wait_for(self.stopping.wait(), interval or 1.0)
+            except asyncio.TimeoutError:
+                pass
+        timer_wheel_task.cancel()
+        self.server.stop()
+
+
+def breakers_from_config(path):
+    with open(path) as f:
+        data = json.load(f)
+    breakers = [
+        Breaker(cb['ioa_control_dp'], cb['ioa_cb_status_dp'])
+        for cb in data.get('circuit_breakers', [])
+        if cb.get('is_dp_mode') and not cb.get('is_sbo') and cb.get('ioa_control_dp') and cb.get('ioa_cb_status_dp')
+    ]
+    read_ioas = [item['ioa'] for key in ('telesignals', 'telemetries') for item in data.get(key, [])]
+    return breakers, read_ioas
+
+
+def share(breakers, index, count):
+    """The breakers connection `index` commands: its own slice, so commands never supersede each other."""
+    if len(breakers) >= count:
+        return breakers[index::count]
+    # Fewer breakers than connections, some are shared
+    return [breakers[index % len(breakers)]] if breakers else []
+
+
+def parse_mix(mix):
+    weights = dict.fromkeys(OPERATIONS, 0.0)
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in weights:
+            raise argparse.ArgumentTypeError(f"unknown operation {name!r}, expected {', '.join(OPERATIONS)}")
+        weights[name.strip()] = float(weight or 1)
+    return [weights[name] for name in OPERATIONS]
+
+
+def summary(samples):
+    if not samples:
+        return None
+    ms = np.asarray(samples) * 1000.0
+    return {
+        'count': len(samples),
+        'p50_ms': round(float(np.percentile(ms, 50)), 3),
+        'p99_ms': round(float(np.percentile(ms, 99)), 3),
+        'max_ms': round(float(ms.max()), 3),
+    }
+
+
+def run(args):
+    simulator = None
+    if args.self_host:
+        args.host = '127.0.0.1'
+        simulator = SelfHostedSimulator(args)
+        simulator.start()
+        breakers, read_ioas = simulator.breakers, simulator.telemetry_ioas
+    elif args.config:
+        breakers, read_ioas = breakers_from_config(args.config)
+    else:
+        breakers, read_ioas = [], []
+
+    weights = parse_mix(args.mix)
+    masters = [Master(i, args, share(breakers, i, args.connections), read_ioas, weights, args.seed + i) for i in range(args.connections)]
+
+    errors = []
+    try:
+        connected = [master for master in masters if master.connect()]
+        errors += [master.error for master in masters if master.error]
+        if not connected:
+            return report(args, masters, 0, errors)
+
+        # Learn the breaker positions before commanding them
+        for master in connected:
+            master.send_gi()
+        time.sleep(min(args.timeout, 1.0))
+
+        started = time.perf_counter()
+        deadline = started + args.seconds
+        threads = [threading.Thread(target=master.run, args=(deadline,), daemon=True) for master in connected]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Give answers to the last requests a moment to arrive
+        time.sleep(min(args.timeout, 1.0))
+        elapsed = time.perf_counter() - started
+        errors += [master.error for master in connected if master.error]
+        errors += [f"connection {master.index}: closed by the server" for master in connected if master.closed]
+        return report(args, masters, elapsed, errors)
+    finally:
+        for master in masters:
+            master.close()
+        if simulator is not None:
+            simulator.stop()
+
+
+def report(args, masters, elapsed, errors):
+    stats = new_stats()
+    latencies = {'act_con': [], 'status': [], 'gi': [], 'read': []}
+    for master in masters:
+        for key, value in master.stats.items():
+            stats[key] += value
+        for key, samples in master.latencies.items():
+            latencies[key] += samples
+
+    elapsed = max(elapsed, 1e-9)
+    result = {
+        'connections': args.connections,
+        'seconds': round(elapsed, 3),
+        'stats': stats,
+        'throughput': {
+            'requests_per_s': round((stats['gi_sent'] + stats['reads_sent'] + stats['commands_sent']) / elapsed, 1),
+            'commands_per_s': round(stats['commands_sent'] / elapsed, 1),
+            'asdus_received_per_s': round(stats['asdus_received'] / elapsed, 1),
+        },
+        'latency': {
+            'command_to_act_con': summary(latencies['act_con']),
+            'command_to_status': summary(latencies['status']),
+            'gi_to_act_term': summary(latencies['gi']),
+            'read_to_response': summary(latencies['read']),
+        },
+        'errors': errors,
+    }
+
+    print(f"{args.connections} connections to {args.host}:{args.port}, {elapsed:.1f}s")
+    for key, value in result['throughput'].items():
+        print(f"  {key:<24} {value}")
+    for key, value in result['latency'].items():
+        if value:
+            print(f"  {key:<24} n={value['count']} p50={value['p50_ms']}ms p99={value['p99_ms']}ms max={value['max_ms']}ms")
+        else:
+            print(f"  {key:<24} no samples")
+    print(f"  commands                 sent={stats['commands_sent']} confirmed={stats['commands_confirmed']} "
+          f"negative={stats['commands_negative']} timed out={stats['commands_timed_out']} send blocked={stats['send_blocked']}")
+    for error in errors[:10]:
+        print(f"  ERROR {error}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+    failed = errors or (stats['commands_sent'] and not stats['commands_confirmed'])
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=2404)
+    parser.add_argument('--ca', type=int, default=1, help="common address of the station")
+    parser.add_argument('--connections', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--rate', type=float, default=50, help="requests per second per connection, 0 for as fast as possible")
+    parser.add_argument('--mix', default='gi=1,read=20,command=20', help="relative weights of gi, read and command requests")
+    parser.add_argument('--timeout', type=float, default=5, help="seconds before an unanswered request is given up")
+    parser.add_argument('--config', help="exported simulator JSON naming the breakers and points of a running simulator")
+    parser.add_argument('--self-host', action='store_true', help="start a simulator in this process")
+    parser.add_argument('--breakers', type=int, default=64, help="breakers of the self-hosted simulator")
+    parser.add_argument('--telemetries', type=int, default=1000, help="telemetries of the self-hosted simulator")
+    parser.add_argument('--telemetry-rate', type=float, default=100, help="spontaneous telemetry updates per second of the self-hosted simulator")
+    parser.add_argument('--travel-time', type=float, default=0.0, help="breaker travel time of the self-hosted simulator")
+    parser.add_argument('--seed', type=int, default=104)
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+    if not args.self_host and not args.config and 'command=0' not in args.mix.replace(' ', ''):
+        print("No breakers to command: pass --config or --self-host, or set command=0 in --mix", file=sys.stderr)
+    sys.exit(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Stress the point table the way the simulator uses it.
+
+GI threads walk the table like GI_h does, command threads look points up
+and submit writes like ASDU_h does (both stand in for lib60870 connection
+threads), while the event loop adds and removes points like the Socket.IO
+CRUD handlers and applies the submitted commands. Any exception on any
+thread fails the run.
+
+    python -m tools.stress_point_table --seconds 10 --points 5000
+
+Pass --plain-dict to run the same workload against a bare dict, which is
+what ioa_list used to be, to see the iteration errors this guards against.
+"""
+import argparse
+import asyncio
+import random
+import sys
+import threading
+import time
+
+from lib.point_table import PointTable
+
+
+class PlainDictTable(dict):
+    """The old ioa_list: a dict iterated in place, commands applied on the caller's thread."""
+
+    def snapshot(self):
+        return self
+
+    def submit(self, fn, *args):
+        fn(*args)
+
+    def bind(self, loop):
+        pass
+
+
+def new_stats():
+    return dict.fromkeys([
+        'gi', 'gi_objects', 'commands_submitted', 'commands_applied', 'commands_dropped',
+        'commands_unknown_ioa', 'added', 'removed',
+    ], 0)
+
+
+def make_point(ioa):
+    return {'type': ioa % 4, 'data': 0, 'callback': None, 'event': True, 'quality': 0}
+
+
+def gi_worker(table, stop, stats, errors):
+    while not stop.is_set():
+        try:
+            objects = 0
+            for ioa, point in table.snapshot().items():
+                if point['type'] >= 0:
+                    objects += 1
+            for ioa in table:
+                objects += 1
+            stats['gi'] += 1
+            stats['gi_objects'] += objects
+        except Exception as e:
+            errors.append(f"GI: {type(e).__name__}: {e}")
+            return
+
+
+def command_worker(table, stop, stats, errors, ioa_range, seed, applied):
+    rng = random.Random(seed)
+
+    def apply(ioa, value):
+        point = table.get(ioa)
+        with applied['lock']:
+            if point is None:
+                applied['dropped'] += 1
+                return
+            point['data'] = value
+            applied['applied'] += 1
+
+    while not stop.is_set():
+        try:
+            ioa = rng.randrange(ioa_range)
+            if table.get(ioa) is not None:
+                stats['commands_submitted'] += 1
+                table.submit(apply, ioa, rng.randint(0, 1))
+            else:
+                stats['commands_unknown_ioa'] += 1
+        except Exception as e:
+            errors.append(f"command: {type(e).__name__}: {e}")
+            return
+        # Yield now and then like a connection thread waiting on its socket
+        if stats['commands_submitted'] % 64 == 0:
+            time.sleep(0)
+
+
+async def crud_worker(table, stop, stats, errors, ioa_range, seed):
+    rng = random.Random(seed)
+    while not stop.is_set():
+        try:
+            for _ in range(50):
+                ioa = rng.randrange(ioa_range)
+                if ioa in table:
+                    del table[ioa]
+                    stats['removed'] += 1
+                else:
+                    table[ioa] = make_point(ioa)
+                    stats['added'] += 1
+        except Exception as e:
+            errors.append(f"CRUD: {type(e).__name__}: {e}")
+            return
+        await asyncio.sleep(0)
+
+
+async def run(args):
+    table = PlainDictTable() if args.plain_dict else PointTable()
+    for ioa in range(args.points):
+        table[ioa] = make_point(ioa)
+    table.bind(asyncio.get_running_loop())
+
+    stop = threading.Event()
+    errors = []
+    applied = {'lock': threading.Lock(), 'applied': 0, 'dropped': 0}
+    # One counter dict per worker, so no counter is shared between threads
+    worker_stats = [new_stats() for _ in range(args.gi_threads + args.command_threads + 1)]
+    ioa_range = args.points * 2
+
+    threads = [threading.Thread(target=gi_worker, args=(table, stop, worker_stats[i], errors), daemon=True) for i in range(args.gi_threads)]
+    threads += [
+        threading.Thread(target=command_worker, args=(table, stop, worker_stats[args.gi_threads + i], errors, ioa_range, args.seed + i, applied), daemon=True)
+        for i in range(args.command_threads)
+    ]
+    for thread in threads:
+        thread.start()
+
+    crud = asyncio.create_task(crud_worker(table, stop, worker_stats[-1], errors, ioa_range, args.seed))
+    started = time.perf_counter()
+    while time.perf_counter() - started < args.seconds and not errors:
+        await asyncio.sleep(0.1)
+    stop.set()
+    await crud
+    for thread in threads:
+        thread.join()
+    # Let the loop drain commands submitted right before the stop
+    await asyncio.sleep(0.2)
+    elapsed = time.perf_counter() - started
+
+    stats = new_stats()
+    for worker in worker_stats:
+        for key, value in worker.items():
+            stats[key] += value
+    stats['commands_applied'] = applied['applied']
+    stats['commands_dropped'] = applied['dropped']
+
+    print(f"{'plain dict' if args.plain_dict else 'PointTable'}: {elapsed:.1f}s, {len(table)} points at the end")
+    print(f"  GI passes:          {stats['gi']} ({stats['gi_objects'] / max(stats['gi'], 1):.0f} objects each)")
+    print(f"  commands submitted: {stats['commands_submitted']} ({stats['commands_submitted'] / elapsed:.0f}/s)")
+    print(f"  commands applied:   {stats['commands_applied']}, dropped for removed IOA: {stats['commands_dropped']}")
+    print(f"  points added:       {stats['added']}, removed: {stats['removed']}")
+
+    if stats['commands_applied'] + stats['commands_dropped'] != stats['commands_submitted']:
+        errors.append("not every submitted command was applied or dropped")
+    for error in errors[:10]:
+        print(f"  ERROR {error}")
+    return 1 if errors else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--points', type=int, default=5000)
+    parser.add_argument('--gi-threads', type=int, default=2)
+    parser.add_argument('--command-threads', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=104)
+    parser.add_argument('--plain-dict', action='store_true')
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import assert from 'node:assert/strict';
+import { test } from 'node:test';
+import { type Packet, PacketType } from 'socket.io-parser';
+import * as jsonParser from 'socket.io-parser';
+import { columnarDecoder, expand } from './columnar.ts';
+import * as msgpackParser from './msgpackParser.ts';
+
+const hex = (text: string) => Uint8Array.from(text.match(/../g) ?? [], (byte) => parseInt(byte, 16));
+
+const decodeWith = (BaseDecoder: typeof msgpackParser.Decoder | typeof jsonParser.Decoder, chunk: unknown) => {
+  const decoded: Packet[] = [];
+  const decoder = new (columnarDecoder(BaseDecoder))();
+  decoder.on('decoded', (packet) => decoded.push(packet));
+  decoder.add(chunk);
+  return decoded;
+};
+
+test('expands columns into rows', () => {
+  assert.deepEqual(expand({ fields: ['id', 'value'], columns: [['t1', 't2'], [1.5, -3]] }), [
+    { id: 't1', value: 1.5 },
+    { id: 't2', value: -3 },
+  ]);
+  assert.deepEqual(expand({ fields: ['id'], columns: [] }), []);
+  assert.deepEqual(expand([{ id: 't1' }]), [{ id: 't1' }]);
+  assert.equal(expand('telemetries'), 'telemetries');
+});
+
+test('expands a msgpack event sent by python-socketio', () => {
+  // MsgPackPacket(packet.EVENT, data=['telemetries', {'fields': ['id', 'value'], 'columns': [['t1', 't2'], [1.5, -3]]}], namespace='/')
+  const packed = hex('83a47479706502a46461746192ab74656c656d65747269657382a66669656c647392a26964a576616c7565a7636f6c756d6e739292a27431a2743292cb3ff8000000000000fda36e7370a12f');
+  assert.deepEqual(decodeWith(msgpackParser.Decoder, packed), [{
+    type: PacketType.EVENT,
+    nsp: '/',
+    data: ['telemetries', [{ id: 't1', value: 1.5 }, { id: 't2', value: -3 }]],
+  }]);
+});
+
+test('expands the columnar collections of the initial data', () => {
+  // MsgPackPacket(packet.EVENT, data=['get_initial_data_response', {'telemetries': {'fields': ['id'], 'columns': [['t1']]},
+  //                                   'circuit_breakers': [{'id': 'cb1'}]}], namespace='/')
+  const packed = hex('83a47479706502a46461746192b96765745f696e697469616c5f646174615f726573706f6e736582ab74656c656d65747269657382a66669656c647391a26964a7636f6c756d6e739191a27431b0636972637569745f627265616b6572739181a26964a3636231a36e7370a12f');
+  const [packet] = decodeWith(msgpackParser.Decoder, packed);
+  assert.deepEqual(packet.data, ['get_initial_data_response', { telemetries: [{ id: 't1' }], circuit_breakers: [{ id: 'cb1' }] }]);
+});
+
+test('expands JSON events and leaves other packets alone', () => {
+  const [event] = decodeWith(jsonParser.Decoder, '2["telemetries",{"fields":["id"],"columns":[["t1","t2"]]}]');
+  assert.deepEqual(event.data, ['telemetries', [{ id: 't1' }, { id: 't2' }]]);
+
+  const [connect] = decodeWith(jsonParser.Decoder, '0{"sid":"abc"}');
+  assert.equal(connect.type, PacketType.CONNECT);
+  assert.deepEqual(connect.data, { sid: 'abc' });
+});
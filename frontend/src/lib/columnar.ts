@@ -0,0 +1,67 @@
+import { Emitter } from '@socket.io/component-emitter';
+import { type Packet, PacketType } from 'socket.io-parser';
+
+// Large collections arrive columnar: field names once, then one array of values per field
+type Columnar = { fields: string[]; columns: unknown[][] };
+
+const isColumnar = (value: unknown): value is Columnar =>
+  typeof value === 'object' && value !== null && !Array.isArray(value) &&
+  Array.isArray((value as Columnar).fields) && Array.isArray((value as Columnar).columns);
+
+const toRows = ({ fields, columns }: Columnar) => {
+  const length = columns.length > 0 ? columns[0].length : 0;
+  const rows: Record<string, unknown>[] = new Array(length);
+  for (let i = 0; i < length; i++) {
+    const row: Record<string, unknown> = {};
+    for (let j = 0; j < fields.length; j++) {
+      row[fields[j]] = columns[j][i];
+    }
+    rows[i] = row;
+  }
+  return rows;
+};
+
+// Expand a columnar argument, or the columnar collections of an object such as get_initial_data_response
+export const expand = (value: unknown): unknown => {
+  if (isColumnar(value)) {
+    return toRows(value);
+  }
+  if (typeof value === 'object' && value !== null && !Array.isArray(value)) {
+    return Object.fromEntries(
+      Object.entries(value).map(([key, item]) => [key, isColumnar(item) ? toRows(item) : item])
+    );
+  }
+  return value;
+};
+
+type DecoderEvents = { decoded: (packet: Packet) => void };
+
+type PacketDecoder = {
+  on(event: 'decoded', listener: (packet: Packet) => void): unknown;
+  add(chunk: unknown): void;
+  destroy(): void;
+};
+
+// Wraps the serializer's decoder so every listener receives plain lists of items
+export const columnarDecoder = (BaseDecoder: new () => PacketDecoder) =>
+  class ColumnarDecoder extends Emitter<DecoderEvents, DecoderEvents> {
+    private decoder = new BaseDecoder();
+
+    constructor() {
+      super();
+      this.decoder.on('decoded', (packet: Packet) => {
+        if ((packet.type === PacketType.EVENT || packet.type === PacketType.BINARY_EVENT) && Array.isArray(packet.data)) {
+          packet.data = packet.data.map(expand);
+        }
+        this.emit('decoded', packet);
+      });
+    }
+
+    add(chunk: unknown) {
+      this.decoder.add(chunk);
+    }
+
+    destroy() {
+      this.decoder.destroy();
+    }
+  };
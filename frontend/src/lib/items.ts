@@ -11,6 +11,9 @@ export interface CircuitBreakerItem {
   ioa_local_remote_sp: number;
   ioa_local_remote_dp?: number;
   is_sbo: boolean;
+  sbo_timeout?: number;
+  travel_time?: number;
+  failure_probability?: number;
   has_double_point: boolean;
   is_dp_mode: boolean;
   is_sdp_mode: boolean;
@@ -0,0 +1,82 @@
+import assert from 'node:assert/strict';
+import { test } from 'node:test';
+import { PacketType } from 'socket.io-parser';
+import { Decoder, Encoder, ExtData, decode, encode } from './msgpackParser.ts';
+
+const hex = (text: string) => Uint8Array.from(text.match(/../g) ?? [], (byte) => parseInt(byte, 16));
+const toHex = (bytes: Uint8Array) => Array.from(bytes, (byte) => byte.toString(16).padStart(2, '0')).join('');
+
+// Packed by Python msgpack 1.x (what python-socketio sends), with the Python value each one came from.
+// The codec decodes every payload and encodes the value back to the same bytes.
+const payloads: [string, string, unknown][] = [
+  // [-1, -32, -33, -129, -40000]: negative fixint, int8, int16, int32
+  ['negative ints', '95ffe0d0dfd1ff7fd2ffff63c0', [-1, -32, -33, -129, -40000]],
+  // [0, 127, 128, 255, 256, 65535, 65536, 2**32 - 1]
+  ['unsigned ints', '98007fcc80ccffcd0100cdffffce00010000ceffffffff', [0, 127, 128, 255, 256, 65535, 65536, 2 ** 32 - 1]],
+  // 0.1
+  ['float64', 'cb3fb999999999999a', 0.1],
+  // 'x' * 40
+  ['str8', 'd928' + '78'.repeat(40), 'x'.repeat(40)],
+  // 'ü' * 200, 400 bytes of UTF-8
+  ['str16', 'da0190' + 'c3bc'.repeat(200), 'ü'.repeat(200)],
+  // 'a' * 70000
+  ['str32', 'db00011170' + '61'.repeat(70000), 'a'.repeat(70000)],
+  // {f'k{i:02}': i for i in range(16)}
+  ['map16', 'de0010a36b303000a36b303101a36b303202a36b303303a36b303404a36b303505a36b303606a36b303707a36b303808a36b303909a36b31300aa36b31310ba36b31320ca36b31330da36b31340ea36b31350f',
+    Object.fromEntries(Array.from({ length: 16 }, (_, i) => [`k${String(i).padStart(2, '0')}`, i]))],
+  // msgpack.ExtType(5, b'\x01\x02'): fixext 2
+  ['fixext', 'd5050102', new ExtData(5, Uint8Array.of(1, 2))],
+  // msgpack.ExtType(1, b'abc'): ext8
+  ['ext8', 'c70301616263', new ExtData(1, Uint8Array.of(0x61, 0x62, 0x63))],
+  // datetime(2024, 1, 1, tzinfo=timezone.utc) with datetime=True: timestamp 32
+  ['timestamp32', 'd6ff65920080', new Date(Date.UTC(2024, 0, 1))],
+  // datetime(2024, 1, 1, 0, 0, 0, 500000, tzinfo=timezone.utc) with datetime=True: timestamp 64
+  ['timestamp64', 'd7ff7735940065920080', new Date(Date.UTC(2024, 0, 1, 0, 0, 0, 500))],
+];
+
+for (const [name, packed, value] of payloads) {
+  test(`decodes and encodes ${name} like Python msgpack`, () => {
+    assert.deepEqual(decode(hex(packed)), value);
+    assert.equal(toHex(encode(value)), packed);
+  });
+}
+
+test('decodes float32 and 64 bit integers', () => {
+  // msgpack.packb([1.5, 0.1], use_single_float=True)
+  assert.deepEqual(decode(hex('92ca3fc00000ca3dcccccd')), [1.5, Math.fround(0.1)]);
+  // [2**53, -2**40]
+  assert.deepEqual(decode(hex('92cf0020000000000000d3ffffff0000000000')), [2 ** 53, -(2 ** 40)]);
+});
+
+test('decodes bin as an ArrayBuffer', () => {
+  // b'\x00\x01'
+  const value = decode(hex('c4020001'));
+  assert.ok(value instanceof ArrayBuffer);
+  assert.deepEqual(new Uint8Array(value), Uint8Array.of(0, 1));
+  assert.equal(toHex(encode(Uint8Array.of(0, 1))), 'c4020001');
+});
+
+test('rejects truncated and trailing data', () => {
+  assert.throws(() => decode(hex('d928' + '78'.repeat(10))), /Truncated/);
+  assert.throws(() => decode(hex('c0c0')), /Trailing/);
+  assert.throws(() => decode(hex('c1')), /Unsupported/);
+});
+
+test('packets round trip through the Socket.IO encoder and decoder', () => {
+  // MsgPackPacket(packet.EVENT, data=['telemetries', {'fields': ['id', 'value'], 'columns': [['t1', 't2'], [1.5, -3]]}], namespace='/')
+  const packed = hex('83a47479706502a46461746192ab74656c656d65747269657382a66669656c647392a26964a576616c7565a7636f6c756d6e739292a27431a2743292cb3ff8000000000000fda36e7370a12f');
+  const expected = {
+    type: PacketType.EVENT,
+    data: ['telemetries', { fields: ['id', 'value'], columns: [['t1', 't2'], [1.5, -3]] }],
+    nsp: '/',
+  };
+  const decoded: unknown[] = [];
+  const decoder = new Decoder();
+  decoder.on('decoded', (packet) => decoded.push(packet));
+  decoder.add(packed.buffer);
+  assert.deepEqual(decoded, [expected]);
+
+  const [encoded] = new Encoder().encode(expected);
+  assert.deepEqual(decode(encoded), expected);
+  assert.throws(() => decoder.add('not binary'), /binary/);
+});
@@ -0,0 +1,347 @@
+import { Emitter } from '@socket.io/component-emitter';
+import { type Packet, PacketType } from 'socket.io-parser';
+
+// Socket.IO packets as one MessagePack map each, the format of python-socketio's
+// msgpack serializer (SOCKETIO_SERIALIZER=msgpack) and of socket.io-msgpack-parser
+
+const textEncoder = new TextEncoder();
+const textDecoder = new TextDecoder();
+
+// Extension value of a type this codec does not interpret
+export class ExtData {
+  readonly type: number;
+  readonly data: Uint8Array;
+
+  constructor(type: number, data: Uint8Array) {
+    this.type = type;
+    this.data = data;
+  }
+}
+
+// Dates are the timestamp extension, as packed by msgpack with datetime=True
+const TIMESTAMP_TYPE = -1;
+const FIXEXT_TYPES: Record<number, number> = { 1: 0xd4, 2: 0xd5, 4: 0xd6, 8: 0xd7, 16: 0xd8 };
+
+class Writer {
+  private buffer = new Uint8Array(256);
+  private view = new DataView(this.buffer.buffer);
+  length = 0;
+
+  private reserve(size: number) {
+    if (this.length + size <= this.buffer.length) {
+      return;
+    }
+    let capacity = this.buffer.length * 2;
+    while (capacity < this.length + size) {
+      capacity *= 2;
+    }
+    const buffer = new Uint8Array(capacity);
+    buffer.set(this.buffer.subarray(0, this.length));
+    this.buffer = buffer;
+    this.view = new DataView(buffer.buffer);
+  }
+
+  u8(value: number) {
+    this.reserve(1);
+    this.view.setUint8(this.length, value);
+    this.length += 1;
+  }
+
+  u16(value: number) {
+    this.reserve(2);
+    this.view.setUint16(this.length, value);
+    this.length += 2;
+  }
+
+  u32(value: number) {
+    this.reserve(4);
+    this.view.setUint32(this.length, value);
+    this.length += 4;
+  }
+
+  f64(value: number) {
+    this.reserve(8);
+    this.view.setFloat64(this.length, value);
+    this.length += 8;
+  }
+
+  bytes(value: Uint8Array) {
+    this.reserve(value.length);
+    this.buffer.set(value, this.length);
+    this.length += value.length;
+  }
+
+  ext(type: number, data: Uint8Array) {
+    const fixext = FIXEXT_TYPES[data.length];
+    if (fixext !== undefined) {
+      this.u8(fixext);
+    } else {
+      this.head(data.length, 0, -1, [0xc7, 0xc8, 0xc9]);
+    }
+    this.u8(type & 0xff);
+    this.bytes(data);
+  }
+
+  head(size: number, fix: number, fixMax: number, [t8, t16, t32]: (number | undefined)[]) {
+    if (size <= fixMax) {
+      this.u8(fix | size);
+    } else if (size < 0x100 && t8 !== undefined) {
+      this.u8(t8);
+      this.u8(size);
+    } else if (size < 0x10000) {
+      this.u8(t16!);
+      this.u16(size);
+    } else {
+      this.u8(t32!);
+      this.u32(size);
+    }
+  }
+
+  result() {
+    return this.buffer.slice(0, this.length);
+  }
+}
+
+const timestamp = (date: Date) => {
+  const milliseconds = date.getTime();
+  const seconds = Math.floor(milliseconds / 1000);
+  const nanoseconds = (milliseconds - seconds * 1000) * 1e6;
+  const data = new DataView(new ArrayBuffer(seconds >= 0 && seconds < 2 ** 34 ? (nanoseconds === 0 && seconds < 2 ** 32 ? 4 : 8) : 12));
+  if (data.byteLength === 4) {
+    data.setUint32(0, seconds);
+  } else if (data.byteLength === 8) {
+    data.setUint32(0, nanoseconds * 4 + Math.floor(seconds / 2 ** 32));
+    data.setUint32(4, seconds >>> 0);
+  } else {
+    data.setUint32(0, nanoseconds);
+    data.setBigInt64(4, BigInt(seconds));
+  }
+  return new Uint8Array(data.buffer);
+};
+
+const encodeValue = (writer: Writer, value: unknown): void => {
+  if (value === null || value === undefined) {
+    writer.u8(0xc0);
+  } else if (value === false) {
+    writer.u8(0xc2);
+  } else if (value === true) {
+    writer.u8(0xc3);
+  } else if (typeof value === 'number') {
+    if (Number.isInteger(value) && value >= -0x80000000 && value <= 0xffffffff) {
+      if (value >= 0) {
+        if (value < 0x80) writer.u8(value);
+        else if (value < 0x100) { writer.u8(0xcc); writer.u8(value); }
+        else if (value < 0x10000) { writer.u8(0xcd); writer.u16(value); }
+        else { writer.u8(0xce); writer.u32(value); }
+      } else if (value >= -32) {
+        writer.u8(value & 0xff);
+      } else if (value >= -0x80) {
+        writer.u8(0xd0); writer.u8(value & 0xff);
+      } else if (value >= -0x8000) {
+        writer.u8(0xd1); writer.u16(value & 0xffff);
+      } else {
+        writer.u8(0xd2); writer.u32(value >>> 0);
+      }
+    } else {
+      writer.u8(0xcb);
+      writer.f64(value);
+    }
+  } else if (typeof value === 'string') {
+    const bytes = textEncoder.encode(value);
+    writer.head(bytes.length, 0xa0, 31, [0xd9, 0xda, 0xdb]);
+    writer.bytes(bytes);
+  } else if (value instanceof ArrayBuffer || ArrayBuffer.isView(value)) {
+    const bytes = value instanceof ArrayBuffer
+      ? new Uint8Array(value)
+      : new Uint8Array(value.buffer, value.byteOffset, value.byteLength);
+    writer.head(bytes.length, 0, -1, [0xc4, 0xc5, 0xc6]);
+    writer.bytes(bytes);
+  } else if (value instanceof ExtData) {
+    writer.ext(value.type, value.data);
+  } else if (value instanceof Date) {
+    writer.ext(TIMESTAMP_TYPE, timestamp(value));
+  } else if (Array.isArray(value)) {
+    writer.head(value.length, 0x90, 15, [undefined, 0xdc, 0xdd]);
+    for (const item of value) {
+      encodeValue(writer, item);
+    }
+  } else if (typeof value === 'object') {
+    const entries = Object.entries(value).filter(([, item]) => item !== undefined);
+    writer.head(entries.length, 0x80, 15, [undefined, 0xde, 0xdf]);
+    for (const [key, item] of entries) {
+      encodeValue(writer, key);
+      encodeValue(writer, item);
+    }
+  } else {
+    throw new Error(`Cannot encode a ${typeof value} as MessagePack`);
+  }
+};
+
+export const encode = (value: unknown): Uint8Array => {
+  const writer = new Writer();
+  encodeValue(writer, value);
+  return writer.result();
+};
+
+class Reader {
+  private bytes: Uint8Array;
+  private view: DataView;
+  private offset = 0;
+
+  constructor(bytes: Uint8Array) {
+    this.bytes = bytes;
+    this.view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+  }
+
+  get done() {
+    return this.offset >= this.bytes.length;
+  }
+
+  private advance(size: number) {
+    const offset = this.offset;
+    if (offset + size > this.bytes.length) {
+      throw new Error('Truncated MessagePack data');
+    }
+    this.offset += size;
+    return offset;
+  }
+
+  private u8() { return this.view.getUint8(this.advance(1)); }
+  private u16() { return this.view.getUint16(this.advance(2)); }
+  private u32() { return this.view.getUint32(this.advance(4)); }
+
+  private str(size: number) {
+    const offset = this.advance(size);
+    return textDecoder.decode(this.bytes.subarray(offset, offset + size));
+  }
+
+  private bin(size: number) {
+    const offset = this.advance(size);
+    return this.bytes.slice(offset, offset + size).buffer;
+  }
+
+  private ext(size: number) {
+    const type = this.view.getInt8(this.advance(1));
+    const offset = this.advance(size);
+    const data = new DataView(this.bytes.buffer, this.bytes.byteOffset + offset, size);
+    if (type !== TIMESTAMP_TYPE) {
+      return new ExtData(type, this.bytes.slice(offset, offset + size));
+    }
+    if (size === 4) {
+      return new Date(data.getUint32(0) * 1000);
+    }
+    if (size === 8) {
+      const high = data.getUint32(0);
+      const seconds = (high & 0x3) * 2 ** 32 + data.getUint32(4);
+      return new Date(seconds * 1000 + Math.floor((high >>> 2) / 1e6));
+    }
+    if (size === 12) {
+      return new Date(Number(data.getBigInt64(4)) * 1000 + Math.floor(data.getUint32(0) / 1e6));
+    }
+    throw new Error(`Invalid MessagePack timestamp of ${size} bytes`);
+  }
+
+  private array(size: number) {
+    const array: unknown[] = new Array(size);
+    for (let i = 0; i < size; i++) {
+      array[i] = this.value();
+    }
+    return array;
+  }
+
+  private map(size: number) {
+    const map: Record<string, unknown> = {};
+    for (let i = 0; i < size; i++) {
+      const key = this.value();
+      map[String(key)] = this.value();
+    }
+    return map;
+  }
+
+  value(): unknown {
+    const type = this.u8();
+    if (type < 0x80) return type;
+    if (type < 0x90) return this.map(type & 0x0f);
+    if (type < 0xa0) return this.array(type & 0x0f);
+    if (type < 0xc0) return this.str(type & 0x1f);
+    if (type >= 0xe0) return type - 0x100;
+    switch (type) {
+      case 0xc0: return null;
+      case 0xc2: return false;
+      case 0xc3: return true;
+      case 0xc4: return this.bin(this.u8());
+      case 0xc5: return this.bin(this.u16());
+      case 0xc6: return this.bin(this.u32());
+      case 0xc7: return this.ext(this.u8());
+      case 0xc8: return this.ext(this.u16());
+      case 0xc9: return this.ext(this.u32());
+      case 0xca: return this.view.getFloat32(this.advance(4));
+      case 0xcb: return this.view.getFloat64(this.advance(8));
+      case 0xcc: return this.u8();
+      case 0xcd: return this.u16();
+      case 0xce: return this.u32();
+      case 0xcf: return Number(this.view.getBigUint64(this.advance(8)));
+      case 0xd0: return this.view.getInt8(this.advance(1));
+      case 0xd1: return this.view.getInt16(this.advance(2));
+      case 0xd2: return this.view.getInt32(this.advance(4));
+      case 0xd3: return Number(this.view.getBigInt64(this.advance(8)));
+      case 0xd4: return this.ext(1);
+      case 0xd5: return this.ext(2);
+      case 0xd6: return this.ext(4);
+      case 0xd7: return this.ext(8);
+      case 0xd8: return this.ext(16);
+      case 0xd9: return this.str(this.u8());
+      case 0xda: return this.str(this.u16());
+      case 0xdb: return this.str(this.u32());
+      case 0xdc: return this.array(this.u16());
+      case 0xdd: return this.array(this.u32());
+      case 0xde: return this.map(this.u16());
+      case 0xdf: return this.map(this.u32());
+    }
+    throw new Error(`Unsupported MessagePack type 0x${type.toString(16)}`);
+  }
+}
+
+export const decode = (data: ArrayBuffer | Uint8Array): unknown => {
+  const reader = new Reader(data instanceof Uint8Array ? data : new Uint8Array(data));
+  const value = reader.value();
+  if (!reader.done) {
+    throw new Error('Trailing bytes after the MessagePack value');
+  }
+  return value;
+};
+
+export class Encoder {
+  encode(packet: Packet) {
+    return [encode(packet)];
+  }
+}
+
+const isPacket = (value: unknown): value is Packet => {
+  if (typeof value !== 'object' || value === null) {
+    return false;
+  }
+  const packet = value as Packet;
+  return Number.isInteger(packet.type) && packet.type >= PacketType.CONNECT && packet.type <= PacketType.BINARY_ACK &&
+    typeof packet.nsp === 'string' && (packet.id == null || Number.isInteger(packet.id));
+};
+
+type DecoderEvents = { decoded: (packet: Packet) => void };
+
+export class Decoder extends Emitter<DecoderEvents, DecoderEvents> {
+  add(chunk: unknown) {
+    if (!(chunk instanceof ArrayBuffer) && !ArrayBuffer.isView(chunk)) {
+      throw new Error('MessagePack packets must be binary');
+    }
+    const bytes = chunk instanceof ArrayBuffer
+      ? new Uint8Array(chunk)
+      : new Uint8Array(chunk.buffer, chunk.byteOffset, chunk.byteLength);
+    const packet = decode(bytes);
+    if (!isPacket(packet)) {
+      throw new Error('Invalid Socket.IO packet');
+    }
+    this.emit('decoded', packet);
+  }
+
+  destroy() {}
+}
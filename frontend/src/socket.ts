@@ -1,4 +1,7 @@
 import { io } from 'socket.io-client';
+import * as jsonParser from 'socket.io-parser';
+import * as msgpackParser from './lib/msgpackParser';
+import { columnarDecoder } from './lib/columnar';
 
 const backendHost =
   import.meta.env.VITE_FASTAPI_HOST || window.location.hostname;
@@ -9,6 +12,10 @@ const backendPort =
     
 const socketUrl = `http://${backendHost}:${backendPort}`;
 
+// Must match SOCKETIO_SERIALIZER on the backend: 'json' (default) or 'msgpack'
+const baseParser =
+  import.meta.env.VITE_SOCKETIO_SERIALIZER === 'msgpack' ? msgpackParser : jsonParser;
+
 console.log(`Creating socket connection to: ${socketUrl}`);
 const socket = io(socketUrl, {
   transports: ['websocket', 'polling'],
@@ -16,6 +23,7 @@ const socket = io(socketUrl, {
   reconnectionDelay: 1000,
   timeout: 20000,
   forceNew: true,
+  parser: { Encoder: baseParser.Encoder, Decoder: columnarDecoder(baseParser.Decoder) },
   extraHeaders: {
     "Access-Control-Allow-Origin": "*"
   }
@@ -18,6 +18,43 @@ REACT_PORT=$6
 REACT_NODEPORT=$7
 FASTAPI_HOST=$8
 
+# Optional RTU farm, one station per port of the range, built from an exported JSON template:
+#   FARM_PORTS=2404-2603 FARM_TEMPLATE=export.json [FARM_IOA_OFFSET=0] [FARM_WORKERS=4] [FARM_NODEPORT_OFFSET=30000] ./install.sh ...
+FARM_PORTS=${FARM_PORTS:-}
+FARM_IOA_OFFSET=${FARM_IOA_OFFSET:-0}
+FARM_WORKERS=${FARM_WORKERS:-}
+FARM_NODEPORT_OFFSET=${FARM_NODEPORT_OFFSET:-30000}
+FARM_TEMPLATE_PATH=""
+FARM_CONTAINER_PORTS=""
+FARM_SERVICE_PORTS=""
+if [ -n "$FARM_PORTS" ]; then
+  if [ -z "$FARM_TEMPLATE" ] || [ ! -f "$FARM_TEMPLATE" ]; then
+    echo "FARM_TEMPLATE must name an exported JSON file when FARM_PORTS is set"
+    exit 1
+  fi
+  FARM_TEMPLATE_PATH="/app/farm/template.json"
+  FARM_FIRST_PORT=${FARM_PORTS%-*}
+  FARM_LAST_PORT=${FARM_PORTS#*-}
+  # Kubernetes has no port ranges, every port of the farm is listed
+  for PORT in $(seq "$FARM_FIRST_PORT" "$FARM_LAST_PORT"); do
+    if [ "$PORT" = "$IEC104_PORT" ]; then
+      continue
+    fi
+    NODEPORT=$((PORT + FARM_NODEPORT_OFFSET))
+    # A node port can only be bound once, the install would fail half way in kubectl apply
+    if [ "$NODEPORT" = "$IEC104_NODEPORT" ] || [ "$NODEPORT" = "$FASTAPI_NODEPORT" ] || [ "$NODEPORT" = "$REACT_NODEPORT" ]; then
+      echo "Farm port $PORT would get node port $NODEPORT, which is already used by the simulator; choose another FARM_PORTS or FARM_NODEPORT_OFFSET"
+      exit 1
+    fi
+    FARM_CONTAINER_PORTS+="            - containerPort: $PORT"$'\n'
+    FARM_SERVICE_PORTS+="    - name: iec104-farm-$PORT"$'\n'
+    FARM_SERVICE_PORTS+="      port: $PORT"$'\n'
+    FARM_SERVICE_PORTS+="      targetPort: $PORT"$'\n'
+    FARM_SERVICE_PORTS+="      nodePort: $NODEPORT"$'\n'
+    FARM_SERVICE_PORTS+="      protocol: TCP"$'\n'
+  done
+fi
+
 BACKEND_IMAGE_TAG="iec104-simulator-backend-$IMAGE_TAG"
 FRONTEND_IMAGE_TAG="iec104-simulator-frontend-$IMAGE_TAG"
 REGISTRY="grita.id/scada"
@@ -48,9 +85,15 @@ echo "  IEC104_NODEPORT: $IEC104_NODEPORT"
 echo "  REACT_PORT: $REACT_PORT"
 echo "  REACT_NODEPORT: $REACT_NODEPORT"
 echo "  FASTAPI_HOST: $FASTAPI_HOST"
+if [ -n "$FARM_PORTS" ]; then
+  echo "  FARM_PORTS: $FARM_PORTS (node ports from $((FARM_FIRST_PORT + FARM_NODEPORT_OFFSET)))"
+  echo "  FARM_TEMPLATE: $FARM_TEMPLATE"
+  echo "  FARM_IOA_OFFSET: $FARM_IOA_OFFSET"
+fi
 
 # Export variables for envsubst
 export IMAGE_TAG FASTAPI_PORT IEC104_PORT FASTAPI_NODEPORT IEC104_NODEPORT REACT_PORT REACT_NODEPORT FASTAPI_HOST
+export FARM_PORTS FARM_TEMPLATE_PATH FARM_IOA_OFFSET FARM_WORKERS FARM_CONTAINER_PORTS FARM_SERVICE_PORTS
 
 # Create temporary files with substituted values
 BACKEND_CONFIGMAP_TMP=$(mktemp)
@@ -65,6 +108,10 @@ envsubst < ./frontend/k8s/configmap.yaml > $FRONTEND_CONFIGMAP_TMP
 envsubst < ./frontend/k8s/deployment.yaml > $FRONTEND_DEPLOYMENT_TMP
 
 # Apply configurations using the temporary files
+if [ -n "$FARM_PORTS" ]; then
+  kubectl create configmap iconics-iec104-simulator-backend-$IMAGE_TAG-farm --namespace scada-grita \
+    --from-file=template.json="$FARM_TEMPLATE" --dry-run=client -o yaml | kubectl apply -f -
+fi
 kubectl apply -f $BACKEND_CONFIGMAP_TMP
 kubectl apply -f $BACKEND_DEPLOYMENT_TMP
 kubectl apply -f $FRONTEND_CONFIGMAP_TMP
@@ -25,6 +25,7 @@ envsubst < ./frontend/k8s/deployment.yaml | kubectl delete -f - || echo "Fronten
 envsubst < ./frontend/k8s/configmap.yaml | kubectl delete -f - || echo "Frontend configmap not found."
 envsubst < ./backend/k8s/deployment.yaml | kubectl delete -f - || echo "Backend deployment not found."
 envsubst < ./backend/k8s/configmap.yaml | kubectl delete -f - || echo "Backend configmap not found."
+kubectl delete configmap iconics-iec104-simulator-backend-$IMAGE_TAG-farm --namespace scada-grita || echo "Farm template configmap not found."
 
 echo "Removing Docker images..."
 docker rmi $REGISTRY/$BACKEND_IMAGE_TAG || echo "Backend image not found."